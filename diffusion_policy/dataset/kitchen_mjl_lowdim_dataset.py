@@ -1,8 +1,15 @@
-from typing import Dict
+from typing import Dict, List, Optional
 import torch
 import numpy as np
+import os
 import copy
+import json
+import hashlib
 import pathlib
+import zarr
+from filelock import FileLock
+import concurrent.futures
+import multiprocessing
 from tqdm import tqdm
 from diffusion_policy.common.pytorch_util import dict_apply
 from diffusion_policy.common.replay_buffer import ReplayBuffer
@@ -20,7 +27,9 @@ class KitchenMjlLowdimDataset(BaseLowdimDataset):
             abs_action=True,
             robot_noise_ratio=0.0,
             seed=42,
-            val_ratio=0.0
+            val_ratio=0.0,
+            use_cache=True,
+            n_workers=None
         ):
         super().__init__()
 
@@ -34,28 +43,51 @@ class KitchenMjlLowdimDataset(BaseLowdimDataset):
         rng = np.random.default_rng(seed=seed)
 
         data_directory = pathlib.Path(dataset_dir)
-        self.replay_buffer = ReplayBuffer.create_empty_numpy()
-        for i, mjl_path in enumerate(tqdm(list(data_directory.glob('*/*.mjl')))):
-            try:
-                data = parse_mjl_logs(str(mjl_path.absolute()), skipamount=40)
-                qpos = data['qpos'].astype(np.float32)
-                obs = np.concatenate([
-                    qpos[:,:9],
-                    qpos[:,-21:],
-                    np.zeros((len(qpos),30),dtype=np.float32)
-                ], axis=-1)
-                if robot_noise_ratio > 0:
-                    # add observation noise to match real robot
-                    noise = robot_noise_ratio * robot_pos_noise_amp * rng.uniform(
-                        low=-1., high=1., size=(obs.shape[0], 30))
-                    obs[:,:30] += noise
-                episode = {
-                    'obs': obs,
-                    'action': data['ctrl'].astype(np.float32)
-                }
-                self.replay_buffer.add_episode(episode)
-            except Exception as e:
-                print(i, e)
+        mjl_paths = sorted(data_directory.glob('*/*.mjl'))
+        skipamount = 40
+        if use_cache:
+            # cache is only valid for the same mjl files and parse params
+            cache_key = _get_cache_key(mjl_paths, skipamount=skipamount)
+            cache_zarr_path = str(data_directory.absolute()) + f'.{cache_key}.zarr.zip'
+            cache_lock_path = cache_zarr_path + '.lock'
+            print('Acquiring lock on cache.')
+            with FileLock(cache_lock_path):
+                if not os.path.exists(cache_zarr_path):
+                    # cache does not exists
+                    try:
+                        print('Cache does not exist. Creating!')
+                        replay_buffer = _convert_mjl_to_replay(
+                            mjl_paths, skipamount=skipamount, n_workers=n_workers)
+                        print('Saving cache to disk.')
+                        with zarr.ZipStore(cache_zarr_path) as zip_store:
+                            replay_buffer.save_to_store(
+                                store=zip_store
+                            )
+                    except Exception as e:
+                        if os.path.exists(cache_zarr_path):
+                            os.remove(cache_zarr_path)
+                        raise e
+                else:
+                    print('Loading cached ReplayBuffer from Disk.')
+                    with zarr.ZipStore(cache_zarr_path, mode='r') as zip_store:
+                        replay_buffer = ReplayBuffer.copy_from_store(
+                            src_store=zip_store)
+                    print('Loaded!')
+        else:
+            replay_buffer = _convert_mjl_to_replay(
+                mjl_paths, skipamount=skipamount, n_workers=n_workers)
+
+        if robot_noise_ratio > 0:
+            # add observation noise to match real robot
+            # same rng draws per episode as adding them while parsing
+            obs = replay_buffer['obs']
+            episode_ends = replay_buffer.episode_ends[:]
+            episode_starts = np.concatenate([[0], episode_ends[:-1]])
+            for start, end in zip(episode_starts, episode_ends):
+                noise = robot_noise_ratio * robot_pos_noise_amp * rng.uniform(
+                    low=-1., high=1., size=(end - start, 30))
+                obs[start:end,:30] += noise
+        self.replay_buffer = replay_buffer
 
         val_mask = get_val_mask(
             n_episodes=self.replay_buffer.n_episodes, 
@@ -110,3 +142,48 @@ class KitchenMjlLowdimDataset(BaseLowdimDataset):
 
         torch_data = dict_apply(data, torch.from_numpy)
         return torch_data
+
+
+def _get_cache_key(mjl_paths: List[pathlib.Path], skipamount: int) -> str:
+    params = {
+        'files': [(str(x.absolute()), x.stat().st_mtime_ns, x.stat().st_size) 
+            for x in mjl_paths],
+        'skipamount': skipamount
+    }
+    params_str = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(params_str.encode()).hexdigest()[:16]
+
+
+def _parse_mjl_episode(mjl_path: str, skipamount: int) -> Dict[str, np.ndarray]:
+    data = parse_mjl_logs(mjl_path, skipamount=skipamount)
+    qpos = data['qpos'].astype(np.float32)
+    obs = np.concatenate([
+        qpos[:,:9],
+        qpos[:,-21:],
+        np.zeros((len(qpos),30),dtype=np.float32)
+    ], axis=-1)
+    episode = {
+        'obs': obs,
+        'action': data['ctrl'].astype(np.float32)
+    }
+    return episode
+
+
+def _convert_mjl_to_replay(mjl_paths: List[pathlib.Path], skipamount: int, 
+        n_workers: Optional[int]=None) -> ReplayBuffer:
+    """
+    Parse mjl logs in a process pool, episodes are added in mjl_paths order.
+    Files that fail to parse are skipped.
+    """
+    if n_workers is None:
+        n_workers = multiprocessing.cpu_count()
+    replay_buffer = ReplayBuffer.create_empty_numpy()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(_parse_mjl_episode, 
+            str(mjl_path.absolute()), skipamount) for mjl_path in mjl_paths]
+        for i, future in enumerate(tqdm(futures, desc='Parsing mjl logs')):
+            try:
+                replay_buffer.add_episode(future.result())
+            except Exception as e:
+                print(i, e)
+    return replay_buffer
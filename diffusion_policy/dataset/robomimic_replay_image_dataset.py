@@ -5,7 +5,6 @@ import h5py
 from tqdm import tqdm
 import zarr
 import os
-import shutil
 import copy
 import json
 import hashlib
@@ -51,7 +50,13 @@ class RobomimicReplayImageDataset(BaseImageDataset):
 
         replay_buffer = None
         if use_cache:
-            cache_zarr_path = dataset_path + '.zarr.zip'
+            # cache is only valid for the same dataset content and conversion params
+            cache_key = _get_cache_key(
+                dataset_path=dataset_path, 
+                shape_meta=shape_meta, 
+                abs_action=abs_action, 
+                rotation_rep=rotation_rep)
+            cache_zarr_path = dataset_path + f'.{cache_key}.zarr.zip'
             cache_lock_path = cache_zarr_path + '.lock'
             print('Acquiring lock on cache.')
             with FileLock(cache_lock_path):
@@ -72,7 +77,8 @@ class RobomimicReplayImageDataset(BaseImageDataset):
                                 store=zip_store
                             )
                     except Exception as e:
-                        shutil.rmtree(cache_zarr_path)
+                        if os.path.exists(cache_zarr_path):
+                            os.remove(cache_zarr_path)
                         raise e
                 else:
                     print('Loading cached ReplayBuffer from Disk.')
@@ -243,12 +249,77 @@ def _convert_actions(raw_actions, abs_action, rotation_transformer):
     return actions
 
 
+def _get_dataset_fingerprint(dataset_path, n_blocks=16, block_size=1<<16):
+    """
+    Hash of file size and n_blocks evenly spaced blocks of the file.
+    Reading the whole multi-GB hdf5 file would defeat the purpose of caching.
+    """
+    file_size = os.path.getsize(dataset_path)
+    h = hashlib.sha1(str(file_size).encode())
+    with open(dataset_path, 'rb') as f:
+        for offset in np.linspace(0, max(file_size - block_size, 0), n_blocks).astype(np.int64):
+            f.seek(int(offset))
+            h.update(f.read(block_size))
+    return h.hexdigest()
+
+
+def _get_cache_key(dataset_path, shape_meta, abs_action, rotation_rep):
+    if not isinstance(shape_meta, dict):
+        shape_meta = OmegaConf.to_container(shape_meta, resolve=True)
+    params = {
+        'dataset': _get_dataset_fingerprint(dataset_path),
+        'shape_meta': shape_meta,
+        'abs_action': abs_action,
+        'rotation_rep': rotation_rep if abs_action else None
+    }
+    params_str = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(params_str.encode()).hexdigest()[:16]
+
+
+_worker_file = None
+
+def _init_img_worker(dataset_path):
+    global _worker_file
+    threadpool_limits(1)
+    _worker_file = h5py.File(dataset_path, 'r')
+
+
+def _read_episode_images(demo_key, key):
+    """
+    Read all frames of one episode, runs in a worker process.
+    """
+    return _worker_file['data'][demo_key]['obs'][key][:]
+
+
+def _write_episode_images(img_arr, zarr_start, frames, validate_ratio, seed):
+    """
+    Write (and thereby encode) one episode into img_arr, runs in a thread.
+    Chunks are one frame each, so episodes never share a chunk.
+    Decodes a random sample of validate_ratio of the frames to make sure 
+    they can be read back.
+    """
+    img_arr[zarr_start:zarr_start+len(frames)] = frames
+    
+    n_validate = int(np.ceil(len(frames) * validate_ratio))
+    rng = np.random.default_rng(seed)
+    for i in rng.choice(len(frames), size=n_validate, replace=False):
+        img = img_arr[zarr_start + i]
+        if img.size != frames[i].size:
+            raise RuntimeError(f'Failed to encode image {img_arr.name}/{zarr_start + i}!')
+    return len(frames)
+
+
 def _convert_robomimic_to_replay(store, shape_meta, dataset_path, abs_action, rotation_transformer, 
-        n_workers=None, max_inflight_tasks=None):
+        n_workers=None, max_inflight_tasks=None, validate_ratio=0.05):
+    """
+    Images are read from hdf5 one episode per task in a process pool
+    and encoded by zarr on a thread pool (the codec releases the GIL),
+    validate_ratio of the frames are decoded again as a sanity check.
+    """
     if n_workers is None:
         n_workers = multiprocessing.cpu_count()
     if max_inflight_tasks is None:
-        max_inflight_tasks = n_workers * 5
+        max_inflight_tasks = n_workers * 2
 
     # parse shape_meta
     rgb_keys = list()
@@ -270,9 +341,10 @@ def _convert_robomimic_to_replay(store, shape_meta, dataset_path, abs_action, ro
     with h5py.File(dataset_path) as file:
         # count total steps
         demos = file['data']
+        n_demos = len(demos)
         episode_ends = list()
         prev_end = 0
-        for i in range(len(demos)):
+        for i in range(n_demos):
             demo = demos[f'demo_{i}']
             episode_length = demo['actions'].shape[0]
             episode_end = prev_end + episode_length
@@ -289,7 +361,7 @@ def _convert_robomimic_to_replay(store, shape_meta, dataset_path, abs_action, ro
             if key == 'action':
                 data_key = 'actions'
             this_data = list()
-            for i in range(len(demos)):
+            for i in range(n_demos):
                 demo = demos[f'demo_{i}']
                 this_data.append(demo[data_key][:].astype(np.float32))
             this_data = np.concatenate(this_data, axis=0)
@@ -310,54 +382,56 @@ def _convert_robomimic_to_replay(store, shape_meta, dataset_path, abs_action, ro
                 compressor=None,
                 dtype=this_data.dtype
             )
-        
-        def img_copy(zarr_arr, zarr_idx, hdf5_arr, hdf5_idx):
-            try:
-                zarr_arr[zarr_idx] = hdf5_arr[hdf5_idx]
-                # make sure we can successfully decode
-                _ = zarr_arr[zarr_idx]
-                return True
-            except Exception as e:
-                return False
-        
-        with tqdm(total=n_steps*len(rgb_keys), desc="Loading image data", mininterval=1.0) as pbar:
-            # one chunk per thread, therefore no synchronization needed
-            with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
-                futures = set()
-                for key in rgb_keys:
-                    data_key = 'obs/' + key
-                    shape = tuple(shape_meta['obs'][key]['shape'])
-                    c,h,w = shape
-                    this_compressor = Jpeg2k(level=50)
-                    img_arr = data_group.require_dataset(
-                        name=key,
-                        shape=(n_steps,h,w,c),
-                        chunks=(1,h,w,c),
-                        compressor=this_compressor,
-                        dtype=np.uint8
-                    )
-                    for episode_idx in range(len(demos)):
-                        demo = demos[f'demo_{episode_idx}']
-                        hdf5_arr = demo['obs'][key]
-                        for hdf5_idx in range(hdf5_arr.shape[0]):
-                            if len(futures) >= max_inflight_tasks:
-                                # limit number of inflight tasks
-                                completed, futures = concurrent.futures.wait(futures, 
-                                    return_when=concurrent.futures.FIRST_COMPLETED)
-                                for f in completed:
-                                    if not f.result():
-                                        raise RuntimeError('Failed to encode image!')
-                                pbar.update(len(completed))
-
-                            zarr_idx = episode_starts[episode_idx] + hdf5_idx
-                            futures.add(
-                                executor.submit(img_copy, 
-                                    img_arr, zarr_idx, hdf5_arr, hdf5_idx))
-                completed, futures = concurrent.futures.wait(futures)
+    
+    # file is closed before forking workers, each worker opens its own handle
+    with tqdm(total=n_steps*len(rgb_keys), desc="Loading image data", mininterval=1.0) as pbar:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=n_workers,
+                initializer=_init_img_worker, 
+                initargs=(dataset_path,)) as read_executor, \
+            concurrent.futures.ThreadPoolExecutor(
+                max_workers=n_workers) as write_executor:
+            read_futures = dict()
+            write_futures = set()
+
+            def handle_completed(completed):
                 for f in completed:
-                    if not f.result():
-                        raise RuntimeError('Failed to encode image!')
-                pbar.update(len(completed))
+                    if f in read_futures:
+                        img_arr, zarr_start, seed = read_futures.pop(f)
+                        write_futures.add(write_executor.submit(
+                            _write_episode_images, img_arr, zarr_start, 
+                            f.result(), validate_ratio, seed))
+                    else:
+                        write_futures.remove(f)
+                        pbar.update(f.result())
+
+            for key in rgb_keys:
+                shape = tuple(shape_meta['obs'][key]['shape'])
+                c,h,w = shape
+                this_compressor = Jpeg2k(level=50)
+                img_arr = data_group.require_dataset(
+                    name=key,
+                    shape=(n_steps,h,w,c),
+                    chunks=(1,h,w,c),
+                    compressor=this_compressor,
+                    dtype=np.uint8
+                )
+                for episode_idx in range(n_demos):
+                    while len(read_futures) + len(write_futures) >= max_inflight_tasks:
+                        # limit number of inflight tasks (and frames in memory)
+                        completed, _ = concurrent.futures.wait(
+                            list(read_futures.keys()) + list(write_futures), 
+                            return_when=concurrent.futures.FIRST_COMPLETED)
+                        handle_completed(completed)
+
+                    f = read_executor.submit(_read_episode_images,
+                        f'demo_{episode_idx}', key)
+                    read_futures[f] = (img_arr, episode_starts[episode_idx], episode_idx)
+            while len(read_futures) + len(write_futures) > 0:
+                completed, _ = concurrent.futures.wait(
+                    list(read_futures.keys()) + list(write_futures), 
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                handle_completed(completed)
 
     replay_buffer = ReplayBuffer(root)
     return replay_buffer
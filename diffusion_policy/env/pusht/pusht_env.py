@@ -11,6 +11,7 @@ import shapely.geometry as sg
 import cv2
 import skimage.transform as st
 from diffusion_policy.env.pusht.pymunk_override import DrawOptions
+from diffusion_policy.env.pusht.pusht_rasterizer import PushTRasterizer
 
 
 def pymunk_to_shapely(body, shapes):
@@ -34,8 +35,14 @@ class PushTEnv(gym.Env):
             block_cog=None, damping=None,
             render_action=True,
             render_size=96,
-            reset_to_state=None
+            reset_to_state=None,
+            renderer='pygame'
         ):
+        """
+        renderer: 'pygame' or 'raster'. 'raster' draws rgb_array frames 
+        with PushTRasterizer without pygame, approximately matching 'pygame'.
+        """
+        assert renderer in ('pygame', 'raster')
         self._seed = None
         self.seed()
         self.window_size = ws = 512  # The size of the PyGame window
@@ -66,6 +73,8 @@ class PushTEnv(gym.Env):
         self.block_cog = block_cog
         self.damping = damping
         self.render_action = render_action
+        self.renderer = renderer
+        self.rasterizer = None
 
         """
         If human-rendering is used, `self.window` will be a reference
@@ -179,7 +188,22 @@ class PushTEnv(gym.Env):
             'n_contacts': n_contact_points_per_step}
         return info
 
+    def _get_rasterizer(self):
+        if self.rasterizer is None:
+            self.rasterizer = PushTRasterizer(
+                tee_polygons=[np.array(shape.get_vertices()) for shape in self.block.shapes],
+                goal_pose=self.goal_pose,
+                render_size=self.render_size,
+                window_size=self.window_size,
+                agent_radius=list(self.agent.shapes)[0].radius)
+        return self.rasterizer
+
     def _render_frame(self, mode):
+        if self.renderer == 'raster' and mode == 'rgb_array':
+            img = self._get_rasterizer().render(
+                agent_pos=np.array(self.agent.position),
+                block_pose=np.array(tuple(self.block.position) + (self.block.angle,)))
+            return self._draw_action(img)
 
         if self.window is None and mode == "human":
             pygame.init()
@@ -217,6 +241,9 @@ class PushTEnv(gym.Env):
                 np.array(pygame.surfarray.pixels3d(canvas)), axes=(1, 0, 2)
             )
         img = cv2.resize(img, (self.render_size, self.render_size))
+        return self._draw_action(img)
+
+    def _draw_action(self, img):
         if self.render_action:
             if self.render_action and (self.latest_action is not None):
                 action = np.array(self.latest_action)
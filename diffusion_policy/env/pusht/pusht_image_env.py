@@ -10,13 +10,15 @@ class PushTImageEnv(PushTEnv):
             legacy=False,
             block_cog=None, 
             damping=None,
-            render_size=96):
+            render_size=96,
+            renderer='pygame'):
         super().__init__(
             legacy=legacy, 
             block_cog=block_cog,
             damping=damping,
             render_size=render_size,
-            render_action=False)
+            render_action=False,
+            renderer=renderer)
         ws = self.window_size
         self.observation_space = spaces.Dict({
             'image': spaces.Box(
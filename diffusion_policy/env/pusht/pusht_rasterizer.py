@@ -0,0 +1,119 @@
+from typing import Optional, Sequence, Tuple
+import numpy as np
+import cv2
+
+# pygame.Color names used by PushTEnv, and light_color from pymunk_override
+WALL_COLOR = (211, 211, 211)        # LightGray
+GOAL_COLOR = (144, 238, 144)        # LightGreen
+BLOCK_COLOR = (119, 136, 153)       # LightSlateGray
+BLOCK_FILL_COLOR = (142, 163, 183)  # light_color(LightSlateGray)
+AGENT_COLOR = (65, 105, 225)        # RoyalBlue
+AGENT_FILL_COLOR = (78, 126, 255)   # light_color(RoyalBlue)
+
+# fixed point bits for sub-pixel cv2 drawing
+SHIFT = 4
+
+
+def transform_points(points: np.ndarray, pose: np.ndarray) -> np.ndarray:
+    """
+    points: (...,2) in body frame
+    pose: (3,) x, y, angle, same as pymunk Body.local_to_world
+    """
+    c, s = np.cos(pose[2]), np.sin(pose[2])
+    rot = np.array([[c, -s], [s, c]])
+    return points @ rot.T + pose[:2]
+
+
+class PushTRasterizer:
+    """
+    Pygame-free renderer for PushTEnv rgb_array frames.
+    The background, walls and goal are rasterized once in the constructor.
+    Agent and block are drawn directly at render_size with anti-aliased 
+    cv2 primitives. Output matches PushTEnv._render_frame up to anti-aliasing at edges.
+    """
+    def __init__(self,
+            tee_polygons: Sequence[np.ndarray],
+            goal_pose: np.ndarray,
+            render_size: int=96,
+            window_size: int=512,
+            agent_radius: float=15,
+            walls: Sequence[Tuple[Tuple[float,float],Tuple[float,float]]]=(
+                ((5, 506), (5, 5)), ((5, 5), (506, 5)),
+                ((506, 5), (506, 506)), ((5, 506), (506, 506))),
+            wall_radius: float=2,
+            outline_radius: float=2
+        ):
+        self.tee_polygons = [np.asarray(x, dtype=np.float64) for x in tee_polygons]
+        self.render_size = render_size
+        self.scale = render_size / window_size
+        self.agent_radius = agent_radius
+        # pymunk_override draws polygon outlines and walls as 2*radius wide lines
+        self.outline_thickness = max(1, int(round(2 * outline_radius * self.scale)))
+
+        # static layer, drawn once at window_size and resized like PushTEnv
+        static_img = np.full((window_size, window_size, 3), 255, dtype=np.uint8)
+        for a, b in walls:
+            cv2.line(static_img, tuple(int(round(x)) for x in a), 
+                tuple(int(round(x)) for x in b), color=WALL_COLOR, 
+                thickness=int(round(2 * wall_radius)))
+        goal_polys = [np.round(transform_points(x, goal_pose)).astype(np.int32)
+            for x in self.tee_polygons]
+        for poly in goal_polys:
+            cv2.fillPoly(static_img, [poly], color=GOAL_COLOR)
+        self.static_img = cv2.resize(static_img, (render_size, render_size))
+
+    def _to_pixel(self, points: np.ndarray) -> np.ndarray:
+        # pygame pixel v covers [v, v+1) of window, cv2 pixel centers are integers
+        pixel = ((points + 0.5) * self.scale - 0.5) * (1 << SHIFT)
+        return np.round(pixel).astype(np.int32)
+
+    def _to_pixel_length(self, length: float) -> int:
+        return int(round(length * self.scale * (1 << SHIFT)))
+
+    def draw(self, img: np.ndarray, agent_pos: np.ndarray, block_pose: np.ndarray):
+        """
+        Draw agent and block on img in-place, in pymunk debug_draw order.
+        """
+        # agent
+        center = tuple(self._to_pixel(np.asarray(agent_pos, dtype=np.float64)).tolist())
+        cv2.circle(img, center, self._to_pixel_length(self.agent_radius),
+            color=AGENT_COLOR, thickness=-1, lineType=cv2.LINE_AA, shift=SHIFT)
+        cv2.circle(img, center, self._to_pixel_length(self.agent_radius - 4),
+            color=AGENT_FILL_COLOR, thickness=-1, lineType=cv2.LINE_AA, shift=SHIFT)
+        # block
+        for poly in self.tee_polygons:
+            pts = self._to_pixel(transform_points(poly, block_pose))
+            cv2.fillPoly(img, [pts], color=BLOCK_FILL_COLOR,
+                lineType=cv2.LINE_AA, shift=SHIFT)
+            cv2.polylines(img, [pts], isClosed=True, color=BLOCK_COLOR,
+                thickness=self.outline_thickness, lineType=cv2.LINE_AA, shift=SHIFT)
+        return img
+
+    def render(self, agent_pos: np.ndarray, block_pose: np.ndarray,
+            out: Optional[np.ndarray]=None) -> np.ndarray:
+        """
+        agent_pos: (2,)
+        block_pose: (3,) x, y, angle of block body
+        returns (H,W,3) uint8 RGB
+        """
+        if out is None:
+            out = self.static_img.copy()
+        else:
+            out[:] = self.static_img
+        return self.draw(out, agent_pos, block_pose)
+
+    def render_batch(self, agent_pos: np.ndarray, block_pose: np.ndarray,
+            out: Optional[np.ndarray]=None) -> np.ndarray:
+        """
+        agent_pos: (N,2)
+        block_pose: (N,3)
+        returns (N,H,W,3) uint8 RGB
+        """
+        n = len(agent_pos)
+        assert len(block_pose) == n
+        if out is None:
+            out = np.empty((n,) + self.static_img.shape, dtype=np.uint8)
+        out[:] = self.static_img
+        for i in range(n):
+            self.draw(out[i], agent_pos[i], block_pose[i])
+        return out
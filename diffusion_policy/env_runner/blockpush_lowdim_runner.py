@@ -1,16 +1,16 @@
+from typing import List, Sequence
 import wandb
 import numpy as np
 import torch
 import collections
 import pathlib
-import tqdm
 import dill
-import math
 import wandb.sdk.data_types.video as wv
 from diffusion_policy.env.block_pushing.block_pushing_multimodal import BlockPushMultimodal
 from diffusion_policy.gym_util.async_vector_env import AsyncVectorEnv
 from diffusion_policy.gym_util.sync_vector_env import SyncVectorEnv
 from diffusion_policy.gym_util.multistep_wrapper import MultiStepWrapper
+from diffusion_policy.gym_util.rollout_scheduler import schedule_policies
 from diffusion_policy.gym_util.video_recording_wrapper import VideoRecordingWrapper, VideoRecorder
 from gym.wrappers import FlattenObservation
 
@@ -36,7 +36,8 @@ class BlockPushLowdimRunner(BaseLowdimRunner):
             abs_action=False,
             obs_eef_target=True,
             tqdm_interval_sec=5.0,
-            n_envs=None
+            n_envs=None,
+            work_stealing=True
         ):
         super().__init__(output_dir)
 
@@ -144,88 +145,63 @@ class BlockPushLowdimRunner(BaseLowdimRunner):
         self.past_action = past_action
         self.max_steps = max_steps
         self.tqdm_interval_sec = tqdm_interval_sec
+        self.work_stealing = work_stealing
         self.obs_eef_target = obs_eef_target
 
 
     def run(self, policy: BaseLowdimPolicy):
+        return self.run_policies([policy])[0]
+
+    def run_policies(self, policies: Sequence[BaseLowdimPolicy]) -> List[dict]:
+        """
+        Evaluate several policies (e.g. checkpoints) on the same init
+        conditions. Episodes of all policies share the env workers and
+        inference is batched per policy. Returns one log_data per policy.
+        """
+        all_results = schedule_policies(self.env, self.env_init_fn_dills,
+            policies, self._get_predict_fn,
+            refill=self.work_stealing,
+            desc="Eval BlockPushLowdimRunner",
+            tqdm_interval_sec=self.tqdm_interval_sec)
+        return [self._get_log_data(results) for results in all_results]
+
+    def _get_predict_fn(self, policy: BaseLowdimPolicy):
         device = policy.device
-        dtype = policy.dtype
-        env = self.env
 
-        # plan for rollout
-        n_envs = len(self.env_fns)
-        n_inits = len(self.env_init_fn_dills)
-        n_chunks = math.ceil(n_inits / n_envs)
-
-        # allocate data
-        all_video_paths = [None] * n_inits
-        all_rewards = [None] * n_inits
-        last_info = [None] * n_inits
-
-        for chunk_idx in range(n_chunks):
-            start = chunk_idx * n_envs
-            end = min(n_inits, start + n_envs)
-            this_global_slice = slice(start, end)
-            this_n_active_envs = end - start
-            this_local_slice = slice(0,this_n_active_envs)
-            
-            this_init_fns = self.env_init_fn_dills[this_global_slice]
-            n_diff = n_envs - len(this_init_fns)
-            if n_diff > 0:
-                this_init_fns.extend([self.env_init_fn_dills[0]]*n_diff)
-            assert len(this_init_fns) == n_envs
-
-            # init envs
-            env.call_each('run_dill_function', 
-                args_list=[(x,) for x in this_init_fns])
-
-            # start rollout
-            obs = env.reset()
-            past_action = None
-            policy.reset()
-
-            pbar = tqdm.tqdm(total=self.max_steps, desc=f"Eval BlockPushLowdimRunner {chunk_idx+1}/{n_chunks}", 
-                leave=False, mininterval=self.tqdm_interval_sec)
-            done = False
-            while not done:
-                # create obs dict
-                if not self.obs_eef_target:
-                    obs[...,8:10] = 0
-                np_obs_dict = {
-                    'obs': obs.astype(np.float32)
-                }
-                if self.past_action and (past_action is not None):
-                    # TODO: not tested
-                    np_obs_dict['past_action'] = past_action[
-                        :,-(self.n_obs_steps-1):].astype(np.float32)
-                # device transfer
-                obs_dict = dict_apply(np_obs_dict, 
-                    lambda x: torch.from_numpy(x).to(
-                        device=device))
-
-                # run policy
-                with torch.no_grad():
-                    action_dict = policy.predict_action(obs_dict)
-
-                # device_transfer
-                np_action_dict = dict_apply(action_dict,
-                    lambda x: x.detach().to('cpu').numpy())
-
-                action = np_action_dict['action']
-
-                # step env
-                obs, reward, done, info = env.step(action)
-                done = np.all(done)
-                past_action = action
-
-                # update pbar
-                pbar.update(action.shape[1])
-            pbar.close()
-
-            # collect data for this round
-            all_video_paths[this_global_slice] = env.render()[this_local_slice]
-            all_rewards[this_global_slice] = env.call('get_attr', 'reward')[this_local_slice]
-            last_info[this_global_slice] = [dict((k,v[-1]) for k, v in x.items()) for x in info][this_local_slice]
+        def predict_fn(obs, past_action):
+            # create obs dict
+            if not self.obs_eef_target:
+                obs[...,8:10] = 0
+            np_obs_dict = {
+                'obs': obs.astype(np.float32)
+            }
+            if self.past_action and (past_action is not None):
+                # TODO: not tested
+                np_obs_dict['past_action'] = past_action[
+                    :,-(self.n_obs_steps-1):].astype(np.float32)
+            # device transfer
+            obs_dict = dict_apply(np_obs_dict, 
+                lambda x: torch.from_numpy(x).to(
+                    device=device))
+
+            # run policy
+            with torch.no_grad():
+                action_dict = policy.predict_action(obs_dict)
+
+            # device_transfer
+            np_action_dict = dict_apply(action_dict,
+                lambda x: x.detach().to('cpu').numpy())
+
+            action = np_action_dict['action']
+            return action, action
+
+        return predict_fn
+
+    def _get_log_data(self, results: List[dict]) -> dict:
+        n_inits = len(results)
+        all_video_paths = [x['video_path'] for x in results]
+        all_rewards = [x['reward'] for x in results]
+        last_info = [dict((k,v[-1]) for k, v in x['info'].items()) for x in results]
 
         # log
         total_rewards = collections.defaultdict(list)
@@ -1,17 +1,17 @@
+from typing import List, Sequence
 import os
 import wandb
 import numpy as np
 import torch
 import collections
 import pathlib
-import tqdm
 import h5py
-import math
 import dill
 import wandb.sdk.data_types.video as wv
 from diffusion_policy.gym_util.async_vector_env import AsyncVectorEnv
 from diffusion_policy.gym_util.sync_vector_env import SyncVectorEnv
 from diffusion_policy.gym_util.multistep_wrapper import MultiStepWrapper
+from diffusion_policy.gym_util.rollout_scheduler import schedule_policies
 from diffusion_policy.gym_util.video_recording_wrapper import VideoRecordingWrapper, VideoRecorder
 from diffusion_policy.model.common.rotation_transformer import RotationTransformer
 
@@ -63,7 +63,8 @@ class RobomimicImageRunner(BaseImageRunner):
             past_action=False,
             abs_action=False,
             tqdm_interval_sec=5.0,
-            n_envs=None
+            n_envs=None,
+            work_stealing=True
         ):
         super().__init__(output_dir)
 
@@ -116,7 +117,8 @@ class RobomimicImageRunner(BaseImageRunner):
                 ),
                 n_obs_steps=n_obs_steps,
                 n_action_steps=n_action_steps,
-                max_episode_steps=max_steps
+                max_episode_steps=max_steps,
+                ring_buffer=True
             )
         
         # For each process the OpenGL context can only be initialized once
@@ -150,7 +152,8 @@ class RobomimicImageRunner(BaseImageRunner):
                 ),
                 n_obs_steps=n_obs_steps,
                 n_action_steps=n_action_steps,
-                max_episode_steps=max_steps
+                max_episode_steps=max_steps,
+                ring_buffer=True
             )
 
         env_fns = [env_fn] * n_envs
@@ -215,7 +218,8 @@ class RobomimicImageRunner(BaseImageRunner):
             env_prefixs.append('test/')
             env_init_fn_dills.append(dill.dumps(init_fn))
 
-        env = AsyncVectorEnv(env_fns, dummy_env_fn=dummy_env_fn)
+        env = AsyncVectorEnv(env_fns, dummy_env_fn=dummy_env_fn,
+            shm_transport=True, shm_transport_info=False)
         # env = SyncVectorEnv(env_fns)
 
 
@@ -234,92 +238,67 @@ class RobomimicImageRunner(BaseImageRunner):
         self.rotation_transformer = rotation_transformer
         self.abs_action = abs_action
         self.tqdm_interval_sec = tqdm_interval_sec
+        self.work_stealing = work_stealing
 
     def run(self, policy: BaseImagePolicy):
+        return self.run_policies([policy])[0]
+
+    def run_policies(self, policies: Sequence[BaseImagePolicy]) -> List[dict]:
+        """
+        Evaluate several policies (e.g. checkpoints) on the same init
+        conditions. Episodes of all policies share the env workers and
+        inference is batched per policy. Returns one log_data per policy.
+        """
+        env_name = self.env_meta['env_name']
+        all_results = schedule_policies(self.env, self.env_init_fn_dills,
+            policies, self._get_predict_fn,
+            refill=self.work_stealing,
+            desc=f"Eval {env_name}Image",
+            tqdm_interval_sec=self.tqdm_interval_sec)
+        # clear out video buffer
+        _ = self.env.reset()
+        return [self._get_log_data(results) for results in all_results]
+
+    def _get_predict_fn(self, policy: BaseImagePolicy):
         device = policy.device
-        dtype = policy.dtype
-        env = self.env
-        
-        # plan for rollout
-        n_envs = len(self.env_fns)
-        n_inits = len(self.env_init_fn_dills)
-        n_chunks = math.ceil(n_inits / n_envs)
-
-        # allocate data
-        all_video_paths = [None] * n_inits
-        all_rewards = [None] * n_inits
-
-        for chunk_idx in range(n_chunks):
-            start = chunk_idx * n_envs
-            end = min(n_inits, start + n_envs)
-            this_global_slice = slice(start, end)
-            this_n_active_envs = end - start
-            this_local_slice = slice(0,this_n_active_envs)
+
+        def predict_fn(obs, past_action):
+            # create obs dict
+            np_obs_dict = dict(obs)
+            if self.past_action and (past_action is not None):
+                # TODO: not tested
+                np_obs_dict['past_action'] = past_action[
+                    :,-(self.n_obs_steps-1):].astype(np.float32)
             
-            this_init_fns = self.env_init_fn_dills[this_global_slice]
-            n_diff = n_envs - len(this_init_fns)
-            if n_diff > 0:
-                this_init_fns.extend([self.env_init_fn_dills[0]]*n_diff)
-            assert len(this_init_fns) == n_envs
-
-            # init envs
-            env.call_each('run_dill_function', 
-                args_list=[(x,) for x in this_init_fns])
-
-            # start rollout
-            obs = env.reset()
-            past_action = None
-            policy.reset()
-
-            env_name = self.env_meta['env_name']
-            pbar = tqdm.tqdm(total=self.max_steps, desc=f"Eval {env_name}Image {chunk_idx+1}/{n_chunks}", 
-                leave=False, mininterval=self.tqdm_interval_sec)
+            # device transfer
+            obs_dict = dict_apply(np_obs_dict, 
+                lambda x: torch.from_numpy(x).to(
+                    device=device))
+
+            # run policy
+            with torch.no_grad():
+                action_dict = policy.predict_action(obs_dict)
+
+            # device_transfer
+            np_action_dict = dict_apply(action_dict,
+                lambda x: x.detach().to('cpu').numpy())
+
+            action = np_action_dict['action']
+            if not np.all(np.isfinite(action)):
+                print(action)
+                raise RuntimeError("Nan or Inf action")
             
-            done = False
-            while not done:
-                # create obs dict
-                np_obs_dict = dict(obs)
-                if self.past_action and (past_action is not None):
-                    # TODO: not tested
-                    np_obs_dict['past_action'] = past_action[
-                        :,-(self.n_obs_steps-1):].astype(np.float32)
-                
-                # device transfer
-                obs_dict = dict_apply(np_obs_dict, 
-                    lambda x: torch.from_numpy(x).to(
-                        device=device))
-
-                # run policy
-                with torch.no_grad():
-                    action_dict = policy.predict_action(obs_dict)
-
-                # device_transfer
-                np_action_dict = dict_apply(action_dict,
-                    lambda x: x.detach().to('cpu').numpy())
-
-                action = np_action_dict['action']
-                if not np.all(np.isfinite(action)):
-                    print(action)
-                    raise RuntimeError("Nan or Inf action")
-                
-                # step env
-                env_action = action
-                if self.abs_action:
-                    env_action = self.undo_transform_action(action)
-
-                obs, reward, done, info = env.step(env_action)
-                done = np.all(done)
-                past_action = action
-
-                # update pbar
-                pbar.update(action.shape[1])
-            pbar.close()
-
-            # collect data for this round
-            all_video_paths[this_global_slice] = env.render()[this_local_slice]
-            all_rewards[this_global_slice] = env.call('get_attr', 'reward')[this_local_slice]
-        # clear out video buffer
-        _ = env.reset()
+            env_action = action
+            if self.abs_action:
+                env_action = self.undo_transform_action(action)
+            return action, env_action
+
+        return predict_fn
+
+    def _get_log_data(self, results: List[dict]) -> dict:
+        n_inits = len(results)
+        all_video_paths = [x['video_path'] for x in results]
+        all_rewards = [x['reward'] for x in results]
         
         # log
         max_rewards = collections.defaultdict(list)
@@ -2,6 +2,7 @@
 Back ported methods: call, set_attr from v0.26
 Disabled auto-reset after done
 Added render method.
+Added shared memory transport for step/reset.
 """
 
 
@@ -11,6 +12,7 @@ import time
 import sys
 from enum import Enum
 from copy import deepcopy
+from multiprocessing.managers import SharedMemoryManager
 
 from gym import logger
 from gym.vector.vector_env import VectorEnv
@@ -29,6 +31,8 @@ from gym.vector.utils import (
     CloudpickleWrapper,
     clear_mpi_env_vars,
 )
+from diffusion_policy.gym_util.shared_memory_transport import (
+    SharedMemoryTransport, CMD_PIPE, CMD_STEP, CMD_RESET)
 
 __all__ = ["AsyncVectorEnv"]
 
@@ -75,6 +79,14 @@ class AsyncVectorEnv(VectorEnv):
         degree of flexibility and a high chance to shoot yourself in the foot; thus,
         if you are writing your own worker, it is recommended to start from the code
         for `_worker` (or `_worker_shared_memory`) method below, and add changes
+    shm_transport : bool (default: `False`)
+        If `True`, actions, observations, rewards and dones of step/reset are
+        exchanged through preallocated shared arrays and a semaphore doorbell
+        per worker instead of pickled pipe messages. Requires a `Box` action
+        space and a `Box` or flat `Dict` of `Box` observation space.
+    shm_transport_info : bool (default: `True`)
+        If `False` with `shm_transport`, step infos are not sent back and
+        `step` returns empty info dicts.
     """
 
     def __init__(
@@ -88,6 +100,8 @@ class AsyncVectorEnv(VectorEnv):
         context=None,
         daemon=True,
         worker=None,
+        shm_transport=False,
+        shm_transport_info=True
     ):
         ctx = mp.get_context(context)
         self.env_fns = env_fns
@@ -113,7 +127,21 @@ class AsyncVectorEnv(VectorEnv):
             action_space=action_space,
         )
 
-        if self.shared_memory:
+        self.shm_manager = None
+        self.transport = None
+        if shm_transport:
+            self.shm_manager = SharedMemoryManager()
+            self.shm_manager.start()
+            self.transport = SharedMemoryTransport(
+                shm_manager=self.shm_manager,
+                observation_space=self.single_observation_space,
+                action_space=self.single_action_space,
+                n=self.num_envs,
+                send_info=shm_transport_info,
+                ctx=ctx)
+            _obs_buffer = self.transport
+            self.observations = self.transport.get_observations()
+        elif self.shared_memory:
             try:
                 _obs_buffer = create_shared_memory(
                     self.single_observation_space, n=self.num_envs, ctx=ctx
@@ -139,6 +167,8 @@ class AsyncVectorEnv(VectorEnv):
         self.parent_pipes, self.processes = [], []
         self.error_queue = ctx.Queue()
         target = _worker_shared_memory if self.shared_memory else _worker
+        if shm_transport:
+            target = _worker_shm_transport
         target = worker or target
         with clear_mpi_env_vars():
             for idx, env_fn in enumerate(self.env_fns):
@@ -181,8 +211,8 @@ class AsyncVectorEnv(VectorEnv):
                 self._state.value,
             )
 
-        for pipe, seed in zip(self.parent_pipes, seeds):
-            pipe.send(("seed", seed))
+        for i, seed in enumerate(seeds):
+            self._send(i, "seed", seed)
         _, successes = zip(*[pipe.recv() for pipe in self.parent_pipes])
         self._raise_if_errors(successes)
 
@@ -195,8 +225,8 @@ class AsyncVectorEnv(VectorEnv):
                 self._state.value,
             )
 
-        for pipe in self.parent_pipes:
-            pipe.send(("reset", None))
+        for i in range(self.num_envs):
+            self._send(i, "reset", None)
         self._state = AsyncState.WAITING_RESET
 
     def reset_wait(self, timeout=None):
@@ -218,6 +248,10 @@ class AsyncVectorEnv(VectorEnv):
                 AsyncState.WAITING_RESET.value,
             )
 
+        if self.transport is not None:
+            self._recv_each(list(range(self.num_envs)), timeout=timeout)
+            return deepcopy(self.observations) if self.copy else self.observations
+
         if not self._poll(timeout):
             self._state = AsyncState.DEFAULT
             raise mp.TimeoutError(
@@ -251,8 +285,8 @@ class AsyncVectorEnv(VectorEnv):
                 self._state.value,
             )
 
-        for pipe, action in zip(self.parent_pipes, actions):
-            pipe.send(("step", action))
+        for i, action in enumerate(actions):
+            self._send(i, "step", action)
         self._state = AsyncState.WAITING_STEP
 
     def step_wait(self, timeout=None):
@@ -280,6 +314,15 @@ class AsyncVectorEnv(VectorEnv):
                 AsyncState.WAITING_STEP.value,
             )
 
+        if self.transport is not None:
+            infos = self._recv_each(list(range(self.num_envs)), timeout=timeout)
+            return (
+                deepcopy(self.observations) if self.copy else self.observations,
+                self.transport.reward_array.get().copy(),
+                self.transport.done_array.get().copy(),
+                infos,
+            )
+
         if not self._poll(timeout):
             self._state = AsyncState.DEFAULT
             raise mp.TimeoutError(
@@ -333,9 +376,9 @@ class AsyncVectorEnv(VectorEnv):
                 if process.is_alive():
                     process.terminate()
         else:
-            for pipe in self.parent_pipes:
+            for i, pipe in enumerate(self.parent_pipes):
                 if (pipe is not None) and (not pipe.closed):
-                    pipe.send(("close", None))
+                    self._send(i, "close", None)
             for pipe in self.parent_pipes:
                 if (pipe is not None) and (not pipe.closed):
                     pipe.recv()
@@ -345,14 +388,33 @@ class AsyncVectorEnv(VectorEnv):
                 pipe.close()
         for process in self.processes:
             process.join()
+        if self.shm_manager is not None:
+            self.shm_manager.shutdown()
+
+    def _send(self, index, command, data):
+        """
+        Send command to worker index. With shm_transport, step and reset
+        only ring the doorbell, other commands still go through the pipe.
+        """
+        if self.transport is None:
+            self.parent_pipes[index].send((command, data))
+        elif command == "step":
+            self.transport.request(index, CMD_STEP, data)
+        elif command == "reset":
+            self.transport.request(index, CMD_RESET)
+        else:
+            self.parent_pipes[index].send((command, data))
+            self.transport.request(index, CMD_PIPE)
 
-    def _poll(self, timeout=None):
+    def _poll(self, timeout=None, pipes=None):
         self._assert_is_running()
         if timeout is None:
             return True
+        if pipes is None:
+            pipes = self.parent_pipes
         end_time = time.perf_counter() + timeout
         delta = None
-        for pipe in self.parent_pipes:
+        for pipe in pipes:
             delta = max(end_time - time.perf_counter(), 0)
             if pipe is None:
                 return False
@@ -362,8 +424,8 @@ class AsyncVectorEnv(VectorEnv):
 
     def _check_observation_spaces(self):
         self._assert_is_running()
-        for pipe in self.parent_pipes:
-            pipe.send(("_check_observation_space", self.single_observation_space))
+        for i in range(self.num_envs):
+            self._send(i, "_check_observation_space", self.single_observation_space)
         same_spaces, successes = zip(*[pipe.recv() for pipe in self.parent_pipes])
         self._raise_if_errors(successes)
         if not all(same_spaces):
@@ -385,7 +447,7 @@ class AsyncVectorEnv(VectorEnv):
         if all(successes):
             return
 
-        num_errors = self.num_envs - sum(successes)
+        num_errors = len(successes) - sum(successes)
         assert num_errors > 0
         for _ in range(num_errors):
             index, exctype, value = self.error_queue.get()
@@ -420,8 +482,8 @@ class AsyncVectorEnv(VectorEnv):
                 self._state.value,
             )
 
-        for pipe in self.parent_pipes:
-            pipe.send(("_call", (name, args, kwargs)))
+        for i in range(self.num_envs):
+            self._send(i, "_call", (name, args, kwargs))
         self._state = AsyncState.WAITING_CALL
 
     def call_wait(self, timeout = None) -> list:
@@ -475,8 +537,16 @@ class AsyncVectorEnv(VectorEnv):
     def call_each(self, name: str, 
             args_list: list=None, 
             kwargs_list: list=None, 
-            timeout = None):
-        n_envs = len(self.parent_pipes)
+            timeout = None,
+            env_idxs: list=None):
+        """
+        Calls the method with name on each env with its own args and kwargs.
+        If env_idxs is given, only these envs are called and args_list,
+        kwargs_list and the results are in the same order as env_idxs.
+        """
+        if env_idxs is None:
+            env_idxs = list(range(len(self.parent_pipes)))
+        n_envs = len(env_idxs)
         if args_list is None:
             args_list = [[]] * n_envs
         assert len(args_list) == n_envs
@@ -485,38 +555,107 @@ class AsyncVectorEnv(VectorEnv):
             kwargs_list = [dict()] * n_envs
         assert len(kwargs_list) == n_envs
 
-        # send
+        self._send_each(
+            [("_call", (name, args_list[i], kwargs_list[i])) for i in range(n_envs)],
+            env_idxs=env_idxs, state=AsyncState.WAITING_CALL)
+        return self._recv_each(env_idxs, timeout=timeout)
+
+    def reset_each(self, env_idxs: list, timeout=None):
+        """
+        Resets only envs in env_idxs, the rest are left untouched.
+        Returns the batched observations of env_idxs.
+        """
+        self._send_each([("reset", None)] * len(env_idxs), 
+            env_idxs=env_idxs, state=AsyncState.WAITING_RESET)
+        results = self._recv_each(env_idxs, timeout=timeout)
+        return self._get_observations_each(results, env_idxs)
+
+    def step_each(self, actions, env_idxs: list, timeout=None):
+        """
+        Steps only envs in env_idxs with actions[i] for env_idxs[i],
+        the rest are left untouched.
+        Returns observations, rewards, dones, infos of env_idxs.
+        """
+        assert len(actions) == len(env_idxs)
+        self._send_each([("step", x) for x in actions], 
+            env_idxs=env_idxs, state=AsyncState.WAITING_STEP)
+        results = self._recv_each(env_idxs, timeout=timeout)
+        if self.transport is not None:
+            return (
+                _take_each(self.observations, env_idxs),
+                self.transport.reward_array.get()[env_idxs],
+                self.transport.done_array.get()[env_idxs],
+                results,
+            )
+        observations_list, rewards, dones, infos = zip(*results)
+        return (
+            self._get_observations_each(observations_list, env_idxs),
+            np.array(rewards),
+            np.array(dones, dtype=np.bool_),
+            infos,
+        )
+
+    def _send_each(self, commands, env_idxs, state):
         self._assert_is_running()
         if self._state != AsyncState.DEFAULT:
             raise AlreadyPendingCallError(
-                "Calling `call_async` while waiting "
+                f"Calling `{state.value}` on a subset of envs while waiting "
                 f"for a pending call to `{self._state.value}` to complete.",
                 self._state.value,
             )
 
-        for i, pipe in enumerate(self.parent_pipes):
-            pipe.send(("_call", (name, args_list[i], kwargs_list[i])))
-        self._state = AsyncState.WAITING_CALL
+        for i, (command, data) in zip(env_idxs, commands):
+            self._send(i, command, data)
+        self._state = state
 
-        # receive
-        self._assert_is_running()
-        if self._state != AsyncState.WAITING_CALL:
-            raise NoAsyncCallError(
-                "Calling `call_wait` without any prior call to `call_async`.",
-                AsyncState.WAITING_CALL.value,
+    def _recv_each(self, env_idxs, timeout=None):
+        """
+        Returns results of env_idxs for the pending call. For step/reset
+        with shm_transport, results are the infos and the rest is read
+        from shared memory.
+        """
+        if (self.transport is not None) and (self._state in (
+                AsyncState.WAITING_RESET, AsyncState.WAITING_STEP)):
+            return self._recv_shm(env_idxs, timeout=timeout)
+
+        pipes = [self.parent_pipes[i] for i in env_idxs]
+        if not self._poll(timeout, pipes=pipes):
+            state = self._state
+            self._state = AsyncState.DEFAULT
+            raise mp.TimeoutError(
+                f"The call to `{state.value}` has timed out after {timeout} second(s)."
             )
 
-        if not self._poll(timeout):
+        results, successes = zip(*[pipe.recv() for pipe in pipes])
+        self._raise_if_errors(successes)
+        self._state = AsyncState.DEFAULT
+        return results
+
+    def _recv_shm(self, env_idxs, timeout=None):
+        self._assert_is_running()
+        if not self.transport.wait_responses(env_idxs, timeout=timeout):
+            state = self._state
             self._state = AsyncState.DEFAULT
             raise mp.TimeoutError(
-                f"The call to `call_wait` has timed out after {timeout} second(s)."
+                f"The call to `{state.value}` has timed out after {timeout} second(s)."
             )
 
-        results, successes = zip(*[pipe.recv() for pipe in self.parent_pipes])
+        successes = self.transport.success_array.get()[env_idxs].tolist()
         self._raise_if_errors(successes)
         self._state = AsyncState.DEFAULT
+        has_info = self.transport.has_info_array.get()
+        return tuple(self.parent_pipes[i].recv() if has_info[i] else dict()
+            for i in env_idxs)
 
-        return results
+    def _get_observations_each(self, results, env_idxs):
+        if self.shared_memory or (self.transport is not None):
+            observations = _take_each(self.observations, env_idxs)
+        else:
+            observations = concatenate(results, 
+                create_empty_array(self.single_observation_space, 
+                    n=len(env_idxs), fn=np.zeros), 
+                self.single_observation_space)
+        return observations
 
 
     def set_attr(self, name: str, values):
@@ -549,8 +688,8 @@ class AsyncVectorEnv(VectorEnv):
                 self._state.value,
             )
 
-        for pipe, value in zip(self.parent_pipes, values):
-            pipe.send(("_setattr", (name, value)))
+        for i, value in enumerate(values):
+            self._send(i, "_setattr", (name, value))
         _, successes = zip(*[pipe.recv() for pipe in self.parent_pipes])
         self._raise_if_errors(successes)
 
@@ -558,6 +697,20 @@ class AsyncVectorEnv(VectorEnv):
         return self.call('render', *args, **kwargs)
 
 
+def _take_each(observations, env_idxs):
+    """
+    Copy rows env_idxs out of (possibly nested dict/tuple) batched observations.
+    """
+    if isinstance(observations, np.ndarray):
+        return observations[env_idxs]
+    elif isinstance(observations, dict):
+        return type(observations)(
+            [(key, _take_each(value, env_idxs)) for key, value in observations.items()])
+    elif isinstance(observations, tuple):
+        return tuple(_take_each(value, env_idxs) for value in observations)
+    else:
+        raise RuntimeError(f'Unsupported observation type {type(observations)}')
+
 
 def _worker(index, env_fn, pipe, parent_pipe, shared_memory, error_queue):
     assert shared_memory is None
@@ -668,4 +821,71 @@ def _worker_shared_memory(index, env_fn, pipe, parent_pipe, shared_memory, error
         error_queue.put((index,) + sys.exc_info()[:2])
         pipe.send((None, False))
     finally:
-        env.close()
\ No newline at end of file
+        env.close()
+
+
+def _worker_shm_transport(index, env_fn, pipe, parent_pipe, transport, error_queue):
+    assert transport is not None
+    env = env_fn()
+    observation_space = env.observation_space
+    parent_pipe.close()
+    command = None
+    try:
+        while True:
+            command = transport.wait_request(index)
+            if command == CMD_RESET:
+                observation = env.reset()
+                transport.write_observation(index, observation)
+                transport.respond(index)
+            elif command == CMD_STEP:
+                observation, reward, done, info = env.step(
+                    transport.get_action(index))
+                transport.write_observation(index, observation)
+                has_info = transport.send_info and (len(info) > 0)
+                transport.respond(index, 
+                    reward=reward, done=done, has_info=has_info)
+                if has_info:
+                    # parent reads infos after all responses arrived
+                    pipe.send(info)
+            elif command == CMD_PIPE:
+                name, data = pipe.recv()
+                if name == "seed":
+                    env.seed(data)
+                    pipe.send((None, True))
+                elif name == "close":
+                    pipe.send((None, True))
+                    break
+                elif name == "_call":
+                    name, args, kwargs = data
+                    if name in ["reset", "step", "seed", "close"]:
+                        raise ValueError(
+                            f"Trying to call function `{name}` with "
+                            f"`_call`. Use `{name}` directly instead."
+                        )
+                    function = getattr(env, name)
+                    if callable(function):
+                        pipe.send((function(*args, **kwargs), True))
+                    else:
+                        pipe.send((function, True))
+                elif name == "_setattr":
+                    name, value = data
+                    setattr(env, name, value)
+                    pipe.send((None, True))
+                elif name == "_check_observation_space":
+                    pipe.send((data == observation_space, True))
+                else:
+                    raise RuntimeError(
+                        "Received unknown command `{0}`. Must "
+                        "be one of {{`seed`, `close`, `_call`, `_setattr`, "
+                        "`_check_observation_space`}}.".format(name)
+                    )
+            else:
+                raise RuntimeError(f"Received unknown doorbell command `{command}`.")
+    except (KeyboardInterrupt, Exception):
+        error_queue.put((index,) + sys.exc_info()[:2])
+        if command == CMD_PIPE:
+            pipe.send((None, False))
+        else:
+            transport.respond(index, success=False)
+    finally:
+        env.close()
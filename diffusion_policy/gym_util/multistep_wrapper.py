@@ -64,14 +64,111 @@ def stack_last_n_obs(all_obs, n_steps):
     return result
 
 
+class RingHistory:
+    """
+    Keeps the last `capacity` values of a fixed shape/dtype stream in a
+    preallocated array. Every value is written twice, at i and i+capacity,
+    so the last n values are always a contiguous slice: append is O(1)
+    and last_n returns an ordered view without copying.
+    Storage is allocated on the first append/fill.
+    """
+    def __init__(self, capacity):
+        assert capacity > 0
+        self.capacity = capacity
+        self.buffer = None
+        self.count = 0
+    
+    def _alloc(self, value):
+        value = np.asarray(value)
+        if (self.buffer is None) or (self.buffer.shape[1:] != value.shape) \
+                or (self.buffer.dtype != value.dtype):
+            self.buffer = np.empty((2 * self.capacity,) + value.shape, 
+                dtype=value.dtype)
+        return value
+
+    def fill(self, value):
+        """
+        Reset history to `capacity` copies of value, i.e. padded with value.
+        """
+        value = self._alloc(value)
+        self.buffer[:] = value
+        self.count = 1
+    
+    def clear(self):
+        self.count = 0
+
+    def append(self, value):
+        if self.count == 0:
+            value = self._alloc(value)
+        idx = self.count % self.capacity
+        self.buffer[idx] = value
+        self.buffer[idx + self.capacity] = value
+        self.count += 1
+    
+    def last_n(self, n):
+        """
+        Ordered view of the last min(n, len(self)) values.
+        The view is overwritten by subsequent appends.
+        """
+        n = min(n, len(self))
+        end = (self.count - 1) % self.capacity + self.capacity + 1
+        return self.buffer[end-n:end]
+    
+    def padded_last_n(self, n):
+        """
+        Ordered view of the last n values, including padding from fill.
+        """
+        assert n <= self.capacity
+        end = (self.count - 1) % self.capacity + self.capacity + 1
+        return self.buffer[end-n:end]
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+
+class GrowableArray:
+    """
+    Append-only typed array with amortized O(1) append.
+    `data` is a view of the valid entries.
+    """
+    def __init__(self, dtype, capacity=16):
+        self.buffer = np.empty(max(capacity, 1), dtype=dtype)
+        self.size = 0
+    
+    def clear(self):
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self.buffer):
+            buffer = np.empty(2 * len(self.buffer), dtype=self.buffer.dtype)
+            buffer[:self.size] = self.buffer
+            self.buffer = buffer
+        self.buffer[self.size] = value
+        self.size += 1
+    
+    @property
+    def data(self):
+        return self.buffer[:self.size]
+
+
 class MultiStepWrapper(gym.Wrapper):
     def __init__(self, 
             env, 
             n_obs_steps, 
             n_action_steps, 
             max_episode_steps=None,
-            reward_agg_method='max'
+            reward_agg_method='max',
+            ring_buffer=False
         ):
+        """
+        ring_buffer: keep observation and info history in preallocated
+            RingHistory arrays and rewards/dones in typed arrays, instead of
+            deques and lists. Returned observations are then views into the
+            history that are only valid until the next step/reset, and
+            self.reward/self.done are numpy arrays instead of lists.
+            Rewards, dones and infos of an episode are never overwritten
+            by later episodes, since reset allocates new arrays for them.
+        """
         super().__init__(env)
         self._action_space = repeated_space(env.action_space, n_action_steps)
         self._observation_space = repeated_space(env.observation_space, n_obs_steps)
@@ -79,20 +176,39 @@ class MultiStepWrapper(gym.Wrapper):
         self.n_obs_steps = n_obs_steps
         self.n_action_steps = n_action_steps
         self.reward_agg_method = reward_agg_method
+        self.ring_buffer = ring_buffer
 
-        self.obs = deque(maxlen=n_obs_steps+1)
-        self.reward = list()
-        self.done = list()
-        self.info = defaultdict(lambda : deque(maxlen=n_obs_steps+1))
+        if ring_buffer:
+            if isinstance(self.observation_space, spaces.Dict):
+                self.obs = dict([(key, RingHistory(n_obs_steps)) 
+                    for key in self.observation_space.keys()])
+            else:
+                self.obs = RingHistory(n_obs_steps)
+            self._reset_episode_arrays()
+        else:
+            self.obs = deque(maxlen=n_obs_steps+1)
+            self.reward = list()
+            self.done = list()
+            self.info = defaultdict(lambda : deque(maxlen=n_obs_steps+1))
     
     def reset(self):
         """Resets the environment using kwargs."""
         obs = super().reset()
 
-        self.obs = deque([obs], maxlen=self.n_obs_steps+1)
-        self.reward = list()
-        self.done = list()
-        self.info = defaultdict(lambda : deque(maxlen=self.n_obs_steps+1))
+        if self.ring_buffer:
+            if isinstance(self.obs, dict):
+                for key, history in self.obs.items():
+                    history.fill(obs[key])
+            else:
+                self.obs.fill(obs)
+            # new arrays instead of clearing, previous episode's
+            # reward/done/info may still be referenced (e.g. SyncVectorEnv)
+            self._reset_episode_arrays()
+        else:
+            self.obs = deque([obs], maxlen=self.n_obs_steps+1)
+            self.reward = list()
+            self.done = list()
+            self.info = defaultdict(lambda : deque(maxlen=self.n_obs_steps+1))
 
         obs = self._get_obs(self.n_obs_steps)
         return obs
@@ -108,25 +224,43 @@ class MultiStepWrapper(gym.Wrapper):
                 break
             observation, reward, done, info = super().step(act)
 
-            self.obs.append(observation)
-            self.reward.append(reward)
+            self._add_obs(observation)
+            self._add_reward(reward)
             if (self.max_episode_steps is not None) \
                 and (len(self.reward) >= self.max_episode_steps):
                 # truncation
                 done = True
-            self.done.append(done)
+            self._add_done(done)
             self._add_info(info)
 
         observation = self._get_obs(self.n_obs_steps)
         reward = aggregate(self.reward, self.reward_agg_method)
         done = aggregate(self.done, 'max')
-        info = dict_take_last_n(self.info, self.n_obs_steps)
+        if self.ring_buffer:
+            info = dict([(key, value.last_n(self.n_obs_steps).copy()) 
+                for key, value in self.info.items() if len(value) > 0])
+        else:
+            info = dict_take_last_n(self.info, self.n_obs_steps)
         return observation, reward, done, info
 
+    def _reset_episode_arrays(self):
+        capacity = self.max_episode_steps if self.max_episode_steps is not None else 256
+        self._reward = GrowableArray(np.float64, capacity=capacity)
+        self._done = GrowableArray(bool, capacity=capacity)
+        self.reward = self._reward.data
+        self.done = self._done.data
+        self.info = defaultdict(lambda : RingHistory(self.n_obs_steps+1))
+
     def _get_obs(self, n_steps=1):
         """
         Output (n_steps,) + obs_shape
         """
+        if self.ring_buffer:
+            if isinstance(self.obs, dict):
+                return dict([(key, value.padded_last_n(n_steps))
+                    for key, value in self.obs.items()])
+            return self.obs.padded_last_n(n_steps)
+
         assert(len(self.obs) > 0)
         if isinstance(self.observation_space, spaces.Box):
             return stack_last_n_obs(self.obs, n_steps)
@@ -141,6 +275,27 @@ class MultiStepWrapper(gym.Wrapper):
         else:
             raise RuntimeError('Unsupported space type')
 
+    def _add_obs(self, obs):
+        if self.ring_buffer and isinstance(self.obs, dict):
+            for key, history in self.obs.items():
+                history.append(obs[key])
+        else:
+            self.obs.append(obs)
+
+    def _add_reward(self, reward):
+        if self.ring_buffer:
+            self._reward.append(reward)
+            self.reward = self._reward.data
+        else:
+            self.reward.append(reward)
+
+    def _add_done(self, done):
+        if self.ring_buffer:
+            self._done.append(done)
+            self.done = self._done.data
+        else:
+            self.done.append(done)
+
     def _add_info(self, info):
         for key, value in info.items():
             self.info[key].append(value)
@@ -158,5 +313,7 @@ class MultiStepWrapper(gym.Wrapper):
     def get_infos(self):
         result = dict()
         for k, v in self.info.items():
+            if self.ring_buffer:
+                v = v.last_n(v.capacity).copy()
             result[k] = list(v)
         return result
@@ -0,0 +1,224 @@
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+import numpy as np
+import tqdm
+from gym.vector.utils import create_empty_array
+from diffusion_policy.policy.base_image_policy import BaseImagePolicy
+from diffusion_policy.policy.base_lowdim_policy import BaseLowdimPolicy
+
+
+PredictFn = Callable[[dict, Optional[np.ndarray]], Tuple[np.ndarray, np.ndarray]]
+
+
+def policy_has_state(policy) -> bool:
+    """
+    Policies that override reset() keep state across predict_action
+    calls (e.g. RNN hidden state), which is tied to the batch layout.
+    """
+    return type(policy).reset not in (BaseImagePolicy.reset, BaseLowdimPolicy.reset)
+
+
+def take_each(x, idxs):
+    if isinstance(x, np.ndarray):
+        return x[idxs]
+    elif isinstance(x, dict):
+        return type(x)([(key, take_each(value, idxs)) for key, value in x.items()])
+    else:
+        raise RuntimeError(f'Unsupported type {type(x)}')
+
+
+def put_each(x, idxs, value):
+    if isinstance(x, np.ndarray):
+        x[idxs] = value
+    elif isinstance(x, dict):
+        for key in x.keys():
+            put_each(x[key], idxs, value[key])
+    else:
+        raise RuntimeError(f'Unsupported type {type(x)}')
+
+
+class RolloutScheduler:
+    """
+    Runs one episode for each init function on a fixed pool of env slots
+    of an AsyncVectorEnv/SyncVectorEnv (with MultiStepWrapper envs).
+
+    refill=True: as soon as an episode is done, its slot is initialized with
+    the next pending init function and reset. Policy inference is batched
+    over the active slots only, so wall time scales with total number of
+    env steps instead of n_chunks * longest episode.
+    refill=False: chunked rollout, all slots are reset together and the
+    next chunk starts after every episode in the chunk is done. Inference
+    always uses the full batch of slots, which stateful policies need.
+
+    groups: optional group (e.g. policy) index of each init function.
+    Episodes of all groups share the env slots, and inference is batched
+    per group with the group's own predict_fn.
+    """
+    def __init__(self, env, init_fn_dills: Sequence[bytes], refill: bool=True,
+            groups: Optional[Sequence[int]]=None):
+        self.env = env
+        self.init_fn_dills = list(init_fn_dills)
+        self.refill = refill
+        if groups is None:
+            groups = np.zeros(len(self.init_fn_dills), dtype=np.int64)
+        self.groups = np.asarray(groups, dtype=np.int64)
+        assert len(self.groups) == len(self.init_fn_dills)
+
+    def run(self,
+            predict_fn: Union[PredictFn, Sequence[PredictFn]],
+            reset_fn: Optional[Union[Callable[[], None], Sequence[Callable[[], None]]]]=None,
+            desc: str='Eval',
+            tqdm_interval_sec: float=5.0
+        ) -> List[dict]:
+        """
+        predict_fn(obs, past_action) -> (action, env_action)
+            obs: batched observation of the slots being inferred
+            past_action: previous action of these slots, None if
+                any of them just started an episode
+            action is stored as past_action, env_action is sent to env.step
+            With groups, a list with one predict_fn per group.
+        reset_fn: called before every batch of episodes starts,
+            typically policy.reset. Only called once when refill=True.
+            With groups, a list with one reset_fn per group.
+
+        Returns a list with one dict(video_path, reward, info) per init
+        function, in the original order. reward is the list of rewards of
+        the episode and info is the info of the last step.
+        """
+        env = self.env
+        n_envs = env.num_envs
+        n_inits = len(self.init_fn_dills)
+        n_groups = int(self.groups.max()) + 1 if n_inits > 0 else 1
+        predict_fns = predict_fn if isinstance(predict_fn, Sequence) \
+            else [predict_fn] * n_groups
+        reset_fns = reset_fn if isinstance(reset_fn, Sequence) \
+            else [reset_fn] * n_groups
+        assert len(predict_fns) == n_groups
+        assert len(reset_fns) == n_groups
+
+        def reset_groups():
+            for fn in reset_fns:
+                if fn is not None:
+                    fn()
+
+        results = [None] * n_inits
+        # init idx running in each slot, -1 for idle
+        slot_inits = np.full(n_envs, -1, dtype=np.int64)
+        # group of the last init started in each slot
+        slot_groups = np.zeros(n_envs, dtype=np.int64)
+        obs_buffer = create_empty_array(
+            env.single_observation_space, n=n_envs, fn=np.zeros)
+        past_actions = [None] * n_groups
+        has_past_action = np.zeros(n_envs, dtype=bool)
+        next_init = 0
+
+        def start_slots(slot_idxs):
+            nonlocal next_init
+            slot_idxs = list(slot_idxs[:n_inits - next_init])
+            if len(slot_idxs) == 0:
+                return
+            init_idxs = np.arange(next_init, next_init + len(slot_idxs))
+            next_init += len(slot_idxs)
+            env.call_each('run_dill_function',
+                args_list=[(self.init_fn_dills[i],) for i in init_idxs],
+                env_idxs=slot_idxs)
+            obs = env.reset_each(slot_idxs)
+            put_each(obs_buffer, slot_idxs, obs)
+            slot_inits[slot_idxs] = init_idxs
+            slot_groups[slot_idxs] = self.groups[init_idxs]
+            has_past_action[slot_idxs] = False
+
+        reset_groups()
+        start_slots(np.arange(n_envs))
+
+        pbar = tqdm.tqdm(total=n_inits, desc=desc,
+            leave=False, mininterval=tqdm_interval_sec)
+        while np.any(slot_inits >= 0):
+            active_idxs = np.nonzero(slot_inits >= 0)[0]
+            step_action = None
+            for group in np.unique(slot_groups[active_idxs]):
+                if self.refill:
+                    infer_idxs = active_idxs[slot_groups[active_idxs] == group]
+                else:
+                    infer_idxs = np.nonzero(slot_groups == group)[0]
+
+                past_action = past_actions[group]
+                this_past_action = None
+                if (past_action is not None) and np.all(has_past_action[infer_idxs]):
+                    this_past_action = past_action[infer_idxs]
+                action, env_action = predict_fns[group](
+                    take_each(obs_buffer, infer_idxs), this_past_action)
+
+                if past_action is None:
+                    past_action = np.zeros((n_envs,) + action.shape[1:], dtype=action.dtype)
+                    past_actions[group] = past_action
+                past_action[infer_idxs] = action
+                has_past_action[infer_idxs] = True
+
+                # rows of env_action for active slots
+                is_active = slot_inits[infer_idxs] >= 0
+                if step_action is None:
+                    step_action = np.zeros((len(active_idxs),) + env_action.shape[1:], 
+                        dtype=env_action.dtype)
+                step_action[np.searchsorted(active_idxs, infer_idxs[is_active])] \
+                    = env_action[is_active]
+
+            obs, _, dones, infos = env.step_each(
+                step_action, list(active_idxs))
+            put_each(obs_buffer, active_idxs, obs)
+
+            done_idxs = active_idxs[dones]
+            if len(done_idxs) == 0:
+                continue
+
+            # collect finished episodes
+            done_slots = list(done_idxs)
+            video_paths = env.call_each('render', env_idxs=done_slots)
+            rewards = env.call_each('get_attr',
+                args_list=[('reward',)] * len(done_slots), env_idxs=done_slots)
+            for i, slot_idx in enumerate(done_slots):
+                info = infos[np.nonzero(active_idxs == slot_idx)[0][0]]
+                results[slot_inits[slot_idx]] = {
+                    'video_path': video_paths[i],
+                    'reward': rewards[i],
+                    'info': info
+                }
+            slot_inits[done_idxs] = -1
+            pbar.update(len(done_idxs))
+
+            # schedule pending inits
+            if self.refill:
+                start_slots(done_idxs)
+            elif np.all(slot_inits < 0) and (next_init < n_inits):
+                reset_groups()
+                start_slots(np.arange(n_envs))
+        pbar.close()
+        return results
+
+
+def schedule_policies(
+        env,
+        init_fn_dills: Sequence[bytes],
+        policies: Sequence,
+        get_predict_fn: Callable[[object], PredictFn],
+        refill: bool=True,
+        desc: str='Eval',
+        tqdm_interval_sec: float=5.0
+    ) -> List[List[dict]]:
+    """
+    Runs every init function once for each policy through the same env
+    slots, see RolloutScheduler. Stateful policies force refill=False.
+    Returns results grouped per policy.
+    """
+    n_inits = len(init_fn_dills)
+    n_policies = len(policies)
+    refill = refill and not any(policy_has_state(x) for x in policies)
+    scheduler = RolloutScheduler(env, 
+        list(init_fn_dills) * n_policies,
+        refill=refill,
+        groups=np.repeat(np.arange(n_policies), n_inits))
+    results = scheduler.run(
+        [get_predict_fn(x) for x in policies],
+        reset_fn=[x.reset for x in policies],
+        desc=desc,
+        tqdm_interval_sec=tqdm_interval_sec)
+    return [results[i*n_inits:(i+1)*n_inits] for i in range(n_policies)]
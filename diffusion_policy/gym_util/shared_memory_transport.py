@@ -0,0 +1,116 @@
+from typing import Dict, Optional, Sequence, Union
+import time
+import numpy as np
+import multiprocessing as mp
+from multiprocessing.managers import SharedMemoryManager
+from gym import spaces
+from diffusion_policy.shared_memory.shared_ndarray import SharedNDArray
+
+# doorbell commands
+CMD_PIPE = 0
+CMD_STEP = 1
+CMD_RESET = 2
+
+
+class SharedMemoryTransport:
+    """
+    Preallocated shared arrays for exchanging actions, observations,
+    rewards and dones between AsyncVectorEnv and its workers, with a
+    request/response semaphore pair per worker as doorbell.
+    step and reset never touch the pipe, other commands (call, seed, close)
+    are still pickled through the pipe and announced with CMD_PIPE.
+    Supports Box or flat Dict of Box observation spaces and Box action spaces.
+    send_info: if False, workers skip sending step infos, which are
+        the only per-step payload left on the pipe.
+    """
+    def __init__(self,
+            shm_manager: SharedMemoryManager,
+            observation_space: Union[spaces.Box, spaces.Dict],
+            action_space: spaces.Box,
+            n: int,
+            send_info: bool=True,
+            ctx=None
+        ):
+        if ctx is None:
+            ctx = mp.get_context()
+        if not isinstance(action_space, spaces.Box):
+            raise ValueError(f'Unsupported action space {action_space}')
+        if isinstance(observation_space, spaces.Dict):
+            obs_spaces = dict(observation_space.spaces.items())
+        else:
+            obs_spaces = {None: observation_space}
+        for key, space in obs_spaces.items():
+            if not isinstance(space, spaces.Box):
+                raise ValueError(f'Unsupported observation space {space} for key {key}')
+
+        def create(shape, dtype):
+            return SharedNDArray.create_from_shape(
+                mem_mgr=shm_manager, shape=(n,) + tuple(shape), dtype=dtype)
+
+        self.n = n
+        self.send_info = send_info
+        self.is_dict = isinstance(observation_space, spaces.Dict)
+        self.obs_arrays = dict((key, create(space.shape, space.dtype))
+            for key, space in obs_spaces.items())
+        self.action_array = create(action_space.shape, action_space.dtype)
+        self.reward_array = create(tuple(), np.float64)
+        self.done_array = create(tuple(), np.bool_)
+        self.command_array = create(tuple(), np.int64)
+        self.success_array = create(tuple(), np.bool_)
+        self.has_info_array = create(tuple(), np.bool_)
+        self.requests = [ctx.Semaphore(0) for _ in range(n)]
+        self.responses = [ctx.Semaphore(0) for _ in range(n)]
+
+    def get_observations(self) -> Union[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Batched observation views into shared memory.
+        """
+        if self.is_dict:
+            return dict((key, value.get()) for key, value in self.obs_arrays.items())
+        return self.obs_arrays[None].get()
+
+    # ========== parent side ==========
+    def request(self, index: int, command: int, action: Optional[np.ndarray]=None):
+        if action is not None:
+            self.action_array.get()[index] = action
+        self.command_array.get()[index] = command
+        self.requests[index].release()
+
+    def wait_responses(self, env_idxs: Sequence[int], timeout: Optional[float]=None) -> bool:
+        """
+        Returns False if any worker of env_idxs did not respond within timeout,
+        which bounds the total wait over all workers.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        for i in env_idxs:
+            this_timeout = None
+            if deadline is not None:
+                this_timeout = max(0, deadline - time.monotonic())
+            if not self.responses[i].acquire(timeout=this_timeout):
+                return False
+        return True
+
+    # ========== worker side ==========
+    def wait_request(self, index: int) -> int:
+        self.requests[index].acquire()
+        return int(self.command_array.get()[index])
+
+    def get_action(self, index: int) -> np.ndarray:
+        return self.action_array.get()[index].copy()
+
+    def write_observation(self, index: int, observation):
+        if self.is_dict:
+            for key, value in self.obs_arrays.items():
+                value.get()[index] = observation[key]
+        else:
+            self.obs_arrays[None].get()[index] = observation
+
+    def respond(self, index: int, success: bool=True,
+            reward: float=0., done: bool=False, has_info: bool=False):
+        self.reward_array.get()[index] = reward
+        self.done_array.get()[index] = done
+        self.success_array.get()[index] = success
+        self.has_info_array.get()[index] = has_info
+        self.responses[index].release()
@@ -133,8 +133,11 @@ class SyncVectorEnv(VectorEnv):
 
     def call_each(self, name: str, 
             args_list: list=None, 
-            kwargs_list: list=None):
-        n_envs = len(self.envs)
+            kwargs_list: list=None,
+            env_idxs: list=None):
+        if env_idxs is None:
+            env_idxs = list(range(len(self.envs)))
+        n_envs = len(env_idxs)
         if args_list is None:
             args_list = [[]] * n_envs
         assert len(args_list) == n_envs
@@ -144,8 +147,8 @@ class SyncVectorEnv(VectorEnv):
         assert len(kwargs_list) == n_envs
 
         results = []
-        for i, env in enumerate(self.envs):
-            function = getattr(env, name)
+        for i, env_idx in enumerate(env_idxs):
+            function = getattr(self.envs[env_idx], name)
             if callable(function):
                 results.append(function(*args_list[i], **kwargs_list[i]))
             else:
@@ -153,6 +156,32 @@ class SyncVectorEnv(VectorEnv):
 
         return tuple(results)
 
+    def reset_each(self, env_idxs: list):
+        observations = [self.envs[i].reset() for i in env_idxs]
+        return concatenate(observations, 
+            create_empty_array(self.single_observation_space, 
+                n=len(env_idxs), fn=np.zeros), 
+            self.single_observation_space)
+
+    def step_each(self, actions, env_idxs: list):
+        assert len(actions) == len(env_idxs)
+        observations, rewards, dones, infos = [], [], [], []
+        for env_idx, action in zip(env_idxs, actions):
+            observation, reward, done, info = self.envs[env_idx].step(action)
+            observations.append(observation)
+            rewards.append(reward)
+            dones.append(done)
+            infos.append(info)
+        observations = concatenate(observations, 
+            create_empty_array(self.single_observation_space, 
+                n=len(env_idxs), fn=np.zeros), 
+            self.single_observation_space)
+        return (
+            observations,
+            np.array(rewards, dtype=np.float64),
+            np.array(dones, dtype=np.bool_),
+            infos,
+        )
 
     def render(self, *args, **kwargs):
         return self.call('render', *args, **kwargs)
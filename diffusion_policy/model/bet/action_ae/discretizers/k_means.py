@@ -1,3 +1,6 @@
+import os
+import pathlib
+import hashlib
 import torch
 import numpy as np
 
@@ -17,52 +20,163 @@ class KMeansDiscretizer(DictOfTensorMixin):
         action_dim: int,
         num_bins: int = 100,
         predict_offsets: bool = False,
+        niter: int = 50,
+        batch_size: Optional[int] = None,
+        chunk_size: int = 65536,
+        cache_dir: Optional[str] = None,
     ):
+        """
+        batch_size: None for full-batch k-means, otherwise number of 
+            actions sampled per iteration for mini-batch k-means.
+        chunk_size: number of actions per distance computation.
+        cache_dir: if set, fitted bin centers are cached there keyed by
+            the hash of the action data and k-means parameters.
+        """
         super().__init__()
         self.n_bins = num_bins
         self.action_dim = action_dim
         self.predict_offsets = predict_offsets
+        self.niter = niter
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.cache_dir = cache_dir
 
     def fit_discretizer(self, input_actions: torch.Tensor) -> None:
         assert (
             self.action_dim == input_actions.shape[-1]
         ), f"Input action dimension {self.action_dim} does not match fitted model {input_actions.shape[-1]}"
 
-        flattened_actions = input_actions.view(-1, self.action_dim)
+        flattened_actions = input_actions.reshape(-1, self.action_dim)
+        cache_path = None
+        if self.cache_dir is not None:
+            cache_dir = pathlib.Path(os.path.expanduser(self.cache_dir))
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            cache_path = cache_dir.joinpath(
+                f'kmeans_{self._get_cache_key(flattened_actions)}.npy')
+            if cache_path.exists():
+                print(f'Loading cached K-means bin centers from {cache_path}')
+                cluster_centers = torch.from_numpy(np.load(str(cache_path))).to(
+                    device=flattened_actions.device, dtype=flattened_actions.dtype)
+                self.params_dict['bin_centers'] = cluster_centers
+                return
+
         cluster_centers = KMeansDiscretizer._kmeans(
-            flattened_actions, ncluster=self.n_bins
+            flattened_actions, 
+            ncluster=self.n_bins,
+            niter=self.niter,
+            batch_size=self.batch_size,
+            chunk_size=self.chunk_size
         )
         self.params_dict['bin_centers'] = cluster_centers
 
+        if cache_path is not None:
+            # write then rename, concurrent readers never see partial files
+            tmp_path = cache_path.with_suffix(f'.{os.getpid()}.tmp.npy')
+            np.save(str(tmp_path), cluster_centers.detach().cpu().numpy())
+            os.replace(tmp_path, cache_path)
+
+    def _get_cache_key(self, flattened_actions: torch.Tensor) -> str:
+        actions = np.ascontiguousarray(flattened_actions.detach().cpu().numpy())
+        h = hashlib.sha1(actions.tobytes())
+        h.update(str((actions.shape, actions.dtype.str, self.n_bins, 
+            self.niter, self.batch_size)).encode('utf-8'))
+        return h.hexdigest()
+
     @property
     def suggested_actions(self) -> torch.Tensor:
         return self.params_dict['bin_centers']
 
+    @staticmethod
+    def _assign(x: torch.Tensor, c: torch.Tensor, chunk_size: int = 65536
+            ) -> torch.Tensor:
+        """
+        Index of the closest center in c for each row of x.
+        Distances are computed in chunks of x, so peak memory is
+        chunk_size * len(c) instead of len(x) * len(c) * D.
+        """
+        c_sq = (c ** 2).sum(-1)
+        result = torch.empty(len(x), dtype=torch.long, device=x.device)
+        for start in range(0, len(x), chunk_size):
+            xc = x[start:start+chunk_size]
+            # ||x||^2 is constant per row and doesn't change argmin
+            dist = c_sq[None,:] - 2 * (xc @ c.T)
+            result[start:start+chunk_size] = dist.argmin(1)
+        return result
+
+    @staticmethod
+    def _kmeans_plusplus(x: torch.Tensor, ncluster: int) -> torch.Tensor:
+        """
+        k-means++ seeding, each new center is sampled with probability
+        proportional to its squared distance to the closest center so far.
+        """
+        N, D = x.size()
+        c = torch.empty((ncluster, D), dtype=x.dtype, device=x.device)
+        c[0] = x[torch.randint(N, (1,)).item()]
+        d2 = ((x - c[0]) ** 2).sum(-1)
+        for k in range(1, ncluster):
+            cdf = torch.cumsum(d2, dim=0)
+            if cdf[-1] <= 0:
+                # fewer distinct points than clusters
+                idx = torch.randint(N, (1,)).item()
+            else:
+                # inverse cdf sampling, multinomial is limited to 2^24 categories
+                u = torch.rand(1, dtype=cdf.dtype, device=x.device) * cdf[-1]
+                idx = torch.searchsorted(cdf, u).clamp(max=N-1).item()
+            c[k] = x[idx]
+            d2 = torch.minimum(d2, ((x - c[k]) ** 2).sum(-1))
+        return c
+
     @classmethod
-    def _kmeans(cls, x: torch.Tensor, ncluster: int = 512, niter: int = 50):
+    def _kmeans(cls, 
+            x: torch.Tensor, 
+            ncluster: int = 512, 
+            niter: int = 50,
+            batch_size: Optional[int] = None,
+            chunk_size: int = 65536):
         """
-        Simple k-means clustering algorithm adapted from Karpathy's minGPT library
+        k-means++ seeded k-means with scatter-add centroid updates.
+        batch_size=None runs Lloyd iterations over all of x, otherwise
+        each iteration is a mini-batch update (Sculley 2010) on
+        batch_size randomly sampled rows with per-center learning 
+        rate 1/count.
+        Adapted from Karpathy's minGPT library
         https://github.com/karpathy/minGPT/blob/master/play_image.ipynb
         """
         N, D = x.size()
-        c = x[torch.randperm(N)[:ncluster]]  # init clusters at random
+        c = cls._kmeans_plusplus(x, ncluster)
+        mini_batch = (batch_size is not None) and (batch_size < N)
+        counts = torch.zeros(ncluster, dtype=x.dtype, device=x.device)
 
         pbar = tqdm.trange(niter)
         pbar.set_description("K-means clustering")
         for i in pbar:
+            xb = x
+            if mini_batch:
+                xb = x[torch.randint(N, (batch_size,), device=x.device)]
             # assign all pixels to the closest codebook element
-            a = ((x[:, None, :] - c[None, :, :]) ** 2).sum(-1).argmin(1)
-            # move each codebook element to be the mean of the pixels that assigned to it
-            c = torch.stack([x[a == k].mean(0) for k in range(ncluster)])
+            a = cls._assign(xb, c, chunk_size=chunk_size)
+            # per cluster sum and count of assigned pixels
+            sums = torch.zeros_like(c).index_add_(0, a, xb)
+            n = torch.bincount(a, minlength=ncluster).to(x.dtype)
+            if mini_batch:
+                counts += n
+                # c += n * (mean - c) / counts, for clusters seen in this batch
+                seen = n > 0
+                c[seen] += (sums[seen] - n[seen,None] * c[seen]) / counts[seen,None]
+                # clusters not sampled yet keep their k-means++ seed
+                nanix = torch.zeros_like(seen)
+            else:
+                # move each codebook element to be the mean of the pixels that assigned to it
+                nanix = n == 0
+                c[~nanix] = sums[~nanix] / n[~nanix,None]
             # re-assign any poorly positioned codebook elements
-            nanix = torch.any(torch.isnan(c), dim=1)
             ndead = nanix.sum().item()
             if ndead:
                 tqdm.tqdm.write(
                     "done step %d/%d, re-initialized %d dead clusters"
                     % (i + 1, niter, ndead)
                 )
-            c[nanix] = x[torch.randperm(N)[:ndead]]  # re-init dead clusters
+                c[nanix] = x[torch.randperm(N, device=x.device)[:ndead]]  # re-init dead clusters
         return c
 
     def encode_into_latent(
@@ -84,16 +198,12 @@ class KMeansDiscretizer(DictOfTensorMixin):
         ), "Input action dimension does not match fitted model"
 
         # flatten the input action
-        flattened_actions = input_action.view(-1, self.action_dim)
+        flattened_actions = input_action.reshape(-1, self.action_dim)
 
         # get the closest cluster center
-        closest_cluster_center = torch.argmin(
-            torch.sum(
-                (flattened_actions[:, None, :] - self.params_dict['bin_centers'][None, :, :]) ** 2,
-                dim=2,
-            ),
-            dim=1,
-        )
+        closest_cluster_center = KMeansDiscretizer._assign(
+            flattened_actions, self.params_dict['bin_centers'],
+            chunk_size=self.chunk_size)
         # Reshape to the original shape
         discretized_action = closest_cluster_center.view(input_action.shape[:-1] + (1,))
 
@@ -0,0 +1,114 @@
+from typing import List, Optional, Tuple
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+def _split_heads(x: torch.Tensor, n_head: int) -> torch.Tensor:
+    B, S, E = x.shape
+    return x.view(B, S, n_head, E // n_head).transpose(1, 2)
+
+
+def project_memory_kv(attn: nn.MultiheadAttention, memory: torch.Tensor
+        ) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Key/value projection of a batch_first MultiheadAttention.
+    memory: (B,S,n_emb)
+    returns k, v: (B,n_head,S,head_dim)
+    """
+    assert attn.batch_first and attn._qkv_same_embed_dim
+    assert (attn.bias_k is None) and (not attn.add_zero_attn)
+    E = attn.embed_dim
+    b_k = b_v = None
+    if attn.in_proj_bias is not None:
+        b_k = attn.in_proj_bias[E:2*E]
+        b_v = attn.in_proj_bias[2*E:]
+    k = F.linear(memory, attn.in_proj_weight[E:2*E], b_k)
+    v = F.linear(memory, attn.in_proj_weight[2*E:], b_v)
+    return _split_heads(k, attn.num_heads), _split_heads(v, attn.num_heads)
+
+
+def cross_attention(attn: nn.MultiheadAttention,
+        x: torch.Tensor, k: torch.Tensor, v: torch.Tensor,
+        attn_mask: Optional[torch.Tensor]=None) -> torch.Tensor:
+    """
+    Same as attn(x, memory, memory, attn_mask=attn_mask)[0]
+    with k, v = project_memory_kv(attn, memory).
+    """
+    E = attn.embed_dim
+    b_q = None
+    if attn.in_proj_bias is not None:
+        b_q = attn.in_proj_bias[:E]
+    q = _split_heads(F.linear(x, attn.in_proj_weight[:E], b_q), attn.num_heads)
+    if attn_mask is not None:
+        attn_mask = attn_mask.to(dtype=q.dtype)
+    out = F.scaled_dot_product_attention(q, k, v,
+        attn_mask=attn_mask,
+        dropout_p=attn.dropout if attn.training else 0.0)
+    # (B,n_head,T,head_dim)
+    out = out.transpose(1, 2).reshape(x.shape[0], x.shape[1], E)
+    return attn.out_proj(out)
+
+
+def self_attention_block(layer: nn.TransformerDecoderLayer,
+        x: torch.Tensor, attn_mask: Optional[torch.Tensor]=None) -> torch.Tensor:
+    """
+    Self-attention residual branch of a TransformerDecoderLayer,
+    built from its public submodules.
+    """
+    x = layer.self_attn(x, x, x, attn_mask=attn_mask, need_weights=False)[0]
+    return layer.dropout1(x)
+
+
+def feed_forward_block(layer: nn.TransformerDecoderLayer,
+        x: torch.Tensor) -> torch.Tensor:
+    """
+    Feed-forward residual branch of a TransformerDecoderLayer.
+    """
+    x = layer.linear2(layer.dropout(layer.activation(layer.linear1(x))))
+    return layer.dropout3(x)
+
+
+def get_memory_kv(decoder: nn.TransformerDecoder, memory: torch.Tensor
+        ) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+    """
+    Per layer cross-attention keys/values of memory tokens
+    that stay constant across denoising steps.
+    """
+    return [project_memory_kv(layer.multihead_attn, memory)
+        for layer in decoder.layers]
+
+
+def decode_cached(decoder: nn.TransformerDecoder,
+        tgt: torch.Tensor,
+        memory_kv: List[Tuple[torch.Tensor, torch.Tensor]],
+        step_memory: Optional[torch.Tensor]=None,
+        step_memory_first: bool=True,
+        tgt_mask: Optional[torch.Tensor]=None,
+        memory_mask: Optional[torch.Tensor]=None) -> torch.Tensor:
+    """
+    Equivalent to decoder(tgt, memory, tgt_mask=tgt_mask, memory_mask=memory_mask)
+    for a norm_first, batch_first nn.TransformerDecoder, where memory is
+    split into constant tokens with cached memory_kv (from get_memory_kv)
+    and step_memory tokens (e.g. diffusion timestep) that are projected
+    on every call and placed before (step_memory_first) or after the
+    constant tokens.
+    """
+    x = tgt
+    for layer, (k, v) in zip(decoder.layers, memory_kv):
+        assert layer.norm_first
+        if step_memory is not None:
+            step_k, step_v = project_memory_kv(layer.multihead_attn, step_memory)
+            if step_memory_first:
+                k = torch.cat([step_k, k], dim=2)
+                v = torch.cat([step_v, v], dim=2)
+            else:
+                k = torch.cat([k, step_k], dim=2)
+                v = torch.cat([v, step_v], dim=2)
+        x = x + self_attention_block(layer, layer.norm1(x), tgt_mask)
+        x = x + layer.dropout2(cross_attention(
+            layer.multihead_attn, layer.norm2(x), k, v, attn_mask=memory_mask))
+        x = x + feed_forward_block(layer, layer.norm3(x))
+    if decoder.norm is not None:
+        x = decoder.norm(x)
+    return x
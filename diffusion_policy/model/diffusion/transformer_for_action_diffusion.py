@@ -4,6 +4,7 @@ import torch
 import torch.nn as nn
 from diffusion_policy.model.diffusion.positional_embedding import SinusoidalPosEmb
 from diffusion_policy.model.common.module_attr_mixin import ModuleAttrMixin
+from diffusion_policy.model.diffusion.cached_decoder import get_memory_kv, decode_cached
 
 logger = logging.getLogger(__name__)
 
@@ -167,28 +168,67 @@ class TransformerForActionDiffusion(ModuleAttrMixin):
         )
         return optimizer
 
+    def _get_time_emb(self, sample: torch.Tensor, 
+            timestep: Union[torch.Tensor, float, int]) -> torch.Tensor:
+        timesteps = timestep
+        if not torch.is_tensor(timesteps):
+            # TODO: this requires sync between CPU and GPU. So try to pass timesteps as tensors if you can
+            timesteps = torch.tensor([timesteps], dtype=torch.long, device=sample.device)
+        elif torch.is_tensor(timesteps) and len(timesteps.shape) == 0:
+            timesteps = timesteps[None].to(sample.device)
+        # broadcast to batch dimension in a way that's compatible with ONNX/Core ML
+        timesteps = timesteps.expand(sample.shape[0])
+        time_emb = self.time_emb(timesteps).unsqueeze(1)
+        # (B,1,n_emb)
+        return time_emb
+
+    def encode_cond(self, cond: torch.Tensor) -> dict:
+        """
+        Computes the cross-attention keys/values of the cond tokens
+        once per conditional_sample. Only the time token is projected 
+        on each denoising step via forward(sample, timestep, cond_cache=...).
+        cond: (B,N,n_emb)
+        """
+        tc = cond.shape[1]
+        cond_emb = cond + self.cond_pos_emb[:, :tc, :]
+        return {
+            'n_cond_tokens': tc,
+            'memory_kv': get_memory_kv(self.decoder, cond_emb),
+            'input_pos_emb': self.pos_emb + self.input_emb.bias
+        }
+
     def forward(self, 
         sample: torch.Tensor, 
         timestep: Union[torch.Tensor, float, int], 
-        cond: Optional[torch.Tensor]=None, **kwargs):
+        cond: Optional[torch.Tensor]=None, 
+        cond_cache: Optional[dict]=None, **kwargs):
         """
         x: (B,T,input_dim)
         timestep: (B,) or int, diffusion step
         cond: (B,N,n_emb)
+        cond_cache: output of encode_cond(cond), replaces cond
         output: (B,T,input_dim)
         """
         
         # 1. time
-        timesteps = timestep
-        if not torch.is_tensor(timesteps):
-            # TODO: this requires sync between CPU and GPU. So try to pass timesteps as tensors if you can
-            timesteps = torch.tensor([timesteps], dtype=torch.long, device=sample.device)
-        elif torch.is_tensor(timesteps) and len(timesteps.shape) == 0:
-            timesteps = timesteps[None].to(sample.device)
-        # broadcast to batch dimension in a way that's compatible with ONNX/Core ML
-        timesteps = timesteps.expand(sample.shape[0])
-        time_emb = self.time_emb(timesteps).unsqueeze(1)
+        time_emb = self._get_time_emb(sample, timestep)
         # (B,1,n_emb)
+
+        if cond_cache is not None:
+            tc = cond_cache['n_cond_tokens']
+            t = sample.shape[1]
+            input_emb = nn.functional.linear(sample, self.input_emb.weight) \
+                + cond_cache['input_pos_emb'][:, :t, :]
+            x = decode_cached(
+                self.decoder,
+                tgt=input_emb,
+                memory_kv=cond_cache['memory_kv'],
+                step_memory=time_emb + self.cond_pos_emb[:, tc:tc+1, :],
+                step_memory_first=False
+            )
+            x = self.ln_f(x)
+            x = self.head(x)
+            return x
         
         # 2. process conditions
         cond_emb = torch.cat([cond, time_emb], dim=1)
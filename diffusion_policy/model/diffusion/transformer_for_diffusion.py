@@ -4,6 +4,7 @@ import torch
 import torch.nn as nn
 from diffusion_policy.model.diffusion.positional_embedding import SinusoidalPosEmb
 from diffusion_policy.model.common.module_attr_mixin import ModuleAttrMixin
+from diffusion_policy.model.diffusion.cached_decoder import get_memory_kv, decode_cached
 
 logger = logging.getLogger(__name__)
 
@@ -147,6 +148,7 @@ class TransformerForDiffusion(ModuleAttrMixin):
         self.time_as_cond = time_as_cond
         self.obs_as_cond = obs_as_cond
         self.encoder_only = encoder_only
+        self.n_cond_layers = n_cond_layers
 
         # init
         self.apply(self._init_weights)
@@ -267,26 +269,67 @@ class TransformerForDiffusion(ModuleAttrMixin):
         )
         return optimizer
 
+    def _get_time_emb(self, sample: torch.Tensor, 
+            timestep: Union[torch.Tensor, float, int]) -> torch.Tensor:
+        timesteps = timestep
+        if not torch.is_tensor(timesteps):
+            # TODO: this requires sync between CPU and GPU. So try to pass timesteps as tensors if you can
+            timesteps = torch.tensor([timesteps], dtype=torch.long, device=sample.device)
+        elif torch.is_tensor(timesteps) and len(timesteps.shape) == 0:
+            timesteps = timesteps[None].to(sample.device)
+        # broadcast to batch dimension in a way that's compatible with ONNX/Core ML
+        timesteps = timesteps.expand(sample.shape[0])
+        time_emb = self.time_emb(timesteps).unsqueeze(1)
+        # (B,1,n_emb)
+        return time_emb
+
+    def encode_cond(self, cond: Optional[torch.Tensor]=None) -> dict:
+        """
+        Computes everything in forward that depends only on cond,
+        once per conditional_sample instead of once per denoising step.
+        Pass the result as forward(sample, timestep, cond_cache=...).
+        Dropout is skipped, only use in eval mode.
+        cond: (B,T',cond_dim)
+        """
+        cache = dict()
+        # constant part of the input embedding
+        pos_emb = self.pos_emb[:,1:,:] if self.encoder_only else self.pos_emb
+        cache['input_pos_emb'] = pos_emb + self.input_emb.bias
+        if self.encoder_only or (not self.obs_as_cond):
+            return cache
+        
+        cond_obs_emb = self.cond_obs_emb(cond)
+        tc = cond_obs_emb.shape[1] + 1
+        cond_obs_emb = cond_obs_emb + self.cond_pos_emb[:, 1:tc, :]
+        # (B,To,n_emb)
+        if self.n_cond_layers > 0:
+            # obs tokens attend to the time token in the encoder,
+            # only the obs embedding can be reused
+            cache['cond_obs_emb'] = cond_obs_emb
+        else:
+            # MLP encoder is per token, obs memory and its
+            # cross-attention keys/values are constant
+            cache['memory_kv'] = get_memory_kv(
+                self.decoder, self.encoder(cond_obs_emb))
+        return cache
+
     def forward(self, 
         sample: torch.Tensor, 
         timestep: Union[torch.Tensor, float, int], 
-        cond: Optional[torch.Tensor]=None, **kwargs):
+        cond: Optional[torch.Tensor]=None, 
+        cond_cache: Optional[dict]=None, **kwargs):
         """
         x: (B,T,input_dim)
         timestep: (B,) or int, diffusion step
         cond: (B,T',cond_dim)
+        cond_cache: output of encode_cond(cond), replaces cond
         output: (B,T,input_dim)
         """
+        if cond_cache is not None:
+            return self._forward_cached(sample, timestep, cond_cache)
+
         # 1. time
-        timesteps = timestep
-        if not torch.is_tensor(timesteps):
-            # TODO: this requires sync between CPU and GPU. So try to pass timesteps as tensors if you can
-            timesteps = torch.tensor([timesteps], dtype=torch.long, device=sample.device)
-        elif torch.is_tensor(timesteps) and len(timesteps.shape) == 0:
-            timesteps = timesteps[None].to(sample.device)
-        # broadcast to batch dimension in a way that's compatible with ONNX/Core ML
-        timesteps = timesteps.expand(sample.shape[0])
-        time_emb = self.time_emb(timesteps).unsqueeze(1)
+        time_emb = self._get_time_emb(sample, timestep)
         # (B,1,n_emb)
 
         # process input
@@ -343,6 +386,49 @@ class TransformerForDiffusion(ModuleAttrMixin):
         # (B,T,n_out)
         return x
 
+    def _forward_cached(self,
+        sample: torch.Tensor, 
+        timestep: Union[torch.Tensor, float, int], 
+        cond_cache: dict):
+        time_emb = self._get_time_emb(sample, timestep)
+        t = sample.shape[1]
+        input_emb = nn.functional.linear(sample, self.input_emb.weight) \
+            + cond_cache['input_pos_emb'][:, :t, :]
+
+        if self.encoder_only:
+            # BERT
+            x = torch.cat([time_emb + self.pos_emb[:, :1, :], input_emb], dim=1)
+            x = self.encoder(src=x, mask=self.mask)
+            x = x[:,1:,:]
+        elif 'memory_kv' in cond_cache:
+            time_memory = self.encoder(time_emb + self.cond_pos_emb[:, :1, :])
+            x = decode_cached(
+                self.decoder,
+                tgt=input_emb,
+                memory_kv=cond_cache['memory_kv'],
+                step_memory=time_memory,
+                step_memory_first=True,
+                tgt_mask=self.mask,
+                memory_mask=self.memory_mask
+            )
+        else:
+            memory = time_emb + self.cond_pos_emb[:, :1, :]
+            if 'cond_obs_emb' in cond_cache:
+                memory = torch.cat([memory, cond_cache['cond_obs_emb']], dim=1)
+            memory = self.encoder(memory)
+            x = self.decoder(
+                tgt=input_emb,
+                memory=memory,
+                tgt_mask=self.mask,
+                memory_mask=self.memory_mask
+            )
+        
+        # head
+        x = self.ln_f(x)
+        x = self.head(x)
+        # (B,T,n_out)
+        return x
+
 
 def test():
     # GPT with time embedding
@@ -0,0 +1,133 @@
+from typing import Callable, Optional, Sequence
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class EnergyMLP:
+    """
+    Inference view of the IBC energy network dense0..dense4, where
+    dense0 takes cat([obs.flatten(), action.flatten()]).
+    The obs part of dense0 is projected once per batch and broadcast
+    over samples instead of repeating the obs for every sample.
+    Samples are evaluated in chunks of at most chunk_size (batch, sample)
+    rows, which bounds peak activation memory to chunk_size*mid_channels.
+    Dropout is skipped, only use in eval mode.
+    """
+    def __init__(self,
+            dense0: nn.Linear,
+            hidden_layers: Sequence[nn.Linear],
+            out_layer: nn.Linear,
+            chunk_size: Optional[int]=None
+        ):
+        self.dense0 = dense0
+        self.hidden_layers = list(hidden_layers)
+        self.out_layer = out_layer
+        self.chunk_size = chunk_size
+
+    def project_obs(self, obs: torch.Tensor) -> torch.Tensor:
+        """
+        obs: (B,To,Do)
+        returns (B,mid_channels)
+        """
+        obs = obs.reshape(obs.shape[0], -1)
+        return F.linear(obs, self.dense0.weight[:, :obs.shape[-1]], self.dense0.bias)
+
+    def __call__(self, obs_proj: torch.Tensor, action: torch.Tensor) -> torch.Tensor:
+        """
+        obs_proj: (B,mid_channels) from project_obs
+        action: (B,N,Ta,Da)
+        returns logits (B,N)
+        """
+        B, N = action.shape[:2]
+        action = action.reshape(B, N, -1)
+        weight = self.dense0.weight[:, -action.shape[-1]:]
+        obs_proj = obs_proj.unsqueeze(1)
+
+        n_chunk = N
+        if self.chunk_size is not None:
+            n_chunk = max(1, self.chunk_size // B)
+        logits = torch.empty((B, N), dtype=obs_proj.dtype, device=obs_proj.device)
+        for start in range(0, N, n_chunk):
+            end = min(start + n_chunk, N)
+            x = torch.relu(F.linear(action[:,start:end], weight) + obs_proj)
+            for layer in self.hidden_layers:
+                x = torch.relu(layer(x))
+            logits[:,start:end] = self.out_layer(x)[...,0]
+        return logits
+
+
+def is_collapsed(prob: torch.Tensor, min_ess_ratio: float) -> bool:
+    """
+    True if the effective sample size 1/sum(p^2) of every
+    distribution in prob (B,N) is below min_ess_ratio * N.
+    """
+    ess = 1 / torch.sum(torch.square(prob), dim=-1)
+    return bool(torch.all(ess < (min_ess_ratio * prob.shape[-1])))
+
+
+def dfo_sample(
+        energy_fn: Callable[[torch.Tensor], torch.Tensor],
+        samples: torch.Tensor,
+        action_min: torch.Tensor,
+        action_max: torch.Tensor,
+        n_iter: int,
+        kevin_inference: bool=False,
+        noise_std: float=3e-2,
+        early_stop_ess: Optional[float]=None
+    ) -> torch.Tensor:
+    """
+    Derivative free optimization of IBC.
+    energy_fn: (B,N,Ta,Da) samples -> (B,N) logits
+    samples: (B,N,Ta,Da) initial samples
+    early_stop_ess: stop resampling once the sample distribution of
+        every batch element has collapsed, i.e. its effective sample size
+        dropped below early_stop_ess * N. None runs all n_iter rounds.
+    returns (B,Ta,Da)
+    """
+    B, N = samples.shape[:2]
+    device = samples.device
+    batch_idxs = torch.arange(B, device=device).unsqueeze(-1)
+    if kevin_inference:
+        # kevin's implementation
+        for i in range(n_iter):
+            # Compute energies.
+            logits = energy_fn(samples)
+            probs = F.softmax(logits, dim=-1)
+            if (early_stop_ess is not None) and is_collapsed(probs, early_stop_ess):
+                break
+
+            # Resample with replacement.
+            idxs = torch.multinomial(probs, N, replacement=True)
+            samples = samples[batch_idxs, idxs]
+
+            # Add noise and clip to target bounds.
+            samples = samples + torch.randn_like(samples) * noise_std
+            samples = samples.clamp(min=action_min, max=action_max)
+        else:
+            logits = energy_fn(samples)
+            probs = F.softmax(logits, dim=-1)
+
+        # Return target with highest probability.
+        best_idxs = probs.argmax(dim=-1)
+        acts_n = samples[batch_idxs[:,0], best_idxs, :]
+    else:
+        # andy's implementation
+        zero = torch.tensor(0, device=device)
+        resample_std = torch.tensor(noise_std, device=device)
+        for i in range(n_iter):
+            # Forward pass.
+            logits = energy_fn(samples) # (B, N)
+            prob = torch.softmax(logits, dim=-1)
+            if (early_stop_ess is not None) and is_collapsed(prob, early_stop_ess):
+                break
+
+            if i < (n_iter - 1):
+                idxs = torch.multinomial(prob, N, replacement=True)
+                samples = samples[batch_idxs, idxs]
+                samples += torch.normal(zero, resample_std, size=samples.shape, device=device)
+
+        # Return one sample per x in batch.
+        idxs = torch.multinomial(prob, num_samples=1, replacement=True)
+        acts_n = samples[batch_idxs, idxs].squeeze(1)
+    return acts_n
@@ -44,6 +44,7 @@ class DiffusionTransformerHybridImagePolicy(BaseImagePolicy):
             obs_as_cond=True,
             pred_action_steps_only=False,
             transforms=None,
+            cache_cond=False,
             # parameters passed to step
             **kwargs):
         super().__init__()
@@ -176,6 +177,7 @@ class DiffusionTransformerHybridImagePolicy(BaseImagePolicy):
         self.obs_as_cond = obs_as_cond
         self.pred_action_steps_only = pred_action_steps_only
         self.transforms = None if transforms is None else torch.nn.Sequential(*transforms)
+        self.cache_cond = cache_cond
         self.kwargs = kwargs
 
         if num_inference_steps is None:
@@ -201,12 +203,21 @@ class DiffusionTransformerHybridImagePolicy(BaseImagePolicy):
         # set step values
         scheduler.set_timesteps(self.num_inference_steps)
 
+        # opt-in: cond only changes between predict_action calls,
+        # encode it once for all denoising steps (eval mode only)
+        cond_cache = None
+        if self.cache_cond and not model.training:
+            cond_cache = model.encode_cond(cond)
+
         for t in scheduler.timesteps:
             # 1. apply conditioning
             trajectory[condition_mask] = condition_data[condition_mask]
 
             # 2. predict model output
-            model_output = model(trajectory, t, cond)
+            if cond_cache is not None:
+                model_output = model(trajectory, t, cond_cache=cond_cache)
+            else:
+                model_output = model(trajectory, t, cond)
 
             # 3. compute previous image: x_t -> x_t-1
             trajectory = scheduler.step(
@@ -22,6 +22,7 @@ class DiffusionTransformerLowdimPolicy(BaseLowdimPolicy):
             num_inference_steps=None,
             obs_as_cond=False,
             pred_action_steps_only=False,
+            cache_cond=False,
             # parameters passed to step
             **kwargs):
         super().__init__()
@@ -45,6 +46,7 @@ class DiffusionTransformerLowdimPolicy(BaseLowdimPolicy):
         self.n_obs_steps = n_obs_steps
         self.obs_as_cond = obs_as_cond
         self.pred_action_steps_only = pred_action_steps_only
+        self.cache_cond = cache_cond
         self.kwargs = kwargs
 
         if num_inference_steps is None:
@@ -70,12 +72,21 @@ class DiffusionTransformerLowdimPolicy(BaseLowdimPolicy):
         # set step values
         scheduler.set_timesteps(self.num_inference_steps)
 
+        # opt-in: cond only changes between predict_action calls,
+        # encode it once for all denoising steps (eval mode only)
+        cond_cache = None
+        if self.cache_cond and not model.training:
+            cond_cache = model.encode_cond(cond)
+
         for t in scheduler.timesteps:
             # 1. apply conditioning
             trajectory[condition_mask] = condition_data[condition_mask]
 
             # 2. predict model output
-            model_output = model(trajectory, t, cond)
+            if cond_cache is not None:
+                model_output = model(trajectory, t, cond_cache=cond_cache)
+            else:
+                model_output = model(trajectory, t, cond)
 
             # 3. compute previous image: x_t -> x_t-1
             trajectory = scheduler.step(
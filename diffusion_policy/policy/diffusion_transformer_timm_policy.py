@@ -25,6 +25,7 @@ class DiffusionTransformerTimmPolicy(BaseImagePolicy):
             n_head=8,
             n_emb=768,
             p_drop_attn=0.1,
+            cache_cond=False,
             # parameters passed to step
             **kwargs):
         super().__init__()
@@ -57,6 +58,7 @@ class DiffusionTransformerTimmPolicy(BaseImagePolicy):
         self.action_dim = action_dim
         self.action_horizon = action_horizon
         self.input_pertub = input_pertub
+        self.cache_cond = cache_cond
         self.kwargs = kwargs
 
         if num_inference_steps is None:
@@ -82,12 +84,21 @@ class DiffusionTransformerTimmPolicy(BaseImagePolicy):
         # set step values
         scheduler.set_timesteps(self.num_inference_steps)
 
+        # opt-in: cond only changes between predict_action calls,
+        # encode it once for all denoising steps (eval mode only)
+        cond_cache = None
+        if self.cache_cond and not model.training:
+            cond_cache = model.encode_cond(cond)
+
         for t in scheduler.timesteps:
             # 1. apply conditioning
             trajectory[condition_mask] = condition_data[condition_mask]
 
             # 2. predict model output
-            model_output = model(trajectory, t, cond)
+            if cond_cache is not None:
+                model_output = model(trajectory, t, cond_cache=cond_cache)
+            else:
+                model_output = model(trajectory, t, cond)
 
             # 3. compute previous image: x_t -> x_t-1
             trajectory = scheduler.step(
@@ -3,6 +3,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from diffusion_policy.model.common.normalizer import LinearNormalizer
+from diffusion_policy.model.ibc.dfo_sampler import EnergyMLP, dfo_sample
 from diffusion_policy.policy.base_image_policy import BaseImagePolicy
 from diffusion_policy.common.robomimic_config_util import get_robomimic_config
 from robomimic.algo import algo_factory
@@ -25,6 +26,8 @@ class IbcDfoHybridImagePolicy(BaseImagePolicy):
             pred_n_samples=16384,
             kevin_inference=False,
             andy_train=False,
+            pred_chunk_size=32768,
+            pred_early_stop_ess=None,
             obs_encoder_group_norm=True,
             eval_fixed_crop=True,
             crop_shape=(76, 76),
@@ -146,6 +149,10 @@ class IbcDfoHybridImagePolicy(BaseImagePolicy):
         self.horizon = horizon
         self.kevin_inference = kevin_inference
         self.andy_train = andy_train
+        # max (batch, sample) rows per energy evaluation
+        self.pred_chunk_size = pred_chunk_size
+        # stop DFO early once effective sample size < ratio * pred_n_samples
+        self.pred_early_stop_ess = pred_early_stop_ess
     
     def forward(self, obs, action):
         B, N, Ta, Da = action.shape
@@ -160,6 +167,13 @@ class IbcDfoHybridImagePolicy(BaseImagePolicy):
         x = x.reshape(B,N)
         return x
 
+    def get_energy_mlp(self) -> EnergyMLP:
+        return EnergyMLP(
+            dense0=self.dense0,
+            hidden_layers=[self.dense1, self.dense2, self.dense3],
+            out_layer=self.dense4,
+            chunk_size=self.pred_chunk_size)
+
     # ========= inference  ============
     def predict_action(self, obs_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
         """
@@ -201,44 +215,16 @@ class IbcDfoHybridImagePolicy(BaseImagePolicy):
             dtype=dtype)
         # (B, N, Ta, Da)
 
-        if self.kevin_inference:
-            # kevin's implementation
-            noise_scale = 3e-2
-            for i in range(self.pred_n_iter):
-                # Compute energies.
-                logits = self.forward(nobs_features, samples)
-                probs = F.softmax(logits, dim=-1)
-
-                # Resample with replacement.
-                idxs = torch.multinomial(probs, self.pred_n_samples, replacement=True)
-                samples = samples[torch.arange(samples.size(0)).unsqueeze(-1), idxs]
-
-                # Add noise and clip to target bounds.
-                samples = samples + torch.randn_like(samples) * noise_scale
-                samples = samples.clamp(min=naction_stats['min'], max=naction_stats['max'])
-
-            # Return target with highest probability.
-            logits = self.forward(nobs_features, samples)
-            probs = F.softmax(logits, dim=-1)
-            best_idxs = probs.argmax(dim=-1)
-            acts_n = samples[torch.arange(samples.size(0)), best_idxs, :]
-        else:
-            # andy's implementation
-            zero = torch.tensor(0, device=self.device)
-            resample_std = torch.tensor(3e-2, device=self.device)
-            for i in range(self.pred_n_iter):
-                # Forward pass.
-                logits = self.forward(nobs_features, samples) # (B, N)
-                prob = torch.softmax(logits, dim=-1)
-
-                if i < (self.pred_n_iter - 1):
-                    idxs = torch.multinomial(prob, self.pred_n_samples, replacement=True)
-                    samples = samples[torch.arange(samples.size(0)).unsqueeze(-1), idxs]
-                    samples += torch.normal(zero, resample_std, size=samples.shape, device=self.device)
-
-            # Return one sample per x in batch.
-            idxs = torch.multinomial(prob, num_samples=1, replacement=True)
-            acts_n = samples[torch.arange(samples.size(0)).unsqueeze(-1), idxs].squeeze(1)
+        energy_mlp = self.get_energy_mlp()
+        obs_proj = energy_mlp.project_obs(nobs_features)
+        acts_n = dfo_sample(
+            energy_fn=lambda x: energy_mlp(obs_proj, x),
+            samples=samples,
+            action_min=naction_stats['min'],
+            action_max=naction_stats['max'],
+            n_iter=self.pred_n_iter,
+            kevin_inference=self.kevin_inference,
+            early_stop_ess=self.pred_early_stop_ess)
 
         action = self.normalizer['action'].unnormalize(acts_n)
         result = {
@@ -3,6 +3,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from diffusion_policy.model.common.normalizer import LinearNormalizer
+from diffusion_policy.model.ibc.dfo_sampler import EnergyMLP, dfo_sample
 from diffusion_policy.policy.base_lowdim_policy import BaseLowdimPolicy
 
 class IbcDfoLowdimPolicy(BaseLowdimPolicy):
@@ -17,7 +18,9 @@ class IbcDfoLowdimPolicy(BaseLowdimPolicy):
             pred_n_iter=5,
             pred_n_samples=16384,
             kevin_inference=False,
-            andy_train=False
+            andy_train=False,
+            pred_chunk_size=32768,
+            pred_early_stop_ess=None
         ):
         super().__init__()
 
@@ -49,6 +52,10 @@ class IbcDfoLowdimPolicy(BaseLowdimPolicy):
         self.horizon = horizon
         self.kevin_inference = kevin_inference
         self.andy_train = andy_train
+        # max (batch, sample) rows per energy evaluation
+        self.pred_chunk_size = pred_chunk_size
+        # stop DFO early once effective sample size < ratio * pred_n_samples
+        self.pred_early_stop_ess = pred_early_stop_ess
     
     def forward(self, obs, action):
         B, N, Ta, Da = action.shape
@@ -63,6 +70,13 @@ class IbcDfoLowdimPolicy(BaseLowdimPolicy):
         x = x.reshape(B,N)
         return x
 
+    def get_energy_mlp(self) -> EnergyMLP:
+        return EnergyMLP(
+            dense0=self.dense0,
+            hidden_layers=[self.dense1, self.dense2, self.dense3],
+            out_layer=self.dense4,
+            chunk_size=self.pred_chunk_size)
+
     # ========= inference  ============
     def predict_action(self, obs_dict: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
         """
@@ -93,44 +107,16 @@ class IbcDfoLowdimPolicy(BaseLowdimPolicy):
             dtype=this_obs.dtype)
         # (B, N, Ta, Da)
 
-        if self.kevin_inference:
-            # kevin's implementation
-            noise_scale = 3e-2
-            for i in range(self.pred_n_iter):
-                # Compute energies.
-                logits = self.forward(this_obs, samples)
-                probs = F.softmax(logits, dim=-1)
-
-                # Resample with replacement.
-                idxs = torch.multinomial(probs, self.pred_n_samples, replacement=True)
-                samples = samples[torch.arange(samples.size(0)).unsqueeze(-1), idxs]
-
-                # Add noise and clip to target bounds.
-                samples = samples + torch.randn_like(samples) * noise_scale
-                samples = samples.clamp(min=naction_stats['min'], max=naction_stats['max'])
-
-            # Return target with highest probability.
-            logits = self.forward(this_obs, samples)
-            probs = F.softmax(logits, dim=-1)
-            best_idxs = probs.argmax(dim=-1)
-            acts_n = samples[torch.arange(samples.size(0)), best_idxs, :]
-        else:
-            # andy's implementation
-            zero = torch.tensor(0, device=self.device)
-            resample_std = torch.tensor(3e-2, device=self.device)
-            for i in range(self.pred_n_iter):
-                # Forward pass.
-                logits = self.forward(this_obs, samples) # (B, N)
-                prob = torch.softmax(logits, dim=-1)
-
-                if i < (self.pred_n_iter - 1):
-                    idxs = torch.multinomial(prob, self.pred_n_samples, replacement=True)
-                    samples = samples[torch.arange(samples.size(0)).unsqueeze(-1), idxs]
-                    samples += torch.normal(zero, resample_std, size=samples.shape, device=self.device)
-
-            # Return one sample per x in batch.
-            idxs = torch.multinomial(prob, num_samples=1, replacement=True)
-            acts_n = samples[torch.arange(samples.size(0)).unsqueeze(-1), idxs].squeeze(1)
+        energy_mlp = self.get_energy_mlp()
+        obs_proj = energy_mlp.project_obs(this_obs)
+        acts_n = dfo_sample(
+            energy_fn=lambda x: energy_mlp(obs_proj, x),
+            samples=samples,
+            action_min=naction_stats['min'],
+            action_max=naction_stats['max'],
+            n_iter=self.pred_n_iter,
+            kevin_inference=self.kevin_inference,
+            early_stop_ess=self.pred_early_stop_ess)
 
         action = self.normalizer['action'].unnormalize(acts_n)
         result = {
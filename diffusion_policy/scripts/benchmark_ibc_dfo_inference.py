@@ -0,0 +1,80 @@
+"""
+CPU latency of IBC DFO inference vs. number of action samples.
+
+Usage:
+python diffusion_policy/scripts/benchmark_ibc_dfo_inference.py -n 1024 -n 4096 -n 16384 -c 8192 -c 32768
+"""
+if __name__ == "__main__":
+    import sys
+    import pathlib
+
+    ROOT_DIR = str(pathlib.Path(__file__).parent.parent.parent)
+    sys.path.append(ROOT_DIR)
+
+import time
+import click
+import numpy as np
+import torch
+from diffusion_policy.model.common.normalizer import LinearNormalizer
+from diffusion_policy.policy.ibc_dfo_lowdim_policy import IbcDfoLowdimPolicy
+
+def timeit(fn, n_repeats):
+    fn()
+    durations = list()
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return np.median(durations) * 1000
+
+@click.command()
+@click.option('-n', '--n_samples', multiple=True, type=int, default=[1024, 4096, 16384])
+@click.option('-c', '--chunk_size', multiple=True, type=int, default=[8192, 32768])
+@click.option('-b', '--batch_size', default=1, type=int)
+@click.option('--obs_dim', default=20, type=int)
+@click.option('--action_dim', default=2, type=int)
+@click.option('--n_iter', default=5, type=int)
+@click.option('--n_repeats', default=5, type=int)
+@click.option('--threads', default=None, type=int)
+def main(n_samples, chunk_size, batch_size, obs_dim, action_dim,
+        n_iter, n_repeats, threads):
+    if threads is not None:
+        torch.set_num_threads(threads)
+    n_obs_steps = 2
+    n_action_steps = 1
+
+    normalizer = LinearNormalizer()
+    normalizer.fit({
+        'obs': torch.randn(1000, obs_dim),
+        'action': torch.rand(1000, action_dim)
+    })
+    obs_dict = {'obs': torch.randn(batch_size, n_obs_steps, obs_dim)}
+
+    print(f"{'n_samples':>10s}{'chunk':>10s}{'forward':>12s}{'energy':>12s}{'predict':>12s}  (ms)")
+    for n in n_samples:
+        for c in chunk_size:
+            policy = IbcDfoLowdimPolicy(
+                horizon=n_obs_steps,
+                obs_dim=obs_dim,
+                action_dim=action_dim,
+                n_action_steps=n_action_steps,
+                n_obs_steps=n_obs_steps,
+                pred_n_iter=n_iter,
+                pred_n_samples=n,
+                pred_chunk_size=c)
+            policy.set_normalizer(normalizer)
+            policy.eval()
+
+            obs = torch.randn(batch_size, n_obs_steps, obs_dim)
+            action = torch.rand(batch_size, n, n_action_steps, action_dim)
+            energy_mlp = policy.get_energy_mlp()
+            with torch.no_grad():
+                # one energy evaluation, repeated obs vs projected obs
+                forward_ms = timeit(lambda: policy.forward(obs, action), n_repeats)
+                energy_ms = timeit(lambda: energy_mlp(
+                    energy_mlp.project_obs(obs), action), n_repeats)
+                predict_ms = timeit(lambda: policy.predict_action(obs_dict), n_repeats)
+            print(f'{n:>10d}{c:>10d}{forward_ms:>12.2f}{energy_ms:>12.2f}{predict_ms:>12.2f}')
+
+if __name__ == '__main__':
+    main()
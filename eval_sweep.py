@@ -0,0 +1,141 @@
+"""
+Usage:
+Evaluate several checkpoints of the same task in one env worker pool:
+python eval_sweep.py -c data/outputs/xxx/checkpoints/epoch=0100-test_mean_score=0.800.ckpt -c data/outputs/xxx/checkpoints/latest.ckpt -o data/eval_sweep
+Evaluate all *.ckpt in a directory:
+python eval_sweep.py -c data/outputs/xxx/checkpoints -o data/eval_sweep
+"""
+
+import sys
+# use line-buffering for both stdout and stderr
+sys.stdout = open(sys.stdout.fileno(), mode='w', buffering=1)
+sys.stderr = open(sys.stderr.fileno(), mode='w', buffering=1)
+
+import os
+import pathlib
+import json
+import click
+import hydra
+import torch
+import dill
+import numpy as np
+import wandb
+from omegaconf import OmegaConf
+
+# allows arbitrary python code execution in configs using the ${eval:''} resolver
+OmegaConf.register_new_resolver("eval", eval, replace=True)
+
+
+def load_policy(ckpt_path, device):
+    """
+    Instantiate cfg.policy and load only the weights used for
+    evaluation (EMA if the run used EMA), skipping the optimizer
+    and the other model copy.
+    """
+    payload = torch.load(open(ckpt_path, 'rb'), pickle_module=dill, map_location='cpu')
+    cfg = payload['cfg']
+    state_dicts = payload['state_dicts']
+    if cfg.training.get('use_ema', False) and ('ema_model' in state_dicts):
+        key = 'ema_model'
+    elif 'model' in state_dicts:
+        key = 'model'
+    else:
+        key = 'policy'
+    policy = hydra.utils.instantiate(cfg.policy)
+    policy.load_state_dict(state_dicts[key])
+    del payload
+    policy.to(device)
+    policy.eval()
+    return cfg, policy
+
+
+def get_ckpt_paths(checkpoint):
+    ckpt_paths = list()
+    for path in checkpoint:
+        path = pathlib.Path(os.path.expanduser(path))
+        if path.is_dir():
+            ckpt_paths.extend(sorted(path.glob('*.ckpt')))
+        else:
+            ckpt_paths.append(path)
+    return ckpt_paths
+
+
+def to_json_log(log_data):
+    json_log = dict()
+    for key, value in log_data.items():
+        if isinstance(value, wandb.sdk.data_types.video.Video):
+            json_log[key] = value._path
+        elif isinstance(value, np.generic):
+            json_log[key] = value.item()
+        else:
+            json_log[key] = value
+    return json_log
+
+
+def format_table(names, json_logs):
+    # aggregate metrics only, skip per seed rewards and videos
+    keys = sorted(set(key for log in json_logs for key, value in log.items()
+        if isinstance(value, (int, float)) and ('_sim_' not in key)
+            and (not key.split('/')[-1].startswith('sim_'))))
+    name_width = max([len('checkpoint')] + [len(x) for x in names])
+    col_width = max([10] + [len(x) + 2 for x in keys])
+    lines = ['checkpoint'.ljust(name_width) + ''.join(x.rjust(col_width) for x in keys)]
+    for name, log in zip(names, json_logs):
+        row = name.ljust(name_width)
+        for key in keys:
+            value = log.get(key)
+            text = '-' if value is None else f'{value:.4f}'
+            row += text.rjust(col_width)
+        lines.append(row)
+    return '\n'.join(lines)
+
+
+@click.command()
+@click.option('-c', '--checkpoint', required=True, multiple=True,
+    help='Checkpoint file or directory of checkpoints, can be repeated.')
+@click.option('-o', '--output_dir', required=True)
+@click.option('-d', '--device', default='cuda:0')
+def main(checkpoint, output_dir, device):
+    ckpt_paths = get_ckpt_paths(checkpoint)
+    assert len(ckpt_paths) > 0, 'No checkpoint found'
+    output_dir = pathlib.Path(os.path.expanduser(output_dir))
+    if output_dir.exists():
+        click.confirm(f"Output path {output_dir} already exists! Overwrite?", abort=True)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    device = torch.device(device)
+
+    # load policies
+    cfg = None
+    env_runner_cfg = None
+    policies = list()
+    for ckpt_path in ckpt_paths:
+        print(f'Loading {ckpt_path}')
+        this_cfg, policy = load_policy(ckpt_path, device)
+        this_runner_cfg = OmegaConf.to_container(this_cfg.task.env_runner, resolve=True)
+        if cfg is None:
+            cfg = this_cfg
+            env_runner_cfg = this_runner_cfg
+        elif this_runner_cfg != env_runner_cfg:
+            raise ValueError(f'{ckpt_path} uses a different env_runner config, '
+                'all checkpoints in a sweep must share the same task.')
+        policies.append(policy)
+
+    # one env worker pool for all policies
+    env_runner = hydra.utils.instantiate(
+        cfg.task.env_runner,
+        output_dir=str(output_dir))
+    all_log_data = env_runner.run_policies(policies)
+
+    # dump logs
+    names = [str(x.name) for x in ckpt_paths]
+    json_logs = [to_json_log(x) for x in all_log_data]
+    sweep_log = dict((str(path), log) for path, log in zip(ckpt_paths, json_logs))
+    json.dump(sweep_log, open(output_dir.joinpath('eval_log.json'), 'w'),
+        indent=2, sort_keys=True)
+    table = format_table(names, json_logs)
+    with open(output_dir.joinpath('eval_table.txt'), 'w') as f:
+        f.write(table + '\n')
+    print(table)
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,7 @@ import collections
 import pickle
 import json
 import numpy as np
-from umi.common.cv_util import get_gripper_width
+from umi.common.cv_util import get_tag_arrays, get_gripper_widths
 
 
 # %%
@@ -26,10 +26,8 @@ def main(input, output, tag_det_threshold, nominal_z):
     
     # identify gripper hardware id
     n_frames = len(tag_detection_results)
-    tag_counts = collections.defaultdict(lambda: 0)
-    for frame in tag_detection_results:
-        for key in frame['tag_dict'].keys():
-            tag_counts[key] += 1
+    tag_counts = collections.Counter(
+        key for frame in tag_detection_results for key in frame['tag_dict'].keys())
     tag_stats = collections.defaultdict(lambda: 0.0)
     for k, v in tag_counts.items():
         tag_stats[k] = v / n_frames
@@ -64,14 +62,12 @@ def main(input, output, tag_det_threshold, nominal_z):
     left_id = gripper_id * tag_per_gripper
     right_id = left_id + 1
 
-    gripper_widths = list()
-    for i, dt in enumerate(tag_detection_results):
-        tag_dict = dt['tag_dict']
-        width = get_gripper_width(tag_dict, left_id, right_id, nominal_z=nominal_z)
-        if width is None:
-            width = float('Nan')
-        gripper_widths.append(width)
-    gripper_widths = np.array(gripper_widths)
+    # all frames at once, NaN where width is unknown
+    tag_arrays = get_tag_arrays(tag_detection_results, [left_id, right_id])
+    gripper_widths = get_gripper_widths(
+        tag_arrays['tags'][left_id]['tvec'],
+        tag_arrays['tags'][right_id]['tvec'],
+        nominal_z=nominal_z)
     max_width = np.nanmax(gripper_widths)
     min_width = np.nanmin(gripper_widths)
 
@@ -11,9 +11,10 @@ import click
 import numpy as np
 import pickle
 import json
-import pandas as pd
-from scipy.spatial.transform import Rotation
 from umi.common.pose_util import pose_to_mat
+from umi.common.orb_slam_util import load_trajectory_df
+from umi.common.cv_util import get_tag_arrays
+from umi.common.interpolation_util import get_nearest_idxs
 from skfda.exploratory.stats import geometric_median
 
 # %%
@@ -32,7 +33,7 @@ def main(tag_detection, csv_trajectory, output, tag_id, keyframe_only):
     """
 
     # load
-    df = pd.read_csv(csv_trajectory)
+    df, all_cam_pose = load_trajectory_df(csv_trajectory)
     tag_detection_results = pickle.load(open(tag_detection, 'rb'))
 
     # filter pose
@@ -40,53 +41,35 @@ def main(tag_detection, csv_trajectory, output, tag_id, keyframe_only):
     if keyframe_only:
         is_valid &= df['is_keyframe']
 
-    # convert to mat
-    cam_pose_timestamps = df['timestamp'].loc[is_valid].to_numpy()
-    cam_pos = df[['x','y','z']].loc[is_valid].to_numpy()
-    cam_rot_quat_xyzw = df[['q_x', 'q_y', 'q_z', 'q_w']].loc[is_valid].to_numpy()
-    cam_rot = Rotation.from_quat(cam_rot_quat_xyzw)
-    cam_pose = np.zeros((cam_pos.shape[0], 4, 4), dtype=np.float32)
-    cam_pose[:,3,3] = 1
-    cam_pose[:,:3,3] = cam_pos
-    cam_pose[:,:3,:3] = cam_rot.as_matrix()
+    # precomputed 4x4 poses
+    is_valid = is_valid.to_numpy()
+    cam_pose_timestamps = df['timestamp'].to_numpy()[is_valid]
+    cam_pose = all_cam_pose[is_valid]
 
     # match tum data to video idx
-    video_timestamps = np.array([x['time'] for x in tag_detection_results])
-    tum_video_idxs = list()
-    for t in cam_pose_timestamps:
-        tum_video_idxs.append(np.argmin(np.abs(video_timestamps - t)))
+    tag_arrays = get_tag_arrays(tag_detection_results, [tag_id])
+    video_timestamps = tag_arrays['time']
+    tum_video_idxs = get_nearest_idxs(video_timestamps, cam_pose_timestamps)
 
     # find corresponding tag detection
-    all_tx_slam_tag = list()
-    all_idxs = list()
-    for tum_idx, video_idx in enumerate(tum_video_idxs):
-        td = tag_detection_results[video_idx]
-        tag_dict = td['tag_dict']
-        if tag_id not in tag_dict:
-            continue
-        
-        tag = tag_dict[tag_id]
-        pose = np.concatenate([tag['tvec'], tag['rvec']])
-        tx_cam_tag = pose_to_mat(pose)
-        tx_slam_cam = cam_pose[tum_idx]
+    tag = dict((k, v[tum_video_idxs]) for k, v in tag_arrays['tags'][tag_id].items())
+    is_valid = tag['is_detected'].copy()
 
-        # filter cam pose
-        dist_to_cam = np.linalg.norm(tx_cam_tag[:3,3])
-        if (dist_to_cam < 0.3) or  (dist_to_cam > 2):
-            continue
-        
-        # filter tag location in image
-        corners = tag['corners']
-        tag_center_pix = corners.mean(axis=0)
-        img_center = np.array([2704, 2028], dtype=np.float32) / 2
-        dist_to_center = np.linalg.norm(tag_center_pix - img_center) / img_center[1]
-        if dist_to_center > 0.6:
-            continue
+    # filter cam pose
+    dist_to_cam = np.linalg.norm(tag['tvec'], axis=-1)
+    is_valid &= (dist_to_cam >= 0.3) & (dist_to_cam <= 2)
 
-        tx_slam_tag = tx_slam_cam @ tx_cam_tag
-        all_tx_slam_tag.append(tx_slam_tag)
-        all_idxs.append(tum_idx)
-    all_tx_slam_tag = np.array(all_tx_slam_tag)
+    # filter tag location in image
+    tag_center_pix = tag['corners'].mean(axis=1)
+    img_center = np.array([2704, 2028], dtype=np.float32) / 2
+    dist_to_center = np.linalg.norm(tag_center_pix - img_center, axis=-1) / img_center[1]
+    is_valid &= dist_to_center <= 0.6
+
+    # batched rvec -> matrix
+    pose = np.concatenate([tag['tvec'][is_valid], tag['rvec'][is_valid]], axis=-1)
+    tx_cam_tag = pose_to_mat(pose)
+    tx_slam_cam = cam_pose[is_valid]
+    all_tx_slam_tag = tx_slam_cam @ tx_cam_tag
 
     # find transform closest to the mean
     all_slam_tag_pos = all_tx_slam_tag[:,:3,3]
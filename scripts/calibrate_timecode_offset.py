@@ -10,11 +10,10 @@ os.chdir(ROOT_DIR)
 import click
 import os
 import av
-import cv2
 import datetime
-from tqdm import tqdm
-import json
+import multiprocessing
 from umi.common.timecode_util import stream_get_start_datetime
+from umi.common.qr_util import scan_video_qr, get_offset_statistics
 
 # %%
 def parse_qr_datetime(qr_txt):
@@ -23,35 +22,43 @@ def parse_qr_datetime(qr_txt):
 # %%
 @click.command()
 @click.option('-i', '--input', required=True, help='GoPro MP4 file')
-def main(input):
+@click.option('-s', '--stride', type=int, default=10, help='Frame stride of the coarse QR search')
+@click.option('-cs', '--coarse_scale', type=float, default=0.25, help='Image scale of the coarse QR search')
+@click.option('-r', '--n_refine', type=int, default=3, help='Number of coarse hits decoded at full resolution')
+@click.option('-n', '--num_workers', type=int, default=None)
+def main(input, stride, coarse_scale, n_refine, num_workers):
     input = os.path.expanduser(input)
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
 
-    # find the first QR code timestamp
-    detector = cv2.QRCodeDetector()
-    qr_datetime = None
-    tc_datetime = None
     with av.open(input) as container:
         stream = container.streams.video[0]
         tc_datetime = stream_get_start_datetime(stream=stream)
-        for i, frame in tqdm(enumerate(container.decode(stream))):
-            img = frame.to_ndarray(format='rgb24')
-            frame_cts_sec = frame.pts * stream.time_base
-
-            qr_txt, _, _ =detector.detectAndDecodeCurved(img)
-            if qr_txt.startswith('#'):
-                # found
-                qr_datetime = parse_qr_datetime(qr_txt) \
-                    - datetime.timedelta(seconds=float(frame_cts_sec))
-                break
-
-    if not qr_datetime:
+
+    # find QR code timestamps, coarse on downscaled frames then refine at full resolution
+    results = scan_video_qr(input, stride=stride, coarse_scale=coarse_scale,
+        n_refine=n_refine, num_workers=num_workers)
+
+    # one estimate per QR code, from its first frame
+    qr_dts = dict()
+    for frame_idx, frame_cts_sec, qr_txt in results:
+        if not qr_txt.startswith('#') or qr_txt in qr_dts:
+            continue
+        qr_datetime = parse_qr_datetime(qr_txt) \
+            - datetime.timedelta(seconds=frame_cts_sec)
+        qr_dts[qr_txt] = (qr_datetime - tc_datetime).total_seconds()
+
+    if len(qr_dts) == 0:
         raise RuntimeError("No valid QR code found.")
     
-    dt = (qr_datetime - tc_datetime).total_seconds()
+    # the first QR code found
+    dt = next(iter(qr_dts.values()))
+    stats = get_offset_statistics(list(qr_dts.values()))
 
     print("time = date + timecode + dt")
     print(f"dt = {dt}")
+    print(f"dt over {stats['n']} QR codes: MEDIAN={stats['median']} MEAN={stats['mean']} "
+        f"STD={stats['std']} MIN={stats['min']} MAX={stats['max']}")
 
 if __name__ == '__main__':
     main()
-
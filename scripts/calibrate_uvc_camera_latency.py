@@ -12,11 +12,12 @@ import cv2
 import qrcode
 import time
 import numpy as np
+import multiprocessing
 from collections import deque
-from tqdm import tqdm
 from multiprocessing.managers import SharedMemoryManager
 from umi.real_world.uvc_camera import UvcCamera
 from umi.common.usb_util import reset_all_elgato_devices, get_sorted_v4l_paths
+from umi.common.qr_util import detect_qr_images, get_offset_statistics
 from matplotlib import pyplot as plt
 
 # %%
@@ -25,7 +26,12 @@ from matplotlib import pyplot as plt
 @click.option('-qs', '--qr_size', type=int, default=720)
 @click.option('-f', '--fps', type=int, default=60)
 @click.option('-n', '--n_frames', type=int, default=120)
-def main(camera_idx, qr_size, fps, n_frames):
+@click.option('-di', '--detect_interval', type=int, default=1, help='Run live QR detection every N frames')
+@click.option('-cs', '--coarse_scale', type=float, default=0.5, help='Image scale of the QR presence check')
+@click.option('-nw', '--num_workers', type=int, default=None)
+def main(camera_idx, qr_size, fps, n_frames, detect_interval, coarse_scale, num_workers):
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
     # Find and reset all Elgato capture cards.
     # Required to workaround a firmware bug.
     reset_all_elgato_devices()
@@ -45,22 +51,26 @@ def main(camera_idx, qr_size, fps, n_frames):
             qr_latency_deque = deque(maxlen=get_max_k)
             qr_det_queue = deque(maxlen=get_max_k)
             data = None
+            iter_idx = 0
             while True:
                 t_start = time.time()
                 data = camera.get(out=data)
                 cam_img = data['color']
-                code, corners, _ = detector.detectAndDecodeCurved(cam_img)
-                color = (0,0,255)
-                if len(code) > 0:
-                    color = (0,255,0)
-                    ts_qr = float(code)
-                    ts_recv = data['camera_receive_timestamp']
-                    latency = ts_recv - ts_qr
-                    qr_det_queue.append(latency)
-                else:
-                    qr_det_queue.append(float('nan'))
-                if corners is not None:
-                    cv2.fillPoly(cam_img, corners.astype(np.int32), color)
+                # live feedback only, calibration runs on the buffered frames below
+                if iter_idx % detect_interval == 0:
+                    code, corners, _ = detector.detectAndDecodeCurved(cam_img)
+                    color = (0,0,255)
+                    if len(code) > 0:
+                        color = (0,255,0)
+                        ts_qr = float(code)
+                        ts_recv = data['camera_receive_timestamp']
+                        latency = ts_recv - ts_qr
+                        qr_det_queue.append(latency)
+                    else:
+                        qr_det_queue.append(float('nan'))
+                    if corners is not None:
+                        cv2.fillPoly(cam_img, corners.astype(np.int32), color)
+                iter_idx += 1
                 
                 qr = qrcode.QRCode(
                     version=1,
@@ -93,21 +103,26 @@ def main(camera_idx, qr_size, fps, n_frames):
                     exit(0)
             data = camera.get(k=get_max_k)
 
+        # presence check on downscaled frames, decode hits only, in a process pool
+        codes = detect_qr_images(data['color'],
+            coarse_scale=coarse_scale, num_workers=num_workers)
         qr_recv_map = dict()
-        for i in tqdm(range(len(data['camera_receive_timestamp']))):
+        for i, code in enumerate(codes):
             ts_recv = data['camera_receive_timestamp'][i]
-            img = data['color'][i]
-            code, corners, _ = detector.detectAndDecodeCurved(img)
             if len(code) > 0:
                 ts_qr = float(code)
                 if ts_qr not in qr_recv_map:
                     qr_recv_map[ts_qr] = ts_recv
+        if len(qr_recv_map) == 0:
+            raise RuntimeError("No valid QR code found.")
 
         avg_qr_latency = np.mean(qr_latency_deque)
         t_offsets = [v-k-avg_qr_latency for k,v in qr_recv_map.items()]
-        avg_latency = np.mean(t_offsets)
-        std_latency = np.std(t_offsets)
+        stats = get_offset_statistics(t_offsets)
+        avg_latency = stats['mean']
+        std_latency = stats['std']
         print(f'Capture to receive latency: AVG={avg_latency} STD={std_latency}')
+        print(f"Over {stats['n']} QR codes: MEDIAN={stats['median']} MIN={stats['min']} MAX={stats['max']}")
 
         x = np.array(list(qr_recv_map.values()))
         y = np.array(list(qr_recv_map.keys()))
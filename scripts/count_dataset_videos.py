@@ -11,6 +11,7 @@ import pathlib
 import pickle
 import collections
 import click
+from umi.common.session_index import SessionIndex
 
 # %%
 @click.command()
@@ -18,6 +19,7 @@ import click
 def main(input):
     n_videos = 0
     n_episode = 0
+    raw_duration_sec = 0
     for ipath in input:
         ipath = pathlib.Path(os.path.expanduser(ipath)).absolute()
         demos_path = ipath.joinpath('demos')
@@ -54,7 +56,9 @@ def main(input):
             for cam_id, camera in enumerate(cameras):
                 video_path_rel = camera['video_path']
                 video_path = demos_path.joinpath(video_path_rel).absolute()
-                assert video_path.is_file()
+                if str(video_path) not in videos_dict:
+                    # same video is shared by many episodes, only check once
+                    assert video_path.is_file()
                 
                 video_start, video_end = camera['video_start_end']
                 if n_frames is None:
@@ -72,7 +76,13 @@ def main(input):
         
         # vid_args.extend(videos_dict.items())
         n_videos += len(videos_dict)
+
+        # recorded duration from session index, without opening videos
+        for meta in SessionIndex(ipath).load('demos/demo*/raw_video.mp4').values():
+            raw_duration_sec += float(meta['n_frames'] / meta['fps'])
     print(f"{n_videos} videos and {n_episode} episodes in total.")
+    if raw_duration_sec > 0:
+        print(f"{raw_duration_sec / 3600:.2f} hours of indexed demo videos.")
 
 # %%
 if __name__ == "__main__":
@@ -13,18 +13,11 @@ import pathlib
 import pickle
 import collections
 import click
-import pandas as pd
 from scipy.spatial.transform import Rotation
+from umi.common.orb_slam_util import load_trajectory_df
 
 # %%
-def pose_interp_from_df(df, tx_base_slam=None):    
-    cam_pos = df[['x', 'y', 'z']].to_numpy()
-    cam_rot_quat_xyzw = df[['q_x', 'q_y', 'q_z', 'q_w']].to_numpy()
-    cam_rot = Rotation.from_quat(cam_rot_quat_xyzw)
-    cam_pose = np.zeros((cam_pos.shape[0], 4, 4), dtype=np.float32)
-    cam_pose[:,3,3] = 1
-    cam_pose[:,:3,3] = cam_pos
-    cam_pose[:,:3,:3] = cam_rot.as_matrix()
+def pose_interp_from_df(cam_pose, tx_base_slam=None):
     tx_slam_cam = cam_pose
     tx_base_cam = tx_slam_cam
     if tx_base_slam is not None:
@@ -58,7 +51,7 @@ def main(session_dir):
                 # no tracking data
                 continue
             
-            csv_df = pd.read_csv(csv_path)
+            csv_df, csv_cam_pose = load_trajectory_df(csv_path)
             
             if csv_df['is_lost'].sum() > 10:
                 # drop episode if too many lost frames
@@ -68,8 +61,8 @@ def main(session_dir):
             if (~csv_df['is_lost']).sum() < 60:
                 continue
             
-            df = csv_df.loc[~csv_df['is_lost']]
-            tx_tag_tcp = pose_interp_from_df(df, 
+            is_tracked = (~csv_df['is_lost']).to_numpy()
+            tx_tag_tcp = pose_interp_from_df(csv_cam_pose[is_tracked], 
                 # build pose in tag frame (z-up)
                 tx_base_slam=tx_tag_slam)
             tx_tag_tcp0 = tx_tag_tcp[0]
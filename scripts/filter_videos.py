@@ -12,6 +12,7 @@ import pathlib
 from aiohttp import web
 import aiofiles
 import asyncio
+from umi.common.session_index import SessionIndex
 
 # %%
 routes = web.RouteTableDef()
@@ -68,12 +69,22 @@ async def check(request):
 def main(session_dir):
     try:
         for session in session_dir:
-            session = pathlib.Path(os.path.expanduser(session))
+            session = pathlib.Path(os.path.expanduser(session)).absolute()
             name = session.name
             routes.static(f'/video/{name}', path=session.absolute())
             
             demos_dir = session.joinpath('demos')
-            for vid_path in sorted(demos_dir.glob("demo*/video_thumbnail.mp4")):
+            # review in recording order if the session index is available
+            video_metas = SessionIndex(session).load('demos/demo*/raw_video.mp4')
+            if len(video_metas) > 0:
+                raw_paths = sorted(video_metas.keys(), 
+                    key=lambda x: video_metas[x]['start_timestamp'])
+                vid_paths = [pathlib.Path(x).parent.joinpath('video_thumbnail.mp4') 
+                    for x in raw_paths]
+                vid_paths = [x for x in vid_paths if x.is_file()]
+            else:
+                vid_paths = sorted(demos_dir.glob("demo*/video_thumbnail.mp4"))
+            for vid_path in vid_paths:
                 rel_path = vid_path.relative_to(session.parent)
                 result_path = vid_path.parent.joinpath('check_result.txt')
                 if result_path.is_file():
@@ -13,18 +13,50 @@ import av
 from tqdm import tqdm
 import concurrent.futures
 import multiprocessing
-import cv2
-import numpy as np
+from fractions import Fraction
 
 # %%
-def worker(in_path, out_path, out_res, down_sample_ratio, speed_up):
+# quality/speed tradeoff
+# skip_frame: decoder side frame skipping, frames dropped by the decoder
+#   are never decoded. NONREF drops non-reference (B) frames,
+#   NONKEY decodes keyframes only (one frame per GOP).
+# interpolation: swscale filter used to downscale directly in YUV.
+# preset/crf: x264 encoder settings.
+QUALITY_PRESETS = {
+    'fast': {
+        'skip_frame': 'NONKEY',
+        'interpolation': 'FAST_BILINEAR',
+        'preset': 'ultrafast',
+        'crf': '28'
+    },
+    'balanced': {
+        'skip_frame': 'NONREF',
+        'interpolation': 'BILINEAR',
+        'preset': 'veryfast',
+        'crf': '23'
+    },
+    'high': {
+        'skip_frame': 'DEFAULT',
+        'interpolation': 'AREA',
+        'preset': 'medium',
+        'crf': '21'
+    }
+}
+
+# %%
+def worker(in_path, out_path, out_res, down_sample_ratio, speed_up, quality='balanced'):
+    params = QUALITY_PRESETS[quality]
+    down_sample_ratio = int(down_sample_ratio)
     with av.open(str(out_path), mode='w') as out_container:
         with av.open(str(in_path)) as in_container:
             in_stream = in_container.streams.video[0]
             in_stream.thread_type = "AUTO"
             in_stream.thread_count = 1
+            in_stream.codec_context.skip_frame = params['skip_frame']
             
-            out_rate = int(float(in_stream.average_rate) / down_sample_ratio * speed_up)
+            in_fps = in_stream.average_rate
+            in_time_base = in_stream.time_base
+            out_rate = int(float(in_fps) / down_sample_ratio * speed_up)
             out_stream = out_container.add_stream('h264', rate=out_rate)
             out_stream.thread_type = 'AUTO'
             out_stream.thread_count = 1
@@ -33,21 +65,33 @@ def worker(in_path, out_path, out_res, down_sample_ratio, speed_up):
 
             out_stream.width = rw
             out_stream.height = rh
+            out_stream.pix_fmt = 'yuv420p'
             
             out_codec_context = out_stream.codec_context
             out_codec_context.options = {
-                'crf': '21',
+                'crf': params['crf'],
+                'preset': params['preset'],
                 'profile': 'high'
             }
             
-            for i, frame in tqdm(enumerate(in_container.decode(in_stream)), total=in_stream.frames):
-                if i % int(down_sample_ratio) != 0:
+            start_pts = None
+            next_idx = 0
+            for frame in tqdm(in_container.decode(in_stream), total=in_stream.frames):
+                # source frame index from timestamp, since skipped
+                # frames are never returned by the decoder
+                if start_pts is None:
+                    start_pts = frame.pts
+                src_idx = int(round(float((frame.pts - start_pts) * in_time_base * in_fps)))
+                if src_idx < next_idx:
                     continue
+                out_idx = src_idx // down_sample_ratio
+                next_idx = (out_idx + 1) * down_sample_ratio
                 
-                img = frame.to_ndarray(format='rgb24')
-                img = cv2.resize(img, (rh, rw), interpolation=cv2.INTER_AREA)
-                
-                out_frame = av.VideoFrame.from_ndarray(img, format='rgb24')
+                # downscale in YUV, skipping rgb conversion
+                out_frame = frame.reformat(width=rw, height=rh, format='yuv420p',
+                    interpolation=params['interpolation'])
+                out_frame.pts = out_idx
+                out_frame.time_base = Fraction(1, out_rate)
                 for packet in out_stream.encode(out_frame):
                     out_container.mux(packet)
             
@@ -62,11 +106,12 @@ def worker(in_path, out_path, out_res, down_sample_ratio, speed_up):
 @click.option('-or', '--out_res', type=str, default='400x300')
 @click.option('-ds', '--down_sample_ratio', type=int, default=8)
 @click.option('-s', '--speed_up', type=float, default=2.0)
+@click.option('-q', '--quality', type=click.Choice(list(QUALITY_PRESETS.keys())), default='balanced',
+    help='fast: keyframes only, balanced: skip non-reference frames, high: decode all frames.')
 @click.option('-n', '--num_workers', type=int, default=None)
-def main(videos, num_workers, out_res, down_sample_ratio, speed_up):
+def main(videos, num_workers, out_res, down_sample_ratio, speed_up, quality):
     if num_workers is None:
         num_workers = multiprocessing.cpu_count()
-    cv2.setNumThreads(1)
     
     out_res = tuple(int(x) for x in out_res.split('x'))
     
@@ -91,7 +136,8 @@ def main(videos, num_workers, out_res, down_sample_ratio, speed_up):
                     worker, *args, 
                     out_res=out_res, 
                     down_sample_ratio=down_sample_ratio,
-                    speed_up=speed_up))
+                    speed_up=speed_up,
+                    quality=quality))
 
             completed, futures = concurrent.futures.wait(futures)
             pbar.update(len(completed))
@@ -135,13 +135,14 @@ def solve_sphere_collision(ee_poses, robots_config):
 @click.option('-sf', '--sim_fov', type=float, default=None)
 @click.option('-ci', '--camera_intrinsics', type=str, default=None)
 @click.option('--mirror_swap', is_flag=True, default=False)
+@click.option('--trace', is_flag=True, default=False, help="Record per-episode latency traces to output/traces.")
 def main(input, output, robot_ip, gripper_ip, 
     match_dataset, match_episode, match_camera,
     camera_reorder,
     vis_camera_idx, init_joints, 
     steps_per_inference, max_duration,
     frequency, command_latency, 
-    no_mirror, sim_fov, camera_intrinsics, mirror_swap):
+    no_mirror, sim_fov, camera_intrinsics, mirror_swap, trace):
     max_gripper_width = 0.09
     gripper_speed = 0.2
 
@@ -235,6 +236,7 @@ def main(input, output, robot_ip, gripper_ip,
                 # action
                 max_pos_speed=2.0,
                 max_rot_speed=6.0,
+                enable_tracing=trace,
                 shm_manager=shm_manager) as env:
             cv2.setNumThreads(2)
             print("Waiting for camera")
@@ -526,6 +528,7 @@ def main(input, output, robot_ip, gripper_ip,
                         # run inference
                         with torch.no_grad():
                             s = time.time()
+                            t_preprocess = time.monotonic()
                             obs_dict_np = get_real_umi_obs_dict(
                                 env_obs=obs, shape_meta=cfg.task.shape_meta, 
                                 obs_pose_repr=obs_pose_rep,
@@ -533,8 +536,12 @@ def main(input, output, robot_ip, gripper_ip,
                                 episode_start_pose=episode_start_pose)
                             obs_dict = dict_apply(obs_dict_np, 
                                 lambda x: torch.from_numpy(x).unsqueeze(0).to(device))
+                            t_inference = time.monotonic()
                             result = policy.predict_action(obs_dict)
                             raw_action = result['action_pred'][0].detach().to('cpu').numpy()
+                            if env.tracer is not None:
+                                env.tracer.record('policy_preprocess', t_preprocess, t_inference)
+                                env.tracer.record('policy_inference', t_inference, time.monotonic())
                             action = get_real_umi_action(raw_action, obs, action_pose_repr)
                             print('Inference latency:', time.time() - s)
                         
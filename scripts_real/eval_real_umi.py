@@ -93,6 +93,7 @@ OmegaConf.register_new_resolver("eval", eval, replace=True)
 @click.option('-rt', '--robot_type', default='ur5')
 @click.option('--mirror_crop', is_flag=True, default=False)
 @click.option('--mirror_swap', is_flag=True, default=False)
+@click.option('--trace', is_flag=True, default=False, help="Record per-episode latency traces to output/traces.")
 def main(input, output, robot_ip, gripper_ip, 
     match_dataset, match_episode, match_camera,
     camera_reorder,
@@ -100,7 +101,7 @@ def main(input, output, robot_ip, gripper_ip,
     steps_per_inference, max_duration,
     frequency, command_latency, 
     no_mirror, sim_fov, camera_intrinsics, robot_type, 
-    mirror_crop, mirror_swap):
+    mirror_crop, mirror_swap, trace):
     max_gripper_width = 0.09
     gripper_speed = 0.2
 
@@ -166,6 +167,7 @@ def main(input, output, robot_ip, gripper_ip,
                 max_pos_speed=2.0,
                 max_rot_speed=6.0,
                 robot_type=robot_type,
+                enable_tracing=trace,
                 shm_manager=shm_manager) as env:
             cv2.setNumThreads(2)
             print("Waiting for camera")
@@ -395,13 +397,18 @@ def main(input, output, robot_ip, gripper_ip,
                         # run inference
                         with torch.no_grad():
                             s = time.time()
+                            t_preprocess = time.monotonic()
                             obs_dict_np = get_real_umi_obs_dict(
                                 env_obs=obs, shape_meta=cfg.task.shape_meta, 
                                 obs_pose_repr=obs_pose_rep)
                             obs_dict = dict_apply(obs_dict_np, 
                                 lambda x: torch.from_numpy(x).unsqueeze(0).to(device))
+                            t_inference = time.monotonic()
                             result = policy.predict_action(obs_dict)
                             raw_action = result['action_pred'][0].detach().to('cpu').numpy()
+                            if env.tracer is not None:
+                                env.tracer.record('policy_preprocess', t_preprocess, t_inference)
+                                env.tracer.record('policy_inference', t_inference, time.monotonic())
                             action = get_real_umi_action(raw_action, obs, action_pose_repr)
                             print('Inference latency:', time.time() - s)
                         
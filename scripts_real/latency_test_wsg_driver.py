@@ -0,0 +1,72 @@
+# %%
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+# %%
+import click
+import time
+import numpy as np
+from umi.real_world.wsg_binary_driver import WSGBinaryDriver
+from umi.real_world.wsg_simulator import WSGSimulator
+
+# %%
+def print_stats(name, latencies):
+    latencies = np.array(latencies) * 1000
+    print(f'{name:>24s}: mean {latencies.mean():.3f}ms '
+          f'p50 {np.percentile(latencies, 50):.3f}ms '
+          f'p99 {np.percentile(latencies, 99):.3f}ms '
+          f'max {latencies.max():.3f}ms')
+
+# %%
+@click.command()
+@click.option('-h', '--hostname', default=None, help='WSG hostname, uses local simulator if not given.')
+@click.option('-p', '--port', type=int, default=1000)
+@click.option('-n', '--n_iters', type=int, default=1000)
+@click.option('-l', '--sim_latency', type=float, default=0.0, help='Simulator response latency in seconds.')
+def main(hostname, port, n_iters, sim_latency):
+    sim = None
+    if hostname is None:
+        sim = WSGSimulator(response_latency=sim_latency)
+        sim.start()
+        hostname = sim.hostname
+        port = sim.port
+        print(f'Started WSG simulator at {hostname}:{port}')
+
+    try:
+        with WSGBinaryDriver(hostname=hostname, port=port) as wsg:
+            wsg.ack_fault()
+            wsg.homing(positive_direction=True, wait=True)
+            pos = wsg.script_query()['position']
+
+            latencies = list()
+            for i in range(n_iters):
+                t = time.perf_counter()
+                wsg.script_position_pd(position=pos, velocity=0.0)
+                latencies.append(time.perf_counter() - t)
+            print_stats('position_pd', latencies)
+
+            latencies = list()
+            for i in range(n_iters):
+                t = time.perf_counter()
+                wsg.script_query()
+                wsg.script_position_pd(position=pos, velocity=0.0)
+                latencies.append(time.perf_counter() - t)
+            print_stats('query + position_pd', latencies)
+
+            latencies = list()
+            for i in range(n_iters):
+                t = time.perf_counter()
+                wsg.script_query_position_pd(position=pos, velocity=0.0)
+                latencies.append(time.perf_counter() - t)
+            print_stats('pipelined query + pd', latencies)
+    finally:
+        if sim is not None:
+            sim.stop()
+
+# %%
+if __name__ == '__main__':
+    main()
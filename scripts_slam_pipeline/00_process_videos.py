@@ -8,8 +8,8 @@ import sys
 import os
 import pathlib
 import shutil
-from exiftool import ExifToolHelper
-from umi.common.timecode_util import mp4_get_start_datetime
+from umi.common.session_index import (
+    SessionIndex, read_camera_serials, read_video_stream_meta, get_file_stat)
 
 '''
 设置根目录 ROOT_DIR 为 /home/{USER}/Project_UMI。
@@ -96,54 +96,69 @@ def main():
     print(f"Found {len(input_mp4_paths)} MP4 videos")
 
     '''
-    使用 ExifTool 获取视频的元数据并处理视频文件
+    使用 ExifTool 一次性批量获取所有视频的相机序列号, 并处理视频文件
     '''
-    with ExifToolHelper() as et:
-        for mp4_path in input_mp4_paths:
-            if mp4_path.is_symlink():
-                print(f"Skipping {mp4_path.name}, already moved.")
-                continue
+    new_mp4_paths = list()
+    for mp4_path in input_mp4_paths:
+        if mp4_path.is_symlink():
+            print(f"Skipping {mp4_path.name}, already moved.")
+            continue
+        new_mp4_paths.append(mp4_path)
+    cam_serials = read_camera_serials(new_mp4_paths)
 
-            start_date = mp4_get_start_datetime(str(mp4_path))
-            meta = list(et.get_metadata(str(mp4_path)))[0]
-            cam_serial = meta["QuickTime:CameraSerialNumber"]
+    index_metas = dict()
+    for mp4_path, cam_serial in zip(new_mp4_paths, cam_serials):
+        meta = read_video_stream_meta(mp4_path)
+        start_date = meta['start_date']
+        out_dname = (
+            "demo_"
+            + cam_serial
+            + "_"
+            + start_date.strftime(r"%Y.%m.%d_%H.%M.%S.%f")
+        )
+
+        # special folders
+        if mp4_path.name.startswith("mapping"):
+            out_dname = "mapping"
+        elif mp4_path.name.startswith(
+            "gripper_cal"
+        ) or mp4_path.parent.name.startswith("gripper_cal"):
             out_dname = (
-                "demo_"
+                "gripper_calibration_"
                 + cam_serial
                 + "_"
                 + start_date.strftime(r"%Y.%m.%d_%H.%M.%S.%f")
             )
 
-            # special folders
-            if mp4_path.name.startswith("mapping"):
-                out_dname = "mapping"
-            elif mp4_path.name.startswith(
-                "gripper_cal"
-            ) or mp4_path.parent.name.startswith("gripper_cal"):
-                out_dname = (
-                    "gripper_calibration_"
-                    + cam_serial
-                    + "_"
-                    + start_date.strftime(r"%Y.%m.%d_%H.%M.%S.%f")
-                )
-
-            # create directory
-            this_out_dir = output_dir.joinpath(out_dname)
-            this_out_dir.mkdir(parents=True, exist_ok=True)
-
-            # move videos
-            vfname = "raw_video.mp4"
-            out_video_path = this_out_dir.joinpath(vfname)
-            shutil.move(mp4_path, out_video_path)
-
-            # create symlink back from original location
-            # relative_to's walk_up argument is not available until python 3.12
-            dots = os.path.join(
-                *[".."] * len(mp4_path.parent.relative_to(session).parts)
-            )
-            rel_path = str(out_video_path.relative_to(session))
-            symlink_path = os.path.join(dots, rel_path)
-            mp4_path.symlink_to(symlink_path)
+        # create directory
+        this_out_dir = output_dir.joinpath(out_dname)
+        this_out_dir.mkdir(parents=True, exist_ok=True)
+
+        # move videos
+        vfname = "raw_video.mp4"
+        out_video_path = this_out_dir.joinpath(vfname)
+        shutil.move(mp4_path, out_video_path)
+
+        # create symlink back from original location
+        # relative_to's walk_up argument is not available until python 3.12
+        dots = os.path.join(
+            *[".."] * len(mp4_path.parent.relative_to(session).parts)
+        )
+        rel_path = str(out_video_path.relative_to(session))
+        symlink_path = os.path.join(dots, rel_path)
+        mp4_path.symlink_to(symlink_path)
+
+        meta['camera_serial'] = cam_serial
+        meta.update(get_file_stat(out_video_path))
+        index_metas[str(out_video_path)] = meta
+
+    '''
+    将视频元数据写入会话索引 session_index.sqlite, 供后续阶段复用
+    '''
+    index = SessionIndex(session)
+    index.put(index_metas)
+    # fill in videos moved by earlier runs
+    index.get_video_meta(sorted(output_dir.glob('*/raw_video.mp4')))
 
 if __name__ == "__main__":
     main()
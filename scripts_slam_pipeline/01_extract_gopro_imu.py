@@ -1,7 +1,10 @@
 """
 python /home/$(whoami)/Project_UMI/scripts_slam_pipeline/01_extract_gopro_imu.py
 
-脚本的主要功能是从 GoPro 视频文件中提取 IMU 数据，并使用 Docker 容器来执行这个任务。
+脚本的主要功能是从 GoPro 视频文件中提取 IMU 数据。
+默认使用 Docker 容器来执行这个任务 (--backend docker)，
+也可以使用 PyAV 在进程内解析 GPMF 数据流 (--backend native)。
+native 与 docker 输出的一致性需先在示例 session 上用 --check 验证。
 """
 
 import sys
@@ -11,6 +14,7 @@ import click
 import subprocess
 import multiprocessing
 import concurrent.futures
+import numpy as np
 from tqdm import tqdm
 
 '''
@@ -21,23 +25,114 @@ ROOT_DIR = '/home/{}/Project_UMI'.format(os.getenv('USER'))
 sys.path.append(ROOT_DIR)
 os.chdir(ROOT_DIR)
 
+from umi.common.gpmf_util import (
+    extract_gopro_imu, save_imu_json, save_imu_npz, load_telemetry_json)
+
+
+def extract_imu_native(video_dir, binary=False):
+    """
+    Parse raw_video.mp4 in video_dir into imu_data.json (and imu_data.npz).
+    """
+    video_dir = pathlib.Path(video_dir)
+    imu = extract_gopro_imu(video_dir.joinpath('raw_video.mp4'))
+    json_path = video_dir.joinpath('imu_data.json')
+    tmp_path = video_dir.joinpath('imu_data.json.tmp')
+    save_imu_json(imu, str(tmp_path))
+    os.replace(tmp_path, json_path)
+    if binary:
+        save_imu_npz(imu, str(video_dir.joinpath('imu_data.npz')))
+    return dict((key, len(x['value'])) for key, x in imu['streams'].items())
+
+
+def check_imu_native(video_dir):
+    """
+    Compare native extraction against an existing (docker) imu_data.json
+    without overwriting it. Returns max abs error of value and cts per stream.
+    """
+    video_dir = pathlib.Path(video_dir)
+    imu = extract_gopro_imu(video_dir.joinpath('raw_video.mp4'))
+    ref = load_telemetry_json(str(video_dir.joinpath('imu_data.json')))
+    result = dict()
+    for key, ref_stream in ref.items():
+        stream = imu['streams'].get(key)
+        if stream is None or len(stream['value']) != len(ref_stream['value']):
+            result[key] = {
+                'n_samples': None if stream is None else len(stream['value']),
+                'n_samples_ref': len(ref_stream['value'])
+            }
+            continue
+        result[key] = {
+            'n_samples': len(stream['value']),
+            'max_value_error': float(np.max(np.abs(stream['value'] - ref_stream['value']))),
+            'max_cts_error': float(np.max(np.abs(stream['cts'] - ref_stream['cts'])))
+        }
+    return result
+
+
 '''
 定义命令行参数
 使用 click 库定义命令行参数
 docker_image 指定要使用的 Docker 镜像
 num_workers 指定并发任务数
 no_docker_pull 用于控制是否从 Docker Hub 拉取最新的 Docker 镜像。
+backend 选择 docker (默认) 或 native (PyAV 进程内解析)
+binary 额外保存 imu_data.npz
+check 将 native 结果与已有的 imu_data.json (docker 输出) 比较，不覆盖文件
 '''
 @click.command()
 @click.option('-d', '--docker_image', default="chicheng/openicc:latest")
 @click.option('-n', '--num_workers', type=int, default=None)
 @click.option('-np', '--no_docker_pull', is_flag=True, default=False, help="pull docker image from docker hub")
+@click.option('-b', '--backend', type=click.Choice(['native', 'docker']), default='docker')
+@click.option('--binary', is_flag=True, default=False, help="also save imu_data.npz")
+@click.option('-c', '--check', is_flag=True, default=False, help="compare native extraction with existing imu_data.json")
 
-def main(docker_image, num_workers, no_docker_pull):
+def main(docker_image, num_workers, no_docker_pull, backend, binary, check):
     session_dir = pathlib.Path("/home/{}/Project_UMI/example_demo_session".format(os.getenv('USER')))
     if num_workers is None:
         num_workers = multiprocessing.cpu_count()
 
+    '''
+    找到包含 raw_video.mp4 的目录
+    '''
+    input_dir = session_dir.joinpath('demos')
+    input_video_dirs = [x.parent for x in input_dir.glob('*/raw_video.mp4')]
+    print(f'Found {len(input_video_dirs)} video dirs')
+
+    '''
+    native: 使用进程池在进程内解析 GPMF
+    '''
+    if check or backend == 'native':
+        if check:
+            video_dirs = [x.absolute() for x in input_video_dirs
+                if x.joinpath('imu_data.json').is_file()]
+        else:
+            video_dirs = list()
+            for video_dir in input_video_dirs:
+                video_dir = video_dir.absolute()
+                if video_dir.joinpath('imu_data.json').is_file():
+                    print(f"imu_data.json already exists, skipping {video_dir.name}")
+                    continue
+                video_dirs.append(video_dir)
+        results = dict()
+        with tqdm(total=len(video_dirs)) as pbar:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+                futures = dict()
+                for video_dir in video_dirs:
+                    if check:
+                        future = executor.submit(check_imu_native, video_dir)
+                    else:
+                        future = executor.submit(extract_imu_native, video_dir, binary)
+                    futures[future] = video_dir
+                for future in concurrent.futures.as_completed(futures):
+                    results[futures[future].name] = future.result()
+                    pbar.update(1)
+
+        print("Done! Result:")
+        for name in sorted(results.keys()):
+            print(name, results[name])
+        return
+
     '''
     检查 Docker 权限, 拉取 Docker 镜像
     '''
@@ -58,13 +153,6 @@ def main(docker_image, num_workers, no_docker_pull):
             print("Docker pull failed!")
             exit(1)
 
-    '''
-    找到包含 raw_video.mp4 的目录
-    '''
-    input_dir = session_dir.joinpath('demos')
-    input_video_dirs = [x.parent for x in input_dir.glob('*/raw_video.mp4')]
-    print(f'Found {len(input_video_dirs)} video dirs')
-
     '''
     使用并发处理提取 IMU 数据
     '''
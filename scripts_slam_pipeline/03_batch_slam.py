@@ -16,6 +16,7 @@ import cv2
 import av
 import numpy as np
 from umi.common.cv_util import draw_predefined_mask
+from umi.common.orb_slam_util import convert_csv_trajectory, get_trajectory_npy_path
 
 '''
 设置根目录 ROOT_DIR 为 /home/{USER}/Project_UMI。
@@ -181,6 +182,18 @@ def main(input_dir, map_path, docker_image, num_workers, max_lost_frames, timeou
     print("Done! Result:")
     print([x.result() for x in completed])
 
+    '''
+    将 camera_trajectory.csv 转换为可内存映射的 camera_trajectory.npy (含预计算的4x4位姿), 供后续阶段快速加载
+    '''
+    for video_dir in input_video_dirs:
+        csv_path = video_dir.joinpath('camera_trajectory.csv')
+        if not csv_path.is_file():
+            continue
+        npy_path = get_trajectory_npy_path(csv_path)
+        if npy_path.is_file() and (npy_path.stat().st_mtime_ns >= csv_path.stat().st_mtime_ns):
+            continue
+        convert_csv_trajectory(csv_path)
+
 # %%
 if __name__ == "__main__":
     main()
@@ -1,7 +1,7 @@
 """
 python /home/$(whoami)/Project_UMI/scripts_slam_pipeline/05_run_calibrations.py /home/$(whoami)/Project_UMI/example_demo_session
 
-脚本的主要功能是运行一系列的校准任务，包括 SLAM 标签校准和夹持器范围校准。
+脚本的主要功能是运行一系列的校准任务，包括 SLAM 标签校准和夹持器范围校准，所有校准目录并发运行。
 """
 
 import sys
@@ -9,6 +9,8 @@ import os
 import pathlib
 import click
 import subprocess
+import multiprocessing
+import concurrent.futures
 
 '''
 设置根目录 ROOT_DIR 为 /home/{USER}/Project_UMI。
@@ -22,16 +24,22 @@ os.chdir(ROOT_DIR)
 定义命令行参数
 使用 click 库定义命令行参数
 session_dir 会话目录, 这个项目默认是example_demo_session
+num_workers 指定并发任务数, 所有校准目录同时运行
 '''
 @click.command()
 @click.argument('session_dir', nargs=-1)
+@click.option('-n', '--num_workers', type=int, default=None)
+
+def main(session_dir, num_workers):
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
 
-def main(session_dir):
     '''
     脚本目录路径
     '''
     script_dir = pathlib.Path(__file__).parent.parent.joinpath('scripts')
     
+    cmds = list()
     for session in session_dir:
         session = pathlib.Path(session)
         demos_dir = session.joinpath('demos')
@@ -39,7 +47,7 @@ def main(session_dir):
         slam_tag_path = mapping_dir.joinpath('tx_slam_tag.json')
             
         '''
-        运行 SLAM 标签校准
+        SLAM 标签校准
         '''
         script_path = script_dir.joinpath('calibrate_slam_tag.py')
         assert script_path.is_file()
@@ -58,10 +66,10 @@ def main(session_dir):
             '--output', str(slam_tag_path),
             '--keyframe_only'
         ]
-        subprocess.run(cmd)
+        cmds.append(cmd)
         
         '''
-        运行夹持器范围校准
+        夹持器范围校准, 每个 gripper_calibration 目录一个任务
         '''
         script_path = script_dir.joinpath('calibrate_gripper_range.py')
         assert script_path.is_file()
@@ -75,8 +83,18 @@ def main(session_dir):
                 '--input', str(tag_path),
                 '--output', str(gripper_range_path)
             ]
-            subprocess.run(cmd)
+            cmds.append(cmd)
+
+    '''
+    并发运行所有校准任务
+    '''
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(subprocess.run, cmd) for cmd in cmds]
+        results = [x.result() for x in futures]
+    for cmd, result in zip(cmds, results):
+        if result.returncode != 0:
+            print(f"Calibration failed: {' '.join(cmd)}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
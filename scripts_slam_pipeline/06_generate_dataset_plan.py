@@ -13,21 +13,22 @@ import numpy as np
 import json
 import math
 import collections
+import functools
+import multiprocessing
+import concurrent.futures
 import scipy.ndimage as sn
 import pandas as pd
 import numpy as np
-from scipy.spatial.transform import Rotation
 from tqdm import tqdm
-import av
-from exiftool import ExifToolHelper
-from umi.common.timecode_util import mp4_get_start_datetime
+from umi.common.session_index import SessionIndex
 from umi.common.pose_util import pose_to_mat, mat_to_pose
+from umi.common.orb_slam_util import load_trajectory_df, quat_pos_to_mat
 from umi.common.cv_util import (
     get_gripper_width
 )
 from umi.common.interpolation_util import (
     get_gripper_calibration_interpolator, 
-    get_interp1d,
+    interp1d_linear,
     PoseInterpolator
 )
 
@@ -55,15 +56,12 @@ def get_bool_segments(bool_seq):
     segment_type = np.array(segment_type, dtype=bool)
     return segments, segment_type
 
-def pose_interp_from_df(df, start_timestamp=0.0, tx_base_slam=None):    
+def pose_interp_from_df(df, start_timestamp=0.0, tx_base_slam=None, cam_pose=None):
     timestamp_sec = df['timestamp'].to_numpy() + start_timestamp
-    cam_pos = df[['x', 'y', 'z']].to_numpy()
-    cam_rot_quat_xyzw = df[['q_x', 'q_y', 'q_z', 'q_w']].to_numpy()
-    cam_rot = Rotation.from_quat(cam_rot_quat_xyzw)
-    cam_pose = np.zeros((cam_pos.shape[0], 4, 4), dtype=np.float32)
-    cam_pose[:,3,3] = 1
-    cam_pose[:,:3,3] = cam_pos
-    cam_pose[:,:3,:3] = cam_rot.as_matrix()
+    if cam_pose is None:
+        cam_pose = quat_pos_to_mat(
+            df[['x', 'y', 'z']].to_numpy(),
+            df[['q_x', 'q_y', 'q_z', 'q_w']].to_numpy())
     tx_slam_cam = cam_pose
     tx_base_cam = tx_slam_cam
     if tx_base_slam is not None:
@@ -80,6 +78,264 @@ def get_x_projection(tx_tag_this, tx_tag_other):
     proj_other_right = np.sum(v_this_right * t_this_other, axis=-1)
     return proj_other_right
 
+
+def generate_demo_plans(demo_idx, demo_data, demo_video_meta_df,
+        n_gripper_cams, tx_tag_slam, tx_cam_tcp,
+        gripper_id_gripper_cal_map, cam_serial_gripper_cal_map,
+        nominal_z, min_episode_length):
+    """
+    Generate plan episodes for one demo.
+    demo_video_meta_df: video meta of this demo, indexed and sorted by camera_idx
+    Independent across demos, runs in worker processes.
+    """
+    start_timestamp = demo_data['start_timestamp']
+    end_timestamp = demo_data['end_timestamp']
+    result = {
+        'plans': list(),
+        'available_time': end_timestamp - start_timestamp,
+        'used_time': 0.0,
+        'dropped_camera_serials': list(),
+        'is_dropped': False
+    }
+    
+    # determine optimal alignment
+    dt = None
+    alignment_costs = list()
+    for cam_idx, row in demo_video_meta_df.iterrows():
+        dt = 1 / row['fps']
+        this_alignment_cost = list()
+        for other_cam_idx, other_row in demo_video_meta_df.iterrows():
+            # what's the delay for previous frame
+            diff = other_row['start_timestamp'] - row['start_timestamp']
+            remainder = diff % dt
+            this_alignment_cost.append(remainder)
+        alignment_costs.append(this_alignment_cost)
+    # first video in bundle
+    align_cam_idx = np.argmin([sum(x) for x in alignment_costs])
+
+    # mock experiment
+    # alignment_costs = list()
+    # starts = [0.2, 0.1, 0.0]
+    # for i in range(len(starts)):
+    #     this_alignment_cost = list()
+    #     for j in range(len(starts)):
+    #         this_alignment_cost.append((starts[j] - starts[i]) % 0.5)
+    #     alignment_costs.append(this_alignment_cost)
+
+    # align_video_idx = np.argmin([sum(x) for x in alignment_costs])
+    # print(align_video_idx)
+
+    # rewrite start_timestamp to be integer multiple of dt
+    align_video_start = demo_video_meta_df.loc[align_cam_idx]['start_timestamp']
+    start_timestamp += dt - ((start_timestamp - align_video_start) % dt)
+
+    # descritize timestamps for all videos
+    cam_start_frame_idxs = list()
+    n_frames = int((end_timestamp - start_timestamp) / dt)
+    for cam_idx, row in demo_video_meta_df.iterrows():
+        video_start_frame = math.ceil((start_timestamp - row['start_timestamp']) / dt)
+        video_n_frames = math.floor((row['end_timestamp'] - start_timestamp) / dt) - 1
+        if video_start_frame < 0:
+            video_n_frames += video_start_frame
+            video_start_frame = 0
+        cam_start_frame_idxs.append(video_start_frame)
+        n_frames = min(n_frames, video_n_frames)
+    demo_timestamps = np.arange(n_frames) * float(dt) + start_timestamp
+
+    # load pose and gripper data for each video
+    # determin valid frames for each video
+    all_cam_poses = list()
+    all_gripper_widths = list()
+    all_is_valid = list()
+    
+    for cam_idx, row in demo_video_meta_df.iterrows():
+        if cam_idx >= n_gripper_cams:
+            # not gripper camera
+            continue
+
+        start_frame_idx = cam_start_frame_idxs[cam_idx]
+        video_dir = row['video_dir']
+        
+        # load check data
+        check_path = video_dir.joinpath('check_result.txt')
+        if check_path.is_file():
+            if not check_path.open('r').read().startswith('true'):
+                print(f"Skipping {video_dir.name}, manually filtered with check_result.txt!=true")
+                continue
+
+        # load SLAM data
+        csv_path = video_dir.joinpath('camera_trajectory.csv')
+        if not csv_path.is_file():
+            print(f"Skipping {video_dir.name}, no camera_trajectory.csv.")
+            result['dropped_camera_serials'].append(row['camera_serial'])
+            continue            
+        
+        csv_df, csv_cam_pose = load_trajectory_df(csv_path)
+        # select aligned frames
+        df = csv_df.iloc[start_frame_idx: start_frame_idx+n_frames]
+        is_tracked = (~df['is_lost']).to_numpy()
+
+        # basic filtering to remove bad tracking
+        n_frames_lost = (~is_tracked).sum()
+        if n_frames_lost > 10:
+            print(f"Skipping {video_dir.name}, {n_frames_lost} frames are lost.")
+            result['dropped_camera_serials'].append(row['camera_serial'])
+            continue
+
+        n_frames_valid = is_tracked.sum()
+        if n_frames_valid < 60:
+            print(f"Skipping {video_dir.name}, only {n_frames_valid} frames are valid.")
+            result['dropped_camera_serials'].append(row['camera_serial'])
+            continue
+        
+        # load camera pose, precomputed (identity rotation for lost frames)
+        cam_pose = csv_cam_pose[start_frame_idx: start_frame_idx+n_frames]
+        tx_slam_cam = cam_pose
+        tx_tag_cam = tx_tag_slam @ tx_slam_cam
+
+        # TODO: handle optinal robot cal based filtering
+        is_step_valid = is_tracked.copy()
+        
+
+        # get gripper data
+        pkl_path = video_dir.joinpath('tag_detection.pkl')
+        if not pkl_path.is_file():
+            print(f"Skipping {video_dir.name}, no tag_detection.pkl.")
+            result['dropped_camera_serials'].append(row['camera_serial'])
+            continue
+                    
+        tag_detection_results = pickle.load(open(pkl_path, 'rb'))
+        # select aligned frames
+        tag_detection_results = tag_detection_results[start_frame_idx: start_frame_idx+n_frames]
+
+        # one item per frame
+        video_timestamps = np.array([x['time'] for x in tag_detection_results])
+
+        if len(df) != len(video_timestamps):
+            print(f"Skipping {video_dir.name}, video csv length mismatch.")
+            continue
+
+        # get gripper action
+        ghi = row['gripper_hardware_id']
+        if ghi < 0:
+            print(f"Skipping {video_dir.name}, invalid gripper hardware id {ghi}")
+            result['dropped_camera_serials'].append(row['camera_serial'])
+            continue
+        
+        left_id = 6 * ghi
+        right_id = left_id + 1
+
+        gripper_cal_interp = None
+        if ghi in gripper_id_gripper_cal_map:
+            gripper_cal_interp = gripper_id_gripper_cal_map[ghi]
+        elif row['camera_serial'] in cam_serial_gripper_cal_map:
+            gripper_cal_interp = cam_serial_gripper_cal_map[row['camera_serial']]
+            print(f"Gripper id {ghi} not found in gripper calibrations {list(gripper_id_gripper_cal_map.keys())}. Falling back to camera serial map.")
+        else:
+            raise RuntimeError("Gripper calibration not found.")
+
+        gripper_timestamps = list()
+        gripper_widths = list()
+        for td in tag_detection_results:
+            width = get_gripper_width(td['tag_dict'], 
+                left_id=left_id, right_id=right_id, 
+                nominal_z=nominal_z)
+            if width is not None:
+                gripper_timestamps.append(td['time'])
+                gripper_widths.append(width)
+        # calibrate all detections at once
+        gripper_widths = gripper_cal_interp(np.array(gripper_widths))
+        
+        gripper_det_ratio = (len(gripper_widths) / len(tag_detection_results))
+        if gripper_det_ratio < 0.9:
+            print(f"Warining: {video_dir.name} only {gripper_det_ratio} of gripper tags detected.")
+        
+        this_gripper_widths = interp1d_linear(
+            gripper_timestamps, gripper_widths, video_timestamps)
+        
+        # transform to tcp frame
+        tx_tag_tcp = tx_tag_cam @ tx_cam_tcp
+        pose_tag_tcp = mat_to_pose(tx_tag_tcp)
+        
+        # output value
+        assert len(pose_tag_tcp) == n_frames
+        assert len(this_gripper_widths) == n_frames
+        assert len(is_step_valid) == n_frames
+        all_cam_poses.append(pose_tag_tcp)
+        all_gripper_widths.append(this_gripper_widths)
+        all_is_valid.append(is_step_valid)
+
+    if len(all_cam_poses) != n_gripper_cams:
+        print(f"Skipped demo {demo_idx}.")
+        result['is_dropped'] = True
+        return result
+
+    # aggregate valid result
+    all_is_valid = np.array(all_is_valid)
+    is_step_valid = np.all(all_is_valid, axis=0)
+    
+    # generate episode start and end pose for each gripper
+    first_valid_step = np.nonzero(is_step_valid)[0][0]
+    last_valid_step = np.nonzero(is_step_valid)[0][-1]
+    demo_start_poses = list()
+    demo_end_poses = list()
+    for cam_idx in range(len(all_cam_poses)):
+        cam_poses = all_cam_poses[cam_idx]
+        demo_start_poses.append(cam_poses[first_valid_step])
+        demo_end_poses.append(cam_poses[last_valid_step])
+
+    # determine episode segmentation
+    # remove valid segments that are too short
+    segment_slices, segment_type = get_bool_segments(is_step_valid)
+    for s, is_valid_segment in zip(segment_slices, segment_type):
+        start = s.start
+        end = s.stop
+        if not is_valid_segment:
+            continue
+        if (end - start) < min_episode_length:
+            is_step_valid[start:end] = False
+    
+    # finally, generate one episode for each valid segment
+    segment_slices, segment_type = get_bool_segments(is_step_valid)
+    for s, is_valid in zip(segment_slices, segment_type):
+        if not is_valid:
+            continue
+        start = s.start
+        end = s.stop
+
+        result['used_time'] += float((end - start) * dt)
+        
+        grippers = list()
+        cameras = list()
+        for cam_idx, row in demo_video_meta_df.iterrows():
+            if cam_idx < n_gripper_cams:
+                pose_tag_tcp = all_cam_poses[cam_idx][start:end]
+                
+                # gripper cam
+                grippers.append({
+                    "tcp_pose": pose_tag_tcp,
+                    "gripper_width": all_gripper_widths[cam_idx][start:end],
+                    "demo_start_pose": demo_start_poses[cam_idx],
+                    "demo_end_pose": demo_end_poses[cam_idx]
+                })
+            # all cams
+            video_dir = row['video_dir']
+            vid_start_frame = cam_start_frame_idxs[cam_idx]
+            cameras.append({
+                "video_path": str(video_dir.joinpath('raw_video.mp4').relative_to(video_dir.parent)),
+                "video_start_end": (start+vid_start_frame, end+vid_start_frame)
+            })
+        
+        result['plans'].append({
+            "episode_timestamps": demo_timestamps[start:end],
+            "grippers": grippers,
+            "cameras": cameras
+        })
+    return result
+
+def generate_demo_plans_star(args, **kwargs):
+    return generate_demo_plans(*args, **kwargs)
+
 '''
 定义命令行参数
 input 项目目录, 包含所有数据文件。
@@ -89,6 +345,7 @@ tx_slam_tag SLAM标签变换矩阵的JSON文件路径。
 nominal_z 夹持器手指标签的标称Z值。
 min_episode_length 最小的演示段长度。
 ignore_cameras 要忽略的摄像头序列号, 以逗号分隔。
+num_workers 并行处理演示的进程数。
 '''
 @click.command()
 @click.option('-i', '--input', required=True, help='Project directory')
@@ -98,8 +355,9 @@ ignore_cameras 要忽略的摄像头序列号, 以逗号分隔。
 @click.option('-nz', '--nominal_z', type=float, default=0.072, help="nominal Z value for gripper finger tag")
 @click.option('-ml', '--min_episode_length', type=int, default=24)
 @click.option('--ignore_cameras', type=str, default=None, help="comma separated string of camera serials to ignore")
+@click.option('-n', '--num_workers', type=int, default=None)
 
-def main(input, output, tcp_offset, tx_slam_tag, nominal_z, min_episode_length, ignore_cameras):
+def main(input, output, tcp_offset, tx_slam_tag, nominal_z, min_episode_length, ignore_cameras, num_workers):
     '''
     阶段 0: 收集输入数据
     '''
@@ -107,6 +365,8 @@ def main(input, output, tcp_offset, tx_slam_tag, nominal_z, min_episode_length,
     demos_dir = input_path.joinpath('demos')
     if output is None:
         output = input_path.joinpath('dataset_plan.pkl')
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
 
     '''
     定义相机到夹持器尖端的偏移量和变换矩阵。
@@ -138,25 +398,29 @@ def main(input, output, tcp_offset, tx_slam_tag, nominal_z, min_episode_length,
     gripper_id_gripper_cal_map = dict()
     cam_serial_gripper_cal_map = dict()
 
-    with ExifToolHelper() as et:
-        for gripper_cal_path in demos_dir.glob("gripper*/gripper_range.json"):
-            mp4_path = gripper_cal_path.parent.joinpath('raw_video.mp4')
-            meta = list(et.get_metadata(str(mp4_path)))[0]
-            cam_serial = meta['QuickTime:CameraSerialNumber']
-
-            gripper_range_data = json.load(gripper_cal_path.open('r'))
-            gripper_id = gripper_range_data['gripper_id']
-            max_width = gripper_range_data['max_width']
-            min_width = gripper_range_data['min_width']
-            gripper_cal_data = {
-                'aruco_measured_width': [min_width, max_width],
-                'aruco_actual_width': [min_width, max_width]
-            }
-            gripper_cal_interp = get_gripper_calibration_interpolator(**gripper_cal_data)
-            gripper_id_gripper_cal_map[gripper_id] = gripper_cal_interp
-            cam_serial_gripper_cal_map[cam_serial] = gripper_cal_interp
+    # video metadata from session index written by 00_process_videos.py,
+    # only new or modified videos are re-read
+    session_index = SessionIndex(input_path)
+    gripper_cal_paths = sorted(demos_dir.glob("gripper*/gripper_range.json"))
+    gripper_video_metas = session_index.get_video_meta(
+        [x.parent.joinpath('raw_video.mp4') for x in gripper_cal_paths])
+
+    for gripper_cal_path, meta in zip(gripper_cal_paths, gripper_video_metas.values()):
+        cam_serial = meta['camera_serial']
+
+        gripper_range_data = json.load(gripper_cal_path.open('r'))
+        gripper_id = gripper_range_data['gripper_id']
+        max_width = gripper_range_data['max_width']
+        min_width = gripper_range_data['min_width']
+        gripper_cal_data = {
+            'aruco_measured_width': [min_width, max_width],
+            'aruco_actual_width': [min_width, max_width]
+        }
+        gripper_cal_interp = get_gripper_calibration_interpolator(**gripper_cal_data)
+        gripper_id_gripper_cal_map[gripper_id] = gripper_cal_interp
+        cam_serial_gripper_cal_map[cam_serial] = gripper_cal_interp
+
 
-    
     '''阶段 1: 提取视频元数据
     遍历 demos 目录中的视频文件, 提取元数据（如摄像头序列号、开始时间戳、帧数、帧率等）, 并将结果存储在 video_meta_df 中。
     '''
@@ -172,51 +436,49 @@ def main(input, output, tcp_offset, tx_slam_tag, nominal_z, min_episode_length,
         serials = ignore_cameras.split(',')
         ignore_cam_serials = set(serials)
     
+    video_metas = session_index.get_video_meta(
+        [x.joinpath('raw_video.mp4') for x in video_dirs])
+
     fps = None
     rows = list()
-    with ExifToolHelper() as et:
-        for video_dir in video_dirs:            
-            mp4_path = video_dir.joinpath('raw_video.mp4')
-            meta = list(et.get_metadata(str(mp4_path)))[0]
-            cam_serial = meta['QuickTime:CameraSerialNumber']
-            start_date = mp4_get_start_datetime(str(mp4_path))
-            start_timestamp = start_date.timestamp()
-
-            if cam_serial in ignore_cam_serials:
-                print(f"Ignored {video_dir.name}")
-                continue
-            
-            csv_path = video_dir.joinpath('camera_trajectory.csv')
-            if not csv_path.is_file():
-                print(f"Ignored {video_dir.name}, no camera_trajectory.csv")
-                continue
-            
-            pkl_path = video_dir.joinpath('tag_detection.pkl')
-            if not pkl_path.is_file():
-                print(f"Ignored {video_dir.name}, no tag_detection.pkl")
-                continue
-            
-            with av.open(str(mp4_path), 'r') as container:
-                stream = container.streams.video[0]
-                n_frames = stream.frames
-                if fps is None:
-                    fps = stream.average_rate
-                else:
-                    if fps != stream.average_rate:
-                        print(f"Inconsistent fps: {float(fps)} vs {float(stream.average_rate)} in {video_dir.name}")
-                        exit(1)
-            duration_sec = float(n_frames / fps)
-            end_timestamp = start_timestamp + duration_sec
-            
-            rows.append({
-                'video_dir': video_dir,
-                'camera_serial': cam_serial,
-                'start_date': start_date,
-                'n_frames': n_frames,
-                'fps': fps,
-                'start_timestamp': start_timestamp,
-                'end_timestamp': end_timestamp
-            })
+    for video_dir, meta in zip(video_dirs, video_metas.values()):
+        cam_serial = meta['camera_serial']
+        start_date = meta['start_date']
+        start_timestamp = start_date.timestamp()
+
+        if cam_serial in ignore_cam_serials:
+            print(f"Ignored {video_dir.name}")
+            continue
+        
+        csv_path = video_dir.joinpath('camera_trajectory.csv')
+        if not csv_path.is_file():
+            print(f"Ignored {video_dir.name}, no camera_trajectory.csv")
+            continue
+        
+        pkl_path = video_dir.joinpath('tag_detection.pkl')
+        if not pkl_path.is_file():
+            print(f"Ignored {video_dir.name}, no tag_detection.pkl")
+            continue
+        
+        n_frames = meta['n_frames']
+        if fps is None:
+            fps = meta['fps']
+        else:
+            if fps != meta['fps']:
+                print(f"Inconsistent fps: {float(fps)} vs {float(meta['fps'])} in {video_dir.name}")
+                exit(1)
+        duration_sec = float(n_frames / fps)
+        end_timestamp = start_timestamp + duration_sec
+        
+        rows.append({
+            'video_dir': video_dir,
+            'camera_serial': cam_serial,
+            'start_date': start_date,
+            'n_frames': n_frames,
+            'fps': fps,
+            'start_timestamp': start_timestamp,
+            'end_timestamp': end_timestamp
+        })
     if len(rows) == 0:
         print("No valid videos found!")
         exit(1)
@@ -432,7 +694,7 @@ def main(input, output, tcp_offset, tx_slam_tag, nominal_z, min_episode_length,
                 # no tracking data
                 break
 
-            csv_df = pd.read_csv(csv_path)
+            csv_df, csv_cam_pose = load_trajectory_df(csv_path)
             
             if csv_df['is_lost'].sum() > 10:
                 # drop episode if too many lost frames
@@ -442,11 +704,13 @@ def main(input, output, tcp_offset, tx_slam_tag, nominal_z, min_episode_length,
             if (~csv_df['is_lost']).sum() < 60:
                 break
 
-            df = csv_df.loc[~csv_df['is_lost']]
+            is_tracked = (~csv_df['is_lost']).to_numpy()
+            df = csv_df.loc[is_tracked]
             pose_interp = pose_interp_from_df(df, 
                 start_timestamp=row['start_timestamp'], 
                 # build pose in tag frame (z-up)
-                tx_base_slam=tx_tag_slam)
+                tx_base_slam=tx_tag_slam,
+                cam_pose=csv_cam_pose[is_tracked])
             pose_interps.append(pose_interp)
         
         if len(pose_interps) != n_gripper_cams:
@@ -540,255 +804,40 @@ def main(input, output, tcp_offset, tx_slam_tag, nominal_z, min_episode_length,
     dropped_camera_count = collections.defaultdict(lambda: 0)
     n_dropped_demos = 0
     all_plans = list()
+    # demos are independent given the camera and gripper maps
+    demo_args = list()
     for demo_idx, demo_data in enumerate(demo_data_list):
-        video_idxs = demo_data['video_idxs']
-        start_timestamp = demo_data['start_timestamp']
-        end_timestamp = demo_data['end_timestamp']
-        total_avaliable_time += (end_timestamp - start_timestamp)
-
         # select relevant video data
-        demo_video_meta_df = video_meta_df.loc[video_idxs].copy()
+        demo_video_meta_df = video_meta_df.loc[demo_data['video_idxs']].copy()
         demo_video_meta_df.set_index('camera_idx', inplace=True)
         demo_video_meta_df.sort_index(inplace=True)
-        
-        # determine optimal alignment
-        dt = None
-        alignment_costs = list()
-        for cam_idx, row in demo_video_meta_df.iterrows():
-            dt = 1 / row['fps']
-            this_alignment_cost = list()
-            for other_cam_idx, other_row in demo_video_meta_df.iterrows():
-                # what's the delay for previous frame
-                diff = other_row['start_timestamp'] - row['start_timestamp']
-                remainder = diff % dt
-                this_alignment_cost.append(remainder)
-            alignment_costs.append(this_alignment_cost)
-        # first video in bundle
-        align_cam_idx = np.argmin([sum(x) for x in alignment_costs])
-
-        # mock experiment
-        # alignment_costs = list()
-        # starts = [0.2, 0.1, 0.0]
-        # for i in range(len(starts)):
-        #     this_alignment_cost = list()
-        #     for j in range(len(starts)):
-        #         this_alignment_cost.append((starts[j] - starts[i]) % 0.5)
-        #     alignment_costs.append(this_alignment_cost)
-
-        # align_video_idx = np.argmin([sum(x) for x in alignment_costs])
-        # print(align_video_idx)
-
-        # rewrite start_timestamp to be integer multiple of dt
-        align_video_start = demo_video_meta_df.loc[align_cam_idx]['start_timestamp']
-        start_timestamp += dt - ((start_timestamp - align_video_start) % dt)
-
-        # descritize timestamps for all videos
-        cam_start_frame_idxs = list()
-        n_frames = int((end_timestamp - start_timestamp) / dt)
-        for cam_idx, row in demo_video_meta_df.iterrows():
-            video_start_frame = math.ceil((start_timestamp - row['start_timestamp']) / dt)
-            video_n_frames = math.floor((row['end_timestamp'] - start_timestamp) / dt) - 1
-            if video_start_frame < 0:
-                video_n_frames += video_start_frame
-                video_start_frame = 0
-            cam_start_frame_idxs.append(video_start_frame)
-            n_frames = min(n_frames, video_n_frames)
-        demo_timestamps = np.arange(n_frames) * float(dt) + start_timestamp
-
-        # load pose and gripper data for each video
-        # determin valid frames for each video
-        all_cam_poses = list()
-        all_gripper_widths = list()
-        all_is_valid = list()
-        
-        for cam_idx, row in demo_video_meta_df.iterrows():
-            if cam_idx >= n_gripper_cams:
-                # not gripper camera
-                continue
-
-            start_frame_idx = cam_start_frame_idxs[cam_idx]
-            video_dir = row['video_dir']
-            
-            # load check data
-            check_path = video_dir.joinpath('check_result.txt')
-            if check_path.is_file():
-                if not check_path.open('r').read().startswith('true'):
-                    print(f"Skipping {video_dir.name}, manually filtered with check_result.txt!=true")
-                    continue
-
-            # load SLAM data
-            csv_path = video_dir.joinpath('camera_trajectory.csv')
-            if not csv_path.is_file():
-                print(f"Skipping {video_dir.name}, no camera_trajectory.csv.")
-                dropped_camera_count[row['camera_serial']] += 1
-                continue            
-            
-            csv_df = pd.read_csv(csv_path)
-            # select aligned frames
-            df = csv_df.iloc[start_frame_idx: start_frame_idx+n_frames]
-            is_tracked = (~df['is_lost']).to_numpy()
-
-            # basic filtering to remove bad tracking
-            n_frames_lost = (~is_tracked).sum()
-            if n_frames_lost > 10:
-                print(f"Skipping {video_dir.name}, {n_frames_lost} frames are lost.")
-                dropped_camera_count[row['camera_serial']] += 1
-                continue
-
-            n_frames_valid = is_tracked.sum()
-            if n_frames_valid < 60:
-                print(f"Skipping {video_dir.name}, only {n_frames_valid} frames are valid.")
-                dropped_camera_count[row['camera_serial']] += 1
-                continue
-            
-            # load camera pose
-            df.loc[df['is_lost'], 'q_w'] = 1
-            cam_pos = df[['x', 'y', 'z']].to_numpy()
-            cam_rot_quat_xyzw = df[['q_x', 'q_y', 'q_z', 'q_w']].to_numpy()
-            cam_rot = Rotation.from_quat(cam_rot_quat_xyzw)
-            cam_pose = np.zeros((cam_pos.shape[0], 4, 4), dtype=np.float32)
-            cam_pose[:,3,3] = 1
-            cam_pose[:,:3,3] = cam_pos
-            cam_pose[:,:3,:3] = cam_rot.as_matrix()
-            tx_slam_cam = cam_pose
-            tx_tag_cam = tx_tag_slam @ tx_slam_cam
-
-            # TODO: handle optinal robot cal based filtering
-            is_step_valid = is_tracked.copy()
-            
-
-            # get gripper data
-            pkl_path = video_dir.joinpath('tag_detection.pkl')
-            if not pkl_path.is_file():
-                print(f"Skipping {video_dir.name}, no tag_detection.pkl.")
-                dropped_camera_count[row['camera_serial']] += 1
-                continue
-                        
-            tag_detection_results = pickle.load(open(pkl_path, 'rb'))
-            # select aligned frames
-            tag_detection_results = tag_detection_results[start_frame_idx: start_frame_idx+n_frames]
-
-            # one item per frame
-            video_timestamps = np.array([x['time'] for x in tag_detection_results])
-
-            if len(df) != len(video_timestamps):
-                print(f"Skipping {video_dir.name}, video csv length mismatch.")
-                continue
-
-            # get gripper action
-            ghi = row['gripper_hardware_id']
-            if ghi < 0:
-                print(f"Skipping {video_dir.name}, invalid gripper hardware id {ghi}")
-                dropped_camera_count[row['camera_serial']] += 1
-                continue
-            
-            left_id = 6 * ghi
-            right_id = left_id + 1
-
-            gripper_cal_interp = None
-            if ghi in gripper_id_gripper_cal_map:
-                gripper_cal_interp = gripper_id_gripper_cal_map[ghi]
-            elif row['camera_serial'] in cam_serial_gripper_cal_map:
-                gripper_cal_interp = cam_serial_gripper_cal_map[row['camera_serial']]
-                print(f"Gripper id {ghi} not found in gripper calibrations {list(gripper_id_gripper_cal_map.keys())}. Falling back to camera serial map.")
-            else:
-                raise RuntimeError("Gripper calibration not found.")
-
-            gripper_timestamps = list()
-            gripper_widths = list()
-            for td in tag_detection_results:
-                width = get_gripper_width(td['tag_dict'], 
-                    left_id=left_id, right_id=right_id, 
-                    nominal_z=nominal_z)
-                if width is not None:
-                    gripper_timestamps.append(td['time'])
-                    gripper_widths.append(gripper_cal_interp(width))
-            gripper_interp = get_interp1d(gripper_timestamps, gripper_widths)
-            
-            gripper_det_ratio = (len(gripper_widths) / len(tag_detection_results))
-            if gripper_det_ratio < 0.9:
-                print(f"Warining: {video_dir.name} only {gripper_det_ratio} of gripper tags detected.")
-            
-            this_gripper_widths = gripper_interp(video_timestamps)
-            
-            # transform to tcp frame
-            tx_tag_tcp = tx_tag_cam @ tx_cam_tcp
-            pose_tag_tcp = mat_to_pose(tx_tag_tcp)
-            
-            # output value
-            assert len(pose_tag_tcp) == n_frames
-            assert len(this_gripper_widths) == n_frames
-            assert len(is_step_valid) == n_frames
-            all_cam_poses.append(pose_tag_tcp)
-            all_gripper_widths.append(this_gripper_widths)
-            all_is_valid.append(is_step_valid)
-
-        if len(all_cam_poses) != n_gripper_cams:
-            print(f"Skipped demo {demo_idx}.")
+        demo_args.append((demo_idx, demo_data, demo_video_meta_df))
+    
+    fn = functools.partial(generate_demo_plans_star,
+        n_gripper_cams=n_gripper_cams,
+        tx_tag_slam=tx_tag_slam,
+        tx_cam_tcp=tx_cam_tcp,
+        gripper_id_gripper_cal_map=gripper_id_gripper_cal_map,
+        cam_serial_gripper_cal_map=cam_serial_gripper_cal_map,
+        nominal_z=nominal_z,
+        min_episode_length=min_episode_length)
+    if num_workers <= 1:
+        demo_results = [fn(x) for x in tqdm(demo_args)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+            # map keeps demo order, so all_plans is deterministic
+            demo_results = list(tqdm(executor.map(fn, demo_args, chunksize=4), 
+                total=len(demo_args)))
+
+    # aggregate
+    for result in demo_results:
+        all_plans.extend(result['plans'])
+        total_avaliable_time += result['available_time']
+        total_used_time += result['used_time']
+        for cam_serial in result['dropped_camera_serials']:
+            dropped_camera_count[cam_serial] += 1
+        if result['is_dropped']:
             n_dropped_demos += 1
-            continue
-
-        # aggregate valid result
-        all_is_valid = np.array(all_is_valid)
-        is_step_valid = np.all(all_is_valid, axis=0)
-        
-        # generate episode start and end pose for each gripper
-        first_valid_step = np.nonzero(is_step_valid)[0][0]
-        last_valid_step = np.nonzero(is_step_valid)[0][-1]
-        demo_start_poses = list()
-        demo_end_poses = list()
-        for cam_idx in range(len(all_cam_poses)):
-            cam_poses = all_cam_poses[cam_idx]
-            demo_start_poses.append(cam_poses[first_valid_step])
-            demo_end_poses.append(cam_poses[last_valid_step])
-
-        # determine episode segmentation
-        # remove valid segments that are too short
-        segment_slices, segment_type = get_bool_segments(is_step_valid)
-        for s, is_valid_segment in zip(segment_slices, segment_type):
-            start = s.start
-            end = s.stop
-            if not is_valid_segment:
-                continue
-            if (end - start) < min_episode_length:
-                is_step_valid[start:end] = False
-        
-        # finally, generate one episode for each valid segment
-        segment_slices, segment_type = get_bool_segments(is_step_valid)
-        for s, is_valid in zip(segment_slices, segment_type):
-            if not is_valid:
-                continue
-            start = s.start
-            end = s.stop
-
-            total_used_time += float((end - start) * dt)
-            
-            grippers = list()
-            cameras = list()
-            for cam_idx, row in demo_video_meta_df.iterrows():
-                if cam_idx < n_gripper_cams:
-                    pose_tag_tcp = all_cam_poses[cam_idx][start:end]
-                    
-                    # gripper cam
-                    grippers.append({
-                        "tcp_pose": pose_tag_tcp,
-                        "gripper_width": all_gripper_widths[cam_idx][start:end],
-                        "demo_start_pose": demo_start_poses[cam_idx],
-                        "demo_end_pose": demo_end_poses[cam_idx]
-                    })
-                # all cams
-                video_dir = row['video_dir']
-                vid_start_frame = cam_start_frame_idxs[cam_idx]
-                cameras.append({
-                    "video_path": str(video_dir.joinpath('raw_video.mp4').relative_to(video_dir.parent)),
-                    "video_start_end": (start+vid_start_frame, end+vid_start_frame)
-                })
-            
-            all_plans.append({
-                "episode_timestamps": demo_timestamps[start:end],
-                "grippers": grippers,
-                "cameras": cameras
-            })
 
     used_ratio = total_used_time / total_avaliable_time
     print(f"{int(used_ratio*100)}% of raw data are used.")
@@ -20,6 +20,7 @@ from umi.common.cv_util import (
     inpaint_tag,
     get_mirror_crop_slices
 )
+from umi.common.video_frame_source import VideoFrameSource
 from diffusion_policy.common.replay_buffer import ReplayBuffer
 from diffusion_policy.codecs.imagecodecs_numcodecs import register_codecs, JpegXl
 register_codecs()
@@ -204,8 +205,6 @@ def main(input, output, out_res, out_fov, compression_level, no_mirror, mirror_s
         name = f'camera{camera_idx}_rgb'
         img_array = replay_buffer.data[name]
         
-        curr_task_idx = 0
-        
         is_mirror = None
         if mirror_swap:
             ow, oh = out_res
@@ -214,26 +213,13 @@ def main(input, output, out_res, out_fov, compression_level, no_mirror, mirror_s
                 mirror_mask, color=(0,0,0), mirror=True, gripper=False, finger=False)
             is_mirror = (mirror_mask[...,0] == 0)
         
-        with av.open(mp4_path) as container:
-            in_stream = container.streams.video[0]
-            # in_stream.thread_type = "AUTO"
-            in_stream.thread_count = 1
-            buffer_idx = 0
-            for frame_idx, frame in tqdm(enumerate(container.decode(in_stream)), total=in_stream.frames, leave=False):
-                if curr_task_idx >= len(tasks):
-                    # all tasks done
-                    break
-                
-                if frame_idx < tasks[curr_task_idx]['frame_start']:
-                    # current task not started
-                    continue
-                elif frame_idx < tasks[curr_task_idx]['frame_end']:
-                    if frame_idx == tasks[curr_task_idx]['frame_start']:
-                        buffer_idx = tasks[curr_task_idx]['buffer_start']
-                    
-                    # do current task
-                    img = frame.to_ndarray(format='rgb24')
-
+        # seek to each task through the keyframe index instead of
+        # decoding the whole video from frame 0,
+        # tasks are sequential slices, stream frames without caching GOPs
+        with VideoFrameSource(mp4_path, cache_size=0, thread_count=1) as source:
+            for task in tqdm(tasks, leave=False):
+                buffer_idx = task['buffer_start']
+                for frame_idx, img in source.iter_frames(task['frame_start'], task['frame_end']):
                     # inpaint tags
                     this_det = tag_detection_results[frame_idx]
                     all_corners = [x['corners'] for x in this_det['tag_dict'].values()]
@@ -257,12 +243,6 @@ def main(input, output, out_res, out_fov, compression_level, no_mirror, mirror_s
                     img_array[buffer_idx] = img
                     buffer_idx += 1
                     
-                    if (frame_idx + 1) == tasks[curr_task_idx]['frame_end']:
-                        # current task done, advance
-                        curr_task_idx += 1
-                else:
-                    assert False
-                    
     with tqdm(total=len(vid_args)) as pbar:
         # one chunk per thread, therefore no synchronization needed
         with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
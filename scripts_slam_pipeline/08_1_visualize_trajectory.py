@@ -19,16 +19,22 @@ python /home/$(whoami)/Project_UMI/scripts_slam_pipeline/08_1_visualize_trajecto
 3, 计算SLAM和ground truth之间的误差
 """
 
+import sys
+import os
 import pandas as pd
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
-import os
 import pickle
 
+ROOT_DIR = '/home/{}/Project_UMI'.format(os.getenv('USER'))
+sys.path.append(ROOT_DIR)
+from umi.common.orb_slam_util import load_trajectory_df
+
 
 # 定义读取和处理CSV文件的函数
 def read_and_process_csv(file_path, global_init_time=0.0):
-    df = pd.read_csv(file_path)
+    # prefers camera_trajectory.npy from 03_batch_slam.py
+    df, _ = load_trajectory_df(file_path)
     df["adjusted_timestamp"] = df["timestamp"] + global_init_time
     df["x"] = pd.to_numeric(df["x"])
     df["y"] = pd.to_numeric(df["y"])
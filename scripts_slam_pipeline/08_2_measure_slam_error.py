@@ -17,188 +17,81 @@ python /home/$(whoami)/Project_UMI/scripts_slam_pipeline/08_2_measure_slam_error
 - ...
 
 3, 计算SLAM和ground truth之间的误差
+   先用速度互相关粗搜索时间偏移, 再在附近批量细搜索, 支持多个session并行
 """
 
-import pandas as pd
+import sys
 import numpy as np
 import os
-import pickle
 import matplotlib.pyplot as plt
-from scipy.spatial.transform import Rotation as R
-from scipy.interpolate import interp1d
 from datetime import datetime
 
+ROOT_DIR = '/home/{}/Project_UMI'.format(os.getenv('USER'))
+sys.path.append(ROOT_DIR)
+from umi.traj_eval.time_offset_search import (
+    load_gt_pkl, load_slam_trajectory, evaluate_offsets, measure_sessions)
 
-# 定义读取和处理CSV文件的函数
-def read_and_process_csv(file_path, slam_start_time, delta):
-    df = pd.read_csv(file_path)
-    df["adjusted_timestamp"] = (
-        (df["timestamp"] * 1e9).astype(np.int64) + slam_start_time + int(delta * 1e9)
-    )  # 将时间戳从秒转换为纳秒并加上起始时间
-    df["x"] = pd.to_numeric(df["x"])
-    df["y"] = pd.to_numeric(df["y"])
-    df["z"] = pd.to_numeric(df["z"])
-    return df
-
-# 定义读取和处理PKL文件的函数
-def read_and_process_pkl(file_path):
-    with open(file_path, "rb") as f:
-        data = pickle.load(f)
-
-    # 提取所需的字段
-    timestamps = []
-    x_values = []
-    y_values = []
-    z_values = []
-
-    for record in data:
-        # 将浮点数时间戳转换为纳秒格式的整数
-        time_str = str(record["timestemp"])
-        dt = datetime.strptime(time_str, "%y%m%d%H%M%S.%f")
-        timestamps.append(int(dt.timestamp() * 1e9))
-        
-        flange_pose = record["flangePose"]
-        x_values.append(flange_pose[0])
-        y_values.append(flange_pose[1])
-        z_values.append(flange_pose[2])
-
-    df = pd.DataFrame(
-        {"timestamp": timestamps, "x": x_values, "y": y_values, "z": z_values}
-    )
-    return df
-
-# 计算最优的转换矩阵
-def compute_transformation_matrix(A, B):
-    assert len(A) == len(B)
-
-    centroid_A = np.mean(A, axis=0)
-    centroid_B = np.mean(B, axis=0)
-
-    AA = A - centroid_A
-    BB = B - centroid_B
-
-    H = np.dot(AA.T, BB)
-
-    U, S, Vt = np.linalg.svd(H)
-    R = np.dot(Vt.T, U.T)
-
-    if np.linalg.det(R) < 0:
-        Vt[-1, :] *= -1
-        R = np.dot(Vt.T, U.T)
-
-    t = centroid_B.T - np.dot(R, centroid_A.T)
-
-    return R, t
-
-
-# 获取当前用户名并构建文件路径
-user = os.getenv("USER")
-slam_file_path = f"/home/{user}/Project_UMI/example_demo_session/demos/demo_C3441328010998_2024.06.24_20.30.00.359967/camera_trajectory.csv"
-ground_truth_file_path = (
-    f"/home/{user}/Project_UMI/example_demo_session/GT_GX011121.pkl"
-)
-
-# 设置SLAM的起始时间戳（占位符变量）
-time_str = "240624203001.414"
-dt = datetime.strptime(time_str, "%y%m%d%H%M%S.%f")
-slam_start_time = int(dt.timestamp() * 1e9) # 1718868741667852978
-print(f'slam_start_time:{slam_start_time}')
-
-# 读取和处理Ground Truth文件
-ground_truth_df = read_and_process_pkl(ground_truth_file_path)
-
-# 设置Pandas选项以避免科学计数法，只影响adjusted_timestamp列
-pd.set_option("display.float_format", "{:.0f}".format)
-pd.options.display.float_format = lambda x: f"{x:.3f}"
-
-# 定义delta的范围
-delta_values = np.linspace(-1.1, 1.1, 100)  # 例如，范围从-1到1，共50个点
-
-rmse_values = []
-
-# 遍历每个delta值
-for delta in delta_values:
-    slam_df = read_and_process_csv(slam_file_path, slam_start_time, delta)
 
-    # 打印SLAM轨迹的前5个点
-    print(f"SLAM Trajectory first 5 points for delta {delta}:")
-    print(slam_df[["adjusted_timestamp", "x", "y", "z"]].head())
+def parse_start_time(time_str):
+    dt = datetime.strptime(time_str, "%y%m%d%H%M%S.%f")
+    return int(dt.timestamp() * 1e9)
 
-    # 打印Ground Truth轨迹的前5个点
-    print("Ground Truth Trajectory first 5 points:")
-    print(ground_truth_df.head())
-
-    # 对齐时间戳
-    interp_func_x = interp1d(
-        slam_df["adjusted_timestamp"], slam_df["x"], fill_value="extrapolate"
-    )
-    interp_func_y = interp1d(
-        slam_df["adjusted_timestamp"], slam_df["y"], fill_value="extrapolate"
-    )
-    interp_func_z = interp1d(
-        slam_df["adjusted_timestamp"], slam_df["z"], fill_value="extrapolate"
-    )
-
-    aligned_slam_x = interp_func_x(ground_truth_df["timestamp"])
-    aligned_slam_y = interp_func_y(ground_truth_df["timestamp"])
-    aligned_slam_z = interp_func_z(ground_truth_df["timestamp"])
-
-    aligned_slam_df = pd.DataFrame(
-        {
-            "timestamp": ground_truth_df["timestamp"],
-            "x": aligned_slam_x,
-            "y": aligned_slam_y,
-            "z": aligned_slam_z,
-        }
-    )
-
-    A = aligned_slam_df[["x", "y", "z"]].to_numpy()
-    B = ground_truth_df[["x", "y", "z"]].to_numpy()
-
-    R, t = compute_transformation_matrix(A, B)
-
-    # 应用转换矩阵
-    transformed_A = np.dot(R, A.T).T + t
-
-    # 计算误差
-    errors = B - transformed_A
-
-    # 计算每个轴的RMSE
-    rmse_x = np.sqrt(np.mean(errors[:, 0] ** 2))
-    rmse_y = np.sqrt(np.mean(errors[:, 1] ** 2))
-    rmse_z = np.sqrt(np.mean(errors[:, 2] ** 2))
-
-    # 计算总的RMSE
-    total_rmse = np.sqrt(np.mean(np.sum(errors**2, axis=1)))
-
-    # 计算欧几里得距离误差
-    euclidean_errors = np.linalg.norm(errors, axis=1)
-    max_error = np.max(euclidean_errors)
-    min_error = np.min(euclidean_errors)
-    mean_error = np.mean(euclidean_errors)
 
+def print_result(name, result):
     print("-" * 40)
-    print(f"Rotation matrix for delta {delta}:\n{R}")
-    print(f"Translation vector for delta {delta}:\n{t}")
-    print(
-        f"RMSE (X) for delta {delta}: {rmse_x:.4f}; RMSE (Y) for delta {delta}: {rmse_y:.4f}; RMSE (Z) for delta {delta}: {rmse_z:.4f}"
-    )
-    print(f"Total RMSE for delta {delta}: {total_rmse:.4f}")
+    print(name)
+    print(f"Best delta: {result['offset']:.4f} (coarse: {result['coarse_offset']:.4f})")
+    print(f"Rotation matrix:\n{result['R']}")
+    print(f"Translation vector:\n{result['t']}")
+    rmse_x, rmse_y, rmse_z = result['rmse_xyz']
+    print(f"RMSE (X): {rmse_x:.4f}; RMSE (Y): {rmse_y:.4f}; RMSE (Z): {rmse_z:.4f}")
+    print(f"Total RMSE: {result['rmse']:.4f}")
     print(
-        f"Max error for delta {delta}: {max_error:.4f}; Min error for delta {delta}: {min_error:.4f}; Mean error for delta {delta}: {mean_error:.4f}"
+        f"Max error: {result['max_error']:.4f}; Min error: {result['min_error']:.4f}; Mean error: {result['mean_error']:.4f}"
     )
     print("-" * 40)
 
-    rmse_values.append(total_rmse)
 
-# 绘制误差随delta变化的曲线
-plt.figure(figsize=(10, 6))
-plt.plot(delta_values, rmse_values, marker="o")
-plt.xlabel("Delta (seconds)")
-plt.ylabel("Total RMSE")
-plt.title("Error Variation with Delta")
-plt.grid(True)
-plt.show()
+# 获取当前用户名并构建文件路径
+user = os.getenv("USER")
+# 每个session: (SLAM轨迹, Ground Truth, SLAM的起始时间戳)
+sessions = [
+    (
+        f"/home/{user}/Project_UMI/example_demo_session/demos/demo_C3441328010998_2024.06.24_20.30.00.359967/camera_trajectory.csv",
+        f"/home/{user}/Project_UMI/example_demo_session/GT_GX011121.pkl",
+        "240624203001.414",
+    ),
+]
+
+# 定义delta的范围
+max_delta = 1.1
+
+if __name__ == "__main__":
+    session_args = [(slam_path, gt_path, parse_start_time(time_str))
+        for slam_path, gt_path, time_str in sessions]
+    print(f'slam_start_time:{[x[2] for x in session_args]}')
+
+    # 粗搜索(速度互相关) + 细搜索(批量刚体对齐), 多个session并行
+    results = measure_sessions(session_args, max_offset=max_delta)
+    for (slam_path, gt_path, _), result in zip(sessions, results):
+        print_result(f"{slam_path} vs {gt_path}", result)
+
+    # 绘制第一个session误差随delta变化的曲线, 整个网格一次批量计算
+    slam_path, gt_path, slam_start_time = session_args[0]
+    slam_t, slam_p = load_slam_trajectory(slam_path, slam_start_time)
+    gt_t, gt_p = load_gt_pkl(gt_path)
+    delta_values = np.linspace(-max_delta, max_delta, 100)
+    rmse_values = evaluate_offsets(
+        (slam_t - gt_t[0]) * 1e-9, slam_p, (gt_t - gt_t[0]) * 1e-9, gt_p, delta_values)
+
+    plt.figure(figsize=(10, 6))
+    plt.plot(delta_values, rmse_values, marker="o")
+    plt.axvline(results[0]['offset'], color="r", linestyle="--")
+    plt.xlabel("Delta (seconds)")
+    plt.ylabel("Total RMSE")
+    plt.title("Error Variation with Delta")
+    plt.grid(True)
+    plt.show()
 
 
 """
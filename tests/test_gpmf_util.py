@@ -0,0 +1,103 @@
+# %%
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+# %%
+import struct
+import datetime
+import tempfile
+import numpy as np
+from umi.common.gpmf_util import (
+    iter_klv, parse_gpmf_payload, imu_to_telemetry_json,
+    save_imu_json, load_telemetry_json)
+
+# %%
+def klv(key, type_char, size, repeat, data):
+    # data padded to 4 bytes
+    pad = (-len(data)) % 4
+    return key.encode('latin-1') + type_char.encode('latin-1') \
+        + bytes([size]) + struct.pack('>H', repeat) + data + b'\0' * pad
+
+
+def get_payload():
+    accl = np.array([[100, 200, 300], [400, -500, 600]], dtype='>i2')
+    gyro = np.array([[10, 20, 30], [-20, 40, 90]], dtype='>i2')
+    accl_strm = klv('STMP', 'J', 8, 1, struct.pack('>Q', 0)) \
+        + klv('TMPC', 'f', 4, 1, struct.pack('>f', 40.5)) \
+        + klv('SCAL', 's', 2, 1, struct.pack('>h', 100)) \
+        + klv('ACCL', 's', 6, 2, accl.tobytes())
+    # one scale per axis
+    gyro_strm = klv('SCAL', 's', 2, 3, struct.pack('>hhh', 10, 20, 30)) \
+        + klv('STNM', 'c', 1, 9, b'Gyroscope') \
+        + klv('GYRO', 's', 6, 2, gyro.tobytes())
+    devc = klv('DVID', 'L', 4, 1, struct.pack('>I', 1)) \
+        + klv('DVNM', 'c', 1, 11, b'HERO9 Black') \
+        + klv('STRM', '\0', 1, len(accl_strm), accl_strm) \
+        + klv('STRM', '\0', 1, len(gyro_strm), gyro_strm)
+    return klv('DEVC', '\0', 1, len(devc), devc), accl, gyro
+
+
+def test_iter_klv():
+    buf, _, _ = get_payload()
+    records = list(iter_klv(buf))
+    assert len(records) == 1
+    key, type_char, size, repeat, data = records[0]
+    assert (key, type_char) == ('DEVC', '\0')
+    assert [x[0] for x in iter_klv(data)] == ['DVID', 'DVNM', 'STRM', 'STRM']
+    # trailing padding is not a record
+    assert len(list(iter_klv(buf + b'\0' * 8))) == 1
+
+
+def test_parse_gpmf_payload():
+    buf, accl, gyro = get_payload()
+    result = parse_gpmf_payload(buf)
+    assert set(result.keys()) == {'ACCL', 'GYRO'}
+    # axis order kept, values divided by SCAL
+    assert np.allclose(result['ACCL']['value'], accl / 100)
+    assert np.allclose(result['GYRO']['value'], gyro / np.array([10, 20, 30]))
+    assert result['ACCL']['temperature'] == 40.5
+    assert result['GYRO']['temperature'] is None
+    assert result['ACCL']['device_name'] == 'HERO9 Black'
+    assert set(parse_gpmf_payload(buf, stream_keys=('GYRO',)).keys()) == {'GYRO'}
+
+
+def test_telemetry_json():
+    buf, accl, _ = get_payload()
+    value = parse_gpmf_payload(buf)['ACCL']['value']
+    imu = {
+        'device_name': 'HERO9 Black',
+        'fps': 59.94,
+        'start_date': datetime.datetime(2024, 1, 1, 12, 0, 0),
+        'streams': {
+            'ACCL': {
+                'value': value,
+                'cts': np.array([0.0, 5.0]),
+                'temperature': np.array([40.5, 40.5])
+            }
+        }
+    }
+    data = imu_to_telemetry_json(imu)
+    samples = data['1']['streams']['ACCL']['samples']
+    assert data['1']['device name'] == 'HERO9 Black'
+    assert data['frames/second'] == 59.94
+    assert samples[0]['value'] == value[0].tolist()
+    assert samples[1]['cts'] == 5.0
+    assert samples[1]['date'] == '2024-01-01T12:00:00.005Z'
+    assert samples[0]['temperature [°C]'] == 40.5
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, 'imu_data.json')
+        save_imu_json(imu, json_path)
+        loaded = load_telemetry_json(json_path)
+    assert np.allclose(loaded['ACCL']['value'], value)
+    assert np.allclose(loaded['ACCL']['cts'], [0.0, 5.0])
+
+
+if __name__ == "__main__":
+    test_iter_klv()
+    test_parse_gpmf_payload()
+    test_telemetry_json()
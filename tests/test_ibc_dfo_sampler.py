@@ -0,0 +1,73 @@
+# %%
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+# %%
+import torch
+from diffusion_policy.model.common.normalizer import LinearNormalizer
+from diffusion_policy.policy.ibc_dfo_lowdim_policy import IbcDfoLowdimPolicy
+
+# %%
+def get_policy(n_samples=50, chunk_size=None, kevin_inference=False):
+    obs_dim = 5
+    action_dim = 2
+    policy = IbcDfoLowdimPolicy(
+        horizon=2,
+        obs_dim=obs_dim,
+        action_dim=action_dim,
+        n_action_steps=1,
+        n_obs_steps=2,
+        pred_n_iter=3,
+        pred_n_samples=n_samples,
+        kevin_inference=kevin_inference,
+        pred_chunk_size=chunk_size)
+    generator = torch.Generator().manual_seed(0)
+    normalizer = LinearNormalizer()
+    normalizer.fit({
+        'obs': torch.randn(100, obs_dim, generator=generator),
+        'action': torch.rand(100, action_dim, generator=generator)
+    })
+    policy.set_normalizer(normalizer)
+    # dropout differs between forward and the sampler in train mode
+    return policy.double().eval()
+
+
+def test_energy_matches_forward():
+    B, N = 3, 50
+    policy = get_policy(n_samples=N)
+    generator = torch.Generator().manual_seed(1)
+    obs = torch.randn((B, 2, 5), generator=generator, dtype=torch.float64)
+    action = torch.rand((B, N, 1, 2), generator=generator, dtype=torch.float64)
+    with torch.no_grad():
+        ref_logits = policy.forward(obs, action)
+        # chunk sizes in (batch, sample) rows, 21 -> 7 samples per chunk
+        # does not divide N
+        for chunk_size in [None, 3, 21, B * N, 10 * B * N]:
+            policy.pred_chunk_size = chunk_size
+            energy_mlp = policy.get_energy_mlp()
+            logits = energy_mlp(energy_mlp.project_obs(obs), action)
+            assert logits.shape == ref_logits.shape
+            assert torch.allclose(logits, ref_logits, rtol=1e-9, atol=1e-9), chunk_size
+
+
+def test_chunking_keeps_actions():
+    obs = torch.randn((3, 2, 5), generator=torch.Generator().manual_seed(2))
+    for kevin_inference in [False, True]:
+        actions = list()
+        for chunk_size in [None, 21]:
+            policy = get_policy(n_samples=50, chunk_size=chunk_size, 
+                kevin_inference=kevin_inference)
+            torch.manual_seed(0)
+            with torch.no_grad():
+                actions.append(policy.predict_action(
+                    {'obs': obs.to(torch.float64)})['action'])
+        assert torch.allclose(actions[0], actions[1])
+
+
+if __name__ == "__main__":
+    test_energy_matches_forward()
+    test_chunking_keeps_actions()
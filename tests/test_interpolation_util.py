@@ -0,0 +1,81 @@
+# %%
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+# %%
+import numpy as np
+import scipy.spatial.transform as st
+from umi.common.interpolation_util import (
+    get_interp1d, get_nearest_idxs, interp1d_linear, interp_pose, PoseInterpolator)
+
+# %%
+def get_random_stream(n, dt=1/125, jitter=0.2):
+    t = np.cumsum(dt * (1 + np.random.uniform(-jitter, jitter, size=n))) + 1e9
+    pos = np.cumsum(np.random.normal(scale=0.01, size=(n,3)), axis=0)
+    rot = st.Rotation.from_rotvec(np.random.normal(size=3)) * st.Rotation.from_rotvec(
+        np.cumsum(np.random.normal(scale=0.1, size=(n,3)), axis=0))
+    return t, np.concatenate([pos, rot.as_rotvec()], axis=-1)
+
+
+def slerp_pose_reference(t, x, query_t):
+    # previous PoseInterpolator, scipy Slerp over the whole history
+    pos_interp = get_interp1d(t, x[:,:3])
+    rot_interp = st.Slerp(t, st.Rotation.from_rotvec(x[:,3:]))
+    query_t = np.clip(query_t, t[0], t[-1])
+    return np.concatenate([
+        pos_interp(query_t), rot_interp(query_t).as_rotvec()], axis=-1)
+
+
+def test_nearest_idxs():
+    for _ in range(20):
+        t, _ = get_random_stream(np.random.randint(1, 200), dt=1/60)
+        query_t = np.random.uniform(t[0] - 0.1, t[-1] + 0.1, size=50)
+        n = min(len(t), len(query_t)) // 2
+        query_t[:n] = t[:n]
+        gt = np.array([np.argmin(np.abs(t - q)) for q in query_t])
+        assert np.array_equal(get_nearest_idxs(t, query_t), gt)
+
+    # ties go to the earlier index, like argmin
+    t = np.array([0.0, 1.0, 2.0])
+    assert np.array_equal(get_nearest_idxs(t, np.array([0.5, 1.5])), [0, 1])
+
+
+def test_interp1d_linear():
+    for _ in range(20):
+        t, x = get_random_stream(np.random.randint(3, 200), dt=1/30)
+        query_t = np.random.uniform(t[0] - 0.1, t[-1] + 0.1, size=50)
+        query_t[:3] = t[:3]
+        gt = get_interp1d(t, x)(query_t)
+        assert np.allclose(interp1d_linear(t, x, query_t), gt)
+        gt = get_interp1d(t, x[:,:1])(query_t)
+        assert np.allclose(interp1d_linear(t, x[:,:1], query_t), gt)
+        assert np.allclose(interp1d_linear(t, x, query_t[0]),
+            get_interp1d(t, x)(query_t[0]))
+
+
+def test_interp_pose():
+    for _ in range(20):
+        t, x = get_random_stream(np.random.randint(3, 500))
+        query_t = np.random.uniform(t[0] - 0.1, t[-1] + 0.1, size=100)
+        query_t[:3] = t[:3]
+        gt = slerp_pose_reference(t, x, query_t)
+        pose = interp_pose(t, x, query_t)
+        assert np.allclose(pose[:,:3], gt[:,:3])
+        # compare rotations, rotvec is not unique near pi
+        rot_diff = st.Rotation.from_rotvec(pose[:,3:]).inv() \
+            * st.Rotation.from_rotvec(gt[:,3:])
+        assert np.allclose(rot_diff.magnitude(), 0, atol=1e-7)
+
+        interp = PoseInterpolator(t, x)
+        assert np.allclose(interp(query_t), pose)
+        assert interp(query_t[0]).shape == (6,)
+
+# %%
+if __name__ == '__main__':
+    test_nearest_idxs()
+    test_interp1d_linear()
+    test_interp_pose()
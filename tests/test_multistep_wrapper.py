@@ -0,0 +1,111 @@
+# %%
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+# %%
+import numpy as np
+import gym
+from gym import spaces
+import dill
+from diffusion_policy.gym_util.multistep_wrapper import MultiStepWrapper
+from diffusion_policy.gym_util.sync_vector_env import SyncVectorEnv
+from diffusion_policy.gym_util.rollout_scheduler import RolloutScheduler
+
+# %%
+class CountEnv(gym.Env):
+    """
+    Episode i has length 3 + i % 4, rewards offset*100 + t for t = 1, 2, ...
+    """
+    def __init__(self):
+        self.observation_space = spaces.Box(-1e9, 1e9, shape=(2,), dtype=np.float64)
+        self.action_space = spaces.Box(-1, 1, shape=(1,), dtype=np.float64)
+        self.offset = 0
+        self.length = 3
+        self.t = 0
+
+    def seed(self, seed=None):
+        self.offset = seed
+        self.length = 3 + seed % 4
+
+    def reset(self):
+        self.t = 0
+        return np.array([self.offset, 0.0])
+
+    def step(self, action):
+        self.t += 1
+        obs = np.array([self.offset, self.t], dtype=np.float64)
+        reward = float(self.offset * 100 + self.t)
+        done = self.t >= self.length
+        return obs, reward, done, {'t': self.t}
+
+    def render(self, mode='rgb_array'):
+        return None
+
+
+def get_expected_rewards(i):
+    return [i * 100 + t for t in range(1, 3 + i % 4 + 1)]
+
+
+def get_init_fn_dills(n_inits):
+    init_fn_dills = list()
+    for i in range(n_inits):
+        def init_fn(env, seed=i):
+            env.seed(seed)
+        init_fn_dills.append(dill.dumps(init_fn))
+    return init_fn_dills
+
+
+def test_ring_buffer_history():
+    env = MultiStepWrapper(CountEnv(), n_obs_steps=2, n_action_steps=2,
+        max_episode_steps=100, ring_buffer=True)
+    ref_env = MultiStepWrapper(CountEnv(), n_obs_steps=2, n_action_steps=2,
+        max_episode_steps=100)
+    action = np.zeros((2, 1))
+    for seed in range(4):
+        env.seed(seed)
+        ref_env.seed(seed)
+        obs = env.reset()
+        ref_obs = ref_env.reset()
+        assert np.array_equal(obs, ref_obs)
+        done = False
+        while not done:
+            obs, reward, done, info = env.step(action)
+            ref_obs, ref_reward, ref_done, ref_info = ref_env.step(action)
+            assert np.array_equal(obs, ref_obs)
+            assert reward == ref_reward
+            assert done == ref_done
+            assert np.array_equal(info['t'], ref_info['t'])
+        assert list(env.get_attr('reward')) == ref_env.get_attr('reward')
+        assert env.get_infos() == ref_env.get_infos()
+
+
+def test_sync_slot_refill():
+    """
+    With SyncVectorEnv, reward/info of finished episodes are not copied
+    by pickling, refilling a slot must not overwrite them.
+    """
+    n_inits = 11
+    for ring_buffer in [False, True]:
+        env = SyncVectorEnv([
+            lambda: MultiStepWrapper(CountEnv(), n_obs_steps=2, n_action_steps=2,
+                max_episode_steps=100, ring_buffer=ring_buffer)
+        ] * 2)
+        scheduler = RolloutScheduler(env, get_init_fn_dills(n_inits), refill=True)
+        def predict_fn(obs, past_action):
+            action = np.zeros((len(obs), 2, 1))
+            return action, action
+        results = scheduler.run(predict_fn, tqdm_interval_sec=100)
+        env.close()
+        for i, result in enumerate(results):
+            expected = get_expected_rewards(i)
+            assert list(result['reward']) == expected, (ring_buffer, i, result['reward'])
+            assert result['info']['t'][-1] == len(expected)
+
+
+if __name__ == "__main__":
+    test_ring_buffer_history()
+    test_sync_slot_refill()
@@ -0,0 +1,62 @@
+# %%
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+# %%
+import numpy as np
+from umi.common.pose_trajectory_interpolator import (
+    PoseTrajectoryInterpolator, IncrementalPoseTrajectoryInterpolator)
+
+# %%
+def random_pose(rng):
+    pose = rng.normal(size=6)
+    pose[3:] *= 0.5
+    return pose
+
+def test():
+    rng = np.random.default_rng(0)
+    t = 0.
+    init_pose = random_pose(rng)
+    ref = PoseTrajectoryInterpolator(times=[t], poses=[init_pose])
+    interp = IncrementalPoseTrajectoryInterpolator(
+        times=[t], poses=[init_pose], capacity=4)
+    last_waypoint_time = t
+    dt = 1e-3
+    out = np.zeros(6)
+    for i in range(300):
+        t += dt * rng.integers(1, 40)
+        curr_time = t + dt
+        target_time = curr_time + rng.uniform(-0.05, 0.2)
+        pose = random_pose(rng)
+        if i % 50 == 49:
+            ref = ref.drive_to_waypoint(pose, target_time, curr_time,
+                max_pos_speed=5.0, max_rot_speed=5.0)
+            interp = interp.drive_to_waypoint(pose, target_time, curr_time,
+                max_pos_speed=5.0, max_rot_speed=5.0)
+        else:
+            ref = ref.schedule_waypoint(pose, target_time,
+                max_pos_speed=5.0, max_rot_speed=5.0,
+                curr_time=curr_time, last_waypoint_time=last_waypoint_time)
+            interp = interp.schedule_waypoint(pose, target_time,
+                max_pos_speed=5.0, max_rot_speed=5.0,
+                curr_time=curr_time, last_waypoint_time=last_waypoint_time)
+        last_waypoint_time = target_time
+        assert np.allclose(ref.times, interp.times)
+        assert np.allclose(ref.poses, interp.poses)
+
+        query_times = t + np.linspace(-0.1, 0.5, 50)
+        assert np.allclose(ref(query_times), interp(query_times))
+        for qt in query_times[::5]:
+            assert np.allclose(ref(qt), interp(qt, out=out))
+            assert np.allclose(ref(qt), interp(float(qt)))
+
+    # capacity grows while the active window stays compact
+    assert interp.capacity >= len(interp)
+
+
+if __name__ == "__main__":
+    test()
@@ -0,0 +1,48 @@
+# %%
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+# %%
+import numpy as np
+from diffusion_policy.env.pusht.pusht_env import PushTEnv
+
+# %%
+def test():
+    env = PushTEnv(render_action=False)
+    raster_env = PushTEnv(render_action=False, renderer='raster')
+    rs = np.random.RandomState(0)
+    states = list()
+    for seed in range(20):
+        env.seed(seed)
+        raster_env.seed(seed)
+        env.reset()
+        raster_env.reset()
+        for _ in range(3):
+            action = rs.uniform(50, 450, size=2)
+            env.step(action)
+            raster_env.step(action)
+        img = env._render_frame('rgb_array').astype(np.float32)
+        raster_img = raster_env._render_frame('rgb_array').astype(np.float32)
+        assert img.shape == raster_img.shape
+        diff = np.abs(img - raster_img)
+        # only anti-aliased edges differ
+        assert diff.mean() < 2.0
+        assert np.mean(diff.max(axis=-1) > 40) < 0.02
+        states.append((raster_env.agent.position, raster_env.block.position, raster_env.block.angle))
+    
+    # batch rendering is the same as rendering one by one
+    rasterizer = raster_env._get_rasterizer()
+    agent_pos = np.array([x[0] for x in states])
+    block_pose = np.array([tuple(x[1]) + (x[2],) for x in states])
+    imgs = rasterizer.render_batch(agent_pos, block_pose)
+    assert imgs.shape == (len(states), 96, 96, 3)
+    for i in range(len(states)):
+        assert np.array_equal(imgs[i], rasterizer.render(agent_pos[i], block_pose[i]))
+
+# %%
+if __name__ == '__main__':
+    test()
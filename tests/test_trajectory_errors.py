@@ -0,0 +1,144 @@
+# %%
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+# %%
+import time
+import numpy as np
+from scipy.spatial.transform import Rotation
+import umi.traj_eval.trajectory_utils as tu
+import umi.traj_eval.transformations as tf
+from umi.traj_eval.compute_trajectory_errors import (
+    compute_relative_error, compute_temporal_relative_error)
+
+# %%
+# reference per-pair loop implementations
+def compute_comparison_indices_length_loop(distances, dist, max_dist_diff):
+    max_idx = len(distances)
+    comparisons = []
+    for idx, d in enumerate(distances):
+        best_idx = -1
+        error = max_dist_diff
+        for i in range(idx, max_idx):
+            if np.abs(distances[i]-(d+dist)) < error:
+                best_idx = i
+                error = np.abs(distances[i] - (d+dist))
+        if best_idx != -1:
+            comparisons.append(best_idx)
+    return comparisons
+
+
+def compute_errors_loop(p_es, q_es, p_gt, q_gt, T_cm, pairs, scale=1.0):
+    T_mc = np.linalg.inv(T_cm)
+    errors = []
+    for idx, c in pairs:
+        T_c1 = tu.get_rigid_body_trafo(q_es[idx, :], p_es[idx, :])
+        T_c2 = tu.get_rigid_body_trafo(q_es[c, :], p_es[c, :])
+        T_c1_c2 = np.dot(np.linalg.inv(T_c1), T_c2)
+        T_c1_c2[:3, 3] *= scale
+
+        T_m1 = tu.get_rigid_body_trafo(q_gt[idx, :], p_gt[idx, :])
+        T_m2 = tu.get_rigid_body_trafo(q_gt[c, :], p_gt[c, :])
+        T_m1_m2 = np.dot(np.linalg.inv(T_m1), T_m2)
+
+        T_m1_m2_in_c1 = np.dot(T_cm, np.dot(T_m1_m2, T_mc))
+        T_error_in_c2 = np.dot(np.linalg.inv(T_m1_m2_in_c1), T_c1_c2)
+        T_c2_rot = np.eye(4)
+        T_c2_rot[0:3, 0:3] = T_c2[0:3, 0:3]
+        T_error_in_w = np.dot(T_c2_rot, np.dot(
+            T_error_in_c2, np.linalg.inv(T_c2_rot)))
+        errors.append(T_error_in_w)
+
+    error_trans_norm = []
+    error_yaw = []
+    error_gravity = []
+    e_rot = []
+    for e in errors:
+        error_trans_norm.append(np.linalg.norm(e[0:3, 3]))
+        ypr_angles = tf.euler_from_matrix(e, 'rzyx')
+        e_rot.append(tu.compute_angle(e))
+        error_yaw.append(abs(ypr_angles[0])*180.0/np.pi)
+        error_gravity.append(
+            np.sqrt(ypr_angles[1]**2+ypr_angles[2]**2)*180.0/np.pi)
+    return np.array(errors), np.array(error_trans_norm),\
+        np.array(error_yaw), np.array(error_gravity), np.array(e_rot)
+
+
+def get_mocap_trajectory(n, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / 120
+    p_gt = np.stack([np.sin(t*0.3), np.cos(t*0.2), 0.1*np.sin(t)], axis=-1)
+    # pauses produce repeated accumulated distances
+    p_gt[n//3:n//3+50] = p_gt[n//3]
+    q_gt = Rotation.from_rotvec(np.stack([0.2*np.sin(t), 0.3*np.cos(t*0.5), t*0.1], axis=-1)).as_quat()
+    p_es = p_gt + rng.normal(scale=1e-3, size=p_gt.shape)
+    q_es = (Rotation.from_rotvec(rng.normal(scale=1e-3, size=p_gt.shape)) * Rotation.from_quat(q_gt)).as_quat()
+    T_cm = np.eye(4)
+    T_cm[:3, :3] = Rotation.from_euler('xyz', [0.1, -0.2, 0.3]).as_matrix()
+    T_cm[:3, 3] = [0.01, 0.02, -0.03]
+    return p_es, q_es, p_gt, q_gt, T_cm
+
+# %%
+def test_comparison_indices():
+    p_es, q_es, p_gt, q_gt, T_cm = get_mocap_trajectory(1000)
+    distances = tu.get_distance_from_start(p_gt)
+    for dist in [0.0, 0.01, 0.1, 0.5, 100.0]:
+        for max_dist_diff in [1e-4, 0.005, 0.1]:
+            gt = compute_comparison_indices_length_loop(distances, dist, max_dist_diff)
+            result = tu.compute_comparison_indices_length(distances, dist, max_dist_diff)
+            assert np.array_equal(np.array(gt, dtype=np.int64), result)
+
+
+def test_relative_error():
+    p_es, q_es, p_gt, q_gt, T_cm = get_mocap_trajectory(1000)
+    distances = tu.get_distance_from_start(p_gt)
+    dist = 0.2
+    max_dist_diff = 0.01
+    comparisons = compute_comparison_indices_length_loop(distances, dist, max_dist_diff)
+    gt = compute_errors_loop(p_es, q_es, p_gt, q_gt, T_cm,
+        enumerate(comparisons), scale=1.1)
+    result = compute_relative_error(p_es, q_es, p_gt, q_gt, T_cm, dist, max_dist_diff, scale=1.1)
+    errors, error_trans_norm, error_trans_perc, error_yaw, error_gravity, e_rot, e_rot_deg_per_m = result
+    for x, y in zip(gt, [errors, error_trans_norm, error_yaw, error_gravity, e_rot]):
+        assert np.allclose(x, y, rtol=1e-9, atol=1e-9)
+    assert np.allclose(error_trans_perc, gt[1] / dist * 100)
+    assert np.allclose(e_rot_deg_per_m, gt[4] / dist)
+
+
+def test_temporal_relative_error():
+    p_es, q_es, p_gt, q_gt, T_cm = get_mocap_trajectory(300)
+    window_steps = 5
+    pairs = list()
+    for i in range(1, window_steps):
+        pairs.extend((j, j + i) for j in range(len(p_gt) - i))
+    gt = compute_errors_loop(p_es, q_es, p_gt, q_gt, T_cm, pairs)
+    result = compute_temporal_relative_error(p_es, q_es, p_gt, q_gt, T_cm, window_steps)
+    for x, y in zip(gt, result):
+        assert np.allclose(x, y, rtol=1e-9, atol=1e-9)
+
+
+def benchmark(n=20000, dist=0.5, max_dist_diff=0.01):
+    p_es, q_es, p_gt, q_gt, T_cm = get_mocap_trajectory(n)
+    distances = tu.get_distance_from_start(p_gt)
+
+    t = time.time()
+    comparisons = compute_comparison_indices_length_loop(distances, dist, max_dist_diff)
+    gt = compute_errors_loop(p_es, q_es, p_gt, q_gt, T_cm, enumerate(comparisons))
+    loop_time = time.time() - t
+
+    t = time.time()
+    result = compute_relative_error(p_es, q_es, p_gt, q_gt, T_cm, dist, max_dist_diff)
+    batch_time = time.time() - t
+    assert np.allclose(gt[1], result[1])
+    print(f'{n} poses, {len(comparisons)} pairs: loop {loop_time:.3f}s, batched {batch_time:.3f}s')
+
+
+if __name__ == "__main__":
+    test_comparison_indices()
+    test_relative_error()
+    test_temporal_relative_error()
+    benchmark()
@@ -0,0 +1,82 @@
+# %%
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+# %%
+import torch
+from diffusion_policy.model.diffusion.transformer_for_diffusion import TransformerForDiffusion
+from diffusion_policy.model.diffusion.transformer_for_action_diffusion import TransformerForActionDiffusion
+
+# %%
+def randomize_(model):
+    # zero-initialized biases and embeddings would hide misplaced terms
+    generator = torch.Generator().manual_seed(0)
+    with torch.no_grad():
+        for p in model.parameters():
+            p.add_(torch.randn(p.shape, generator=generator) * 0.1)
+    return model
+
+
+def check_cached(model, sample, cond, timesteps=(torch.tensor(0), torch.tensor(50), 99)):
+    model.eval()
+    with torch.no_grad():
+        cond_cache = model.encode_cond(cond)
+        for timestep in timesteps:
+            out = model(sample, timestep, cond)
+            cached_out = model(sample, timestep, cond_cache=cond_cache)
+            assert torch.allclose(out, cached_out, atol=1e-5, rtol=1e-4), \
+                (timestep, (out - cached_out).abs().max())
+
+
+def test_transformer_for_diffusion():
+    torch.manual_seed(0)
+    for kwargs in [
+            # MLP cond encoder, as in the shipped configs
+            dict(cond_dim=10, causal_attn=True),
+            dict(cond_dim=10, causal_attn=False),
+            # transformer cond encoder
+            dict(cond_dim=10, causal_attn=True, n_cond_layers=2),
+            # time token only
+            dict(causal_attn=True),
+            # BERT, encoder only
+            dict(time_as_cond=False),
+            dict(time_as_cond=False, causal_attn=True)]:
+        model = randomize_(TransformerForDiffusion(
+            input_dim=16,
+            output_dim=16,
+            horizon=8,
+            n_obs_steps=4,
+            n_layer=2,
+            n_head=4,
+            n_emb=32,
+            **kwargs
+        ))
+        sample = torch.randn((3,8,16))
+        cond = torch.randn((3,4,10)) if 'cond_dim' in kwargs else None
+        check_cached(model, sample, cond)
+
+
+def test_transformer_for_action_diffusion():
+    torch.manual_seed(0)
+    n_cond_tokens = 6
+    model = randomize_(TransformerForActionDiffusion(
+        input_dim=10,
+        output_dim=10,
+        action_horizon=16,
+        n_layer=2,
+        n_head=4,
+        n_emb=32,
+        max_cond_tokens=n_cond_tokens+1
+    ))
+    sample = torch.randn((3,16,10))
+    cond = torch.randn((3,n_cond_tokens,32))
+    check_cached(model, sample, cond)
+
+
+if __name__ == "__main__":
+    test_transformer_for_diffusion()
+    test_transformer_for_action_diffusion()
@@ -0,0 +1,75 @@
+# %%
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+# %%
+import tempfile
+import pathlib
+import numpy as np
+import av
+from umi.common.video_frame_source import VideoFrameSource, get_frame_index_path
+
+# %%
+def write_test_video(path, n_frames=120, gop_size=12):
+    with av.open(str(path), mode='w') as container:
+        stream = container.add_stream('h264', rate=60)
+        stream.width = 64
+        stream.height = 48
+        stream.pix_fmt = 'yuv420p'
+        # B-frames reorder decode and presentation order
+        stream.codec_context.options = {'g': str(gop_size), 'bf': '2'}
+        for i in range(n_frames):
+            img = np.zeros((48,64,3), dtype=np.uint8)
+            img[:,(i % 64)] = 255
+            img[...,1] = i * 2
+            for packet in stream.encode(av.VideoFrame.from_ndarray(img, format='rgb24')):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+
+
+def test():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = pathlib.Path(tmp_dir).joinpath('raw_video.mp4')
+        write_test_video(video_path)
+        with av.open(str(video_path)) as container:
+            gt_imgs = [x.to_ndarray(format='rgb24') for x in container.decode(container.streams.video[0])]
+
+        with VideoFrameSource(video_path) as source:
+            assert get_frame_index_path(video_path).is_file()
+            assert len(source) == len(gt_imgs)
+            assert source.n_gops > 1
+            for start, stop, step in [(0, None, 1), (5, 50, 7), (100, 120, 1), (11, 13, 1)]:
+                result = list(source.iter_frames(start, stop, step))
+                idxs = list(range(*slice(start, stop, step).indices(len(gt_imgs))))
+                assert [x[0] for x in result] == idxs
+                for idx, img in result:
+                    assert np.array_equal(img, gt_imgs[idx])
+            # random access, backwards
+            for idx in [119, 60, 3, 61, 0]:
+                assert np.array_equal(source.read_frame(idx), gt_imgs[idx])
+
+        # streaming without GOP cache
+        with VideoFrameSource(video_path, cache_size=0) as source:
+            for start, stop, step in [(0, None, 1), (5, 50, 7), (3, 120, 40), 
+                    (100, 120, 1), (11, 13, 1), (30, 0, -4)]:
+                result = list(source.iter_frames(start, stop, step))
+                idxs = list(range(*slice(start, stop, step).indices(len(gt_imgs))))
+                assert [x[0] for x in result] == idxs
+                for idx, img in result:
+                    assert np.array_equal(img, gt_imgs[idx])
+            for idx in [119, 60, 3, 61, 0]:
+                assert np.array_equal(source.read_frame(idx), gt_imgs[idx])
+            assert len(source.gop_cache) == 0
+
+        # reuse sidecar index
+        with VideoFrameSource(video_path) as source:
+            assert np.array_equal(source.read_frame(-1), gt_imgs[-1])
+
+
+if __name__ == "__main__":
+    test()
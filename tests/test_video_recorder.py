@@ -0,0 +1,78 @@
+# %%
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+sys.path.append(ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+# %%
+import time
+import pathlib
+import tempfile
+import av
+import numpy as np
+from multiprocessing.managers import SharedMemoryManager
+from umi.real_world.video_recorder import VideoRecorder
+
+# %%
+def write_episode(recorder, video_path, n_frames, fps):
+    start_time = time.time()
+    recorder.start_recording(video_path, start_time=start_time)
+    # frames written before the recorder picked up the command
+    # belong to the previous video
+    while not recorder.cmd_queue.empty():
+        time.sleep(0.001)
+    for i in range(n_frames):
+        img = np.full((48,64,3), i * 2, dtype=np.uint8)
+        recorder.write_frame(img, frame_time=start_time + (i + 0.1) / fps)
+    recorder.stop_recording()
+
+
+def wait_finalized(video_path, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not VideoRecorder.is_finalized(video_path):
+        assert time.monotonic() < deadline, video_path
+        time.sleep(0.01)
+
+
+def read_timestamps(video_path):
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        pts = [frame.pts for frame in container.decode(stream)]
+        return np.array(pts) * float(stream.time_base)
+
+
+def test_segment_rotation():
+    fps = 30
+    n_frames = [100, 40]
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            SharedMemoryManager() as shm_manager:
+        recorder = VideoRecorder.create_h264(
+            fps=fps, segment_duration=1.0, buffer_size=256)
+        recorder.start(shm_manager=shm_manager,
+            data_example=np.zeros((48,64,3), dtype=np.uint8))
+        recorder.start_wait()
+        # next episode starts right after the previous one stopped
+        video_paths = [os.path.join(tmp_dir, f'{i}.mp4') for i in range(len(n_frames))]
+        for video_path, n in zip(video_paths, n_frames):
+            write_episode(recorder, video_path, n, fps)
+        for video_path in video_paths:
+            wait_finalized(video_path)
+        metrics = recorder.get_metrics()
+        recorder.stop()
+        recorder.end_wait()
+
+        assert metrics['n_frames_dropped'] == 0
+        assert metrics['n_segments'] == 2
+        for video_path, n in zip(video_paths, n_frames):
+            timestamps = read_timestamps(video_path)
+            assert len(timestamps) == n
+            assert np.allclose(timestamps, np.arange(n) / fps, atol=1e-3)
+        # segments are removed after remux
+        assert sorted(p.name for p in pathlib.Path(tmp_dir).iterdir()) \
+            == ['0.mp4', '1.mp4']
+
+
+if __name__ == "__main__":
+    test_segment_rotation()
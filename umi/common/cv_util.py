@@ -244,6 +244,66 @@ def get_gripper_width(tag_dict, left_id, right_id, nominal_z=0.072, z_tolerance=
     return width
 
 
+def get_tag_arrays(tag_detection_results, tag_ids):
+    """
+    Columnar view of tag detections (list of dict with 'time' and 'tag_dict')
+    for tag_ids, in one pass over the frames.
+    Returns dict(
+        time=(N,),
+        tags={tag_id: dict(
+            is_detected=(N,) bool,
+            rvec=(N,3), tvec=(N,3), corners=(N,4,2))})
+    Values of frames without the tag are NaN.
+    """
+    n = len(tag_detection_results)
+    timestamps = np.array([x['time'] for x in tag_detection_results])
+    tags = dict()
+    for tag_id in tag_ids:
+        tags[tag_id] = {
+            'is_detected': np.zeros(n, dtype=np.bool_),
+            'rvec': np.full((n,3), np.nan),
+            'tvec': np.full((n,3), np.nan),
+            'corners': np.full((n,4,2), np.nan)
+        }
+    for i, td in enumerate(tag_detection_results):
+        tag_dict = td['tag_dict']
+        for tag_id, arrs in tags.items():
+            tag = tag_dict.get(tag_id)
+            if tag is None:
+                continue
+            arrs['is_detected'][i] = True
+            arrs['rvec'][i] = tag['rvec']
+            arrs['tvec'][i] = tag['tvec']
+            arrs['corners'][i] = tag['corners']
+    return {
+        'time': timestamps,
+        'tags': tags
+    }
+
+
+def get_gripper_widths(left_tvec, right_tvec, nominal_z=0.072, z_tolerance=0.008):
+    """
+    Vectorized get_gripper_width over (N,3) tvecs (NaN for undetected tags).
+    Returns (N,) widths, NaN where get_gripper_width returns None.
+    """
+    zmax = nominal_z + z_tolerance
+    zmin = nominal_z - z_tolerance
+    # NaN compares False
+    left_valid = (zmin < left_tvec[:,-1]) & (left_tvec[:,-1] < zmax)
+    right_valid = (zmin < right_tvec[:,-1]) & (right_tvec[:,-1] < zmax)
+    left_x = left_tvec[:,0]
+    right_x = right_tvec[:,0]
+
+    width = np.full(len(left_tvec), np.nan)
+    is_single_left = left_valid & ~right_valid
+    is_single_right = right_valid & ~left_valid
+    is_both = left_valid & right_valid
+    width[is_both] = right_x[is_both] - left_x[is_both]
+    width[is_single_left] = np.abs(left_x[is_single_left]) * 2
+    width[is_single_right] = np.abs(right_x[is_single_right]) * 2
+    return width
+
+
 # =========== image mask ====================
 def canonical_to_pixel_coords(coords, img_shape=(2028, 2704)):
     pts = np.asarray(coords) * img_shape[0] + np.array(img_shape[::-1]) * 0.5
@@ -0,0 +1,258 @@
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+import datetime
+import json
+import struct
+import numpy as np
+import av
+
+# GPMF value types, all big endian
+# https://github.com/gopro/gpmf-parser#type
+GPMF_DTYPES = {
+    'b': '>i1',
+    'B': '>u1',
+    's': '>i2',
+    'S': '>u2',
+    'l': '>i4',
+    'L': '>u4',
+    'j': '>i8',
+    'J': '>u8',
+    'f': '>f4',
+    'd': '>f8',
+}
+# fixed point types: (raw dtype, scale)
+GPMF_FIXED_DTYPES = {
+    'q': ('>i4', 1 / (1 << 16)),
+    'Q': ('>i8', 1 / (1 << 32)),
+}
+
+GPMF_STREAM_NAMES = {
+    'ACCL': 'Accelerometer',
+    'GYRO': 'Gyroscope'
+}
+
+
+def iter_klv(buf: bytes, start: int=0, end: Optional[int]=None
+        ) -> Iterator[Tuple[str, str, int, int, memoryview]]:
+    """
+    Iterate KLV records of a GPMF buffer.
+    Yields key, type, structure size, repeat and data (without padding).
+    Type '\\x00' means the data is a nested KLV container.
+    """
+    buf = memoryview(buf)
+    if end is None:
+        end = len(buf)
+    offset = start
+    while offset + 8 <= end:
+        key = bytes(buf[offset:offset+4]).decode('latin-1')
+        type_char = chr(buf[offset+4])
+        size = buf[offset+5]
+        repeat = struct.unpack_from('>H', buf, offset+6)[0]
+        n_bytes = size * repeat
+        data_start = offset + 8
+        if key == '\x00\x00\x00\x00':
+            # padding
+            break
+        yield key, type_char, size, repeat, buf[data_start:data_start+n_bytes]
+        # data is padded to 4 bytes
+        offset = data_start + ((n_bytes + 3) & ~3)
+
+
+def decode_klv_value(type_char: str, size: int, repeat: int, data: memoryview):
+    """
+    Decode a leaf KLV record into a (repeat, size/itemsize) array,
+    or str for char/date types. Returns None for unsupported types.
+    """
+    if type_char in ('c', 'U'):
+        return bytes(data).decode('latin-1').rstrip('\x00')
+    if type_char in GPMF_DTYPES:
+        dtype = np.dtype(GPMF_DTYPES[type_char])
+        arr = np.frombuffer(data, dtype=dtype)
+        return arr.reshape(repeat, size // dtype.itemsize)
+    if type_char in GPMF_FIXED_DTYPES:
+        dtype, scale = GPMF_FIXED_DTYPES[type_char]
+        dtype = np.dtype(dtype)
+        arr = np.frombuffer(data, dtype=dtype).astype(np.float64) * scale
+        return arr.reshape(repeat, size // dtype.itemsize)
+    return None
+
+
+def parse_gpmf_payload(buf: bytes, stream_keys: Sequence[str]=('ACCL', 'GYRO')
+        ) -> Dict[str, dict]:
+    """
+    Parse one GPMF payload (one mp4 sample of the gpmd track).
+    Returns stream key -> dict(
+        value=(N,k) float64 after SCAL,
+        temperature=float or None,
+        device_name=str or None)
+    """
+    results = dict()
+    for devc_key, devc_type, _, _, devc_data in iter_klv(buf):
+        if devc_key != 'DEVC' or devc_type != '\x00':
+            continue
+        device_name = None
+        for strm_key, strm_type, strm_size, strm_repeat, strm_data in iter_klv(devc_data):
+            if strm_key == 'DVNM':
+                device_name = decode_klv_value(strm_type, strm_size, strm_repeat, strm_data)
+                continue
+            if strm_key != 'STRM' or strm_type != '\x00':
+                continue
+            # sticky values within the stream
+            scale = None
+            temperature = None
+            for key, type_char, size, repeat, data in iter_klv(strm_data):
+                if key == 'SCAL':
+                    scale = decode_klv_value(type_char, size, repeat, data)
+                elif key == 'TMPC':
+                    temperature = float(decode_klv_value(type_char, size, repeat, data)[0,0])
+                elif key in stream_keys:
+                    value = decode_klv_value(type_char, size, repeat, data)
+                    if value is None:
+                        continue
+                    value = value.astype(np.float64)
+                    if scale is not None:
+                        # one scale for all axes or one per axis
+                        value = value / scale.reshape(-1)
+                    results[key] = {
+                        'value': value,
+                        'temperature': temperature,
+                        'device_name': device_name
+                    }
+    return results
+
+
+def extract_gopro_imu(mp4_path: str, stream_keys: Sequence[str]=('ACCL', 'GYRO')) -> dict:
+    """
+    Demux the GPMF (gpmd) track with PyAV and parse IMU streams.
+    Samples within a payload are spread evenly over the payload's
+    duration in the mp4 track, same as gopro-telemetry.
+    Returns dict(
+        device_name=str, fps=float, start_date=datetime or None,
+        streams={key: dict(value=(N,3) float64, cts=(N,) float64 ms,
+            temperature=(N,) float64 or None)})
+    """
+    chunks = dict((key, list()) for key in stream_keys)
+    device_name = None
+    with av.open(str(mp4_path), 'r') as container:
+        video = container.streams.video[0]
+        fps = float(video.average_rate)
+        creation_time = container.metadata.get('creation_time')
+        gpmd = None
+        for stream in container.streams.data:
+            codec_context = getattr(stream, 'codec_context', None)
+            codec_tag = getattr(codec_context, 'codec_tag', None)
+            if codec_tag == 'gpmd' \
+                or stream.metadata.get('handler_name', '').strip().startswith('GoPro MET'):
+                gpmd = stream
+                break
+        if gpmd is None:
+            raise RuntimeError(f'No GPMF stream found in {mp4_path}')
+        time_base = float(gpmd.time_base)
+        for packet in container.demux(gpmd):
+            if packet.size == 0 or packet.pts is None:
+                continue
+            start_ms = packet.pts * time_base * 1000
+            duration_ms = packet.duration * time_base * 1000
+            payload = parse_gpmf_payload(bytes(packet), stream_keys=stream_keys)
+            for key, result in payload.items():
+                n = len(result['value'])
+                if n == 0:
+                    continue
+                cts = start_ms + np.arange(n) * (duration_ms / n)
+                temperature = result['temperature']
+                if temperature is None:
+                    temperature = np.nan
+                chunks[key].append((result['value'], cts, np.full(n, temperature)))
+                if result['device_name'] is not None:
+                    device_name = result['device_name']
+
+    start_date = None
+    if creation_time is not None:
+        start_date = datetime.datetime.strptime(creation_time, r"%Y-%m-%dT%H:%M:%S.%fZ")
+    streams = dict()
+    for key, chunk in chunks.items():
+        if len(chunk) == 0:
+            continue
+        value, cts, temperature = [np.concatenate(x) for x in zip(*chunk)]
+        if np.all(np.isnan(temperature)):
+            temperature = None
+        streams[key] = {
+            'value': value,
+            'cts': cts,
+            'temperature': temperature
+        }
+    return {
+        'device_name': device_name,
+        'fps': fps,
+        'start_date': start_date,
+        'streams': streams
+    }
+
+
+def imu_to_telemetry_json(imu: dict) -> dict:
+    """
+    Same layout as gopro-telemetry used by OpenImuCameraCalibrator
+    extract_metadata_single.js, as read by ORB_SLAM3:
+    {"1": {"streams": {"ACCL": {"samples": [{"value", "cts", "date"}]}}}}
+    """
+    streams = dict()
+    for key, stream in imu['streams'].items():
+        samples = list()
+        values = stream['value'].tolist()
+        ctss = stream['cts'].tolist()
+        temperatures = None
+        if stream['temperature'] is not None:
+            temperatures = stream['temperature'].tolist()
+        for i in range(len(values)):
+            sample = {
+                'value': values[i],
+                'cts': ctss[i]
+            }
+            if imu['start_date'] is not None:
+                date = imu['start_date'] + datetime.timedelta(milliseconds=ctss[i])
+                sample['date'] = date.strftime(r"%Y-%m-%dT%H:%M:%S.%f")[:-3] + 'Z'
+            if temperatures is not None:
+                sample['temperature [°C]'] = temperatures[i]
+            samples.append(sample)
+        streams[key] = {
+            'samples': samples,
+            'name': GPMF_STREAM_NAMES.get(key, key)
+        }
+    return {
+        '1': {
+            'streams': streams,
+            'device name': imu['device_name']
+        },
+        'frames/second': imu['fps']
+    }
+
+
+def save_imu_json(imu: dict, json_path: str):
+    with open(json_path, 'w') as f:
+        json.dump(imu_to_telemetry_json(imu), f)
+
+
+def save_imu_npz(imu: dict, npz_path: str):
+    arrays = dict()
+    for key, stream in imu['streams'].items():
+        arrays[key.lower()] = stream['value']
+        arrays[key.lower() + '_cts'] = stream['cts']
+    np.savez(npz_path, **arrays)
+
+
+def load_telemetry_json(json_path: str, stream_keys: Sequence[str]=('ACCL', 'GYRO')
+        ) -> Dict[str, dict]:
+    """
+    Read value and cts arrays from a gopro-telemetry style json.
+    """
+    data = json.load(open(json_path, 'r'))
+    streams = data['1']['streams']
+    results = dict()
+    for key in stream_keys:
+        if key not in streams:
+            continue
+        samples = streams[key]['samples']
+        results[key] = {
+            'value': np.array([x['value'] for x in samples], dtype=np.float64),
+            'cts': np.array([x['cts'] for x in samples], dtype=np.float64)
+        }
+    return results
@@ -11,27 +11,106 @@ def get_interp1d(t, x):
     return gripper_interp
 
 
+def get_nearest_idxs(t, query_t):
+    """
+    Index of the nearest timestamp in sorted t for each query_t,
+    equivalent to np.argmin(np.abs(t - q)) for each q (ties go to the
+    earlier index).
+    """
+    t = np.asarray(t)
+    query_t = np.asarray(query_t)
+    if len(t) == 1:
+        return np.zeros(query_t.shape, dtype=np.int64)
+    idxs = np.clip(np.searchsorted(t, query_t, side='left'), 1, len(t) - 1)
+    prev_idxs = idxs - 1
+    use_prev = np.abs(t[prev_idxs] - query_t) <= np.abs(t[idxs] - query_t)
+    return np.where(use_prev, prev_idxs, idxs)
+
+
+def get_interp_bracket(t, query_t):
+    """
+    For each query_t, returns (lo, hi) indices into sorted t with
+    t[lo] <= q <= t[hi] and hi = lo + 1. Query outside of t uses the 
+    first/last bracket.
+    """
+    idxs = np.clip(np.searchsorted(t, query_t, side='left'), 1, len(t) - 1)
+    return idxs - 1, idxs
+
+
+def interp1d_linear(t, x, query_t):
+    """
+    Same result as get_interp1d(t, x)(query_t), only the brackets
+    containing query_t are touched.
+    """
+    t = np.asarray(t)
+    x = np.asarray(x)
+    query_t = np.asarray(query_t)
+    if len(t) == 1:
+        return np.repeat(x[:1], query_t.size, axis=0).reshape(
+            query_t.shape + x.shape[1:])
+    lo, hi = get_interp_bracket(t, query_t)
+    t_lo = t[lo]
+    x_lo = x[lo]
+    slope = (x[hi] - x_lo) / (t[hi] - t_lo).reshape(
+        t_lo.shape + (1,) * (x.ndim - 1))
+    result = slope * (query_t - t_lo).reshape(
+        t_lo.shape + (1,) * (x.ndim - 1)) + x_lo
+    result[query_t < t[0]] = x[0]
+    result[query_t > t[-1]] = x[-1]
+    return result
+
+
+def slerp_rotvec(rotvec0, rotvec1, alpha):
+    """
+    Spherical interpolation from rotvec0 (alpha=0) to rotvec1 (alpha=1),
+    batched over leading dimension. Returns rotvec.
+    """
+    rot0 = st.Rotation.from_rotvec(rotvec0)
+    delta = (rot0.inv() * st.Rotation.from_rotvec(rotvec1)).as_rotvec()
+    rot = rot0 * st.Rotation.from_rotvec(delta * np.asarray(alpha)[...,None])
+    return rot.as_rotvec()
+
+
+def interp_pose(t, x, query_t):
+    """
+    Linear position and slerp rotation interpolation of (N,6) poses
+    [pos, rotvec] at query_t, clamped to [t[0], t[-1]].
+    Only the bracketing samples of query_t are converted to rotations,
+    so the cost is independent of len(t).
+    """
+    t = np.asarray(t)
+    x = np.asarray(x)
+    query_t = np.clip(np.asarray(query_t), t[0], t[-1])
+    shape = query_t.shape
+    query_t = query_t.reshape(-1)
+    if len(t) == 1:
+        return np.repeat(x[:1], query_t.size, axis=0).reshape(shape + (6,))
+    lo, hi = get_interp_bracket(t, query_t)
+    t_lo = t[lo]
+    dt = t[hi] - t_lo
+    pos_lo = x[lo,:3]
+    pos = ((x[hi,:3] - pos_lo) / dt[:,None]) * (query_t - t_lo)[:,None] + pos_lo
+    alpha = (query_t - t_lo) / dt
+    rvec = slerp_rotvec(x[lo,3:], x[hi,3:], alpha)
+    pose = np.concatenate([pos, rvec], axis=-1)
+    return pose.reshape(shape + (6,))
+
+
 class PoseInterpolator:
     def __init__(self, t, x):
-        pos = x[:,:3]
-        rot = st.Rotation.from_rotvec(x[:,3:])
-        self.pos_interp = get_interp1d(t, pos)
-        self.rot_interp = st.Slerp(t, rot)
+        t = np.asarray(t)
+        x = np.asarray(x)
+        assert len(t) == len(x)
+        assert len(t) >= 2
+        self.t = t
+        self.pose = x
     
     @property
     def x(self):
-        return self.pos_interp.x
+        return self.t
     
     def __call__(self, t):
-        min_t = self.pos_interp.x[0]
-        max_t = self.pos_interp.x[-1]
-        t = np.clip(t, min_t, max_t)
-
-        pos = self.pos_interp(t)
-        rot = self.rot_interp(t)
-        rvec = rot.as_rotvec()
-        pose = np.concatenate([pos, rvec], axis=-1)
-        return pose
+        return interp_pose(self.t, self.pose, t)
 
 def get_gripper_calibration_interpolator(
         aruco_measured_width, 
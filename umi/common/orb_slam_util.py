@@ -1,3 +1,5 @@
+import os
+import pathlib
 import numpy as np
 import pandas as pd
 from scipy.spatial.transform import Rotation
@@ -26,24 +28,90 @@ def load_tum_trajectory(tum_txt_path):
     }
     return result
 
+def get_trajectory_npy_path(csv_path):
+    """
+    camera_trajectory.csv -> camera_trajectory.npy
+    """
+    return pathlib.Path(csv_path).with_suffix('.npy')
+
+def quat_pos_to_mat(cam_pos, cam_rot_quat_xyzw):
+    """
+    (N,3), (N,4) -> (N,4,4) float32
+    Rows with all-zero quaternion (lost frames) get identity rotation.
+    """
+    cam_rot_quat_xyzw = np.array(cam_rot_quat_xyzw, dtype=np.float64)
+    is_zero = np.all(cam_rot_quat_xyzw == 0, axis=-1)
+    cam_rot_quat_xyzw[is_zero, 3] = 1
+    cam_pose = np.zeros((cam_pos.shape[0], 4, 4), dtype=np.float32)
+    cam_pose[:,3,3] = 1
+    cam_pose[:,:3,3] = cam_pos
+    if len(cam_pose) > 0:
+        cam_pose[:,:3,:3] = Rotation.from_quat(cam_rot_quat_xyzw).as_matrix()
+    return cam_pose
+
+def csv_trajectory_to_array(df):
+    """
+    Structured array with one field per CSV column
+    plus precomputed 'pose' (4,4) float32.
+    """
+    cam_pose = quat_pos_to_mat(
+        df[['x', 'y', 'z']].to_numpy(),
+        df[['q_x', 'q_y', 'q_z', 'q_w']].to_numpy())
+    fields = [(str(name), df[name].to_numpy().dtype) for name in df.columns]
+    fields.append(('pose', np.float32, (4,4)))
+    arr = np.empty(len(df), dtype=fields)
+    for name in df.columns:
+        arr[str(name)] = df[name].to_numpy()
+    arr['pose'] = cam_pose
+    return arr
+
+def convert_csv_trajectory(csv_path, npy_path=None):
+    """
+    Write camera_trajectory.csv from SLAM as a memory-mappable .npy
+    next to it. Returns path of the .npy file.
+    """
+    if npy_path is None:
+        npy_path = get_trajectory_npy_path(csv_path)
+    npy_path = pathlib.Path(npy_path)
+    arr = csv_trajectory_to_array(pd.read_csv(csv_path))
+    tmp_path = npy_path.with_name(npy_path.name + '.tmp.npy')
+    np.save(tmp_path, arr)
+    os.replace(tmp_path, npy_path)
+    return npy_path
+
+def load_trajectory_array(csv_path, mmap_mode='r'):
+    """
+    Load trajectory as structured array (see csv_trajectory_to_array).
+    Prefers the .npy written by convert_csv_trajectory if it
+    is not older than the CSV, otherwise parses the CSV.
+    """
+    csv_path = pathlib.Path(csv_path)
+    npy_path = get_trajectory_npy_path(csv_path)
+    if npy_path.is_file() and ((not csv_path.is_file()) 
+            or (npy_path.stat().st_mtime_ns >= csv_path.stat().st_mtime_ns)):
+        return np.load(npy_path, mmap_mode=mmap_mode)
+    return csv_trajectory_to_array(pd.read_csv(csv_path))
+
+def load_trajectory_df(csv_path):
+    """
+    Returns the CSV columns as DataFrame and (N,4,4) float32 poses 
+    of all rows, lost frames included.
+    """
+    arr = load_trajectory_array(csv_path)
+    names = [x for x in arr.dtype.names if x != 'pose']
+    df = pd.DataFrame(dict((x, arr[x]) for x in names))
+    return df, np.asarray(arr['pose'])
+
 def load_csv_trajectory(csv_path):
-    df = pd.read_csv(csv_path)
+    df, all_cam_pose = load_trajectory_df(csv_path)
     if (~df.is_lost).sum() == 0:
         return {
             'raw_data': df
         }
     
-    valid_df = df.loc[~df.is_lost]
-    
-    timestamp_sec = valid_df['timestamp'].to_numpy()
-    cam_pos = valid_df[['x', 'y', 'z']].to_numpy()
-    cam_rot_quat_xyzw = valid_df[['q_x', 'q_y', 'q_z', 'q_w']].to_numpy()
-    cam_rot = Rotation.from_quat(cam_rot_quat_xyzw)
-
-    cam_pose = np.zeros((cam_pos.shape[0], 4, 4), dtype=np.float32)
-    cam_pose[:,3,3] = 1
-    cam_pose[:,:3,3] = cam_pos
-    cam_pose[:,:3,:3] = cam_rot.as_matrix()
+    is_valid = (~df.is_lost).to_numpy()
+    timestamp_sec = df['timestamp'].to_numpy()[is_valid]
+    cam_pose = all_cam_pose[is_valid]
 
     result = {
         'timestamp': timestamp_sec,
@@ -1,4 +1,5 @@
-from typing import Union
+from typing import Union, Optional
+import math
 import numbers
 import numpy as np
 import scipy.interpolate as si
@@ -206,3 +207,354 @@ class PoseTrajectoryInterpolator:
         if is_single:
             pose = pose[0]
         return pose
+
+
+def _rotvec_to_quat(x, y, z):
+    # scalar version of st.Rotation.from_rotvec(...).as_quat(), xyzw order
+    angle = math.sqrt(x*x + y*y + z*z)
+    if angle <= 1e-3:
+        angle2 = angle * angle
+        scale = 0.5 - angle2 / 48 + angle2 * angle2 / 3840
+    else:
+        scale = math.sin(angle / 2) / angle
+    return x * scale, y * scale, z * scale, math.cos(angle / 2)
+
+def _quat_to_rotvec(x, y, z, w):
+    # scalar version of st.Rotation.from_quat(...).as_rotvec()
+    if w < 0:
+        x, y, z, w = -x, -y, -z, -w
+    angle = 2 * math.atan2(math.sqrt(x*x + y*y + z*z), w)
+    if angle <= 1e-3:
+        angle2 = angle * angle
+        scale = 2 + angle2 / 12 + 7 * angle2 * angle2 / 2880
+    else:
+        scale = angle / math.sin(angle / 2)
+    return x * scale, y * scale, z * scale
+
+def _quat_mul(ax, ay, az, aw, bx, by, bz, bw):
+    return (
+        aw*bx + ax*bw + ay*bz - az*by,
+        aw*by - ax*bz + ay*bw + az*bx,
+        aw*bz + ax*by - ay*bx + az*bw,
+        aw*bw - ax*bx - ay*by - az*bz
+    )
+
+
+class IncrementalPoseTrajectoryInterpolator:
+    """
+    Array-backed drop-in replacement for PoseTrajectoryInterpolator,
+    intended for the 1kHz loops in the robot controllers.
+
+    Waypoints live in preallocated arrays and only the active window
+    [_begin, _end) is used. Trimming moves the window in place and 
+    appending is amortized O(1). Per-segment position delta and relative
+    rotation are cached so that evaluation is a closed-form lerp/slerp,
+    identical to si.interp1d and st.Slerp. Evaluating a single time does
+    not allocate any temporary arrays (pass out= to reuse the result).
+
+    Unlike PoseTrajectoryInterpolator, trim/drive_to_waypoint/schedule_waypoint
+    modify the trajectory in place and return self, therefore existing
+    `pose_interp = pose_interp.schedule_waypoint(...)` call sites keep working.
+    """
+    def __init__(self, times: np.ndarray, poses: np.ndarray, capacity: int=64):
+        assert len(times) >= 1
+        assert len(poses) == len(times)
+        times = np.asarray(times, dtype=np.float64)
+        poses = np.asarray(poses, dtype=np.float64)
+        assert np.all(times[1:] > times[:-1])
+        n = len(times)
+        capacity = max(capacity, 2 * n)
+
+        self._times = np.zeros((capacity,), dtype=np.float64)
+        self._pos = np.zeros((capacity, 3), dtype=np.float64)
+        self._quat = np.zeros((capacity, 4), dtype=np.float64)
+        # segment i goes from waypoint i to i+1
+        self._dpos = np.zeros((capacity, 3), dtype=np.float64)
+        self._omega = np.zeros((capacity, 3), dtype=np.float64)
+        self._inv_dt = np.zeros((capacity,), dtype=np.float64)
+
+        self._times[:n] = times
+        self._pos[:n] = poses[:,:3]
+        self._quat[:n] = st.Rotation.from_rotvec(poses[:,3:]).as_quat()
+        self._begin = 0
+        self._end = n
+        self._cursor = 0
+        for i in range(n - 1):
+            self._update_segment(i)
+    
+    def __len__(self) -> int:
+        return self._end - self._begin
+
+    @property
+    def capacity(self) -> int:
+        return len(self._times)
+
+    @property
+    def times(self) -> np.ndarray:
+        return self._times[self._begin:self._end].copy()
+    
+    @property
+    def poses(self) -> np.ndarray:
+        b, e = self._begin, self._end
+        poses = np.zeros((e - b, 6))
+        poses[:,:3] = self._pos[b:e]
+        poses[:,3:] = st.Rotation.from_quat(self._quat[b:e]).as_rotvec()
+        return poses
+
+    # ========= internal storage ===========
+    def _relocate(self, capacity, offset):
+        """
+        Move the active window to [offset, offset+len) of arrays 
+        with the given capacity.
+        """
+        b, e = self._begin, self._end
+        n = e - b
+        assert offset + n <= capacity
+        for name in ('_times', '_pos', '_quat', '_dpos', '_omega', '_inv_dt'):
+            old = getattr(self, name)
+            if capacity == len(old):
+                new = old
+            else:
+                new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            # numpy buffers overlapping assignment internally
+            new[offset:offset+n] = old[b:e]
+            setattr(self, name, new)
+        self._cursor += offset - b
+        self._begin = offset
+        self._end = offset + n
+
+    def _reserve_back(self, k):
+        if self._end + k <= self.capacity:
+            return
+        n = len(self) + k
+        capacity = self.capacity
+        if 2 * n > capacity:
+            capacity = 2 * capacity
+        self._relocate(capacity, 0)
+
+    def _reserve_front(self):
+        if self._begin > 0:
+            return
+        capacity = self.capacity
+        if 2 * (len(self) + 1) > capacity:
+            capacity = 2 * capacity
+        self._relocate(capacity, 1)
+
+    def _set_waypoint(self, i, t, p):
+        # p: (x,y,z,qx,qy,qz,qw)
+        self._times[i] = t
+        self._pos[i] = p[:3]
+        self._quat[i] = p[3:]
+
+    def _update_segment(self, i):
+        x0, y0, z0, w0 = self._quat[i]
+        x1, y1, z1, w1 = self._quat[i+1]
+        q = _quat_mul(-x0, -y0, -z0, w0, x1, y1, z1, w1)
+        self._omega[i] = _quat_to_rotvec(*q)
+        np.subtract(self._pos[i+1], self._pos[i], out=self._dpos[i])
+        self._inv_dt[i] = 1 / (self._times[i+1] - self._times[i])
+
+    def _find_segment(self, t):
+        """
+        Find segment i with times[i] <= t < times[i+1], assuming 
+        times[begin] <= t < times[end-1]. Checks the cached segment and its 
+        successor first since query times are mostly monotonic.
+        """
+        times = self._times
+        i = self._cursor
+        if times[i] <= t < times[i+1]:
+            return i
+        if (i + 2 < self._end) and (times[i+1] <= t < times[i+2]):
+            i += 1
+        else:
+            b = self._begin
+            i = b + int(np.searchsorted(times[b:self._end], t, side='right')) - 1
+        self._cursor = i
+        return i
+
+    def _interp(self, t):
+        """
+        Returns (x,y,z,qx,qy,qz,qw) at scalar t, clipped to the trajectory.
+        """
+        times = self._times
+        b, e = self._begin, self._end
+        if t <= times[b]:
+            i = b
+        elif t >= times[e-1]:
+            i = e - 1
+        else:
+            i = self._find_segment(t)
+            alpha = (t - times[i]) * self._inv_dt[i]
+            pos = self._pos[i]
+            dpos = self._dpos[i]
+            ox, oy, oz = self._omega[i]
+            q = _quat_mul(*self._quat[i], 
+                *_rotvec_to_quat(ox * alpha, oy * alpha, oz * alpha))
+            return (
+                pos[0] + alpha * dpos[0],
+                pos[1] + alpha * dpos[1],
+                pos[2] + alpha * dpos[2]) + q
+        return tuple(self._pos[i]) + tuple(self._quat[i])
+
+    def _append(self, t, pose):
+        p = tuple(pose[:3]) + _rotvec_to_quat(*pose[3:])
+        last = self._end - 1
+        if t <= self._times[last]:
+            # zero-duration move, replace the last waypoint
+            assert t == self._times[last]
+            self._set_waypoint(last, t, p)
+        else:
+            self._reserve_back(1)
+            last = self._end
+            self._set_waypoint(last, t, p)
+            self._end += 1
+        if last > self._begin:
+            self._update_segment(last - 1)
+
+    # ========= public API ===========
+    def trim(self, 
+            start_t: float, end_t: float
+            ) -> "IncrementalPoseTrajectoryInterpolator":
+        """
+        In-place version of PoseTrajectoryInterpolator.trim.
+        """
+        assert start_t <= end_t
+        start_p = self._interp(start_t)
+        end_p = self._interp(end_t)
+
+        b, e = self._begin, self._end
+        active_times = self._times[b:e]
+        # waypoints [keep_start, keep_end) satisfy start_t < t < end_t
+        keep_start = b + int(np.searchsorted(active_times, start_t, side='right'))
+        keep_end = max(keep_start, 
+            b + int(np.searchsorted(active_times, end_t, side='left')))
+        if keep_start == 0:
+            self._reserve_front()
+            keep_start += 1
+            keep_end += 1
+        
+        self._begin = keep_start - 1
+        self._end = keep_end
+        self._set_waypoint(self._begin, start_t, start_p)
+        if end_t > start_t:
+            self._reserve_back(1)
+            self._set_waypoint(self._end, end_t, end_p)
+            self._end += 1
+        
+        # only the first and last segment changed
+        if len(self) > 1:
+            self._update_segment(self._begin)
+            self._update_segment(self._end - 2)
+        self._cursor = max(self._begin, min(self._cursor, self._end - 2))
+        return self
+
+    def drive_to_waypoint(self, 
+            pose, time, curr_time,
+            max_pos_speed=np.inf, 
+            max_rot_speed=np.inf
+        ) -> "IncrementalPoseTrajectoryInterpolator":
+        assert(max_pos_speed > 0)
+        assert(max_rot_speed > 0)
+        time = max(time, curr_time)
+        
+        curr_pose = self(curr_time)
+        pos_dist, rot_dist = pose_distance(curr_pose, pose)
+        pos_min_duration = pos_dist / max_pos_speed
+        rot_min_duration = rot_dist / max_rot_speed
+        duration = time - curr_time
+        duration = max(duration, max(pos_min_duration, rot_min_duration))
+        assert duration >= 0
+        last_waypoint_time = curr_time + duration
+
+        # insert new pose
+        self.trim(curr_time, curr_time)
+        self._append(last_waypoint_time, pose)
+        return self
+
+    def schedule_waypoint(self,
+            pose, time, 
+            max_pos_speed=np.inf, 
+            max_rot_speed=np.inf,
+            curr_time=None,
+            last_waypoint_time=None
+        ) -> "IncrementalPoseTrajectoryInterpolator":
+        """
+        In-place version of PoseTrajectoryInterpolator.schedule_waypoint.
+        See there for the derivation of start_time <= end_time <= time.
+        """
+        assert(max_pos_speed > 0)
+        assert(max_rot_speed > 0)
+        if last_waypoint_time is not None:
+            assert curr_time is not None
+
+        start_time = self._times[self._begin]
+        end_time = self._times[self._end - 1]
+
+        if curr_time is not None:
+            if time <= curr_time:
+                # if insert time is earlier than current time
+                # no effect should be done to the interpolator
+                return self
+            start_time = max(curr_time, start_time)
+
+            if last_waypoint_time is not None:
+                if time <= last_waypoint_time:
+                    end_time = curr_time
+                else:
+                    end_time = max(last_waypoint_time, curr_time)
+            else:
+                end_time = curr_time
+
+        end_time = min(end_time, time)
+        start_time = min(start_time, end_time)
+        assert start_time <= end_time
+        assert end_time <= time
+
+        self.trim(start_time, end_time)
+
+        # determine speed
+        duration = time - end_time
+        end_pose = self(end_time)
+        pos_dist, rot_dist = pose_distance(pose, end_pose)
+        pos_min_duration = pos_dist / max_pos_speed
+        rot_min_duration = rot_dist / max_rot_speed
+        duration = max(duration, max(pos_min_duration, rot_min_duration))
+        assert duration >= 0
+        last_waypoint_time = end_time + duration
+
+        # insert new pose
+        self._append(last_waypoint_time, pose)
+        return self
+
+    def __call__(self, 
+            t: Union[numbers.Number, np.ndarray], 
+            out: Optional[np.ndarray]=None) -> np.ndarray:
+        if isinstance(t, numbers.Number):
+            if out is None:
+                out = np.empty((6,), dtype=np.float64)
+            x, y, z, qx, qy, qz, qw = self._interp(t)
+            out[0] = x
+            out[1] = y
+            out[2] = z
+            out[3], out[4], out[5] = _quat_to_rotvec(qx, qy, qz, qw)
+            return out
+
+        t = np.asarray(t, dtype=np.float64)
+        b, e = self._begin, self._end
+        if out is None:
+            out = np.empty((len(t), 6), dtype=np.float64)
+        if e - b == 1:
+            out[:,:3] = self._pos[b]
+            out[:,3:] = st.Rotation.from_quat(self._quat[b]).as_rotvec()
+            return out
+
+        active_times = self._times[b:e]
+        t = np.clip(t, active_times[0], active_times[-1])
+        idxs = np.searchsorted(active_times, t, side='right') - 1
+        idxs = b + np.clip(idxs, 0, e - b - 2)
+        alpha = ((t - self._times[idxs]) * self._inv_dt[idxs])[:,None]
+        out[:,:3] = self._pos[idxs] + alpha * self._dpos[idxs]
+        rot = st.Rotation.from_quat(self._quat[idxs]) \
+            * st.Rotation.from_rotvec(self._omega[idxs] * alpha)
+        out[:,3:] = rot.as_rotvec()
+        return out
@@ -0,0 +1,175 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import concurrent.futures
+import numpy as np
+import cv2
+from umi.common.video_frame_source import VideoFrameSource, load_frame_index
+
+
+def detect_qr_presence(gray_img: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Cheap check for a QR code without decoding it.
+    Returns (4,2) corner points or None.
+    """
+    detector = cv2.QRCodeDetector()
+    found, points = detector.detect(gray_img)
+    if not found or points is None:
+        return None
+    return points.reshape(-1, 2)
+
+
+def decode_qr(img: np.ndarray) -> str:
+    """
+    Full QR detection and decoding, empty string if nothing decoded.
+    Curved decoding handles fisheye distortion, plain decoding is the
+    fallback for flat codes it rejects.
+    """
+    detector = cv2.QRCodeDetector()
+    code, _, _ = detector.detectAndDecodeCurved(img)
+    if len(code) == 0:
+        code, _, _ = detector.detectAndDecode(img)
+    return code
+
+
+def _get_scaled_size(width, height, scale):
+    # even size for swscale
+    return max(int(width * scale) // 2 * 2, 2), max(int(height * scale) // 2 * 2, 2)
+
+
+def get_crop_box(points, width, height, margin=0.5):
+    """
+    Bounding box (x0, y0, x1, y1) of QR corner points, grown by margin
+    times the box size on each side, clipped to the image.
+    """
+    x0, y0 = points.min(axis=0)
+    x1, y1 = points.max(axis=0)
+    mx = (x1 - x0) * margin
+    my = (y1 - y0) * margin
+    return (
+        int(max(x0 - mx, 0)), int(max(y0 - my, 0)),
+        int(min(x1 + mx, width)), int(min(y1 + my, height)))
+
+
+# ========= video ===========
+def _coarse_scan_worker(video_path, start, stop, stride, scale):
+    cv2.setNumThreads(1)
+    hits = list()
+    with VideoFrameSource(video_path, cache_size=1, save_index=False) as source:
+        for frame_idx, frame in source.iter_av_frames(start, stop, stride):
+            # downscale in swscale, straight to gray
+            w, h = _get_scaled_size(frame.width, frame.height, scale)
+            img = frame.reformat(width=w, height=h, format='gray').to_ndarray()
+            points = detect_qr_presence(img)
+            if points is not None:
+                points = points * np.array([frame.width / w, frame.height / h])
+                hits.append((frame_idx, get_crop_box(points, frame.width, frame.height)))
+    return hits
+
+
+def _refine_worker(video_path, windows):
+    cv2.setNumThreads(1)
+    results = list()
+    with VideoFrameSource(video_path, cache_size=1, save_index=False, format='gray') as source:
+        frame_times = source.get_frame_times()
+        for start, stop, (x0, y0, x1, y1) in windows:
+            for frame_idx, img in source.iter_frames(start, stop):
+                # full resolution, only around the coarse detection
+                code = decode_qr(img[y0:y1, x0:x1])
+                if len(code) > 0:
+                    results.append((frame_idx, float(frame_times[frame_idx]), code))
+    return results
+
+
+def scan_video_qr(video_path,
+        stride: int=10,
+        coarse_scale: float=0.25,
+        n_refine: int=3,
+        num_workers: Optional[int]=None
+        ) -> List[Tuple[int, float, str]]:
+    """
+    Sparse QR code search in a video.
+    1. Coarse: every stride-th frame, downscaled by coarse_scale,
+       is checked for QR presence (no decoding).
+    2. Refine: for the first n_refine coarse hits, every frame between
+       the previous coarse sample and the hit is decoded at full resolution
+       within a crop around the coarse QR location, so the first decodable
+       frame of a QR segment is found.
+    Both passes are split over a process pool, workers share the
+    keyframe index sidecar (umi.common.video_frame_source).
+    Returns sorted (frame_idx, frame_time_sec, qr_text) of decoded frames,
+    frame_time_sec is frame.pts * time_base.
+    """
+    if num_workers is None:
+        num_workers = 1
+    video_path = str(video_path)
+    # build the sidecar once before the workers read it
+    n_frames = len(load_frame_index(video_path)['pts'])
+
+    # coarse pass, one contiguous chunk per task
+    n_samples = (n_frames + stride - 1) // stride
+    n_chunks = max(min(num_workers * 4, n_samples), 1)
+    chunk_samples = (n_samples + n_chunks - 1) // n_chunks
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = list()
+        for i in range(0, n_samples, chunk_samples):
+            futures.append(executor.submit(_coarse_scan_worker, video_path,
+                i * stride, min((i + chunk_samples) * stride, n_frames), stride, coarse_scale))
+        hits = sorted(x for f in futures for x in f.result())
+
+        # refine pass
+        windows = [(max(x - stride + 1, 0), x + 1, box) for x, box in hits[:n_refine]]
+        futures = [executor.submit(_refine_worker, video_path, windows[i::num_workers])
+            for i in range(min(num_workers, len(windows)))]
+        results = sorted(x for f in futures for x in f.result())
+    return results
+
+
+# ========= images in memory ===========
+def _detect_images_worker(imgs, scale):
+    cv2.setNumThreads(1)
+    codes = list()
+    for img in imgs:
+        code = ''
+        small_img = img
+        if scale != 1.0:
+            h, w = img.shape[:2]
+            small_img = cv2.resize(img, _get_scaled_size(w, h, scale), interpolation=cv2.INTER_AREA)
+        if detect_qr_presence(small_img) is not None:
+            code = decode_qr(img)
+        codes.append(code)
+    return codes
+
+
+def detect_qr_images(imgs: Sequence[np.ndarray],
+        coarse_scale: float=0.5,
+        num_workers: Optional[int]=None
+        ) -> List[str]:
+    """
+    QR text of each image ('' if none). Images are first checked for
+    QR presence downscaled by coarse_scale, only hits are decoded at
+    full resolution. Chunks of images are processed in a process pool.
+    """
+    if num_workers is None:
+        num_workers = 1
+    n_chunks = max(min(num_workers * 4, len(imgs)), 1)
+    chunk_size = (len(imgs) + n_chunks - 1) // n_chunks
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(_detect_images_worker,
+            [np.asarray(x) for x in imgs[i:i+chunk_size]], coarse_scale)
+            for i in range(0, len(imgs), chunk_size)]
+        return [x for f in futures for x in f.result()]
+
+
+# ========= statistics ===========
+def get_offset_statistics(offsets: Sequence[float]) -> Dict[str, float]:
+    """
+    Confidence statistics of per-code offset estimates.
+    """
+    offsets = np.asarray(offsets, dtype=np.float64)
+    return {
+        'n': int(len(offsets)),
+        'mean': float(np.mean(offsets)),
+        'median': float(np.median(offsets)),
+        'std': float(np.std(offsets)),
+        'min': float(np.min(offsets)),
+        'max': float(np.max(offsets))
+    }
@@ -0,0 +1,165 @@
+from typing import Dict, Optional, Sequence
+import os
+import pathlib
+import sqlite3
+import datetime
+from fractions import Fraction
+import av
+from exiftool import ExifToolHelper
+from umi.common.timecode_util import stream_get_start_datetime
+
+INDEX_FNAME = 'session_index.sqlite'
+
+_COLUMNS = [
+    ('video_path', 'TEXT PRIMARY KEY'),
+    ('camera_serial', 'TEXT'),
+    ('start_datetime', 'TEXT'),
+    ('start_timestamp', 'REAL'),
+    ('n_frames', 'INTEGER'),
+    ('fps', 'TEXT'),
+    ('file_size', 'INTEGER'),
+    ('file_mtime_ns', 'INTEGER')
+]
+
+
+def get_file_stat(video_path) -> Dict[str, int]:
+    stat = os.stat(video_path)
+    return {
+        'file_size': stat.st_size,
+        'file_mtime_ns': stat.st_mtime_ns
+    }
+
+
+def read_video_stream_meta(video_path) -> dict:
+    """
+    Start time, frame count and fps of a video with a single av.open.
+    """
+    with av.open(str(video_path), 'r') as container:
+        stream = container.streams.video[0]
+        start_date = stream_get_start_datetime(stream=stream)
+        return {
+            'start_date': start_date,
+            'start_timestamp': start_date.timestamp(),
+            'n_frames': stream.frames,
+            'fps': stream.average_rate
+        }
+
+
+def read_camera_serials(video_paths: Sequence[str]) -> list:
+    """
+    Camera serial of all videos in one batched exiftool call.
+    """
+    video_paths = [str(x) for x in video_paths]
+    if len(video_paths) == 0:
+        return list()
+    with ExifToolHelper() as et:
+        metas = et.get_tags(video_paths, tags=['QuickTime:CameraSerialNumber'])
+    return [meta['QuickTime:CameraSerialNumber'] for meta in metas]
+
+
+class SessionIndex:
+    """
+    Per session SQLite cache of video metadata:
+    camera serial, start time, frame count and fps of each video,
+    keyed by path relative to the session directory and invalidated
+    by file size and mtime.
+    Written by 00_process_videos.py and read by later stages.
+    """
+    def __init__(self, session_dir):
+        self.session_dir = pathlib.Path(os.path.expanduser(session_dir)).absolute()
+        self.index_path = self.session_dir.joinpath(INDEX_FNAME)
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.index_path))
+        columns = ', '.join(f'{name} {dtype}' for name, dtype in _COLUMNS)
+        conn.execute(f'CREATE TABLE IF NOT EXISTS videos ({columns})')
+        return conn
+
+    def _rel_path(self, video_path) -> str:
+        video_path = pathlib.Path(os.path.expanduser(video_path)).absolute()
+        return str(video_path.relative_to(self.session_dir))
+
+    def exists(self) -> bool:
+        return self.index_path.is_file()
+
+    def put(self, metas: Dict[str, dict]):
+        """
+        metas: video_path -> dict with camera_serial, start_date,
+            start_timestamp, n_frames, fps, file_size, file_mtime_ns
+        """
+        rows = list()
+        for video_path, meta in metas.items():
+            rows.append((
+                self._rel_path(video_path),
+                meta['camera_serial'],
+                meta['start_date'].isoformat(),
+                meta['start_timestamp'],
+                meta['n_frames'],
+                str(Fraction(meta['fps'])),
+                meta['file_size'],
+                meta['file_mtime_ns']
+            ))
+        names = ', '.join(name for name, _ in _COLUMNS)
+        values = ', '.join(['?'] * len(_COLUMNS))
+        with self._connect() as conn:
+            conn.executemany(
+                f'INSERT OR REPLACE INTO videos ({names}) VALUES ({values})', rows)
+        conn.close()
+
+    def load(self, pattern: Optional[str]=None) -> Dict[str, dict]:
+        """
+        Returns all indexed entries (optionally filtered by a glob pattern
+        relative to session_dir) as absolute video_path -> meta.
+        Entries are not checked for staleness.
+        """
+        if not self.exists():
+            return dict()
+        names = [name for name, _ in _COLUMNS]
+        query = f"SELECT {', '.join(names)} FROM videos"
+        args = tuple()
+        if pattern is not None:
+            query += ' WHERE video_path GLOB ?'
+            args = (pattern,)
+        conn = self._connect()
+        rows = conn.execute(query, args).fetchall()
+        conn.close()
+
+        results = dict()
+        for row in rows:
+            meta = dict(zip(names, row))
+            rel_path = meta.pop('video_path')
+            meta['start_date'] = datetime.datetime.fromisoformat(meta.pop('start_datetime'))
+            meta['fps'] = Fraction(meta['fps'])
+            results[str(self.session_dir.joinpath(rel_path))] = meta
+        return results
+
+    def get_video_meta(self, video_paths: Sequence[str]) -> Dict[str, dict]:
+        """
+        Metadata of video_paths. Entries missing from the index or whose
+        file size/mtime changed are re-read (one batched exiftool call
+        for all of them) and written back.
+        """
+        video_paths = [str(pathlib.Path(os.path.expanduser(x)).absolute())
+            for x in video_paths]
+        cached = self.load()
+        results = dict()
+        stale_paths = list()
+        for video_path in video_paths:
+            meta = cached.get(video_path)
+            stat = get_file_stat(video_path)
+            if (meta is not None) and all(meta[k] == v for k, v in stat.items()):
+                results[video_path] = meta
+            else:
+                stale_paths.append(video_path)
+
+        if len(stale_paths) > 0:
+            new_metas = dict()
+            serials = read_camera_serials(stale_paths)
+            for video_path, serial in zip(stale_paths, serials):
+                meta = read_video_stream_meta(video_path)
+                meta['camera_serial'] = serial
+                meta.update(get_file_stat(video_path))
+                new_metas[video_path] = meta
+            self.put(new_metas)
+            results.update(new_metas)
+        return dict((x, results[x]) for x in video_paths)
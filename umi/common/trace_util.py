@@ -0,0 +1,187 @@
+from typing import Dict, Sequence, Tuple, Union
+import time
+import pathlib
+import numpy as np
+from multiprocessing.managers import SharedMemoryManager
+from umi.shared_memory.shared_ndarray import SharedNDArray
+from umi.shared_memory.shared_memory_util import SharedAtomicCounter
+
+
+class SpanTracer:
+    """
+    Lock-free single-writer span recorder in shared memory.
+    Each process (camera, controller, env) owns one SpanTracer and
+    records (span, t_start, t_end) in time.monotonic() seconds,
+    which is comparable across processes.
+    Recording never blocks. Spans are stored in a ring of fixed capacity,
+    older spans are overwritten if not collected in time.
+    """
+    def __init__(self,
+            shm_manager: SharedMemoryManager,
+            name: str,
+            span_names: Sequence[str],
+            capacity: int=1<<16
+        ):
+        spans = SharedNDArray.create_from_shape(
+            mem_mgr=shm_manager,
+            shape=(capacity, 3),
+            dtype=np.float64)
+        counter = SharedAtomicCounter(shm_manager)
+
+        self.name = name
+        self.span_names = list(span_names)
+        self.span_idx = {x: i for i, x in enumerate(self.span_names)}
+        self.capacity = capacity
+        self.spans = spans
+        self.counter = counter
+
+    @property
+    def count(self) -> int:
+        return self.counter.load()
+
+    def record(self, span: Union[str, int], t_start: float, t_end: float):
+        if isinstance(span, str):
+            span = self.span_idx[span]
+        count = self.counter.load()
+        self.spans.get()[count % self.capacity] = (span, t_start, t_end)
+        self.counter.add(1)
+
+    def span(self, span: Union[str, int]) -> "_SpanContext":
+        """
+        with tracer.span('inference'):
+            ...
+        """
+        return _SpanContext(self, span)
+
+    def get_since(self, count: int) -> Tuple[np.ndarray, int, int]:
+        """
+        Returns (spans, new_count, n_lost), spans has shape (N,3) with
+        columns span_idx, t_start, t_end.
+        """
+        new_count = self.count
+        n = new_count - count
+        n_lost = max(0, n - self.capacity)
+        n = min(n, self.capacity)
+        arr = self.spans.get()
+        start = (new_count - n) % self.capacity
+        end = start + n
+        if end <= self.capacity:
+            spans = arr[start:end].copy()
+        else:
+            spans = np.concatenate([arr[start:], arr[:end - self.capacity]])
+        return spans, new_count, n_lost
+
+
+class _SpanContext:
+    def __init__(self, tracer: SpanTracer, span: Union[str, int]):
+        self.tracer = tracer
+        self.span = span
+        self.t_start = None
+
+    def __enter__(self):
+        self.t_start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.tracer.record(self.span, self.t_start, time.monotonic())
+
+
+class TraceCollector:
+    """
+    Collects spans of multiple SpanTracers between mark() and collect().
+    Typically mark() at start_episode and dump() at end_episode.
+    """
+    def __init__(self, tracers: Sequence[SpanTracer]):
+        self.tracers = list(tracers)
+        self.counts = [0] * len(self.tracers)
+
+    def mark(self):
+        self.counts = [x.count for x in self.tracers]
+
+    def collect(self) -> Dict[str, np.ndarray]:
+        """
+        Columnar trace:
+        tracer_idx: (N,) uint8
+        span_idx: (N,) uint16
+        t_start: (N,) float64, time.monotonic seconds
+        duration: (N,) float32 seconds
+        tracer_names, span_names: (M,) str, span_names are 'tracer/span'
+        span_offsets: (len(tracers)+1,) int, spans of tracer i are
+            span_names[span_offsets[i]:span_offsets[i+1]]
+        n_lost: (len(tracers),) number of overwritten spans
+        """
+        tracer_idxs = list()
+        all_spans = list()
+        n_lost = list()
+        for i, tracer in enumerate(self.tracers):
+            spans, self.counts[i], lost = tracer.get_since(self.counts[i])
+            tracer_idxs.append(np.full(len(spans), i, dtype=np.uint8))
+            all_spans.append(spans)
+            n_lost.append(lost)
+        spans = np.concatenate(all_spans) if len(all_spans) > 0 \
+            else np.zeros((0,3))
+        span_offsets = np.cumsum(
+            [0] + [len(x.span_names) for x in self.tracers])
+        trace = {
+            'tracer_idx': np.concatenate(tracer_idxs).astype(np.uint8),
+            'span_idx': spans[:,0].astype(np.uint16),
+            't_start': spans[:,1],
+            'duration': (spans[:,2] - spans[:,1]).astype(np.float32),
+            'tracer_names': np.array([x.name for x in self.tracers]),
+            'span_names': np.array([f'{x.name}/{y}'
+                for x in self.tracers for y in x.span_names]),
+            'span_offsets': span_offsets,
+            'n_lost': np.array(n_lost)
+        }
+        return trace
+
+    def dump(self, path: Union[str, pathlib.Path]) -> Dict[str, Dict[str, float]]:
+        """
+        Write the spans since last mark() as a compressed npz trace
+        and return its summary.
+        """
+        trace = self.collect()
+        np.savez_compressed(str(path), **trace)
+        return summarize_trace(trace)
+
+
+def load_trace(path: Union[str, pathlib.Path]) -> Dict[str, np.ndarray]:
+    with np.load(str(path)) as f:
+        return dict(f)
+
+
+def summarize_trace(
+        trace: Dict[str, np.ndarray],
+        percentiles: Sequence[float]=(50, 90, 99)
+    ) -> Dict[str, Dict[str, float]]:
+    """
+    Per span duration statistics in milliseconds.
+    """
+    global_span_idx = trace['span_offsets'][trace['tracer_idx']] \
+        + trace['span_idx']
+    result = dict()
+    for i, name in enumerate(trace['span_names']):
+        durations = trace['duration'][global_span_idx == i] * 1000
+        if len(durations) == 0:
+            continue
+        stats = {
+            'count': len(durations),
+            'mean': float(np.mean(durations))
+        }
+        for p, v in zip(percentiles, np.percentile(durations, percentiles)):
+            stats[f'p{p:g}'] = float(v)
+        stats['max'] = float(np.max(durations))
+        result[str(name)] = stats
+    return result
+
+
+def print_trace_summary(summary: Dict[str, Dict[str, float]]):
+    if len(summary) == 0:
+        return
+    keys = list(next(iter(summary.values())).keys())
+    width = max(len(x) for x in summary.keys())
+    print(' ' * width + ''.join(f'{x:>10s}' for x in keys) + '  (ms)')
+    for name, stats in summary.items():
+        row = f'{name:<{width}s}' + f"{stats['count']:>10d}"
+        row += ''.join(f'{stats[x]:>10.3f}' for x in keys[1:])
+        print(row)
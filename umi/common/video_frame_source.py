@@ -0,0 +1,254 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+import os
+import pathlib
+import collections
+import numpy as np
+import av
+
+
+def get_frame_index_path(video_path) -> pathlib.Path:
+    """
+    raw_video.mp4 -> raw_video.frame_index.npz
+    """
+    video_path = pathlib.Path(video_path)
+    return video_path.with_name(video_path.stem + '.frame_index.npz')
+
+
+def build_frame_index(video_path) -> Dict[str, np.ndarray]:
+    """
+    Demux (without decoding) the first video stream and collect
+    pts, dts, byte offset, size and keyframe flag of every packet,
+    in decode order.
+    """
+    pts = list()
+    dts = list()
+    pos = list()
+    size = list()
+    is_keyframe = list()
+    with av.open(str(video_path), 'r') as container:
+        stream = container.streams.video[0]
+        for packet in container.demux(stream):
+            if packet.pts is None or packet.size == 0:
+                # flush packet
+                continue
+            pts.append(packet.pts)
+            dts.append(packet.pts if packet.dts is None else packet.dts)
+            pos.append(-1 if packet.pos is None else packet.pos)
+            size.append(packet.size)
+            is_keyframe.append(packet.is_keyframe)
+    stat = os.stat(video_path)
+    return {
+        'pts': np.array(pts, dtype=np.int64),
+        'dts': np.array(dts, dtype=np.int64),
+        'pos': np.array(pos, dtype=np.int64),
+        'size': np.array(size, dtype=np.int64),
+        'is_keyframe': np.array(is_keyframe, dtype=np.bool_),
+        'file_size': np.array(stat.st_size, dtype=np.int64),
+        'file_mtime_ns': np.array(stat.st_mtime_ns, dtype=np.int64)
+    }
+
+
+def load_frame_index(video_path, index_path=None, save=True) -> Dict[str, np.ndarray]:
+    """
+    Load the sidecar index of video_path, rebuilding it if missing or
+    if the video's size/mtime changed. The rebuilt index is written
+    next to the video when save is True.
+    """
+    if index_path is None:
+        index_path = get_frame_index_path(video_path)
+    index_path = pathlib.Path(index_path)
+    stat = os.stat(video_path)
+    if index_path.is_file():
+        with np.load(index_path) as data:
+            index = dict(data.items())
+        if (int(index['file_size']) == stat.st_size) \
+                and (int(index['file_mtime_ns']) == stat.st_mtime_ns):
+            return index
+
+    index = build_frame_index(video_path)
+    if save:
+        tmp_path = index_path.with_name(index_path.name + '.tmp.npz')
+        np.savez(tmp_path, **index)
+        os.replace(tmp_path, index_path)
+    return index
+
+
+class VideoFrameSource:
+    """
+    Random access to frames of a video through a packet/keyframe index.
+    Frame i is the i-th frame in presentation order, same as
+    enumerate(container.decode(stream)).
+    Reads seek to the keyframe starting the GOP of the requested frame.
+    With cache_size > 0, decoded GOPs are kept in an LRU cache
+    (as av.VideoFrame, converted on read) so that overlapping or
+    random access requests do not decode a GOP twice.
+    With cache_size=0, forward reads yield frames as they are decoded
+    and never hold more than one decoded frame, use this for
+    sequential slices of high resolution videos.
+    """
+    def __init__(self,
+            video_path,
+            cache_size: int=2,
+            format: str='rgb24',
+            thread_type: Optional[str]=None,
+            thread_count: int=1,
+            index_path=None,
+            save_index: bool=True
+        ):
+        self.video_path = str(video_path)
+        self.cache_size = cache_size
+        self.format = format
+        index = load_frame_index(video_path, index_path=index_path, save=save_index)
+        self.index = index
+
+        # presentation order
+        self.frame_pts = np.sort(index['pts'])
+        keyframe_pts = np.sort(index['pts'][index['is_keyframe']])
+        if len(keyframe_pts) == 0 or keyframe_pts[0] > self.frame_pts[0]:
+            # frames before the first keyframe belong to the first GOP
+            keyframe_pts = np.concatenate([self.frame_pts[:1], keyframe_pts])
+        self.keyframe_pts = keyframe_pts
+        self.gop_frame_start = np.searchsorted(self.frame_pts, keyframe_pts, side='left')
+        self.gop_frame_end = np.append(self.gop_frame_start[1:], len(self.frame_pts))
+
+        self.container = av.open(self.video_path, 'r')
+        self.stream = self.container.streams.video[0]
+        if thread_type is not None:
+            self.stream.thread_type = thread_type
+        self.stream.thread_count = thread_count
+        self.time_base = self.stream.time_base
+        self.fps = self.stream.average_rate
+        self.gop_cache = collections.OrderedDict()
+
+    # ========= context manager ===========
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.gop_cache.clear()
+        self.container.close()
+
+    # ========= properties ===========
+    def __len__(self):
+        return len(self.frame_pts)
+
+    @property
+    def n_gops(self):
+        return len(self.keyframe_pts)
+
+    def get_frame_times(self) -> np.ndarray:
+        """
+        Presentation time of every frame in seconds.
+        """
+        return self.frame_pts * float(self.time_base)
+
+    def get_gop_idx(self, frame_idx):
+        return np.searchsorted(self.gop_frame_start, frame_idx, side='right') - 1
+
+    # ========= decoding ===========
+    def _decode_from(self, gop_idx: int, target_pts: np.ndarray) -> Dict[int, av.VideoFrame]:
+        self.container.seek(int(self.keyframe_pts[gop_idx]),
+            stream=self.stream, backward=True, any_frame=False)
+        target_set = set(target_pts.tolist())
+        max_pts = target_pts[-1]
+        frames = dict()
+        for frame in self.container.decode(self.stream):
+            if frame.pts in target_set:
+                frames[frame.pts] = frame
+                if len(frames) == len(target_set):
+                    break
+            elif frame.pts is not None and frame.pts > max_pts:
+                break
+        return frames
+
+    def _get_gop(self, gop_idx: int) -> List[av.VideoFrame]:
+        if gop_idx in self.gop_cache:
+            self.gop_cache.move_to_end(gop_idx)
+            return self.gop_cache[gop_idx]
+
+        target_pts = self.frame_pts[self.gop_frame_start[gop_idx]:self.gop_frame_end[gop_idx]]
+        frames = self._decode_from(gop_idx, target_pts)
+        if len(frames) < len(target_pts) and gop_idx > 0:
+            # open GOP, leading frames reference the previous GOP
+            frames = self._decode_from(gop_idx - 1, target_pts)
+        if len(frames) < len(target_pts):
+            raise RuntimeError(f'Failed to decode {len(target_pts) - len(frames)} frames '
+                f'of GOP {gop_idx} in {self.video_path}')
+        gop = [frames[x] for x in target_pts.tolist()]
+
+        if self.cache_size > 0:
+            self.gop_cache[gop_idx] = gop
+            while len(self.gop_cache) > self.cache_size:
+                self.gop_cache.popitem(last=False)
+        return gop
+
+    def _iter_stream(self, frame_idxs: range) -> Iterator[Tuple[int, av.VideoFrame]]:
+        """
+        Decode forward from the keyframe of the first requested frame,
+        yielding requested frames as they are decoded.
+        Seeks again if whole GOPs can be skipped.
+        """
+        target_pts = self.frame_pts[frame_idxs]
+        i = 0
+        while i < len(frame_idxs):
+            gop_idx = self.get_gop_idx(frame_idxs[i])
+            start_i = i
+            # open GOP, leading frames reference the previous GOP
+            for seek_gop_idx in (gop_idx, gop_idx - 1):
+                if seek_gop_idx < 0:
+                    break
+                self.container.seek(int(self.keyframe_pts[seek_gop_idx]),
+                    stream=self.stream, backward=True, any_frame=False)
+                is_missed = True
+                for frame in self.container.decode(self.stream):
+                    if frame.pts is None or frame.pts < target_pts[i]:
+                        continue
+                    if frame.pts > target_pts[i]:
+                        break
+                    yield frame_idxs[i], frame
+                    i += 1
+                    if (i == len(frame_idxs)) or (self.get_gop_idx(frame_idxs[i]) 
+                            > self.get_gop_idx(frame_idxs[i-1]) + 1):
+                        is_missed = False
+                        break
+                if (not is_missed) or (i > start_i):
+                    break
+            if i == start_i:
+                raise RuntimeError(f'Failed to decode frame {frame_idxs[i]} '
+                    f'of GOP {gop_idx} in {self.video_path}')
+
+    def iter_av_frames(self, start: int=0, stop: Optional[int]=None, step: int=1
+            ) -> Iterator[Tuple[int, av.VideoFrame]]:
+        """
+        Yields (frame_idx, av.VideoFrame) for frames in range(start, stop, step),
+        decoding only GOPs that contain a requested frame.
+        Frames can be reformatted (e.g. downscaled) before conversion.
+        """
+        frame_idxs = range(*slice(start, stop, step).indices(len(self)))
+        if (self.cache_size == 0) and (frame_idxs.step > 0):
+            yield from self._iter_stream(frame_idxs)
+            return
+        for frame_idx in frame_idxs:
+            gop_idx = self.get_gop_idx(frame_idx)
+            gop = self._get_gop(gop_idx)
+            yield frame_idx, gop[frame_idx - self.gop_frame_start[gop_idx]]
+
+    def iter_frames(self, start: int=0, stop: Optional[int]=None, step: int=1
+            ) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Yields (frame_idx, img) for frames in range(start, stop, step).
+        """
+        for frame_idx, frame in self.iter_av_frames(start, stop, step):
+            yield frame_idx, frame.to_ndarray(format=self.format)
+
+    def read_frames(self, start: int=0, stop: Optional[int]=None, step: int=1
+            ) -> List[np.ndarray]:
+        return [img for _, img in self.iter_frames(start, stop, step)]
+
+    def read_frame(self, frame_idx: int) -> np.ndarray:
+        if frame_idx < 0:
+            frame_idx += len(self)
+        return self.read_frames(frame_idx, frame_idx + 1)[0]
@@ -20,10 +20,17 @@ from diffusion_policy.common.cv2_util import (
     get_image_transform, optimal_row_cols)
 from umi.common.usb_util import reset_all_elgato_devices, get_sorted_v4l_paths
 from umi.common.pose_util import pose_to_pos_rot
-from umi.common.interpolation_util import get_interp1d, PoseInterpolator
+from umi.common.interpolation_util import (
+    get_nearest_idxs, interp1d_linear, interp_pose)
+from umi.common.trace_util import SpanTracer, TraceCollector, print_trace_summary
+from umi.real_world.uvc_camera import UvcCamera
 
 
 class BimanualUmiEnv:
+    # spans recorded by self.tracer, policy spans are recorded by the eval script
+    TRACE_SPANS = ('get_obs_fetch', 'get_obs_align', 'exec_actions', 
+        'policy_preprocess', 'policy_inference')
+
     def __init__(self, 
             # required params
             output_dir,
@@ -57,6 +64,8 @@ class BimanualUmiEnv:
             # vis params
             enable_multi_cam_vis=True,
             multi_cam_vis_resolution=(960, 960),
+            # latency tracing, dumped to output_dir/traces per episode
+            enable_tracing=False,
             # shared memory
             shm_manager=None
             ):
@@ -83,6 +92,26 @@ class BimanualUmiEnv:
             paths = [v4l_paths[i] for i in camera_reorder]
             v4l_paths = paths
 
+        # tracers, one per process
+        tracer = None
+        camera_tracers = None
+        robot_tracers = [None] * len(robots_config)
+        gripper_tracers = [None] * len(grippers_config)
+        trace_collector = None
+        trace_dir = None
+        if enable_tracing:
+            tracer = SpanTracer(shm_manager, 'env', self.TRACE_SPANS)
+            camera_tracers = [SpanTracer(shm_manager, f'camera{i}', UvcCamera.TRACE_SPANS)
+                for i in range(len(v4l_paths))]
+            robot_tracers = [SpanTracer(shm_manager, f'robot{i}', 
+                RTDEInterpolationController.TRACE_SPANS) for i in range(len(robots_config))]
+            gripper_tracers = [SpanTracer(shm_manager, f'gripper{i}', WSGController.TRACE_SPANS)
+                for i in range(len(grippers_config))]
+            trace_collector = TraceCollector(
+                [tracer] + camera_tracers + robot_tracers + gripper_tracers)
+            trace_dir = output_dir.joinpath('traces')
+            trace_dir.mkdir(parents=True, exist_ok=True)
+
         # compute resolution for vis
         rw, rh, col, row = optimal_row_cols(
             n_cameras=len(v4l_paths),
@@ -188,6 +217,7 @@ class BimanualUmiEnv:
             transform=transform,
             vis_transform=vis_transform,
             video_recorder=video_recorder,
+            tracer=camera_tracers,
             verbose=False
         )
 
@@ -208,7 +238,7 @@ class BimanualUmiEnv:
         assert len(robots_config) == len(grippers_config)
         robots: List[RTDEInterpolationController] = list()
         grippers: List[WSGController] = list()
-        for rc in robots_config:
+        for rc, robot_tracer in zip(robots_config, robot_tracers):
             if rc['robot_type'].startswith('ur5'):
                 assert rc['robot_type'] in ['ur5', 'ur5e']
                 this_robot = RTDEInterpolationController(
@@ -228,7 +258,8 @@ class BimanualUmiEnv:
                     soft_real_time=False,
                     verbose=False,
                     receive_keys=None,
-                    receive_latency=rc['robot_obs_latency']
+                    receive_latency=rc['robot_obs_latency'],
+                    tracer=robot_tracer
                 )
             elif rc['robot_type'].startswith('franka'):
                 this_robot = FrankaInterpolationController(
@@ -238,19 +269,21 @@ class BimanualUmiEnv:
                     Kx_scale=1.0,
                     Kxd_scale=np.array([2.0,1.5,2.0,1.0,1.0,1.0]),
                     verbose=False,
-                    receive_latency=rc['robot_obs_latency']
+                    receive_latency=rc['robot_obs_latency'],
+                    tracer=robot_tracer
                 )
             else:
                 raise NotImplementedError()
             robots.append(this_robot)
 
-        for gc in grippers_config:
+        for gc, gripper_tracer in zip(grippers_config, gripper_tracers):
             this_gripper = WSGController(
                 shm_manager=shm_manager,
                 hostname=gc['gripper_ip'],
                 port=gc['gripper_port'],
                 receive_latency=gc['gripper_obs_latency'],
-                use_meters=True
+                use_meters=True,
+                tracer=gripper_tracer
             )
 
             grippers.append(this_gripper)
@@ -279,6 +312,11 @@ class BimanualUmiEnv:
         self.output_dir = output_dir
         self.video_dir = video_dir
         self.replay_buffer = replay_buffer
+        # tracing
+        self.tracer = tracer
+        self.trace_collector = trace_collector
+        self.trace_dir = trace_dir
+        self.trace_episode_id = None
         # temp memory buffers
         self.last_camera_data = None
         # recording buffers
@@ -359,6 +397,7 @@ class BimanualUmiEnv:
 
         "observation dict"
         assert self.is_ready
+        t_fetch_start = time.monotonic()
 
         # get data
         # 60 Hz, camera_calibrated_timestamp
@@ -380,6 +419,8 @@ class BimanualUmiEnv:
         for gripper in self.grippers:
             last_grippers_data.append(gripper.get_all_state())
 
+        t_align_start = time.monotonic()
+
         # select align_camera_idx
         num_obs_cameras = len(self.robots)
         align_camera_idx = None
@@ -410,12 +451,7 @@ class BimanualUmiEnv:
         camera_obs = dict()
         for camera_idx, value in self.last_camera_data.items():
             this_timestamps = value['timestamp']
-            this_idxs = list()
-            for t in camera_obs_timestamps:
-                nn_idx = np.argmin(np.abs(this_timestamps - t))
-                # if np.abs(this_timestamps - t)[nn_idx] > 1.0 / 120 and camera_idx != 3:
-                #     print('ERROR!!!  ', camera_idx, len(this_timestamps), nn_idx, (this_timestamps - t)[nn_idx-1: nn_idx+2])
-                this_idxs.append(nn_idx)
+            this_idxs = get_nearest_idxs(this_timestamps, camera_obs_timestamps)
             # remap key
             camera_obs[f'camera{camera_idx}_rgb'] = value['color'][this_idxs]
 
@@ -429,10 +465,10 @@ class BimanualUmiEnv:
         robot_obs_timestamps = last_timestamp - (
             np.arange(self.robot_obs_horizon)[::-1] * self.robot_down_sample_steps * dt)
         for robot_idx, last_robot_data in enumerate(last_robots_data):
-            robot_pose_interpolator = PoseInterpolator(
+            robot_pose = interp_pose(
                 t=last_robot_data['robot_timestamp'], 
-                x=last_robot_data['ActualTCPPose'])
-            robot_pose = robot_pose_interpolator(robot_obs_timestamps)
+                x=last_robot_data['ActualTCPPose'],
+                query_t=robot_obs_timestamps)
             robot_obs = {
                 f'robot{robot_idx}_eef_pos': robot_pose[...,:3],
                 f'robot{robot_idx}_eef_rot_axis_angle': robot_pose[...,3:]
@@ -445,12 +481,12 @@ class BimanualUmiEnv:
             np.arange(self.gripper_obs_horizon)[::-1] * self.gripper_down_sample_steps * dt)
         for robot_idx, last_gripper_data in enumerate(last_grippers_data):
             # align gripper obs
-            gripper_interpolator = get_interp1d(
+            gripper_width = interp1d_linear(
                 t=last_gripper_data['gripper_timestamp'],
-                x=last_gripper_data['gripper_position'][...,None]
-            )
+                x=last_gripper_data['gripper_position'][...,None],
+                query_t=gripper_obs_timestamps)
             gripper_obs = {
-                f'robot{robot_idx}_gripper_width': gripper_interpolator(gripper_obs_timestamps)
+                f'robot{robot_idx}_gripper_width': gripper_width
             }
 
             # update obs_data
@@ -476,6 +512,9 @@ class BimanualUmiEnv:
                     timestamps=last_gripper_data['gripper_timestamp']
                 )
 
+        if self.tracer is not None:
+            self.tracer.record(0, t_fetch_start, t_align_start)
+            self.tracer.record(1, t_align_start, time.monotonic())
         return obs_data
     
     def exec_actions(self, 
@@ -483,6 +522,7 @@ class BimanualUmiEnv:
             timestamps: np.ndarray,
             compensate_latency=False):
         assert self.is_ready
+        t_exec_start = time.monotonic()
         if not isinstance(actions, np.ndarray):
             actions = np.array(actions)
         if not isinstance(timestamps, np.ndarray):
@@ -519,6 +559,9 @@ class BimanualUmiEnv:
                 new_actions,
                 new_timestamps
             )
+
+        if self.tracer is not None:
+            self.tracer.record(2, t_exec_start, time.monotonic())
     
     def get_robot_state(self):
         return [robot.get_state() for robot in self.robots]
@@ -545,6 +588,10 @@ class BimanualUmiEnv:
             video_paths.append(
                 str(this_video_dir.joinpath(f'{i}.mp4').absolute()))
         
+        if self.trace_collector is not None:
+            self.trace_collector.mark()
+            self.trace_episode_id = episode_id
+
         # start recording on camera
         self.camera.restart_put(start_time=start_time)
         self.camera.start_recording(video_path=video_paths, start_time=start_time)
@@ -563,6 +610,10 @@ class BimanualUmiEnv:
         
         # stop video recorder
         self.camera.stop_recording()
+        for i, metrics in enumerate(self.camera.get_recorder_metrics()):
+            if metrics['n_frames_dropped'] > 0:
+                print(f"[{type(self).__name__}] Camera {i} dropped {int(metrics['n_frames_dropped'])} "
+                    f"of {int(metrics['n_frames_received'])} frames while recording.")
 
         # TODO
         if self.obs_accumulator is not None:
@@ -590,29 +641,29 @@ class BimanualUmiEnv:
                     'action': actions[:n_steps],
                 }
                 for robot_idx in range(len(self.robots)):
-                    robot_pose_interpolator = PoseInterpolator(
+                    robot_pose = interp_pose(
                         t=np.array(self.obs_accumulator.timestamps[f'robot{robot_idx}_eef_pose']),
-                        x=np.array(self.obs_accumulator.data[f'robot{robot_idx}_eef_pose'])
+                        x=np.array(self.obs_accumulator.data[f'robot{robot_idx}_eef_pose']),
+                        query_t=timestamps
                     )
-                    robot_pose = robot_pose_interpolator(timestamps)
                     episode[f'robot{robot_idx}_eef_pos'] = robot_pose[:,:3]
                     episode[f'robot{robot_idx}_eef_rot_axis_angle'] = robot_pose[:,3:]
-                    joint_pos_interpolator = get_interp1d(
-                        np.array(self.obs_accumulator.timestamps[f'robot{robot_idx}_joint_pos']),
-                        np.array(self.obs_accumulator.data[f'robot{robot_idx}_joint_pos'])
+                    episode[f'robot{robot_idx}_joint_pos'] = interp1d_linear(
+                        t=np.array(self.obs_accumulator.timestamps[f'robot{robot_idx}_joint_pos']),
+                        x=np.array(self.obs_accumulator.data[f'robot{robot_idx}_joint_pos']),
+                        query_t=timestamps
                     )
-                    joint_vel_interpolator = get_interp1d(
-                        np.array(self.obs_accumulator.timestamps[f'robot{robot_idx}_joint_vel']),
-                        np.array(self.obs_accumulator.data[f'robot{robot_idx}_joint_vel'])
+                    episode[f'robot{robot_idx}_joint_vel'] = interp1d_linear(
+                        t=np.array(self.obs_accumulator.timestamps[f'robot{robot_idx}_joint_vel']),
+                        x=np.array(self.obs_accumulator.data[f'robot{robot_idx}_joint_vel']),
+                        query_t=timestamps
                     )
-                    episode[f'robot{robot_idx}_joint_pos'] = joint_pos_interpolator(timestamps)
-                    episode[f'robot{robot_idx}_joint_vel'] = joint_vel_interpolator(timestamps)
 
-                    gripper_interpolator = get_interp1d(
+                    episode[f'robot{robot_idx}_gripper_width'] = interp1d_linear(
                         t=np.array(self.obs_accumulator.timestamps[f'robot{robot_idx}_gripper_width']),
-                        x=np.array(self.obs_accumulator.data[f'robot{robot_idx}_gripper_width'])
+                        x=np.array(self.obs_accumulator.data[f'robot{robot_idx}_gripper_width']),
+                        query_t=timestamps
                     )
-                    episode[f'robot{robot_idx}_gripper_width'] = gripper_interpolator(timestamps)
 
                 self.replay_buffer.add_episode(episode, compressors='disk')
                 episode_id = self.replay_buffer.n_episodes - 1
@@ -621,6 +672,12 @@ class BimanualUmiEnv:
             self.obs_accumulator = None
             self.action_accumulator = None
 
+            if self.trace_collector is not None:
+                trace_path = self.trace_dir.joinpath(f'{self.trace_episode_id}.npz')
+                summary = self.trace_collector.dump(trace_path)
+                print(f'Episode {self.trace_episode_id} latency trace saved to {trace_path}')
+                print_trace_summary(summary)
+
     def drop_episode(self):
         self.end_episode()
         self.replay_buffer.drop_episode()
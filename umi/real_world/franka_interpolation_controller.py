@@ -10,7 +10,7 @@ import numpy as np
 from umi.shared_memory.shared_memory_queue import (
     SharedMemoryQueue, Empty)
 from umi.shared_memory.shared_memory_ring_buffer import SharedMemoryRingBuffer
-from umi.common.pose_trajectory_interpolator import PoseTrajectoryInterpolator
+from umi.common.pose_trajectory_interpolator import IncrementalPoseTrajectoryInterpolator
 from diffusion_policy.common.precise_sleep import precise_wait
 import torch
 from umi.common.pose_util import pose_to_mat, mat_to_pose
@@ -73,6 +73,9 @@ class FrankaInterpolationController(mp.Process):
     To ensure sending command to the robot with predictable latency
     this controller need its separate process (due to python GIL)
     """
+    # spans recorded by tracer, see umi.common.trace_util
+    TRACE_SPANS = ('work', 'period')
+
     def __init__(self,
         shm_manager: SharedMemoryManager, 
         robot_ip,
@@ -86,7 +89,8 @@ class FrankaInterpolationController(mp.Process):
         soft_real_time=False,
         verbose=False,
         get_max_k=None,
-        receive_latency=0.0
+        receive_latency=0.0,
+        tracer=None
         ):
         """
         robot_ip: the ip of the middle-layer controller (NUC)
@@ -113,6 +117,7 @@ class FrankaInterpolationController(mp.Process):
         self.soft_real_time = soft_real_time
         self.receive_latency = receive_latency
         self.verbose = verbose
+        self.tracer = tracer
 
         if get_max_k is None:
             get_max_k = int(frequency * 5)
@@ -260,7 +265,7 @@ class FrankaInterpolationController(mp.Process):
             # use monotonic time to make sure the control loop never go backward
             curr_t = time.monotonic()
             last_waypoint_time = curr_t
-            pose_interp = PoseTrajectoryInterpolator(
+            pose_interp = IncrementalPoseTrajectoryInterpolator(
                 times=[curr_t],
                 poses=[curr_pose]
             )
@@ -271,16 +276,19 @@ class FrankaInterpolationController(mp.Process):
                 Kxd=self.Kxd
             )
 
+            # reused output buffer, avoids allocation in the control loop
+            tip_pose = np.zeros((6,))
             t_start = time.monotonic()
             iter_idx = 0
             keep_running = True
+            t_prev = None
             while keep_running:
                 # send command to robot
                 t_now = time.monotonic()
                 # diff = t_now - pose_interp.times[-1]
                 # if diff > 0:
                 #     print('extrapolate', diff)
-                tip_pose = pose_interp(t_now)
+                tip_pose = pose_interp(t_now, out=tip_pose)
                 flange_pose = mat_to_pose(pose_to_mat(tip_pose) @ tx_tip_flange)
 
                 # send command to robot
@@ -353,6 +361,12 @@ class FrankaInterpolationController(mp.Process):
                         keep_running = False
                         break
 
+                if self.tracer is not None:
+                    self.tracer.record(0, t_now, time.monotonic())
+                    if t_prev is not None:
+                        self.tracer.record(1, t_prev, t_now)
+                t_prev = t_now
+
                 # regulate frequency
                 t_wait_util = t_start + (iter_idx + 1) * dt
                 precise_wait(t_wait_util, time_func=time.monotonic)
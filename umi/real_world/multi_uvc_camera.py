@@ -7,6 +7,7 @@ from multiprocessing.managers import SharedMemoryManager
 import numpy as np
 from umi.real_world.uvc_camera import UvcCamera
 from umi.real_world.video_recorder import VideoRecorder
+from umi.common.trace_util import SpanTracer
 
 class MultiUvcCamera:
     def __init__(self,
@@ -26,6 +27,7 @@ class MultiUvcCamera:
             vis_transform: Optional[Union[Callable[[Dict], Dict], List[Callable]]]=None,
             recording_transform: Optional[Union[Callable[[Dict], Dict], List[Callable]]]=None,
             video_recorder: Optional[Union[VideoRecorder, List[VideoRecorder]]]=None,
+            tracer: Optional[List[SpanTracer]]=None,
             verbose=False
         ):
         super().__init__()
@@ -49,6 +51,10 @@ class MultiUvcCamera:
             recording_transform, n_cameras, Callable)
         video_recorder = repeat_to_list(
             video_recorder, n_cameras, VideoRecorder)
+        # tracers are single-writer, one per camera, never copied
+        if tracer is None:
+            tracer = [None] * n_cameras
+        assert len(tracer) == n_cameras
         
         cameras = dict()
         for i, path in enumerate(dev_video_paths):
@@ -66,6 +72,7 @@ class MultiUvcCamera:
                 vis_transform=vis_transform[i],
                 recording_transform=recording_transform[i],
                 video_recorder=video_recorder[i],
+                tracer=tracer[i],
                 verbose=verbose
             )
 
@@ -155,6 +162,9 @@ class MultiUvcCamera:
                 out[key] = np.stack([x[key] for x in results])
         return out
 
+    def get_recorder_metrics(self) -> List[Dict[str, float]]:
+        return [camera.get_recorder_metrics() for camera in self.cameras.values()]
+
     def start_recording(self, video_path: Union[str, List[str]], start_time: float):
         if isinstance(video_path, str):
             # directory
@@ -11,7 +11,7 @@ from rtde_receive import RTDEReceiveInterface
 from umi.shared_memory.shared_memory_queue import (
     SharedMemoryQueue, Empty)
 from umi.shared_memory.shared_memory_ring_buffer import SharedMemoryRingBuffer
-from umi.common.pose_trajectory_interpolator import PoseTrajectoryInterpolator
+from umi.common.pose_trajectory_interpolator import IncrementalPoseTrajectoryInterpolator
 from diffusion_policy.common.precise_sleep import precise_wait
 
 class Command(enum.Enum):
@@ -25,6 +25,8 @@ class RTDEInterpolationController(mp.Process):
     To ensure sending command to the robot with predictable latency
     this controller need its separate process (due to python GIL)
     """
+    # spans recorded by tracer, see umi.common.trace_util
+    TRACE_SPANS = ('work', 'period')
 
 
     def __init__(self,
@@ -45,7 +47,8 @@ class RTDEInterpolationController(mp.Process):
             verbose=False,
             receive_keys=None,
             get_max_k=None,
-            receive_latency=0.0
+            receive_latency=0.0,
+            tracer=None
             ):
         """
         frequency: CB2=125, UR3e=500
@@ -95,6 +98,7 @@ class RTDEInterpolationController(mp.Process):
         self.soft_real_time = soft_real_time
         self.receive_latency = receive_latency
         self.verbose = verbose
+        self.tracer = tracer
 
         if get_max_k is None:
             get_max_k = int(frequency * 5)
@@ -252,14 +256,17 @@ class RTDEInterpolationController(mp.Process):
             # use monotonic time to make sure the control loop never go backward
             curr_t = time.monotonic()
             last_waypoint_time = curr_t
-            pose_interp = PoseTrajectoryInterpolator(
+            pose_interp = IncrementalPoseTrajectoryInterpolator(
                 times=[curr_t],
                 poses=[curr_pose]
             )
             
+            # reused output buffer, avoids allocation in the control loop
+            pose_command = np.zeros((6,))
             t_start = time.monotonic()
             iter_idx = 0
             keep_running = True
+            t_prev = None
             while keep_running:
                 # start control iteration
                 # t_start = rtde_c.initPeriod()
@@ -269,7 +276,7 @@ class RTDEInterpolationController(mp.Process):
                 # diff = t_now - pose_interp.times[-1]
                 # if diff > 0:
                 #     print('extrapolate', diff)
-                pose_command = pose_interp(t_now)
+                pose_command = pose_interp(t_now, out=pose_command)
                 vel = 0.5
                 acc = 0.5
                 assert rtde_c.servoL(pose_command, 
@@ -347,6 +354,12 @@ class RTDEInterpolationController(mp.Process):
                         keep_running = False
                         break
 
+                if self.tracer is not None:
+                    self.tracer.record(0, t_now, time.monotonic())
+                    if t_prev is not None:
+                        self.tracer.record(1, t_prev, t_now)
+                t_prev = t_now
+
                 # regulate frequency
                 # rtde_c.waitPeriod(t_start)
                 t_wait_util = t_start + (iter_idx + 1) * dt
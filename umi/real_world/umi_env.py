@@ -24,10 +24,17 @@ from diffusion_policy.common.cv2_util import (
     get_image_transform, optimal_row_cols)
 from umi.common.usb_util import reset_all_elgato_devices, get_sorted_v4l_paths
 from umi.common.pose_util import pose_to_pos_rot
-from umi.common.interpolation_util import get_interp1d, PoseInterpolator
+from umi.common.interpolation_util import (
+    get_nearest_idxs, interp1d_linear, interp_pose)
+from umi.common.trace_util import SpanTracer, TraceCollector, print_trace_summary
+from umi.real_world.uvc_camera import UvcCamera
 
 
 class UmiEnv:
+    # spans recorded by self.tracer, policy spans are recorded by the eval script
+    TRACE_SPANS = ('get_obs_fetch', 'get_obs_align', 'exec_actions', 
+        'policy_preprocess', 'policy_inference')
+
     def __init__(self, 
             # required params
             output_dir,
@@ -72,6 +79,8 @@ class UmiEnv:
             # vis params
             enable_multi_cam_vis=True,
             multi_cam_vis_resolution=(960, 960),
+            # latency tracing, dumped to output_dir/traces per episode
+            enable_tracing=False,
             # shared memory
             shm_manager=None
             ):
@@ -98,6 +107,25 @@ class UmiEnv:
             paths = [v4l_paths[i] for i in camera_reorder]
             v4l_paths = paths
 
+        # tracers, one per process
+        tracer = None
+        camera_tracers = None
+        robot_tracer = None
+        gripper_tracer = None
+        trace_collector = None
+        trace_dir = None
+        if enable_tracing:
+            tracer = SpanTracer(shm_manager, 'env', self.TRACE_SPANS)
+            camera_tracers = [SpanTracer(shm_manager, f'camera{i}', UvcCamera.TRACE_SPANS)
+                for i in range(len(v4l_paths))]
+            robot_tracer = SpanTracer(shm_manager, 'robot', 
+                RTDEInterpolationController.TRACE_SPANS)
+            gripper_tracer = SpanTracer(shm_manager, 'gripper', WSGController.TRACE_SPANS)
+            trace_collector = TraceCollector(
+                [tracer] + camera_tracers + [robot_tracer, gripper_tracer])
+            trace_dir = output_dir.joinpath('traces')
+            trace_dir.mkdir(parents=True, exist_ok=True)
+
         # compute resolution for vis
         rw, rh, col, row = optimal_row_cols(
             n_cameras=len(v4l_paths),
@@ -211,6 +239,7 @@ class UmiEnv:
             transform=transform,
             vis_transform=vis_transform,
             video_recorder=video_recorder,
+            tracer=camera_tracers,
             verbose=False
         )
 
@@ -246,7 +275,8 @@ class UmiEnv:
                 soft_real_time=False,
                 verbose=False,
                 receive_keys=None,
-                receive_latency=robot_obs_latency
+                receive_latency=robot_obs_latency,
+                tracer=robot_tracer
                 )
         elif robot_type.startswith('franka'):
             robot = FrankaInterpolationController(
@@ -256,7 +286,8 @@ class UmiEnv:
                 Kx_scale=1.0,
                 Kxd_scale=np.array([2.0,1.5,2.0,1.0,1.0,1.0]),
                 verbose=False,
-                receive_latency=robot_obs_latency
+                receive_latency=robot_obs_latency,
+                tracer=robot_tracer
             )
         
         gripper = WSGController(
@@ -264,7 +295,8 @@ class UmiEnv:
             hostname=gripper_ip,
             port=gripper_port,
             receive_latency=gripper_obs_latency,
-            use_meters=True
+            use_meters=True,
+            tracer=gripper_tracer
         )
 
         self.camera = camera
@@ -293,6 +325,11 @@ class UmiEnv:
         self.output_dir = output_dir
         self.video_dir = video_dir
         self.replay_buffer = replay_buffer
+        # tracing
+        self.tracer = tracer
+        self.trace_collector = trace_collector
+        self.trace_dir = trace_dir
+        self.trace_episode_id = None
         # temp memory buffers
         self.last_camera_data = None
         # recording buffers
@@ -358,6 +395,7 @@ class UmiEnv:
 
         "observation dict"
         assert self.is_ready
+        t_fetch_start = time.monotonic()
 
         # get data
         # 60 Hz, camera_calibrated_timestamp
@@ -375,6 +413,8 @@ class UmiEnv:
         # 30 hz, gripper_receive_timestamp
         last_gripper_data = self.gripper.get_all_state()
 
+        t_align_start = time.monotonic()
+
         last_timestamp = self.last_camera_data[self.align_camera_idx]['timestamp'][-1]
         dt = 1 / self.frequency
 
@@ -384,10 +424,7 @@ class UmiEnv:
         camera_obs = dict()
         for camera_idx, value in self.last_camera_data.items():
             this_timestamps = value['timestamp']
-            this_idxs = list()
-            for t in camera_obs_timestamps:
-                nn_idx = np.argmin(np.abs(this_timestamps - t))
-                this_idxs.append(nn_idx)
+            this_idxs = get_nearest_idxs(this_timestamps, camera_obs_timestamps)
             # remap key
             if camera_idx == 0 and self.mirror_crop:
                 camera_obs['camera0_rgb'] = value['color'][...,:3][this_idxs]
@@ -398,10 +435,10 @@ class UmiEnv:
         # align robot obs
         robot_obs_timestamps = last_timestamp - (
             np.arange(self.robot_obs_horizon)[::-1] * self.robot_down_sample_steps * dt)
-        robot_pose_interpolator = PoseInterpolator(
+        robot_pose = interp_pose(
             t=last_robot_data['robot_timestamp'], 
-            x=last_robot_data['ActualTCPPose'])
-        robot_pose = robot_pose_interpolator(robot_obs_timestamps)
+            x=last_robot_data['ActualTCPPose'],
+            query_t=robot_obs_timestamps)
         robot_obs = {
             'robot0_eef_pos': robot_pose[...,:3],
             'robot0_eef_rot_axis_angle': robot_pose[...,3:]
@@ -410,12 +447,12 @@ class UmiEnv:
         # align gripper obs
         gripper_obs_timestamps = last_timestamp - (
             np.arange(self.gripper_obs_horizon)[::-1] * self.gripper_down_sample_steps * dt)
-        gripper_interpolator = get_interp1d(
+        gripper_width = interp1d_linear(
             t=last_gripper_data['gripper_timestamp'],
-            x=last_gripper_data['gripper_position'][...,None]
-        )
+            x=last_gripper_data['gripper_position'][...,None],
+            query_t=gripper_obs_timestamps)
         gripper_obs = {
-            'robot0_gripper_width': gripper_interpolator(gripper_obs_timestamps)
+            'robot0_gripper_width': gripper_width
         }
 
         # accumulate obs
@@ -441,6 +478,9 @@ class UmiEnv:
         obs_data.update(gripper_obs)
         obs_data['timestamp'] = camera_obs_timestamps
 
+        if self.tracer is not None:
+            self.tracer.record(0, t_fetch_start, t_align_start)
+            self.tracer.record(1, t_align_start, time.monotonic())
         return obs_data
     
     def exec_actions(self, 
@@ -448,6 +488,7 @@ class UmiEnv:
             timestamps: np.ndarray,
             compensate_latency=False):
         assert self.is_ready
+        t_exec_start = time.monotonic()
         if not isinstance(actions, np.ndarray):
             actions = np.array(actions)
         if not isinstance(timestamps, np.ndarray):
@@ -481,6 +522,9 @@ class UmiEnv:
                 new_actions,
                 new_timestamps
             )
+
+        if self.tracer is not None:
+            self.tracer.record(2, t_exec_start, time.monotonic())
     
     def get_robot_state(self):
         return self.robot.get_state()
@@ -504,6 +548,10 @@ class UmiEnv:
             video_paths.append(
                 str(this_video_dir.joinpath(f'{i}.mp4').absolute()))
         
+        if self.trace_collector is not None:
+            self.trace_collector.mark()
+            self.trace_episode_id = episode_id
+
         # start recording on camera
         self.camera.restart_put(start_time=start_time)
         self.camera.start_recording(video_path=video_paths, start_time=start_time)
@@ -522,6 +570,10 @@ class UmiEnv:
         
         # stop video recorder
         self.camera.stop_recording()
+        for i, metrics in enumerate(self.camera.get_recorder_metrics()):
+            if metrics['n_frames_dropped'] > 0:
+                print(f"[{type(self).__name__}] Camera {i} dropped {int(metrics['n_frames_dropped'])} "
+                    f"of {int(metrics['n_frames_received'])} frames while recording.")
 
         # TODO
         if self.obs_accumulator is not None:
@@ -548,29 +600,29 @@ class UmiEnv:
                     'timestamp': timestamps,
                     'action': actions[:n_steps],
                 }
-                robot_pose_interpolator = PoseInterpolator(
+                robot_pose = interp_pose(
                     t=np.array(self.obs_accumulator.timestamps['robot0_eef_pose']),
-                    x=np.array(self.obs_accumulator.data['robot0_eef_pose'])
+                    x=np.array(self.obs_accumulator.data['robot0_eef_pose']),
+                    query_t=timestamps
                 )
-                robot_pose = robot_pose_interpolator(timestamps)
                 episode['robot0_eef_pos'] = robot_pose[:,:3]
                 episode['robot0_eef_rot_axis_angle'] = robot_pose[:,3:]
-                joint_pos_interpolator = get_interp1d(
-                    np.array(self.obs_accumulator.timestamps['robot0_joint_pos']),
-                    np.array(self.obs_accumulator.data['robot0_joint_pos'])
+                episode['robot0_joint_pos'] = interp1d_linear(
+                    t=np.array(self.obs_accumulator.timestamps['robot0_joint_pos']),
+                    x=np.array(self.obs_accumulator.data['robot0_joint_pos']),
+                    query_t=timestamps
                 )
-                joint_vel_interpolator = get_interp1d(
-                    np.array(self.obs_accumulator.timestamps['robot0_joint_vel']),
-                    np.array(self.obs_accumulator.data['robot0_joint_vel'])
+                episode['robot0_joint_vel'] = interp1d_linear(
+                    t=np.array(self.obs_accumulator.timestamps['robot0_joint_vel']),
+                    x=np.array(self.obs_accumulator.data['robot0_joint_vel']),
+                    query_t=timestamps
                 )
-                episode['robot0_joint_pos'] = joint_pos_interpolator(timestamps)
-                episode['robot0_joint_vel'] = joint_vel_interpolator(timestamps)
 
-                gripper_interpolator = get_interp1d(
+                episode['robot0_gripper_width'] = interp1d_linear(
                     t=np.array(self.obs_accumulator.timestamps['robot0_gripper_width']),
-                    x=np.array(self.obs_accumulator.data['robot0_gripper_width'])
+                    x=np.array(self.obs_accumulator.data['robot0_gripper_width']),
+                    query_t=timestamps
                 )
-                episode['robot0_gripper_width'] = gripper_interpolator(timestamps)
 
                 self.replay_buffer.add_episode(episode, compressors='disk')
                 episode_id = self.replay_buffer.n_episodes - 1
@@ -579,6 +631,12 @@ class UmiEnv:
             self.obs_accumulator = None
             self.action_accumulator = None
 
+            if self.trace_collector is not None:
+                trace_path = self.trace_dir.joinpath(f'{self.trace_episode_id}.npz')
+                summary = self.trace_collector.dump(trace_path)
+                print(f'Episode {self.trace_episode_id} latency trace saved to {trace_path}')
+                print_trace_summary(summary)
+
     def drop_episode(self):
         self.end_episode()
         self.replay_buffer.drop_episode()
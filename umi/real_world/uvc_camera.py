@@ -11,6 +11,7 @@ from umi.shared_memory.shared_memory_ring_buffer import SharedMemoryRingBuffer
 from umi.shared_memory.shared_memory_queue import SharedMemoryQueue, Full, Empty
 from umi.real_world.video_recorder import VideoRecorder
 from umi.common.usb_util import reset_usb_device
+from umi.common.trace_util import SpanTracer
 
 class Command(enum.Enum):
     RESTART_PUT = 0
@@ -24,6 +25,7 @@ class UvcCamera(mp.Process):
     Required to workaround firmware bugs.
     """
     MAX_PATH_LENGTH = 4096 # linux path has a limit of 4096 bytes
+    TRACE_SPANS = ('grab', 'retrieve', 'transform', 'put', 'period')
     
     def __init__(
             self,
@@ -44,8 +46,12 @@ class UvcCamera(mp.Process):
             vis_transform: Optional[Callable[[Dict], Dict]] = None,
             recording_transform: Optional[Callable[[Dict], Dict]] = None,
             video_recorder: Optional[VideoRecorder] = None,
+            tracer: Optional[SpanTracer] = None,
             verbose=False
         ):
+        """
+        tracer: if given, records spans TRACE_SPANS of every capture iteration.
+        """
         super().__init__()
 
         if put_fps is None:
@@ -118,6 +124,7 @@ class UvcCamera(mp.Process):
         self.vis_transform = vis_transform
         self.recording_transform = recording_transform
         self.video_recorder = video_recorder
+        self.tracer = tracer
         self.verbose = verbose
         self.put_start_time = None
         self.num_threads = num_threads
@@ -177,6 +184,9 @@ class UvcCamera(mp.Process):
     def get_vis(self, out=None):
         return self.vis_ring_buffer.get(out=out)
 
+    def get_recorder_metrics(self):
+        return self.video_recorder.get_metrics()
+
     def start_recording(self, video_path: str, start_time: float=-1):
         path_len = len(video_path.encode('utf-8'))
         if path_len > self.MAX_PATH_LENGTH:
@@ -226,15 +236,20 @@ class UvcCamera(mp.Process):
             # reuse frame buffer
             iter_idx = 0
             t_start = time.time()
+            tracer = self.tracer
+            mt_prev = time.monotonic()
             while not self.stop_event.is_set():
                 ts = time.time()
+                mt_grab = time.monotonic()
                 ret = cap.grab()
                 assert ret
+                mt_retrieve = time.monotonic()
                 
                 # directly write into shared memory to avoid copy
                 frame = self.video_recorder.get_img_buffer()
                 ret, frame = cap.retrieve(frame)
                 t_recv = time.time()
+                mt_transform = time.monotonic()
                 assert ret
                 mt_cap = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
                 t_cap = mt_cap - time.monotonic() + time.time()
@@ -253,6 +268,7 @@ class UvcCamera(mp.Process):
                 put_data = data
                 if self.transform is not None:
                     put_data = self.transform(dict(data))
+                mt_put = time.monotonic()
 
                 if self.put_downsample:                
                     # put frequency regulation
@@ -291,6 +307,15 @@ class UvcCamera(mp.Process):
                     vis_data = self.vis_transform(dict(data))
                 self.vis_ring_buffer.put(vis_data, wait=False)
 
+                if tracer is not None:
+                    mt_end = time.monotonic()
+                    tracer.record(0, mt_grab, mt_retrieve)
+                    tracer.record(1, mt_retrieve, mt_transform)
+                    tracer.record(2, mt_transform, mt_put)
+                    tracer.record(3, mt_put, mt_end)
+                    tracer.record(4, mt_prev, mt_grab)
+                mt_prev = mt_grab
+
                 # perf
                 t_end = time.time()
                 duration = t_end - t_start
@@ -1,16 +1,38 @@
-from typing import Optional, Callable, Generator
+from typing import Optional, Callable, Generator, Dict, List, Tuple
+import os
+import pathlib
 import numpy as np
 import av
 import time
 import enum
 import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing.managers import SharedMemoryManager
 from diffusion_policy.shared_memory.shared_memory_queue import SharedMemoryQueue, Full, Empty
+from umi.shared_memory.shared_ndarray import SharedNDArray
 from umi.common.timestamp_accumulator import get_accumulate_timestamp_idxs
 
 
 class VideoRecorder(mp.Process):
     MAX_PATH_LENGTH = 4096 # linux path has a limit of 4096 bytes
+    # counters are reset at every start_recording
+    # written by the process calling write_frame/write_img_buffer
+    WRITER_METRICS = (
+        'n_frames_received', # frames passed to write_*
+        'n_frames_dropped', # frames lost due to full img_queue
+        'n_frames_repeated', # extra copies inserted to fill timestamp gaps
+        'n_frames_skipped', # frames arriving faster than fps
+    )
+    # written by the recorder process
+    ENCODER_METRICS = (
+        'n_frames_encoded', # including repeats
+        'n_segments',
+        'queue_high_water', # max observed img_queue size
+        'encode_time', # total seconds spent in encode and mux
+    )
+    METRICS = WRITER_METRICS + ENCODER_METRICS
+    METRIC_IDX = {key: i for i, key in enumerate(METRICS)}
+
     class Command(enum.Enum):
         START_RECORDING = 0
         STOP_RECORDING = 1
@@ -21,22 +43,46 @@ class VideoRecorder(mp.Process):
         input_pix_fmt,
         buffer_size=128,
         no_repeat=False,
+        thread_type=None,
+        thread_count=None,
+        segment_duration=None,
+        keep_segments=False,
         # options for codec
         **kwargs     
     ):
+        """
+        thread_type: encoder threading, one of 'NONE', 'SLICE', 'FRAME', 'AUTO'.
+            Only effective for software encoders (e.g. libx264).
+        thread_count: number of encoder threads, 0 for automatic.
+        segment_duration: if set, rotate to a new file every segment_duration
+            seconds of video. Segments of video_path are written to 
+            get_segment_path(video_path, i) and finalized in the background.
+            After stop_recording, segments are remuxed into video_path in the
+            background as well, video_path only appears once it is complete
+            (see is_finalized).
+        keep_segments: keep segment files after they are remuxed into video_path.
+        """
         self.fps = fps
         self.codec = codec
         self.input_pix_fmt = input_pix_fmt
         self.buffer_size = buffer_size
         self.no_repeat = no_repeat
+        self.thread_type = thread_type
+        self.thread_count = thread_count
+        self.segment_duration = segment_duration
+        self.keep_segments = keep_segments
         self.kwargs = kwargs
         
         self.img_queue = None
         self.cmd_queue = None
         self.stop_event = None
         self.ready_event = None
+        self.wake_event = None
+        self.metrics_array = None
         self.is_started = False
         self.shape = None
+        self.dtype = None
+        self._overflow_img = None
         
         self._reset_state()
         
@@ -101,6 +147,13 @@ class VideoRecorder(mp.Process):
         super().__init__()
         self.ready_event = mp.Event()
         self.stop_event = mp.Event()
+        # doorbell for the recorder process, set on every put
+        self.wake_event = mp.Event()
+        self.metrics_array = SharedNDArray.create_from_shape(
+            mem_mgr=shm_manager,
+            shape=(len(self.METRICS),),
+            dtype=np.float64)
+        self.metrics_array.get()[:] = 0
         self.img_queue = SharedMemoryQueue.create_from_examples(
             shm_manager=shm_manager,
             examples={
@@ -118,11 +171,13 @@ class VideoRecorder(mp.Process):
             buffer_size=self.buffer_size
         )
         self.shape = data_example.shape
+        self.dtype = data_example.dtype
         self.is_started = True
         super().start()
     
     def stop(self):
         self.stop_event.set()
+        self.wake_event.set()
 
     def start_wait(self):
         self.ready_event.wait()
@@ -140,24 +195,102 @@ class VideoRecorder(mp.Process):
         if path_len > self.MAX_PATH_LENGTH:
             raise RuntimeError('video_path too long.')
         self.start_time = start_time
+        self.metrics_array.get()[:len(self.WRITER_METRICS)] = 0
         self.cmd_queue.put({
             'cmd': self.Command.START_RECORDING.value,
             'video_path': video_path
         })
+        self.wake_event.set()
     
     def stop_recording(self):
         self.cmd_queue.put({
             'cmd': self.Command.STOP_RECORDING.value
         })
+        self.wake_event.set()
         self._reset_state()
+
+    def get_metrics(self) -> Dict[str, float]:
+        """
+        Drop/duplicate and encoder statistics of the current recording.
+        Safe to call from any process.
+        """
+        values = self.metrics_array.get()
+        return dict(zip(self.METRICS, values.tolist()))
+
+    @staticmethod
+    def concat_segments(segment_paths: List[str], video_path: str):
+        """
+        Remux (without re-encoding) segments into a single video,
+        timestamps of each segment are shifted to follow the previous one.
+        """
+        with av.open(video_path, mode='w') as out_container:
+            out_stream = None
+            offset_sec = 0.0
+            for path in segment_paths:
+                with av.open(path, mode='r') as in_container:
+                    in_stream = in_container.streams.video[0]
+                    if out_stream is None:
+                        if hasattr(out_container, 'add_stream_from_template'):
+                            # av>=13, template argument removed in av 14
+                            out_stream = out_container.add_stream_from_template(in_stream)
+                        else:
+                            out_stream = out_container.add_stream(template=in_stream)
+                    time_base = in_stream.time_base
+                    offset = int(round(offset_sec / time_base))
+                    end = 0
+                    for packet in in_container.demux(in_stream):
+                        if packet.dts is None:
+                            # flush packet
+                            continue
+                        end = max(end, packet.pts + packet.duration)
+                        packet.pts += offset
+                        packet.dts += offset
+                        packet.stream = out_stream
+                        out_container.mux(packet)
+                    offset_sec += float(end * time_base)
+
+    @classmethod
+    def finalize_segments(cls, segment_paths: List[str], video_path: str, 
+            keep_segments: bool=False):
+        """
+        Remux segments into a temporary file which is then renamed to
+        video_path, such that video_path never exists half-written.
+        """
+        path = pathlib.Path(video_path)
+        tmp_path = path.with_name(f'{path.stem}.tmp{path.suffix}')
+        cls.concat_segments(segment_paths, str(tmp_path))
+        os.replace(tmp_path, path)
+        if not keep_segments:
+            for segment_path in segment_paths:
+                pathlib.Path(segment_path).unlink()
+
+    @staticmethod
+    def is_finalized(video_path: str) -> bool:
+        """
+        Whether video_path is completely written.
+        With segment_duration set, the remux runs in the background
+        after stop_recording returns.
+        """
+        return pathlib.Path(video_path).is_file()
+
+    @staticmethod
+    def get_segment_path(video_path: str, segment_idx: int) -> str:
+        """
+        e.g. videos/0.mp4 -> videos/0.0003.mp4
+        """
+        path = pathlib.Path(video_path)
+        return str(path.with_name(f'{path.stem}.{segment_idx:04d}{path.suffix}'))
     
-    def write_frame(self, img: np.ndarray, frame_time=None):
-        if not self.is_ready():
-            raise RuntimeError('Must run start() before writing!')
-            
+    def _compute_repeats(self, frame_time) -> Tuple[int, int]:
+        """
+        Returns (n_repeats, next_global_idx). 
+        next_global_idx should only be committed if the frame is accepted,
+        such that dropped frames are filled by repeating the next frame.
+        """
         n_repeats = 1
+        next_global_idx = self.next_global_idx
         if (not self.no_repeat) and (self.start_time is not None):
-            local_idxs, global_idxs, self.next_global_idx \
+            local_idxs, global_idxs, next_global_idx \
                 = get_accumulate_timestamp_idxs(
                 # only one timestamp
                 timestamps=[frame_time],
@@ -167,19 +300,52 @@ class VideoRecorder(mp.Process):
             )
             # number of apperance means repeats
             n_repeats = len(local_idxs)
-        
-        self.img_queue.put({
-            'img': img,
-            'repeat': n_repeats
-        })
+        return n_repeats, next_global_idx
+
+    def _on_frame_written(self, n_repeats, next_global_idx, accepted):
+        metrics = self.metrics_array.get()
+        idx = self.METRIC_IDX
+        metrics[idx['n_frames_received']] += 1
+        if not accepted:
+            metrics[idx['n_frames_dropped']] += 1
+            return
+        self.next_global_idx = next_global_idx
+        if n_repeats > 1:
+            metrics[idx['n_frames_repeated']] += n_repeats - 1
+        elif n_repeats == 0:
+            metrics[idx['n_frames_skipped']] += 1
+        self.wake_event.set()
+    
+    def write_frame(self, img: np.ndarray, frame_time=None):
+        if not self.is_ready():
+            raise RuntimeError('Must run start() before writing!')
+            
+        n_repeats, next_global_idx = self._compute_repeats(frame_time)
+        try:
+            self.img_queue.put({
+                'img': img,
+                'repeat': n_repeats
+            })
+            accepted = True
+        except Full:
+            accepted = False
+        self._on_frame_written(n_repeats, next_global_idx, accepted)
     
     def get_img_buffer(self):
         """
         Get view to the next img queue memory
-        for zero-copy writing
+        for zero-copy writing.
+        If the queue is full, returns a private overflow buffer instead,
+        which is copied into the queue by write_img_buffer if space frees up
+        or dropped otherwise.
         """
-        data = self.img_queue.get_next_view()
-        img = data['img']
+        try:
+            data = self.img_queue.get_next_view()
+            img = data['img']
+        except Full:
+            if self._overflow_img is None:
+                self._overflow_img = np.empty(self.shape, dtype=self.dtype)
+            img = self._overflow_img
         return img
     
     def write_img_buffer(self, img: np.ndarray, frame_time=None):
@@ -190,36 +356,69 @@ class VideoRecorder(mp.Process):
         if not self.is_ready():
             raise RuntimeError('Must run start() before writing!')
             
-        n_repeats = 1
-        if (not self.no_repeat) and (self.start_time is not None):
-            local_idxs, global_idxs, self.next_global_idx \
-                = get_accumulate_timestamp_idxs(
-                # only one timestamp
-                timestamps=[frame_time],
-                start_time=self.start_time,
-                dt=1/self.fps,
-                next_global_idx=self.next_global_idx
-            )
-            # number of apperance means repeats
-            n_repeats = len(local_idxs)
-        
-        self.img_queue.put_next_view({
-            'img': img,
-            'repeat': n_repeats
-        })
+        n_repeats, next_global_idx = self._compute_repeats(frame_time)
+        accepted = True
+        try:
+            if img is self._overflow_img:
+                self.img_queue.put({
+                    'img': img,
+                    'repeat': n_repeats
+                })
+            else:
+                self.img_queue.put_next_view({
+                    'img': img,
+                    'repeat': n_repeats
+                })
+        except Full:
+            accepted = False
+        self._on_frame_written(n_repeats, next_global_idx, accepted)
 
     # ========= interval API ===========
     def _reset_state(self):
         self.start_time = None
         self.next_global_idx = 0
     
+    def _open_stream(self, video_path: str):
+        container = av.open(video_path, mode='w')
+        stream = container.add_stream(self.codec, rate=self.fps)
+        h,w,c = self.shape
+        stream.width = w
+        stream.height = h
+        codec_context = stream.codec_context
+        if self.thread_type is not None:
+            codec_context.thread_type = self.thread_type
+        if self.thread_count is not None:
+            codec_context.thread_count = self.thread_count
+        for k, v in self.kwargs.items():
+            setattr(codec_context, k, v)
+        return container, stream
+
+    def _encode(self, container, stream, frame, repeat):
+        t = time.monotonic()
+        for _ in range(repeat):
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        metrics = self.metrics_array.get()
+        metrics[self.METRIC_IDX['n_frames_encoded']] += repeat
+        metrics[self.METRIC_IDX['encode_time']] += time.monotonic() - t
+
     def run(self):
         # I'm sorry it has to be this complicated...
+        metrics = self.metrics_array.get()
+        idx = self.METRIC_IDX
+        frames_per_segment = None
+        if self.segment_duration is not None:
+            frames_per_segment = max(1, int(round(self.segment_duration * self.fps)))
+        # finalizes (writes trailer of) finished segments in background
+        close_executor = ThreadPoolExecutor(max_workers=1)
+
         self.ready_event.set()
         while not self.stop_event.is_set():
             video_path = None
             # ========= stopped state ============
             while (video_path is None) and (not self.stop_event.is_set()):
+                # clear before checking, so no put can be missed
+                self.wake_event.clear()
                 try:
                     commands = self.cmd_queue.get_all()
                     for i in range(len(commands['cmd'])):
@@ -231,60 +430,81 @@ class VideoRecorder(mp.Process):
                         else:
                             raise RuntimeError("Unknown command: ", cmd)
                 except Empty:
-                    time.sleep(0.1/self.fps)
+                    self.wake_event.wait(timeout=0.1)
             if self.stop_event.is_set():
                 break
             assert video_path is not None
             # ========= recording state ==========
-            with av.open(video_path, mode='w') as container:
-                stream = container.add_stream(self.codec, rate=self.fps)
-                h,w,c = self.shape
-                stream.width = w
-                stream.height = h
-                codec_context = stream.codec_context
-                for k, v in self.kwargs.items():
-                    setattr(codec_context, k, v)
-                
-                # loop
-                while not self.stop_event.is_set():
-                    try:
-                        command = self.cmd_queue.get()
+            metrics[len(self.WRITER_METRICS):] = 0
+            n_segment_frames = 0
+            segment_paths = list()
+            this_path = video_path
+            if frames_per_segment is not None:
+                this_path = self.get_segment_path(video_path, 0)
+                segment_paths.append(this_path)
+            container, stream = self._open_stream(this_path)
+            metrics[idx['n_segments']] = 1
+
+            try:
+                # loop, after stop the queue is flushed through the same path
+                # so that segment rotation still applies
+                stopping = False
+                while True:
+                    self.wake_event.clear()
+                    if self.stop_event.is_set():
+                        stopping = True
+                    while not stopping:
+                        try:
+                            command = self.cmd_queue.get()
+                        except Empty:
+                            break
                         cmd = int(command['cmd'])
                         if cmd == self.Command.STOP_RECORDING.value:
-                            break
-                        elif cmd == self.Command.START_RECORDING.value:
-                            continue
-                        else:
+                            stopping = True
+                        elif cmd != self.Command.START_RECORDING.value:
                             raise RuntimeError("Unknown command: ", cmd)
-                    except Empty:
-                        pass
                     
+                    metrics[idx['queue_high_water']] = max(
+                        metrics[idx['queue_high_water']], self.img_queue.qsize())
                     try:
                         with self.img_queue.get_view() as data:
                             img = data['img']
-                            repeat = data['repeat']
+                            repeat = int(data['repeat'])
                             frame = av.VideoFrame.from_ndarray(
                                 img, format=self.input_pix_fmt)
-                        for _ in range(repeat):
-                            for packet in stream.encode(frame):
-                                container.mux(packet)
                     except Empty:
-                        time.sleep(0.1/self.fps)
-                        
-                # Flush queue
-                try:
-                    while not self.img_queue.empty():
-                        with self.img_queue.get_view() as data:
-                            img = data['img']
-                            repeat = data['repeat']
-                            frame = av.VideoFrame.from_ndarray(
-                                img, format=self.input_pix_fmt)
-                        for _ in range(repeat):
-                            for packet in stream.encode(frame):
-                                container.mux(packet)
-                except Empty:
-                    pass
+                        if stopping:
+                            break
+                        self.wake_event.wait(timeout=0.1)
+                        continue
+
+                    if (frames_per_segment is not None) \
+                            and (n_segment_frames + repeat > frames_per_segment) \
+                            and (n_segment_frames > 0):
+                        # rotate segment, flush synchronously and finalize in background
+                        for packet in stream.encode():
+                            container.mux(packet)
+                        close_executor.submit(container.close)
+                        container = None
+                        n_segment_frames = 0
+                        this_path = self.get_segment_path(video_path, len(segment_paths))
+                        segment_paths.append(this_path)
+                        container, stream = self._open_stream(this_path)
+                        metrics[idx['n_segments']] += 1
+                    self._encode(container, stream, frame, repeat)
+                    n_segment_frames += repeat
+            finally:
+                # Flush stream, also on error so that the current file
+                # gets its trailer written
+                if container is not None:
+                    for packet in stream.encode():
+                        container.mux(packet)
+                    container.close()
 
-                 # Flush stream
-                for packet in stream.encode():
-                    container.mux(packet)
+            if len(segment_paths) > 0:
+                # remux segments into the requested video_path in background,
+                # single worker runs after all segments are closed
+                close_executor.submit(self.finalize_segments, 
+                    segment_paths, video_path, self.keep_segments)
+        # wait for all segments and videos to be finalized
+        close_executor.shutdown(wait=True)
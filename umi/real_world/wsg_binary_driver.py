@@ -1,4 +1,4 @@
-from typing import Union, Optional
+from typing import Union, Optional, Sequence, Tuple, List
 import socket
 import enum
 import struct
@@ -39,12 +39,34 @@ CRC_TABLE_CCITT16 = [
 ]
 
 
-def checksum_update_crc16(data: bytes, crc: int=0xFFFF):
-    for b in data:
-        crc = CRC_TABLE_CCITT16[(crc ^ b) & 0x00FF] ^ ( crc >> 8 )
+_CRC_TABLE_CCITT16 = tuple(CRC_TABLE_CCITT16)
+
+# CRC of the 3 preamble bytes, used to check frames starting at the command id
+HEADER_CHECKSUM = 0x50f5
+PREAMBLE = b'\xaa\xaa\xaa'
+RECV_BUFFER_SIZE = 1 << 17
+
+
+def checksum_update_crc16(data: Union[bytes, bytearray, memoryview], crc: int=0xFFFF):
+    """
+    Table-driven CRC. Accepts any bytes-like object, pass a memoryview 
+    to checksum part of a buffer without copying.
+    """
+    table = _CRC_TABLE_CCITT16
+    for b in memoryview(data).cast('B'):
+        crc = table[(crc ^ b) & 0x00FF] ^ (crc >> 8)
     return crc
 
 
+def build_msg(cmd_id: int, payload: bytes) -> bytes:
+    msg_b = bytearray(PREAMBLE)
+    msg_b.append(int(cmd_id))
+    msg_b += len(payload).to_bytes(2, 'little')
+    msg_b += payload
+    msg_b += checksum_update_crc16(msg_b).to_bytes(2, 'little')
+    return bytes(msg_b)
+
+
 class StatusCode(enum.IntEnum):
     E_SUCCESS = 0
     E_NOT_AVAILABLE = 1
@@ -86,6 +108,11 @@ class CommandId(enum.IntEnum):
     FastStop = 0x23
     AckFastStop = 0x24
 
+class ScriptId(enum.IntEnum):
+    # custom commands registered by cmd_measure.lua
+    Query = 0xB0
+    PositionPD = 0xB1
+
 
 
 
@@ -106,15 +133,91 @@ def args_to_bytes(*args, int_bytes=1):
 
 
 
+class WSGMessageReader:
+    """
+    Buffered parser for the WSG binary protocol over a stream socket.
+    Reads as many bytes as available per syscall and handles 
+    short reads and garbage before the preamble.
+    """
+    def __init__(self, sock: socket.socket, buffer_size: int=RECV_BUFFER_SIZE):
+        self.sock = sock
+        # valid data in [_rx_start, _rx_end)
+        self._rx_buf = bytearray(buffer_size)
+        self._rx_view = memoryview(self._rx_buf)
+        self._rx_start = 0
+        self._rx_end = 0
+
+    def _recv_more(self):
+        """
+        Read whatever is available on the socket (at least 1 byte) 
+        into the receive buffer.
+        """
+        if self._rx_start == self._rx_end:
+            self._rx_start = self._rx_end = 0
+        elif self._rx_end == len(self._rx_buf):
+            # compact
+            n = self._rx_end - self._rx_start
+            self._rx_buf[:n] = self._rx_view[self._rx_start:self._rx_end]
+            self._rx_start = 0
+            self._rx_end = n
+        n_read = self.sock.recv_into(self._rx_view[self._rx_end:])
+        if n_read == 0:
+            raise ConnectionError('Connection closed by WSG')
+        self._rx_end += n_read
+
+    def _parse_msg(self) -> Optional[Tuple[int, bytes]]:
+        """
+        Parse one frame from the receive buffer into (cmd_id, payload).
+        Returns None if the buffer does not contain a complete frame yet.
+        """
+        buf = self._rx_buf
+        end = self._rx_end
+        idx = buf.find(PREAMBLE, self._rx_start, end)
+        if idx < 0:
+            # keep a possibly incomplete preamble
+            self._rx_start = max(self._rx_start, end - len(PREAMBLE) + 1)
+            return None
+        # discard garbage before preamble
+        self._rx_start = idx
+
+        # preamble(3) cmd_id(1) size(2) payload(size) checksum(2)
+        if end - idx < 6:
+            return None
+        size = buf[idx+4] | (buf[idx+5] << 8)
+        msg_end = idx + 6 + size + 2
+        if msg_end > end:
+            return None
+        self._rx_start = msg_end
+
+        # correct checksum ends in zero
+        msg_checksum = checksum_update_crc16(
+            self._rx_view[idx+3:msg_end], crc=HEADER_CHECKSUM)
+        if msg_checksum != 0:
+            raise RuntimeError('Corrupted packet received from WSG')
+
+        return buf[idx+3], bytes(buf[idx+6:idx+6+size])
+
+    def receive(self) -> Tuple[int, bytes]:
+        msg = self._parse_msg()
+        while msg is None:
+            self._recv_more()
+            msg = self._parse_msg()
+        return msg
+
+
 class WSGBinaryDriver:
     def __init__(self, hostname='192.168.0.103', port=1000):
         self.hostname = hostname
         self.port = port
         self.tcp_sock = None
+        self.reader = None
 
     def start(self):
         self.tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # commands are tiny and latency sensitive
+        self.tcp_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.tcp_sock.connect((self.hostname, self.port))
+        self.reader = WSGMessageReader(self.tcp_sock)
         # self.ack_fast_stop()
     
     def stop(self):
@@ -133,50 +236,16 @@ class WSGBinaryDriver:
     # ================= low level API ================
 
     def msg_send(self, cmd_id: int, payload: bytes):
-        preamble_b = 0xAA.to_bytes(1, 'little') * 3
-        cmd_b = int(cmd_id).to_bytes(1, 'little')
-        size_b = len(payload).to_bytes(2, 'little')
-        msg_b = preamble_b + cmd_b + size_b + payload
-        checksum_b = checksum_update_crc16(msg_b).to_bytes(2, 'little')
-        msg_b += checksum_b
-        return self.tcp_sock.send(msg_b)
+        msg_b = build_msg(cmd_id, payload)
+        self.tcp_sock.sendall(msg_b)
+        return len(msg_b)
 
     def msg_receive(self) -> dict:
-        # syncing
-        sync = 0
-        while sync != 3:
-            res = self.tcp_sock.recv(1)
-            if res == 0xAA.to_bytes(1, 'little'):
-                sync += 1
-        
-        # read header
-        cmd_id_b = self.tcp_sock.recv(1)
-        cmd_id = int.from_bytes(cmd_id_b, 'little')
-
-        # read size
-        size_b = self.tcp_sock.recv(2)
-        size = int.from_bytes(size_b, 'little')
-        
-        # read payload
-        payload_b = self.tcp_sock.recv(size)
-        status_code = int.from_bytes(payload_b[:2], 'little')
-
-        parameters_b = payload_b[2:]
-
-        # read checksum
-        checksum_b = self.tcp_sock.recv(2)
-        
-        # correct checksum ends in zero
-        header_checksum = 0x50f5
-        msg_checksum = checksum_update_crc16(
-            cmd_id_b + size_b + payload_b + checksum_b, crc=header_checksum)
-        if msg_checksum != 0:
-            raise RuntimeError('Corrupted packet received from WSG')
-        
+        cmd_id, payload_b = self.reader.receive()
         result = {
             'command_id': cmd_id,
-            'status_code': status_code,
-            'payload_bytes': parameters_b
+            'status_code': int.from_bytes(payload_b[:2], 'little'),
+            'payload_bytes': payload_b[2:]
         }
         return result
     
@@ -254,7 +323,8 @@ class WSGBinaryDriver:
     def stop_cmd(self):
         return self.act(CommandId.Stop, wait=False, ignore_other=True)
 
-    def custom_script(self, cmd_id: int, *args):
+    @staticmethod
+    def script_payload(*args) -> bytes:
         # Custom payload format:
         # 0:	Unused
         # 1..4	float
@@ -262,10 +332,10 @@ class WSGBinaryDriver:
         payload_args = [0]
         for arg in args:
             payload_args.append(float(arg))
-        payload = args_to_bytes(*payload_args, int_bytes=1)
+        return args_to_bytes(*payload_args, int_bytes=1)
 
-        # send message
-        msg = self.cmd_submit(cmd_id=cmd_id, payload=payload, pending=False)
+    @staticmethod
+    def parse_script_response(msg: dict) -> dict:
         status = StatusCode(msg['status_code'])
         response_payload = msg['payload_bytes']
         if status == StatusCode.E_CMD_UNKNOWN:
@@ -279,11 +349,7 @@ class WSGBinaryDriver:
         
         # parse payload
         state = response_payload[0]
-        values = list()
-        for i in range(4):
-            start = i * 4 + 1
-            end = start + 4
-            values.append(struct.unpack('<f', response_payload[start:end])[0])
+        values = struct.unpack_from('<4f', response_payload, 1)
 
         info = {
             'state': state,
@@ -293,28 +359,78 @@ class WSGBinaryDriver:
             'measure_timestamp': values[3],
             'is_moving': (state & 0x02) != 0
         }
-        # info = {
-        #     'state': 0,
-        #     'position': 100.,
-        #     'velocity': 0.,
-        #     'force_motor': 0.,
-        #     'is_moving': 0.
-        # }
         return info
 
+    def custom_script_send(self, cmd_id: int, *args):
+        """
+        Send a custom script command without waiting for the response.
+        Must be paired with a custom_script_receive call.
+        """
+        return self.msg_send(cmd_id, self.script_payload(*args))
+
+    def custom_script_receive(self, cmd_id: int) -> dict:
+        msg = self.msg_receive()
+        if msg['command_id'] != cmd_id:
+            raise RuntimeError(
+                "Response ID ({:02X}) does not match submitted command ID ({:02X})\n".format(
+                msg['command_id'], cmd_id))
+        return self.parse_script_response(msg)
+
+    def custom_script(self, cmd_id: int, *args):
+        self.custom_script_send(cmd_id, *args)
+        return self.custom_script_receive(cmd_id)
+
+    def custom_script_pipelined(self, scripts: Sequence[Tuple[int, Sequence[float]]]) -> List[dict]:
+        """
+        Send multiple custom script commands in one write, 
+        then collect the responses in order. 
+        Costs one network round trip instead of len(scripts).
+        scripts: list of (cmd_id, args)
+        """
+        msg_b = b''.join(
+            build_msg(cmd_id, self.script_payload(*args)) 
+            for cmd_id, args in scripts)
+        self.tcp_sock.sendall(msg_b)
+        return [self.custom_script_receive(cmd_id) for cmd_id, _ in scripts]
+
     def script_query(self):
-        return self.custom_script(0xB0)
+        return self.custom_script(ScriptId.Query)
     
+    @staticmethod
+    def position_pd_args(position: float, velocity: float,
+                         kp: float=15.0, kd: float=1e-3,
+                         travel_force_limit: float=80.0, 
+                         blocked_force_limit: float=None):
+        if blocked_force_limit is None:
+            blocked_force_limit = travel_force_limit
+        assert kp > 0
+        assert kd >= 0
+        return (position, velocity, kp, kd, travel_force_limit, blocked_force_limit)
+
     def script_position_pd(self, 
                            position: float, velocity: float,
                            kp: float=15.0, kd: float=1e-3,
                            travel_force_limit: float=80.0, 
                            blocked_force_limit: float=None):
-        if blocked_force_limit is None:
-            blocked_force_limit = travel_force_limit
-        assert kp > 0
-        assert kd >= 0
-        return self.custom_script(0xB1, position, velocity, kp, kd, travel_force_limit, blocked_force_limit)
+        args = self.position_pd_args(position, velocity, kp, kd,
+            travel_force_limit, blocked_force_limit)
+        return self.custom_script(ScriptId.PositionPD, *args)
+
+    def script_query_position_pd(self, 
+                           position: float, velocity: float,
+                           kp: float=15.0, kd: float=1e-3,
+                           travel_force_limit: float=80.0, 
+                           blocked_force_limit: float=None):
+        """
+        Pipelined query followed by position_pd command in a single round trip.
+        Returns (query_info, position_pd_info)
+        """
+        args = self.position_pd_args(position, velocity, kp, kd,
+            travel_force_limit, blocked_force_limit)
+        return tuple(self.custom_script_pipelined([
+            (ScriptId.Query, ()),
+            (ScriptId.PositionPD, args)
+        ]))
 
 
 def test():
@@ -7,8 +7,8 @@ from umi.shared_memory.shared_memory_queue import (
     SharedMemoryQueue, Empty)
 from umi.shared_memory.shared_memory_ring_buffer import SharedMemoryRingBuffer
 from umi.common.precise_sleep import precise_wait
-from umi.real_world.wsg_binary_driver import WSGBinaryDriver
-from umi.common.pose_trajectory_interpolator import PoseTrajectoryInterpolator
+from umi.real_world.wsg_binary_driver import WSGBinaryDriver, ScriptId
+from umi.common.pose_trajectory_interpolator import IncrementalPoseTrajectoryInterpolator
 
 
 class Command(enum.Enum):
@@ -17,6 +17,9 @@ class Command(enum.Enum):
     RESTART_PUT = 2
 
 class WSGController(mp.Process):
+    # spans recorded by tracer, see umi.common.trace_util
+    TRACE_SPANS = ('work', 'period')
+
     def __init__(self,
             shm_manager: SharedMemoryManager,
             hostname,
@@ -29,8 +32,15 @@ class WSGController(mp.Process):
             launch_timeout=3,
             receive_latency=0.0,
             use_meters=False,
-            verbose=False
+            pipeline=False,
+            verbose=False,
+            tracer=None
             ):
+        """
+        pipeline: send the position command at the start of each cycle and
+            collect its response after processing queued commands, 
+            overlapping the network round trip with local work.
+        """
         super().__init__(name="WSGController")
         self.hostname = hostname
         self.port = port
@@ -40,7 +50,9 @@ class WSGController(mp.Process):
         self.launch_timeout = launch_timeout
         self.receive_latency = receive_latency
         self.scale = 1000.0 if use_meters else 1.0
+        self.pipeline = pipeline
         self.verbose = verbose
+        self.tracer = tracer
 
         if get_max_k is None:
             get_max_k = int(frequency * 10)
@@ -141,6 +153,19 @@ class WSGController(mp.Process):
         return self.ring_buffer.get_all()
     
     # ========= main loop in process ============
+    def _put_state(self, info):
+        # get state from robot
+        state = {
+            'gripper_state': info['state'],
+            'gripper_position': info['position'] / self.scale,
+            'gripper_velocity': info['velocity'] / self.scale,
+            'gripper_force': info['force_motor'],
+            'gripper_measure_timestamp': info['measure_timestamp'],
+            'gripper_receive_timestamp': time.time(),
+            'gripper_timestamp': time.time() - self.receive_latency
+        }
+        self.ring_buffer.put(state)
+
     def run(self):
         # start connection
         try:
@@ -158,7 +183,7 @@ class WSGController(mp.Process):
                 # curr_pos = 100.0
                 curr_t = time.monotonic()
                 last_waypoint_time = curr_t
-                pose_interp = PoseTrajectoryInterpolator(
+                pose_interp = IncrementalPoseTrajectoryInterpolator(
                     times=[curr_t],
                     poses=[[curr_pos,0,0,0,0,0]]
                 )
@@ -166,6 +191,7 @@ class WSGController(mp.Process):
                 keep_running = True
                 t_start = time.monotonic()
                 iter_idx = 0
+                t_prev = None
                 while keep_running:
                     # command gripper
                     t_now = time.monotonic()
@@ -174,21 +200,16 @@ class WSGController(mp.Process):
                     target_pos = pose_interp(t_target)[0]
                     target_vel = (target_pos - pose_interp(t_target - dt)[0]) / dt
                     # print('controller', target_pos, target_vel)
-                    info = wsg.script_position_pd(
-                        position=target_pos, velocity=target_vel)
-                    # time.sleep(1e-3)
-
-                    # get state from robot
-                    state = {
-                        'gripper_state': info['state'],
-                        'gripper_position': info['position'] / self.scale,
-                        'gripper_velocity': info['velocity'] / self.scale,
-                        'gripper_force': info['force_motor'],
-                        'gripper_measure_timestamp': info['measure_timestamp'],
-                        'gripper_receive_timestamp': time.time(),
-                        'gripper_timestamp': time.time() - self.receive_latency
-                    }
-                    self.ring_buffer.put(state)
+                    if self.pipeline:
+                        # response is received after command processing below
+                        wsg.custom_script_send(ScriptId.PositionPD, 
+                            *wsg.position_pd_args(
+                                position=target_pos, velocity=target_vel))
+                    else:
+                        info = wsg.script_position_pd(
+                            position=target_pos, velocity=target_vel)
+                        # time.sleep(1e-3)
+                        self._put_state(info)
 
                     # fetch command from queue
                     try:
@@ -230,11 +251,21 @@ class WSGController(mp.Process):
                             keep_running = False
                             break
                         
+                    if self.pipeline:
+                        info = wsg.custom_script_receive(ScriptId.PositionPD)
+                        self._put_state(info)
+
                     # first loop successful, ready to receive command
                     if iter_idx == 0:
                         self.ready_event.set()
                     iter_idx += 1
                     
+                    if self.tracer is not None:
+                        self.tracer.record(0, t_now, time.monotonic())
+                        if t_prev is not None:
+                            self.tracer.record(1, t_prev, t_now)
+                    t_prev = t_now
+
                     # regulate frequency
                     dt = 1 / self.frequency
                     t_end = t_start + dt * iter_idx
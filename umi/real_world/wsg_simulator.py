@@ -0,0 +1,157 @@
+from typing import Optional
+import socket
+import queue
+import struct
+import threading
+import time
+from umi.real_world.wsg_binary_driver import (
+    WSGMessageReader, StatusCode, CommandId, ScriptId, build_msg)
+
+
+class WSGSimulator:
+    """
+    Local TCP server speaking the WSG binary protocol, 
+    including the custom scripts in cmd_measure.lua.
+    Used to test WSGBinaryDriver and benchmark round-trip latency
+    without hardware. The gripper follows position commands with
+    a simple velocity-limited model.
+    """
+    def __init__(self, 
+            hostname: str='127.0.0.1', 
+            port: int=0,
+            response_latency: float=0.0,
+            max_speed: float=400.0,
+            max_width: float=110.0):
+        """
+        port: 0 picks a free port, see .port after start()
+        response_latency: delay between request arrival and its response, in seconds.
+        """
+        self.hostname = hostname
+        self.port = port
+        self.response_latency = response_latency
+        self.max_speed = max_speed
+        self.max_width = max_width
+
+        self.server_sock = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+        self.position = max_width
+        self.velocity = 0.0
+        self.target_position = max_width
+        self.last_update_time = time.monotonic()
+        self.n_requests = 0
+
+    # ========= launch method ===========
+    def start(self):
+        self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_sock.bind((self.hostname, self.port))
+        self.server_sock.listen(1)
+        self.server_sock.settimeout(0.1)
+        self.port = self.server_sock.getsockname()[1]
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.server_sock.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    # ========= simulation ===========
+    def _update(self):
+        t = time.monotonic()
+        dt = t - self.last_update_time
+        self.last_update_time = t
+        err = self.target_position - self.position
+        step = min(abs(err), self.max_speed * dt)
+        step = step if err >= 0 else -step
+        self.position += step
+        self.velocity = step / dt if dt > 0 else 0.0
+
+    def _script_payload(self, status: StatusCode) -> bytes:
+        self._update()
+        state = 0x02 if self.position != self.target_position else 0x00
+        return status.to_bytes(2, 'little') + struct.pack('<B4f', 
+            state, self.position, self.velocity, 0.0, time.monotonic())
+
+    def handle(self, cmd_id: int, payload: bytes) -> Optional[bytes]:
+        """
+        Returns response payload (including status code) 
+        or None if no response should be sent.
+        """
+        success = StatusCode.E_SUCCESS.to_bytes(2, 'little')
+        if cmd_id == CommandId.Disconnect:
+            return None
+        elif cmd_id == CommandId.Homing:
+            self.position = self.target_position = self.max_width
+            return success
+        elif cmd_id == CommandId.PrePosition:
+            _, width, _ = struct.unpack('<Bff', payload)
+            self.target_position = width
+            return success
+        elif cmd_id in (CommandId.Stop, CommandId.FastStop, CommandId.AckFastStop):
+            self.target_position = self.position
+            return success
+        elif cmd_id == ScriptId.Query:
+            return self._script_payload(StatusCode.E_SUCCESS)
+        elif cmd_id == ScriptId.PositionPD:
+            # unused(1) position velocity kp kd travel_force blocked_force
+            values = struct.unpack_from('<6f', payload, 1)
+            self.target_position = min(max(values[0], 0.0), self.max_width)
+            return self._script_payload(StatusCode.E_SUCCESS)
+        return StatusCode.E_CMD_UNKNOWN.to_bytes(2, 'little')
+
+    # ========= main loop in thread ============
+    def _send_loop(self, conn: socket.socket, send_queue: queue.Queue):
+        while True:
+            item = send_queue.get()
+            if item is None:
+                break
+            t_send, msg_b = item
+            t_wait = t_send - time.monotonic()
+            if t_wait > 0:
+                time.sleep(t_wait)
+            conn.sendall(msg_b)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                conn, _ = self.server_sock.accept()
+            except socket.timeout:
+                continue
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn.settimeout(0.1)
+            reader = WSGMessageReader(conn)
+            # responses are delayed on a separate thread, 
+            # so pipelined requests overlap like on the network
+            send_queue = queue.Queue()
+            sender = threading.Thread(
+                target=self._send_loop, args=(conn, send_queue), daemon=True)
+            sender.start()
+            with conn:
+                while not self.stop_event.is_set():
+                    try:
+                        cmd_id, payload = reader.receive()
+                    except socket.timeout:
+                        continue
+                    except ConnectionError:
+                        break
+                    t_recv = time.monotonic()
+                    self.n_requests += 1
+                    response = self.handle(cmd_id, payload)
+                    if response is None:
+                        break
+                    send_queue.put((t_recv + self.response_latency, 
+                        build_msg(cmd_id, response)))
+                send_queue.put(None)
+                sender.join()
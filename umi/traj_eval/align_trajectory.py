@@ -54,7 +54,7 @@ def align_umeyama(model, data, known_scale=False, yaw_only=False):
     # correlation
     C = 1.0/n*np.dot(model_zerocentered.transpose(), data_zerocentered)
     sigma2 = 1.0/n*np.multiply(data_zerocentered, data_zerocentered).sum()
-    U_svd, D_svd, V_svd = np.linalg.linalg.svd(C)
+    U_svd, D_svd, V_svd = np.linalg.svd(C)
     D_svd = np.diag(D_svd)
     V_svd = np.transpose(V_svd)
 
@@ -77,3 +77,46 @@ def align_umeyama(model, data, known_scale=False, yaw_only=False):
     t = mu_M-s*np.dot(R, mu_D)
 
     return s, R, t
+
+
+def align_umeyama_batch(model, data, known_scale=False):
+    """Batched align_umeyama over a leading dimension, without yaw_only.
+
+    model = s * R * data + t
+
+    Input:
+    model -- first trajectories (kxnx3) or (nx3) broadcast to all k
+    data -- second trajectories (kxnx3)
+
+    Output:
+    s -- scale factors (k)
+    R -- rotation matrices (kx3x3)
+    t -- translation vectors (kx3)
+
+    """
+    model, data = np.broadcast_arrays(model, data)
+    mu_M = model.mean(-2, keepdims=True)
+    mu_D = data.mean(-2, keepdims=True)
+    model_zerocentered = model - mu_M
+    data_zerocentered = data - mu_D
+    n = model.shape[-2]
+
+    # correlation
+    C = 1.0/n*np.matmul(np.swapaxes(model_zerocentered, -1, -2), data_zerocentered)
+    sigma2 = 1.0/n*np.square(data_zerocentered).sum(axis=(-2, -1))
+    U_svd, D_svd, V_svd = np.linalg.svd(C)
+    V_svd = np.swapaxes(V_svd, -1, -2)
+
+    S = np.ones(D_svd.shape)
+    S[np.linalg.det(U_svd)*np.linalg.det(V_svd) < 0, 2] = -1
+
+    R = np.matmul(U_svd * S[..., None, :], np.swapaxes(V_svd, -1, -2))
+
+    if known_scale:
+        s = np.ones(D_svd.shape[:-1])
+    else:
+        s = 1.0/sigma2*np.sum(D_svd * S, axis=-1)
+
+    t = mu_M[..., 0, :] - s[..., None]*np.matmul(R, mu_D[..., 0, :, None])[..., 0]
+
+    return s, R, t
@@ -7,6 +7,47 @@ import umi.traj_eval.trajectory_utils as tu
 import umi.traj_eval.transformations as tf
 
 
+def _compute_relative_error_transforms(p_es, q_es, p_gt, q_gt, T_cm,
+                                       idx_1, idx_2, scale=1.0):
+    '''
+    Batched relative pose error between the (idx_1, idx_2) pose pairs,
+    expressed in world orientation of the second estimated pose.
+    Returns (M,4,4).
+    '''
+    T_c = tu.get_rigid_body_trafo_batch(q_es, p_es)
+    T_m = tu.get_rigid_body_trafo_batch(q_gt, p_gt)
+    T_c1, T_c2 = T_c[idx_1], T_c[idx_2]
+    T_m1, T_m2 = T_m[idx_1], T_m[idx_2]
+
+    T_c1_c2 = np.matmul(np.linalg.inv(T_c1), T_c2)
+    T_c1_c2[:, :3, 3] *= scale
+    T_m1_m2 = np.matmul(np.linalg.inv(T_m1), T_m2)
+
+    T_mc = np.linalg.inv(T_cm)
+    T_m1_m2_in_c1 = np.matmul(T_cm, np.matmul(T_m1_m2, T_mc))
+    T_error_in_c2 = np.matmul(np.linalg.inv(T_m1_m2_in_c1), T_c1_c2)
+    T_c2_rot = np.zeros_like(T_c2)
+    T_c2_rot[:, 0:3, 0:3] = T_c2[:, 0:3, 0:3]
+    T_c2_rot[:, 3, 3] = 1.0
+    T_error_in_w = np.matmul(T_c2_rot, np.matmul(
+        T_error_in_c2, np.linalg.inv(T_c2_rot)))
+    return T_error_in_w
+
+
+def _compute_error_statistics(errors):
+    '''
+    Translation norm, yaw, gravity (roll and pitch) and rotation angle
+    in degrees of (M,4,4) error transforms.
+    '''
+    error_trans_norm = np.linalg.norm(errors[:, 0:3, 3], axis=-1)
+    ypr_angles = tu.euler_from_matrix_batch(errors, 'rzyx')
+    e_rot = tu.compute_angle_batch(errors)
+    error_yaw = np.abs(ypr_angles[:, 0])*180.0/np.pi
+    error_gravity = np.sqrt(
+        ypr_angles[:, 1]**2+ypr_angles[:, 2]**2)*180.0/np.pi
+    return error_trans_norm, error_yaw, error_gravity, e_rot
+
+
 def compute_relative_error(p_es, q_es, p_gt, q_gt, T_cm, dist, max_dist_diff,
                            accum_distances=[],
                            scale=1.0):
@@ -23,46 +64,18 @@ def compute_relative_error(p_es, q_es, p_gt, q_gt, T_cm, dist, max_dist_diff,
         return np.array([]), np.array([]), np.array([]), np.array([]), np.array([]),\
             np.array([]), np.array([])
 
-    T_mc = np.linalg.inv(T_cm)
-    errors = []
-    for idx, c in enumerate(comparisons):
-        if not c == -1:
-            T_c1 = tu.get_rigid_body_trafo(q_es[idx, :], p_es[idx, :])
-            T_c2 = tu.get_rigid_body_trafo(q_es[c, :], p_es[c, :])
-            T_c1_c2 = np.dot(np.linalg.inv(T_c1), T_c2)
-            T_c1_c2[:3, 3] *= scale
-
-            T_m1 = tu.get_rigid_body_trafo(q_gt[idx, :], p_gt[idx, :])
-            T_m2 = tu.get_rigid_body_trafo(q_gt[c, :], p_gt[c, :])
-            T_m1_m2 = np.dot(np.linalg.inv(T_m1), T_m2)
-
-            T_m1_m2_in_c1 = np.dot(T_cm, np.dot(T_m1_m2, T_mc))
-            T_error_in_c2 = np.dot(np.linalg.inv(T_m1_m2_in_c1), T_c1_c2)
-            T_c2_rot = np.eye(4)
-            T_c2_rot[0:3, 0:3] = T_c2[0:3, 0:3]
-            T_error_in_w = np.dot(T_c2_rot, np.dot(
-                T_error_in_c2, np.linalg.inv(T_c2_rot)))
-            errors.append(T_error_in_w)
-
-    error_trans_norm = []
-    error_trans_perc = []
-    error_yaw = []
-    error_gravity = []
-    e_rot = []
-    e_rot_deg_per_m = []
-    for e in errors:
-        tn = np.linalg.norm(e[0:3, 3])
-        error_trans_norm.append(tn)
-        error_trans_perc.append(tn / dist * 100)
-        ypr_angles = tf.euler_from_matrix(e, 'rzyx')
-        e_rot.append(tu.compute_angle(e))
-        error_yaw.append(abs(ypr_angles[0])*180.0/np.pi)
-        error_gravity.append(
-            np.sqrt(ypr_angles[1]**2+ypr_angles[2]**2)*180.0/np.pi)
-        e_rot_deg_per_m.append(e_rot[-1] / dist)
-    return errors, np.array(error_trans_norm), np.array(error_trans_perc),\
-        np.array(error_yaw), np.array(error_gravity), np.array(e_rot),\
-        np.array(e_rot_deg_per_m)
+    # the i-th match is paired with the i-th pose
+    errors = _compute_relative_error_transforms(
+        p_es, q_es, p_gt, q_gt, T_cm,
+        idx_1=np.arange(n_samples), idx_2=comparisons, scale=scale)
+
+    error_trans_norm, error_yaw, error_gravity, e_rot = \
+        _compute_error_statistics(errors)
+    error_trans_perc = error_trans_norm / dist * 100
+    e_rot_deg_per_m = e_rot / dist
+    return errors, error_trans_norm, error_trans_perc,\
+        error_yaw, error_gravity, e_rot,\
+        e_rot_deg_per_m
 
 
 def compute_temporal_relative_error(
@@ -86,42 +99,14 @@ def compute_temporal_relative_error(
         return np.array([]), np.array([]), np.array([]), np.array([]), np.array([]),\
             np.array([]), np.array([])
 
-    T_mc = np.linalg.inv(T_cm)
-    errors = []
-    # for idx, c in enumerate(comparisons):
-    for idx, c in comparisons:
-        if not c == -1:
-            T_c1 = tu.get_rigid_body_trafo(q_es[idx, :], p_es[idx, :])
-            T_c2 = tu.get_rigid_body_trafo(q_es[c, :], p_es[c, :])
-            T_c1_c2 = np.dot(np.linalg.inv(T_c1), T_c2)
-            T_c1_c2[:3, 3] *= scale
-
-            T_m1 = tu.get_rigid_body_trafo(q_gt[idx, :], p_gt[idx, :])
-            T_m2 = tu.get_rigid_body_trafo(q_gt[c, :], p_gt[c, :])
-            T_m1_m2 = np.dot(np.linalg.inv(T_m1), T_m2)
-
-            T_m1_m2_in_c1 = np.dot(T_cm, np.dot(T_m1_m2, T_mc))
-            T_error_in_c2 = np.dot(np.linalg.inv(T_m1_m2_in_c1), T_c1_c2)
-            T_c2_rot = np.eye(4)
-            T_c2_rot[0:3, 0:3] = T_c2[0:3, 0:3]
-            T_error_in_w = np.dot(T_c2_rot, np.dot(
-                T_error_in_c2, np.linalg.inv(T_c2_rot)))
-            errors.append(T_error_in_w)
-
-    error_trans_norm = []
-    error_yaw = []
-    error_gravity = []
-    e_rot = []
-    for e in errors:
-        tn = np.linalg.norm(e[0:3, 3])
-        error_trans_norm.append(tn)
-        ypr_angles = tf.euler_from_matrix(e, 'rzyx')
-        e_rot.append(tu.compute_angle(e))
-        error_yaw.append(abs(ypr_angles[0])*180.0/np.pi)
-        error_gravity.append(
-            np.sqrt(ypr_angles[1]**2+ypr_angles[2]**2)*180.0/np.pi)
-    return errors, np.array(error_trans_norm),\
-        np.array(error_yaw), np.array(error_gravity), np.array(e_rot)
+    errors = _compute_relative_error_transforms(
+        p_es, q_es, p_gt, q_gt, T_cm,
+        idx_1=comparisons[:, 0], idx_2=comparisons[:, 1], scale=scale)
+
+    error_trans_norm, error_yaw, error_gravity, e_rot = \
+        _compute_error_statistics(errors)
+    return errors, error_trans_norm,\
+        error_yaw, error_gravity, e_rot
 
 
 def compute_absolute_error(p_es_aligned, q_es_aligned, p_gt, q_gt):
@@ -0,0 +1,173 @@
+"""
+Time offset search between a SLAM trajectory and a ground truth trajectory.
+
+Both trajectories are loaded once. A coarse offset is found by
+cross-correlating speed profiles (invariant to the unknown rigid
+transform), then a fine grid around it is evaluated in one batch:
+SLAM positions are interpolated at all shifted ground truth timestamps,
+rigidly aligned with a batched Umeyama fit and scored by RMSE.
+"""
+
+import pickle
+import datetime
+import concurrent.futures
+import numpy as np
+
+import umi.traj_eval.align_trajectory as align
+
+
+def load_gt_pkl(pkl_path):
+    """
+    Ground truth robot log (list of dict with 'timestemp' and 'flangePose').
+    Returns timestamps in ns (N,) int64 and positions (N,3).
+    """
+    with open(pkl_path, 'rb') as f:
+        data = pickle.load(f)
+    timestamps = list()
+    positions = list()
+    for record in data:
+        dt = datetime.datetime.strptime(str(record['timestemp']), '%y%m%d%H%M%S.%f')
+        timestamps.append(int(dt.timestamp() * 1e9))
+        positions.append(record['flangePose'][:3])
+    return np.array(timestamps, dtype=np.int64), np.array(positions, dtype=np.float64)
+
+
+def load_slam_trajectory(csv_path, start_time_ns):
+    """
+    SLAM camera_trajectory.csv (or its .npy cache).
+    Returns timestamps in ns (N,) int64 and positions (N,3).
+    """
+    from umi.common.orb_slam_util import load_trajectory_array
+    arr = load_trajectory_array(csv_path)
+    timestamps = (arr['timestamp'] * 1e9).astype(np.int64) + start_time_ns
+    positions = np.stack([arr['x'], arr['y'], arr['z']], axis=-1).astype(np.float64)
+    return timestamps, positions
+
+
+def interp_positions(t, p, query):
+    """
+    Piecewise linear interpolation of p (N,3) sampled at sorted t (N,)
+    with linear extrapolation, same as interp1d(fill_value='extrapolate').
+    query: (...,) -> (...,3)
+    """
+    idx = np.clip(np.searchsorted(t, query, side='right') - 1, 0, len(t) - 2)
+    t0 = t[idx]
+    t1 = t[idx + 1]
+    w = ((query - t0) / (t1 - t0))[..., None]
+    return p[idx] * (1 - w) + p[idx + 1] * w
+
+
+def evaluate_offsets(slam_t, slam_p, gt_t, gt_p, offsets, chunk_size=64):
+    """
+    RMSE after rigid alignment for each time offset.
+    slam_t, gt_t: seconds, slam_t + offset is compared with gt_t.
+    offsets: (K,)
+    Returns (K,) total RMSE.
+    """
+    offsets = np.asarray(offsets, dtype=np.float64)
+    rmse = np.zeros(len(offsets))
+    for start in range(0, len(offsets), chunk_size):
+        this_offsets = offsets[start:start+chunk_size]
+        query = gt_t[None] - this_offsets[:, None]
+        aligned_slam = interp_positions(slam_t, slam_p, query)
+        _, R, t = align.align_umeyama_batch(gt_p, aligned_slam, known_scale=True)
+        transformed = np.matmul(aligned_slam, np.swapaxes(R, -1, -2)) + t[:, None]
+        errors = gt_p[None] - transformed
+        rmse[start:start+chunk_size] = np.sqrt(np.mean(np.sum(np.square(errors), axis=-1), axis=-1))
+    return rmse
+
+
+def coarse_offset_xcorr(slam_t, slam_p, gt_t, gt_p, max_offset, dt=0.01):
+    """
+    Offset in [-max_offset, max_offset] maximizing the normalized
+    cross-correlation of speed profiles, resolution dt.
+    """
+    def speed(t, p, grid):
+        pos = np.stack([np.interp(grid, t, p[:, i]) for i in range(3)], axis=-1)
+        return np.linalg.norm(np.gradient(pos, dt, axis=0), axis=-1)
+
+    grid = np.arange(slam_t[0], slam_t[-1], dt)
+    lags = np.arange(-max_offset, max_offset + dt / 2, dt)
+    slam_speed = speed(slam_t, slam_p, grid)
+    # gt speed at every shifted grid, (K,M)
+    gt_grid = np.arange(gt_t[0] - dt, gt_t[-1] + dt, dt)
+    gt_speed = np.interp(grid[None] + lags[:, None], gt_grid,
+        speed(gt_t, gt_p, gt_grid), left=np.nan, right=np.nan)
+    valid = np.isfinite(gt_speed)
+    n_valid = valid.sum(axis=-1)
+
+    gt_speed = np.where(valid, gt_speed, 0)
+    slam_speed = np.where(valid, slam_speed[None], 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        gt_mean = gt_speed.sum(axis=-1, keepdims=True) / n_valid[:, None]
+        slam_mean = slam_speed.sum(axis=-1, keepdims=True) / n_valid[:, None]
+        gt_c = np.where(valid, gt_speed - gt_mean, 0)
+        slam_c = np.where(valid, slam_speed - slam_mean, 0)
+        corr = (gt_c * slam_c).sum(axis=-1) / np.sqrt(
+            np.square(gt_c).sum(axis=-1) * np.square(slam_c).sum(axis=-1))
+    # require at least half of the overlap
+    corr[n_valid < (len(grid) / 2)] = -np.inf
+    corr[~np.isfinite(corr)] = -np.inf
+    return float(lags[np.argmax(corr)])
+
+
+def search_time_offset(slam_t, slam_p, gt_t, gt_p,
+        max_offset=1.1, coarse_dt=0.01, fine_range=0.05, fine_step=0.001):
+    """
+    slam_t, gt_t: (N,) ns int64 or seconds float64
+    Returns dict with best offset (seconds, added to SLAM timestamps),
+    rigid alignment R, t (gt = R * slam + t) and error statistics.
+    """
+    # seconds relative to gt start, avoid float precision loss on epoch ns
+    t_ref = gt_t[0]
+    scale = 1e-9 if np.issubdtype(np.asarray(gt_t).dtype, np.integer) else 1.0
+    slam_t = (np.asarray(slam_t) - t_ref) * scale
+    gt_t = (np.asarray(gt_t) - t_ref) * scale
+
+    coarse_offset = coarse_offset_xcorr(slam_t, slam_p, gt_t, gt_p,
+        max_offset=max_offset, dt=coarse_dt)
+    fine_offsets = np.arange(
+        max(coarse_offset - fine_range, -max_offset),
+        min(coarse_offset + fine_range, max_offset) + fine_step / 2,
+        fine_step)
+    fine_rmse = evaluate_offsets(slam_t, slam_p, gt_t, gt_p, fine_offsets)
+    offset = float(fine_offsets[np.argmin(fine_rmse)])
+
+    # final fit at the best offset
+    aligned_slam = interp_positions(slam_t, slam_p, gt_t - offset)
+    _, R, t = align.align_umeyama(gt_p, aligned_slam, known_scale=True)
+    errors = gt_p - (aligned_slam @ R.T + t)
+    euclidean_errors = np.linalg.norm(errors, axis=-1)
+    return {
+        'offset': offset,
+        'coarse_offset': coarse_offset,
+        'R': R,
+        't': t,
+        'rmse': float(np.sqrt(np.mean(np.sum(np.square(errors), axis=-1)))),
+        'rmse_xyz': np.sqrt(np.mean(np.square(errors), axis=0)),
+        'max_error': float(euclidean_errors.max()),
+        'min_error': float(euclidean_errors.min()),
+        'mean_error': float(euclidean_errors.mean()),
+        'fine_offsets': fine_offsets,
+        'fine_rmse': fine_rmse
+    }
+
+
+def measure_session(slam_csv_path, gt_pkl_path, slam_start_time_ns, **kwargs):
+    """
+    Load one SLAM/ground truth pair and run search_time_offset.
+    """
+    slam_t, slam_p = load_slam_trajectory(slam_csv_path, slam_start_time_ns)
+    gt_t, gt_p = load_gt_pkl(gt_pkl_path)
+    return search_time_offset(slam_t, slam_p, gt_t, gt_p, **kwargs)
+
+
+def measure_sessions(sessions, num_workers=None, **kwargs):
+    """
+    sessions: list of (slam_csv_path, gt_pkl_path, slam_start_time_ns)
+    Runs measure_session for all sessions in a process pool,
+    results in the same order.
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(measure_session, *args, **kwargs) for args in sessions]
+        return [x.result() for x in futures]
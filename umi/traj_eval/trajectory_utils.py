@@ -6,13 +6,37 @@
 import os
 import numpy as np
 import umi.traj_eval.transformations as tf
-import numba
 
 def get_rigid_body_trafo(quat, trans):
     T = tf.quaternion_matrix(quat)
     T[0:3, 3] = trans
     return T
 
+def get_rigid_body_trafo_batch(quats, trans):
+    """
+    Batched get_rigid_body_trafo, (N,4) quaternions and (N,3) translations
+    to (N,4,4), same convention as tf.quaternion_matrix.
+    """
+    q = np.array(quats, dtype=np.float64)[:, :4]
+    nq = np.sum(q * q, axis=-1)
+    is_small = nq < tf._EPS
+    q = q * np.sqrt(2.0 / np.where(is_small, 1.0, nq))[:, None]
+    q = q[:, :, None] * q[:, None, :]
+    T = np.zeros((len(q), 4, 4))
+    T[:, 0, 0] = 1.0-q[:, 1, 1]-q[:, 2, 2]
+    T[:, 0, 1] = q[:, 0, 1]-q[:, 2, 3]
+    T[:, 0, 2] = q[:, 0, 2]+q[:, 1, 3]
+    T[:, 1, 0] = q[:, 0, 1]+q[:, 2, 3]
+    T[:, 1, 1] = 1.0-q[:, 0, 0]-q[:, 2, 2]
+    T[:, 1, 2] = q[:, 1, 2]-q[:, 0, 3]
+    T[:, 2, 0] = q[:, 0, 2]-q[:, 1, 3]
+    T[:, 2, 1] = q[:, 1, 2]+q[:, 0, 3]
+    T[:, 2, 2] = 1.0-q[:, 0, 0]-q[:, 1, 1]
+    T[is_small, :3, :3] = np.eye(3)
+    T[:, 3, 3] = 1.0
+    T[:, 0:3, 3] = trans
+    return T
+
 def get_distance_from_start(gt_translation):
     distances = np.diff(gt_translation[:, 0:3], axis=0)
     distances = np.sqrt(np.sum(np.multiply(distances, distances), 1))
@@ -20,20 +44,36 @@ def get_distance_from_start(gt_translation):
     distances = np.concatenate(([0], distances))
     return distances
 
-@numba.jit(nopython=True)
 def compute_comparison_indices_length(distances, dist, max_dist_diff):
-    max_idx = len(distances)
-    comparisons = []
-    for idx, d in enumerate(distances):
-        best_idx = -1
-        error = max_dist_diff
-        for i in range(idx, max_idx):
-            if np.abs(distances[i]-(d+dist)) < error:
-                best_idx = i
-                error = np.abs(distances[i] - (d+dist))
-        if best_idx != -1:
-            comparisons.append(best_idx)
-    return comparisons
+    """
+    For each idx, the first i >= idx minimizing |distances[i] - (distances[idx] + dist)|,
+    kept only if that error is below max_dist_diff.
+    distances must be non-decreasing (accumulated distance), so the
+    best match is next to the searchsorted insertion point. O(N log N).
+    Returns matched indices (int64) in order of idx, unmatched idx are dropped.
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    n = len(distances)
+    if n == 0:
+        return np.zeros((0,), dtype=np.int64)
+    idxs = np.arange(n)
+    target = distances + dist
+    upper = np.maximum(np.searchsorted(distances, target, side='left'), idxs)
+    # last value below target, moved to its first occurrence
+    # since ties are resolved to the smallest index
+    lower = upper - 1
+    has_lower = lower >= idxs
+    lower = np.maximum(np.searchsorted(distances, distances[np.clip(lower, 0, n-1)],
+        side='left'), idxs)
+    has_upper = upper < n
+    error_lower = np.where(has_lower,
+        np.abs(distances[np.clip(lower, 0, n-1)] - target), np.inf)
+    error_upper = np.where(has_upper,
+        np.abs(distances[np.clip(upper, 0, n-1)] - target), np.inf)
+    use_lower = error_lower <= error_upper
+    best_idx = np.where(use_lower, lower, upper)
+    error = np.where(use_lower, error_lower, error_upper)
+    return best_idx[error < max_dist_diff].astype(np.int64)
 
 
 def compute_angle(transform):
@@ -43,3 +83,46 @@ def compute_angle(transform):
     # an invitation to 3-d vision, p 27
     return np.arccos(
         min(1, max(-1, (np.trace(transform[0:3, 0:3]) - 1)/2)))*180.0/np.pi
+
+def compute_angle_batch(transforms):
+    """
+    Batched compute_angle, (N,4,4) -> (N,) degrees.
+    """
+    traces = np.trace(transforms[:, 0:3, 0:3], axis1=-2, axis2=-1)
+    return np.arccos(np.clip((traces - 1)/2, -1, 1))*180.0/np.pi
+
+def euler_from_matrix_batch(matrices, axes='sxyz'):
+    """
+    Batched tf.euler_from_matrix, (N,4,4) or (N,3,3) -> (N,3).
+    """
+    try:
+        firstaxis, parity, repetition, frame = tf._AXES2TUPLE[axes.lower()]
+    except (AttributeError, KeyError):
+        _ = tf._TUPLE2AXES[axes]
+        firstaxis, parity, repetition, frame = axes
+
+    i = firstaxis
+    j = tf._NEXT_AXIS[i+parity]
+    k = tf._NEXT_AXIS[i-parity+1]
+
+    M = np.asarray(matrices, dtype=np.float64)[:, :3, :3]
+    if repetition:
+        sy = np.sqrt(M[:, i, j]*M[:, i, j] + M[:, i, k]*M[:, i, k])
+        is_regular = sy > tf._EPS
+        ax = np.where(is_regular,
+            np.arctan2(M[:, i, j], M[:, i, k]), np.arctan2(-M[:, j, k], M[:, j, j]))
+        ay = np.arctan2(sy, M[:, i, i])
+        az = np.where(is_regular, np.arctan2(M[:, j, i], -M[:, k, i]), 0.0)
+    else:
+        cy = np.sqrt(M[:, i, i]*M[:, i, i] + M[:, j, i]*M[:, j, i])
+        is_regular = cy > tf._EPS
+        ax = np.where(is_regular,
+            np.arctan2(M[:, k, j], M[:, k, k]), np.arctan2(-M[:, j, k], M[:, j, j]))
+        ay = np.arctan2(-M[:, k, i], cy)
+        az = np.where(is_regular, np.arctan2(M[:, j, i], M[:, i, i]), 0.0)
+
+    if parity:
+        ax, ay, az = -ax, -ay, -az
+    if frame:
+        ax, az = az, ax
+    return np.stack([ax, ay, az], axis=-1)